@@ -206,6 +206,8 @@ def _Decompress(data):
     return content
   elif encoding == constants.RPC_ENCODING_ZLIB_BASE64:
     return zlib.decompress(base64.b64decode(content))
+  elif encoding == constants.RPC_ENCODING_ZLIB_RAW:
+    return zlib.decompress(content)
   else:
     raise AssertionError("Unknown data encoding")
 
@@ -1902,6 +1904,89 @@ def InstanceShutdown(instance, timeout, reason, store_reason=True):
   _RemoveBlockDevLinks(iname, instance.disks)
 
 
+#: Maximum number of instances started or stopped at the same time by
+#: L{StartInstanceMulti} and L{InstanceShutdownMulti}
+_instance_ops_max_parallel = 4
+
+
+def SetInstanceOpsParallel(max_parallel):
+  """Configures how many instances are started or stopped at the same time.
+
+  @type max_parallel: int
+  @param max_parallel: Maximum number of instances handled concurrently
+
+  """
+  global _instance_ops_max_parallel # pylint: disable=W0603
+
+  _instance_ops_max_parallel = max_parallel
+
+
+def _RunInstanceOps(fn, instances, max_parallel):
+  """Runs an operation on several instances concurrently.
+
+  @type fn: callable
+  @param fn: function receiving an instance as its only parameter
+  @type instances: list of L{objects.Instance}
+  @param instances: instances to run the operation on
+  @type max_parallel: int or None
+  @param max_parallel: maximum number of concurrent operations, defaults to
+    the value set by L{SetInstanceOpsParallel}
+  @rtype: list of tuples
+  @return: one tuple (success, message) per instance, in the same order as
+    C{instances}
+
+  """
+  if max_parallel is None:
+    max_parallel = _instance_ops_max_parallel
+
+  def _Run(instance):
+    try:
+      fn(instance)
+    except RPCFail, err:
+      return (False, str(err))
+    except Exception, err: # pylint: disable=W0703
+      logging.exception("Error while handling instance %s", instance.name)
+      return (False, str(err))
+    return (True, None)
+
+  return utils.RunInParallel(_Run, instances, max_parallel)
+
+
+def StartInstanceMulti(instances, startup_paused, reason, max_parallel=None):
+  """Starts several instances concurrently.
+
+  @type instances: list of L{objects.Instance}
+  @param instances: the instances to start
+  @type startup_paused: bool
+  @param startup_paused: pause instances at startup?
+  @type reason: list of reasons
+  @param reason: the reason trail for this startup
+  @see: L{StartInstance} and L{_RunInstanceOps}
+
+  """
+  return _RunInstanceOps(lambda instance: StartInstance(instance,
+                                                        startup_paused,
+                                                        reason),
+                         instances, max_parallel)
+
+
+def InstanceShutdownMulti(instances, timeout, reason, max_parallel=None):
+  """Shuts down several instances concurrently.
+
+  @type instances: list of L{objects.Instance}
+  @param instances: the instances to shut down
+  @type timeout: integer
+  @param timeout: maximum timeout for soft shutdown
+  @type reason: list of reasons
+  @param reason: the reason trail for this shutdown
+  @see: L{InstanceShutdown} and L{_RunInstanceOps}
+
+  """
+  return _RunInstanceOps(lambda instance: InstanceShutdown(instance, timeout,
+                                                           reason),
+                         instances, max_parallel)
+
+
 def InstanceReboot(instance, reboot_type, shutdown_timeout, reason):
   """Reboot an instance.
 
@@ -4455,6 +4540,29 @@ def ConfigureOVS(ovs_name, ovs_link):
             result.output), log=True)
 
 
+#: Maximum number of hook scripts of a directory run at the same time
+_hooks_max_parallel = 1
+
+#: Time in seconds after which a hook script is killed, None for no timeout
+_hooks_timeout = None
+
+
+def SetHooksExecution(max_parallel, timeout):
+  """Configures how hook scripts are run by L{HooksRunner}.
+
+  @type max_parallel: int
+  @param max_parallel: Maximum number of scripts run at the same time
+  @type timeout: number or None
+  @param timeout: Time in seconds after which a script is killed
+
+  """
+  global _hooks_max_parallel # pylint: disable=W0603
+  global _hooks_timeout # pylint: disable=W0603
+
+  _hooks_max_parallel = max_parallel
+  _hooks_timeout = timeout
+
+
 class HooksRunner(object):
   """Hook runner.
 
@@ -4462,19 +4570,31 @@ class HooksRunner(object):
   on the master side.
 
   """
-  def __init__(self, hooks_base_dir=None):
+  def __init__(self, hooks_base_dir=None, max_parallel=None, timeout=None):
     """Constructor for hooks runner.
 
     @type hooks_base_dir: str or None
     @param hooks_base_dir: if not None, this overrides the
         L{pathutils.HOOKS_BASE_DIR} (useful for unittests)
+    @type max_parallel: int or None
+    @param max_parallel: maximum number of scripts run at the same time,
+        defaults to the value set using L{SetHooksExecution}
+    @type timeout: number or None
+    @param timeout: time in seconds after which a script is killed,
+        defaults to the value set using L{SetHooksExecution}
 
     """
     if hooks_base_dir is None:
       hooks_base_dir = pathutils.HOOKS_BASE_DIR
+    if max_parallel is None:
+      max_parallel = _hooks_max_parallel
+    if timeout is None:
+      timeout = _hooks_timeout
     # yeah, _BASE_DIR is not valid for attributes, we use it like a
     # constant
     self._BASE_DIR = hooks_base_dir # pylint: disable=C0103
+    self._max_parallel = max_parallel
+    self._timeout = timeout
 
   def RunLocalHooks(self, node_list, hpath, phase, env):
     """Check that the hooks will be run only locally and then run them.
@@ -4529,7 +4649,9 @@ class HooksRunner(object):
       # warning at every operation
       return results
 
-    runparts_results = utils.RunParts(dir_name, env=env, reset_env=True)
+    runparts_results = utils.RunParts(dir_name, env=env, reset_env=True,
+                                      max_parallel=self._max_parallel,
+                                      timeout=self._timeout)
 
     for (relname, relstatus, runresult) in runparts_results:
       if relstatus == constants.RUNPARTS_SKIP:
@@ -4549,6 +4671,48 @@ class HooksRunner(object):
     return results
 
 
+  def GetManifest(self):
+    """Returns the hook directories containing runnable scripts.
+
+    @rtype: list of strings
+    @return: names of the hook directories (e.g. C{instance-start-pre.d})
+      containing at least one runnable script
+
+    """
+    manifest = []
+
+    try:
+      subdirs = utils.ListVisibleFiles(self._BASE_DIR)
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        logging.warning("Can't list hooks directory %s: %s", self._BASE_DIR,
+                        err)
+      return manifest
+
+    for subdir in subdirs:
+      if not (subdir.endswith("-%s.d" % constants.HOOKS_PHASE_PRE) or
+              subdir.endswith("-%s.d" % constants.HOOKS_PHASE_POST)):
+        continue
+
+      dir_name = utils.PathJoin(self._BASE_DIR, subdir)
+      if not os.path.isdir(dir_name):
+        continue
+
+      try:
+        names = utils.ListVisibleFiles(dir_name)
+      except EnvironmentError, err:
+        logging.warning("Can't list hooks directory %s: %s", dir_name, err)
+        continue
+
+      for relname in names:
+        if (constants.EXT_PLUGIN_MASK.match(relname) is not None and
+            utils.IsExecutable(utils.PathJoin(dir_name, relname))):
+          manifest.append(subdir)
+          break
+
+    return manifest
+
+
 class IAllocatorRunner(object):
   """IAllocator runner.
 
@@ -63,6 +63,7 @@ __all__ = [
   "AUTO_PROMOTE_OPT",
   "AUTO_REPLACE_OPT",
   "BACKEND_OPT",
+  "BATCH_OPT",
   "BLK_OS_OPT",
   "CAPAB_MASTER_OPT",
   "CAPAB_VM_OPT",
@@ -1579,6 +1580,11 @@ FORCE_FILTER_OPT = cli_option("-F", "--filter", dest="force_filter",
                               help=("Whether command argument should be treated"
                                     " as filter"))
 
+BATCH_OPT = cli_option("--batch", dest="batch",
+                       action="store_true", default=False,
+                       help=("Run the operation on all instances in a single"
+                             " job, acquiring all locks at once"))
+
 NO_REMEMBER_OPT = cli_option("--no-remember",
                              dest="no_remember",
                              action="store_true", default=False,
@@ -48,6 +48,29 @@ _LIST_LOCKS_DEF_FIELDS = [
   "pending",
   ]
 
+#: Default fields for L{ListRpcStatistics}
+_LIST_RPC_DEF_FIELDS = [
+  "procedure",
+  "node",
+  "calls",
+  "failures",
+  "timeouts",
+  "latency_avg",
+  "latency_p90",
+  "latency_max",
+  ]
+
+#: Default fields for L{ShowQueueStatistics}
+_QUEUE_STATS_DEF_FIELDS = [
+  "workers",
+  "workers_busy",
+  "workers_min",
+  "workers_max",
+  "jobs_pending",
+  "lock_wait_ratio",
+  "resizes",
+  ]
+
 
 def Delay(opts, args):
   """Sleeps for a while
@@ -570,6 +593,95 @@ def TestJobqueue(opts, _):
   return 0
 
 
+def _AggregateLockStatistics(rows):
+  """Aggregates lock contention statistics by lock level and by opcode.
+
+  @type rows: list
+  @param rows: Query result rows for the fields C{name}, C{acquires},
+    C{timeouts}, C{wait_total}, C{hold_total} and C{opcodes}
+  @rtype: tuple; (dict, dict)
+  @return: Dictionaries mapping lock level and opcode respectively to a list
+    of acquires, timeouts, wait time and hold time
+
+  """
+  by_level = {}
+  by_opcode = {}
+
+  for row in rows:
+    if compat.any(status != constants.RS_NORMAL for (status, _) in row):
+      # Statistics are not available for this lock
+      continue
+
+    (name, acquires, timeouts, wait_total, hold_total, opcodes) = \
+      map(compat.snd, row)
+
+    # Locks are named after their level, e.g. "instance/inst1.example.com"
+    level = name.split("/", 1)[0]
+
+    totals = by_level.setdefault(level, [0, 0, 0.0, 0.0])
+    for (idx, value) in enumerate([acquires, timeouts, wait_total,
+                                   hold_total]):
+      totals[idx] += value
+
+    for (op_id, op_acquires, op_timeouts, op_wait, op_hold) in opcodes:
+      totals = by_opcode.setdefault(op_id, [0, 0, 0.0, 0.0])
+      for (idx, value) in enumerate([op_acquires, op_timeouts, op_wait,
+                                     op_hold]):
+        totals[idx] += value
+
+  return (by_level, by_opcode)
+
+
+def _ShowLockSummary(opts):
+  """Shows lock contention statistics aggregated by level and opcode.
+
+  @param opts: the command line options selected by the user
+  @rtype: int
+  @return: the desired exit code
+
+  """
+  cl = GetClient()
+
+  response = cl.Query(constants.QR_LOCK, ["name", "acquires", "timeouts",
+                                          "wait_total", "hold_total",
+                                          "opcodes"], None)
+
+  (by_level, by_opcode) = _AggregateLockStatistics(response.data)
+
+  if not (by_level or by_opcode):
+    ToStderr("No lock statistics available; they need to be enabled using"
+             " the --lock-stats option of the master daemon")
+    return constants.EXIT_FAILURE
+
+  fields = ["name", "acquires", "timeouts", "wait_total", "hold_total"]
+  numfields = fields[1:]
+
+  for (title, totals) in [("Level", by_level), ("Opcode", by_opcode)]:
+    if opts.no_headers:
+      headers = None
+    else:
+      headers = {
+        "name": title,
+        "acquires": "Acquires",
+        "timeouts": "Timeouts",
+        "wait_total": "WaitTotal",
+        "hold_total": "HoldTotal",
+        }
+
+    data = [[name or "-", acquires, timeouts, "%.3f" % wait_total,
+             "%.3f" % hold_total]
+            for (name, (acquires, timeouts, wait_total, hold_total)) in
+              sorted(totals.items())]
+
+    for line in GenerateTable(separator=opts.separator, headers=headers,
+                              fields=fields, data=data, numfields=numfields):
+      ToStdout(line)
+
+    ToStdout("")
+
+  return constants.EXIT_SUCCESS
+
+
 def ListLocks(opts, args): # pylint: disable=W0613
   """List all locks.
 
@@ -580,6 +692,9 @@ def ListLocks(opts, args): # pylint: disable=W0613
   @return: the desired exit code
 
   """
+  if opts.summary:
+    return _ShowLockSummary(opts)
+
   selected_fields = ParseFields(opts.output, _LIST_LOCKS_DEF_FIELDS)
 
   def _DashIfNone(fn):
@@ -596,11 +711,33 @@ def ListLocks(opts, args): # pylint: disable=W0613
     return utils.CommaJoin("%s:%s" % (mode, ",".join(threads))
                            for mode, threads in value)
 
+  def _FormatSeconds(value):
+    return "%.3f" % value
+
+  def _FormatHistogram(value):
+    return utils.CommaJoin("%s:%s" % (upper or "inf", num)
+                           for (upper, num) in value)
+
+  def _FormatOpcodes(value):
+    return utils.CommaJoin("%s:%s/%s" % (op_id or "-", acquires, timeouts)
+                           for (op_id, acquires, timeouts, _, _) in value)
+
+  def _FormatBlockedBy(value):
+    return utils.CommaJoin("%s<%s:%s" % (waiting or "-", owning or "-", count)
+                           for (waiting, owning, count) in value)
+
   # Format raw values
   fmtoverride = {
     "mode": (_DashIfNone(str), False),
     "owner": (_DashIfNone(",".join), False),
     "pending": (_DashIfNone(_FormatPending), False),
+    "wait_total": (_FormatSeconds, True),
+    "wait_max": (_FormatSeconds, True),
+    "hold_total": (_FormatSeconds, True),
+    "hold_max": (_FormatSeconds, True),
+    "wait_hist": (_DashIfNone(_FormatHistogram), False),
+    "opcodes": (_DashIfNone(_FormatOpcodes), False),
+    "blocked_by": (_DashIfNone(_FormatBlockedBy), False),
     }
 
   while True:
@@ -620,6 +757,181 @@ def ListLocks(opts, args): # pylint: disable=W0613
   return 0
 
 
+def ListRpcStatistics(opts, args): # pylint: disable=W0613
+  """List statistics about RPC calls made by the master daemon.
+
+  @param opts: the command line options selected by the user
+  @type args: list
+  @param args: should be an empty list
+  @rtype: int
+  @return: the desired exit code
+
+  """
+  selected_fields = ParseFields(opts.output, _LIST_RPC_DEF_FIELDS)
+
+  def _FormatLatency(value):
+    return "%.3f" % value
+
+  def _FormatHistogram(value):
+    return utils.CommaJoin("%s:%s" % (upper or "inf", num)
+                           for (upper, num) in value)
+
+  fmtoverride = dict.fromkeys(["latency_total", "latency_avg", "latency_max",
+                               "latency_p50", "latency_p90", "latency_p99"],
+                              (_FormatLatency, True))
+  fmtoverride["latency_hist"] = (_FormatHistogram, False)
+
+  # Statistics are only kept by the master daemon
+  cl = GetClient(query=False)
+
+  while True:
+    ret = GenericList(constants.QR_RPC, selected_fields, None, None,
+                      opts.separator, not opts.no_headers, cl=cl,
+                      format_override=fmtoverride, verbose=opts.verbose)
+
+    if ret != constants.EXIT_SUCCESS:
+      return ret
+
+    if not opts.interval:
+      break
+
+    ToStdout("")
+    time.sleep(opts.interval)
+
+  return 0
+
+
+def ShowQueueStatistics(opts, args): # pylint: disable=W0613
+  """Show statistics about the job queue worker pool of the master daemon.
+
+  @param opts: the command line options selected by the user
+  @type args: list
+  @param args: should be an empty list
+  @rtype: int
+  @return: the desired exit code
+
+  """
+  selected_fields = ParseFields(opts.output, _QUEUE_STATS_DEF_FIELDS)
+
+  def _FormatSeconds(value):
+    return "%.3f" % value
+
+  def _FormatRatio(value):
+    return "%.2f" % value
+
+  fmtoverride = {
+    "lock_wait": (_FormatSeconds, True),
+    "exec_time": (_FormatSeconds, True),
+    "lock_wait_ratio": (_FormatRatio, True),
+    }
+
+  # Statistics are only kept by the master daemon
+  cl = GetClient(query=False)
+
+  while True:
+    ret = GenericList(constants.QR_QUEUE, selected_fields, None, None,
+                      opts.separator, not opts.no_headers, cl=cl,
+                      format_override=fmtoverride, verbose=opts.verbose)
+
+    if ret != constants.EXIT_SUCCESS:
+      return ret
+
+    if not opts.interval:
+      break
+
+    ToStdout("")
+    time.sleep(opts.interval)
+
+  return 0
+
+
+def _AggregateOpProfiles(rows):
+  """Aggregates opcode execution profiles by opcode and span.
+
+  @type rows: list
+  @param rows: Query result rows for the fields C{ops} and C{opprofile}
+  @rtype: dict
+  @return: Dictionary mapping tuples of opcode ID and span name to a list of
+    the number of opcodes, total and maximum duration
+
+  """
+  result = {}
+
+  for row in rows:
+    if compat.any(status != constants.RS_NORMAL for (status, _) in row):
+      continue
+
+    (ops, profiles) = map(compat.snd, row)
+
+    for (op, profile) in zip(ops, profiles):
+      if not profile:
+        # Opcode was not profiled or has not been executed yet
+        continue
+
+      op_id = op.get("OP_ID", None)
+
+      for (name, duration) in profile.items():
+        totals = result.setdefault((op_id, name), [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] = max(totals[2], duration)
+
+  return result
+
+
+def ShowOpProfile(opts, args): # pylint: disable=W0613
+  """Show execution profiles of recent opcodes, aggregated by opcode.
+
+  @param opts: the command line options selected by the user
+  @type args: list
+  @param args: should be an empty list
+  @rtype: int
+  @return: the desired exit code
+
+  """
+  cl = GetClient()
+
+  response = cl.Query(constants.QR_JOB, ["id", "ops", "opprofile"], None)
+
+  rows = [row[1:] for row in
+          sorted(response.data, key=lambda row: int(row[0][1]))]
+  if opts.jobs > 0:
+    rows = rows[-opts.jobs:]
+
+  totals = _AggregateOpProfiles(rows)
+
+  if not totals:
+    ToStderr("No opcode profiles available; profiling needs to be enabled"
+             " using the --opcode-profiling option of the master daemon")
+    return constants.EXIT_FAILURE
+
+  fields = ["opcode", "span", "count", "total", "avg", "max"]
+
+  if opts.no_headers:
+    headers = None
+  else:
+    headers = {
+      "opcode": "Opcode",
+      "span": "Span",
+      "count": "Count",
+      "total": "Total",
+      "avg": "Average",
+      "max": "Max",
+      }
+
+  data = [[op_id or "-", name, count, "%.3f" % total,
+           "%.3f" % (total / count), "%.3f" % maximum]
+          for ((op_id, name), (count, total, maximum)) in
+            sorted(totals.items(), key=lambda (_, values): -values[1])]
+
+  for line in GenerateTable(separator=opts.separator, headers=headers,
+                            fields=fields, data=data,
+                            numfields=fields[2:]):
+    ToStdout(line)
+
+  return constants.EXIT_SUCCESS
+
+
 commands = {
   "delay": (
     Delay, [ArgUnknown(min=1, max=1)],
@@ -689,8 +1001,29 @@ commands = {
     "", "Test a few aspects of the job queue"),
   "locks": (
     ListLocks, ARGS_NONE,
-    [NOHDR_OPT, SEP_OPT, FIELDS_OPT, INTERVAL_OPT, VERBOSE_OPT],
+    [NOHDR_OPT, SEP_OPT, FIELDS_OPT, INTERVAL_OPT, VERBOSE_OPT,
+     cli_option("--summary", default=False, action="store_true",
+                help=("Show lock contention statistics aggregated by lock"
+                      " level and opcode"))],
     "[--interval N]", "Show a list of locks in the master daemon"),
+  "rpc-stats": (
+    ListRpcStatistics, ARGS_NONE,
+    [NOHDR_OPT, SEP_OPT, FIELDS_OPT, INTERVAL_OPT, VERBOSE_OPT],
+    "[--interval N]", "Show statistics about RPC calls made by the master"
+    " daemon"),
+  "queue-stats": (
+    ShowQueueStatistics, ARGS_NONE,
+    [NOHDR_OPT, SEP_OPT, FIELDS_OPT, INTERVAL_OPT, VERBOSE_OPT],
+    "[--interval N]", "Show statistics about the job queue worker threads of"
+    " the master daemon"),
+  "op-profile": (
+    ShowOpProfile, ARGS_NONE,
+    [NOHDR_OPT, SEP_OPT,
+     cli_option("--jobs", dest="jobs", type="int", default=100,
+                help=("Number of most recent jobs to consider (0 for all"
+                      " jobs)"))],
+    "[--jobs N]", "Show execution profiles of recent opcodes aggregated by"
+    " opcode"),
   }
 
 #: dictionary with aliases for commands
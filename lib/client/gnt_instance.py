@@ -194,6 +194,8 @@ def GenericManyOps(operation, fn):
     if not (opts.force_multi or not multi_on
             or ConfirmOperation(inames, "instances", operation)):
       return 1
+    if getattr(opts, "batch", False) and len(inames) > 1:
+      return _BatchManyOps(cl, inames, fn, opts)
     jex = JobExecutor(verbose=multi_on, cl=cl, opts=opts)
     for name in inames:
       op = fn(name, opts)
@@ -204,6 +206,23 @@ def GenericManyOps(operation, fn):
   return realfn
 
 
+def _BatchManyOps(cl, inames, fn, opts):
+  """Runs an operation on multiple instances as a single batch job.
+
+  """
+  ops = [fn(name, opts) for name in inames]
+  SetGenericOpcodeOpts(ops, opts)
+  batch_op = opcodes.OpInstanceBatch(ops=ops)
+
+  op_results = SubmitOrSend(batch_op, opts, cl=cl)
+  rcode = constants.EXIT_SUCCESS
+  for (name, (success, result)) in zip(inames, op_results):
+    if not success:
+      ToStderr("Operation failed for instance %s: %s", name, result)
+      rcode = constants.EXIT_FAILURE
+  return rcode
+
+
 def ListInstances(opts, args):
   """List instances and their properties.
 
@@ -1580,7 +1599,8 @@ commands = {
     [FORCE_OPT, m_node_opt, m_pri_node_opt, m_sec_node_opt, m_clust_opt,
      m_node_tags_opt, m_pri_node_tags_opt, m_sec_node_tags_opt,
      m_inst_tags_opt, m_inst_opt, m_force_multi, TIMEOUT_OPT] + SUBMIT_OPTS
-    + [DRY_RUN_OPT, PRIORITY_OPT, IGNORE_OFFLINE_OPT, NO_REMEMBER_OPT],
+    + [DRY_RUN_OPT, PRIORITY_OPT, IGNORE_OFFLINE_OPT, NO_REMEMBER_OPT,
+       BATCH_OPT],
     "<instance>", "Stops an instance"),
   "startup": (
     GenericManyOps("startup", _StartupInstance), [ArgInstance()],
@@ -1589,14 +1609,15 @@ commands = {
      m_inst_tags_opt, m_clust_opt, m_inst_opt] + SUBMIT_OPTS +
     [HVOPTS_OPT,
      BACKEND_OPT, DRY_RUN_OPT, PRIORITY_OPT, IGNORE_OFFLINE_OPT,
-     NO_REMEMBER_OPT, STARTUP_PAUSED_OPT],
+     NO_REMEMBER_OPT, STARTUP_PAUSED_OPT, BATCH_OPT],
     "<instance>", "Starts an instance"),
   "reboot": (
     GenericManyOps("reboot", _RebootInstance), [ArgInstance()],
     [m_force_multi, REBOOT_TYPE_OPT, IGNORE_SECONDARIES_OPT, m_node_opt,
      m_pri_node_opt, m_sec_node_opt, m_clust_opt, m_inst_opt] + SUBMIT_OPTS +
     [m_node_tags_opt, m_pri_node_tags_opt, m_sec_node_tags_opt,
-     m_inst_tags_opt, SHUTDOWN_TIMEOUT_OPT, DRY_RUN_OPT, PRIORITY_OPT],
+     m_inst_tags_opt, SHUTDOWN_TIMEOUT_OPT, DRY_RUN_OPT, PRIORITY_OPT,
+     BATCH_OPT],
     "<instance>", "Reboots an instance"),
   "activate-disks": (
     ActivateDisks, ARGS_ONE_INSTANCE,
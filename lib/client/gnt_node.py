@@ -124,6 +124,17 @@ IGNORE_STATUS_OPT = cli_option("--ignore-status", default=False,
                                help=("Ignore the Node(s) offline status"
                                      " (potentially DANGEROUS)"))
 
+MAX_PARALLEL_OPT = cli_option("--max-parallel", default=None, type="int",
+                              dest="max_parallel", metavar="<count>",
+                              help=("Migrate up to this many instances"
+                                    " concurrently"))
+
+BANDWIDTH_BUDGET_OPT = cli_option("--bandwidth-budget", default=None,
+                                  type="int", dest="bandwidth_budget",
+                                  metavar="<MiB/s>",
+                                  help=("Total migration bandwidth shared by"
+                                        " the concurrent migrations"))
+
 
 def ConvertStorageType(user_storage_type):
   """Converts a user storage type to its internal name.
@@ -512,7 +523,9 @@ def MigrateNode(opts, args):
                              iallocator=opts.iallocator,
                              target_node=opts.dst_node,
                              allow_runtime_changes=opts.allow_runtime_chgs,
-                             ignore_ipolicy=opts.ignore_ipolicy)
+                             ignore_ipolicy=opts.ignore_ipolicy,
+                             max_parallel=opts.max_parallel,
+                             bandwidth_budget=opts.bandwidth_budget)
 
   result = SubmitOrSend(op, opts, cl=cl)
 
@@ -1114,7 +1127,7 @@ commands = {
     MigrateNode, ARGS_ONE_NODE,
     [FORCE_OPT, NONLIVE_OPT, MIGRATION_MODE_OPT, DST_NODE_OPT,
      IALLOCATOR_OPT, PRIORITY_OPT, IGNORE_IPOLICY_OPT,
-     NORUNTIME_CHGS_OPT] + SUBMIT_OPTS,
+     NORUNTIME_CHGS_OPT, MAX_PARALLEL_OPT, BANDWIDTH_BUDGET_OPT] + SUBMIT_OPTS,
     "[-f] <node>",
     "Migrate all the primary instance on a node away from it"
     " (only for instances of type drbd)"),
@@ -88,7 +88,8 @@ from ganeti.cmdlib.instance_operation import \
   LUInstanceShutdown, \
   LUInstanceReinstall, \
   LUInstanceReboot, \
-  LUInstanceConsole
+  LUInstanceConsole, \
+  LUInstanceBatch
 from ganeti.cmdlib.instance_query import \
   LUInstanceQueryData
 from ganeti.cmdlib.backup import \
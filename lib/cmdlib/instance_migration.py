@@ -180,18 +180,32 @@ class LUInstanceMigrate(LogicalUnit):
     self._ExpandAndLockInstance()
     _ExpandNamesForMigration(self)
 
+    if self.op.parallel:
+      # Migrations of different instances only need shared node locks so
+      # that several of them can run off the same node at once
+      self.share_locks[locking.LEVEL_NODE] = 1
+
     self._migrater = \
       TLMigrateInstance(self, self.op.instance_uuid, self.op.instance_name,
                         self.op.cleanup, False, self.op.allow_failover, False,
                         self.op.allow_runtime_changes,
                         constants.DEFAULT_SHUTDOWN_TIMEOUT,
-                        self.op.ignore_ipolicy)
+                        self.op.ignore_ipolicy,
+                        migration_bandwidth=self.op.migration_bandwidth)
 
     self.tasklets = [self._migrater]
 
   def DeclareLocks(self, level):
     _DeclareLocksForMigration(self, level)
 
+    if (level == locking.LEVEL_NODE_RES and self.op.parallel and
+        self.needed_locks[locking.LEVEL_NODE_RES] is not locking.ALL_SET):
+      # The submitter (e.g. L{LUNodeMigrate}) has already checked the
+      # target's free memory for all migrations of the batch, so resource
+      # locks can be shared as well. Migrations whose target is chosen by an
+      # iallocator can't be accounted for up front and keep them exclusive.
+      self.share_locks[locking.LEVEL_NODE_RES] = 1
+
   def BuildHooksEnv(self):
     """Build hooks env.
 
@@ -254,6 +268,9 @@ class TLMigrateInstance(Tasklet):
   @ivar shutdown_timeout: In case of failover timeout of the shutdown
   @type ignore_ipolicy: bool
   @ivar ignore_ipolicy: If true, we can ignore instance policy when migrating
+  @type migration_bandwidth: int
+  @ivar migration_bandwidth: If given, the bandwidth limit in MiB/s for this
+      migration, overriding the instance's hypervisor parameter
 
   """
 
@@ -263,7 +280,7 @@ class TLMigrateInstance(Tasklet):
 
   def __init__(self, lu, instance_uuid, instance_name, cleanup, failover,
                fallback, ignore_consistency, allow_runtime_changes,
-               shutdown_timeout, ignore_ipolicy):
+               shutdown_timeout, ignore_ipolicy, migration_bandwidth=None):
     """Initializes this class.
 
     """
@@ -280,6 +297,8 @@ class TLMigrateInstance(Tasklet):
     self.shutdown_timeout = shutdown_timeout
     self.ignore_ipolicy = ignore_ipolicy
     self.allow_runtime_changes = allow_runtime_changes
+    self.migration_bandwidth = migration_bandwidth
+    self.migration_hvparams = None
 
   def CheckPrereq(self):
     """Check prerequisites.
@@ -439,6 +458,24 @@ class TLMigrateInstance(Tasklet):
       # Failover is never live
       self.live = False
 
+    if self.migration_bandwidth is not None and not self.failover:
+      i_hv = cluster.FillHV(self.instance, skip_globals=False)
+      if constants.HV_MIGRATION_BANDWIDTH not in i_hv:
+        self.lu.LogWarning("Hypervisor '%s' does not support limiting the"
+                           " migration bandwidth, ignoring the limit",
+                           self.instance.hypervisor)
+      else:
+        self.migration_hvparams = {
+          constants.HV_MIGRATION_BANDWIDTH: self.migration_bandwidth,
+          }
+        if i_hv.get(constants.HV_KVM_MIGRATION_ESCALATION):
+          # Escalation raises the bandwidth beyond the requested limit
+          self.lu.LogInfo("Disabling migration escalation to stay within the"
+                          " bandwidth limit of %s MiB/s",
+                          self.migration_bandwidth)
+          self.migration_hvparams[constants.HV_KVM_MIGRATION_ESCALATION] = \
+            False
+
     if not (self.failover or self.cleanup):
       remote_info = self.rpc.call_instance_info(
           self.instance.primary_node, self.instance.name,
@@ -739,7 +776,8 @@ class TLMigrateInstance(Tasklet):
                      self.cfg.GetNodeName(self.target_node_uuid))
     cluster = self.cfg.GetClusterInfo()
     result = self.rpc.call_instance_migrate(
-        self.source_node_uuid, cluster.cluster_name, self.instance,
+        self.source_node_uuid, cluster.cluster_name,
+        (self.instance, self.migration_hvparams, None),
         self.nodes_ip[self.target_node_uuid], self.live)
     msg = result.fail_msg
     if msg:
@@ -755,7 +793,8 @@ class TLMigrateInstance(Tasklet):
     last_feedback = time.time()
     while True:
       result = self.rpc.call_instance_get_migration_status(
-                 self.source_node_uuid, self.instance)
+                 self.source_node_uuid,
+                 (self.instance, self.migration_hvparams, None))
       msg = result.fail_msg
       ms = result.payload   # MigrationStatus instance
       if msg or (ms.status in constants.HV_MIGRATION_FAILED_STATUSES):
@@ -777,7 +816,20 @@ class TLMigrateInstance(Tasklet):
                                self._MIGRATION_FEEDBACK_INTERVAL) and
           ms.transferred_ram is not None):
         mem_progress = 100 * float(ms.transferred_ram) / float(ms.total_ram)
-        self.feedback_fn("* memory transfer progress: %.2f %%" % mem_progress)
+        details = []
+        if ms.remaining_ram is not None:
+          details.append("%s remaining" %
+                         utils.FormatUnit(int(ms.remaining_ram) / 1024, "h"))
+        if ms.dirty_rate is not None:
+          details.append("%s pages/s dirtied" % ms.dirty_rate)
+        if ms.iterations is not None:
+          details.append("pass %s" % ms.iterations)
+        if details:
+          self.feedback_fn("* memory transfer progress: %.2f %% (%s)" %
+                           (mem_progress, utils.CommaJoin(details)))
+        else:
+          self.feedback_fn("* memory transfer progress: %.2f %%" %
+                           mem_progress)
         last_feedback = time.time()
 
       time.sleep(self._MIGRATION_POLL_INTERVAL)
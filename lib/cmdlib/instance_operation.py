@@ -28,11 +28,13 @@ running instance directly.
 
 import logging
 
+from ganeti import compat
 from ganeti import constants
 from ganeti import errors
 from ganeti import hypervisor
 from ganeti import locking
 from ganeti import objects
+from ganeti import opcodes
 from ganeti import utils
 from ganeti.cmdlib.base import LogicalUnit, NoHooksLU
 from ganeti.cmdlib.common import INSTANCE_ONLINE, INSTANCE_DOWN, \
@@ -149,8 +151,12 @@ class LUInstanceStartup(LogicalUnit):
             bep[constants.BE_MINMEM], self.instance.hypervisor,
             self.cfg.GetClusterInfo().hvparams[self.instance.hypervisor])
 
-  def Exec(self, feedback_fn):
-    """Start the instance.
+  def PrepareStart(self):
+    """Marks the instance as started and activates its disks.
+
+    @rtype: bool
+    @return: Whether the instance still needs to be started on its primary
+      node
 
     """
     if not self.op.no_remember:
@@ -159,18 +165,33 @@ class LUInstanceStartup(LogicalUnit):
     if self.primary_offline:
       assert self.op.ignore_offline_nodes
       self.LogInfo("Primary node offline, marked instance as started")
-    else:
-      StartInstanceDisks(self, self.instance, self.op.force)
+      return False
+
+    StartInstanceDisks(self, self.instance, self.op.force)
+    return True
+
+  def FinishStart(self, msg):
+    """Handles the result of starting the instance on its primary node.
 
+    @type msg: string or None
+    @param msg: Error message if the instance could not be started
+
+    """
+    if msg:
+      ShutdownInstanceDisks(self, self.instance)
+      raise errors.OpExecError("Could not start instance: %s" % msg)
+
+  def Exec(self, feedback_fn):
+    """Start the instance.
+
+    """
+    if self.PrepareStart():
       result = \
         self.rpc.call_instance_start(self.instance.primary_node,
                                      (self.instance, self.op.hvparams,
                                       self.op.beparams),
                                      self.op.startup_paused, self.op.reason)
-      msg = result.fail_msg
-      if msg:
-        ShutdownInstanceDisks(self, self.instance)
-        raise errors.OpExecError("Could not start instance: %s" % msg)
+      self.FinishStart(result.fail_msg)
 
 
 class LUInstanceShutdown(LogicalUnit):
@@ -224,8 +245,12 @@ class LUInstanceShutdown(LogicalUnit):
     else:
       CheckNodeOnline(self, self.instance.primary_node)
 
-  def Exec(self, feedback_fn):
-    """Shutdown the instance.
+  def PrepareShutdown(self):
+    """Marks the instance as stopped.
+
+    @rtype: bool
+    @return: Whether the instance still needs to be stopped on its primary
+      node
 
     """
     # If the instance is offline we shouldn't mark it as down, as that
@@ -236,16 +261,32 @@ class LUInstanceShutdown(LogicalUnit):
     if self.primary_offline:
       assert self.op.ignore_offline_nodes
       self.LogInfo("Primary node offline, marked instance as stopped")
-    else:
+      return False
+
+    return True
+
+  def FinishShutdown(self, msg):
+    """Handles the result of stopping the instance on its primary node.
+
+    @type msg: string or None
+    @param msg: Error message if the instance could not be stopped
+
+    """
+    if msg:
+      self.LogWarning("Could not shutdown instance: %s", msg)
+
+    ShutdownInstanceDisks(self, self.instance)
+
+  def Exec(self, feedback_fn):
+    """Shutdown the instance.
+
+    """
+    if self.PrepareShutdown():
       result = self.rpc.call_instance_shutdown(
         self.instance.primary_node,
         self.instance,
         self.op.timeout, self.op.reason)
-      msg = result.fail_msg
-      if msg:
-        self.LogWarning("Could not shutdown instance: %s", msg)
-
-      ShutdownInstanceDisks(self, self.instance)
+      self.FinishShutdown(result.fail_msg)
 
 
 class LUInstanceReinstall(LogicalUnit):
@@ -430,6 +471,229 @@ class LUInstanceReboot(LogicalUnit):
     self.cfg.MarkInstanceUp(self.instance.uuid)
 
 
+def _MergeLockNames(values):
+  """Merges the lock names several logical units need at one level.
+
+  @param values: list of lock names as declared in C{needed_locks}, i.e.
+    L{locking.ALL_SET}, a single name or a list of names
+  @return: L{locking.ALL_SET} if any of the values is L{locking.ALL_SET},
+    otherwise the sorted union of all names
+
+  """
+  names = set()
+  for value in values:
+    if value == locking.ALL_SET:
+      return locking.ALL_SET
+    elif isinstance(value, basestring):
+      names.add(value)
+    else:
+      names.update(value)
+  return sorted(names)
+
+
+class LUInstanceBatch(NoHooksLU):
+  """Runs operations on multiple instances.
+
+  The locks needed by all batched operations are acquired at once, and the
+  configuration is only written once at the end. Instances are started or
+  stopped with a single RPC per primary node. Each operation still runs its
+  own prerequisite checks and hooks, and fails independently of the others.
+
+  """
+  REQ_BGL = False
+
+  _BATCH_OPCODES = compat.UniqueFrozenset([
+    opcodes.OpInstanceStartup,
+    opcodes.OpInstanceShutdown,
+    opcodes.OpInstanceReboot,
+    ])
+
+  def CheckArguments(self):
+    if not self.op.ops:
+      raise errors.OpPrereqError("No operations given", errors.ECODE_INVAL)
+
+    for op in self.op.ops:
+      if op.__class__ not in self._BATCH_OPCODES:
+        raise errors.OpPrereqError("Opcode %s can't be batched" % op.OP_ID,
+                                   errors.ECODE_INVAL)
+
+    self.lus = [self.proc.DISPATCH_TABLE[op.__class__](self.proc, op,
+                                                         self.context,
+                                                         self.rpc)
+                for op in self.op.ops]
+
+  def _MergeLocks(self, level):
+    """Declares the union of the locks the batched operations need.
+
+    """
+    lus = [lu for lu in self.lus if level in lu.needed_locks]
+    if lus:
+      self.needed_locks[level] = \
+        _MergeLockNames([lu.needed_locks[level] for lu in lus])
+      self.share_locks[level] = int(compat.all(lu.share_locks[level]
+                                               for lu in lus))
+
+  def ExpandNames(self):
+    self.needed_locks = {}
+
+    # Instance names are only expanded by the batched operations, so that
+    # a short name and a full name of the same instance are detected here
+    instance_uuids = set()
+    for lu in self.lus:
+      lu.ExpandNames()
+      if lu.op.instance_uuid in instance_uuids:
+        raise errors.OpPrereqError("Instance '%s' is given more than once" %
+                                   lu.op.instance_name, errors.ECODE_INVAL)
+      instance_uuids.add(lu.op.instance_uuid)
+
+    for level in locking.LEVELS:
+      self._MergeLocks(level)
+
+  def DeclareLocks(self, level):
+    for lu in self.lus:
+      if level in lu.needed_locks:
+        lu.DeclareLocks(level)
+    self._MergeLocks(level)
+
+  def CheckPrereq(self):
+    """Check prerequisites.
+
+    This runs the prerequisite checks of all batched operations.
+
+    """
+    self.results = [None] * len(self.lus)
+    for (idx, lu) in enumerate(self.lus):
+      try:
+        lu.CheckPrereq()
+      except errors.OpPrereqError, err:
+        self.LogWarning("Operation %s on instance %s can't be run: %s",
+                        lu.op.OP_ID, lu.op.instance_name, err)
+        self.results[idx] = (False, str(err))
+
+    self.dry_run_result = [result or (True, None) for result in self.results]
+
+  @staticmethod
+  def _GetNodeOpKey(lu):
+    """Returns the key grouping operations run with a single RPC per node.
+
+    Operations can only share an RPC if they have the same primary node and
+    the same RPC arguments besides the instances. The reason trails of the
+    operations are not compared, as each of them carries its own timestamp;
+    the batch's reason trail is sent instead.
+
+    @return: C{None} if the operation is run on its own, otherwise a tuple
+      whose first element is the operation's class and second element the
+      primary node's UUID
+
+    """
+    if isinstance(lu, LUInstanceStartup):
+      return (LUInstanceStartup, lu.instance.primary_node,
+              lu.op.startup_paused)
+    elif isinstance(lu, LUInstanceShutdown):
+      return (LUInstanceShutdown, lu.instance.primary_node, lu.op.timeout)
+    else:
+      return None
+
+  def _FinishOp(self, idx, hm, feedback_fn, result):
+    """Runs the post-execution hooks of an operation and records its result.
+
+    """
+    lu = self.lus[idx]
+    h_results = hm.RunPhase(constants.HOOKS_PHASE_POST)
+    result = lu.HooksCallBack(constants.HOOKS_PHASE_POST, h_results,
+                              feedback_fn, result)
+    self.results[idx] = (True, result)
+
+  def _FailOp(self, idx, err):
+    """Records the failure of an operation.
+
+    """
+    lu = self.lus[idx]
+    self.LogWarning("Operation %s on instance %s failed: %s",
+                    lu.op.OP_ID, lu.op.instance_name, err)
+    self.results[idx] = (False, str(err))
+
+  def _RunNodeOps(self, key, entries, feedback_fn):
+    """Starts or stops several instances of a node with a single RPC.
+
+    @param key: Operation key, see L{_GetNodeOpKey}
+    @type entries: list of tuples
+    @param entries: Index and hooks manager of each operation
+
+    """
+    lus = [self.lus[idx] for (idx, _) in entries]
+    (lu_class, node_uuid) = key[:2]
+    reason = self.op.reason
+
+    if lu_class is LUInstanceStartup:
+      result = self.rpc.call_instance_start_multi(
+        node_uuid,
+        [(lu.instance, lu.op.hvparams, lu.op.beparams) for lu in lus],
+        lus[0].op.startup_paused, reason)
+    else:
+      result = self.rpc.call_instance_shutdown_multi(
+        node_uuid, [lu.instance for lu in lus], lus[0].op.timeout, reason)
+
+    if result.fail_msg:
+      msgs = [result.fail_msg] * len(lus)
+    else:
+      msgs = [msg for (_, msg) in result.payload]
+
+    assert len(entries) == len(lus) == len(msgs), \
+      "Node %s returned %s results for %s instances" % \
+      (node_uuid, len(msgs), len(lus))
+
+    for ((idx, hm), lu, msg) in zip(entries, lus, msgs):
+      try:
+        if lu_class is LUInstanceStartup:
+          lu.FinishStart(msg)
+        else:
+          lu.FinishShutdown(msg)
+        self._FinishOp(idx, hm, feedback_fn, None)
+      except errors.GenericError, err:
+        self._FailOp(idx, err)
+
+  def Exec(self, feedback_fn):
+    """Runs the batched operations.
+
+    """
+    # Operations waiting for their instances to be started or stopped,
+    # grouped by L{_GetNodeOpKey}
+    node_ops = {}
+
+    self.cfg.DeferWrites()
+    try:
+      for (idx, lu) in enumerate(self.lus):
+        if self.results[idx] is not None:
+          continue
+
+        feedback_fn("* running %s on instance %s" %
+                    (lu.op.OP_ID, lu.op.instance_name))
+        try:
+          hm = self.proc.BuildHooksManager(lu)
+          h_results = hm.RunPhase(constants.HOOKS_PHASE_PRE)
+          lu.HooksCallBack(constants.HOOKS_PHASE_PRE, h_results,
+                           feedback_fn, None)
+
+          key = self._GetNodeOpKey(lu)
+          if key is None:
+            self._FinishOp(idx, hm, feedback_fn, lu.Exec(feedback_fn))
+          elif ((key[0] is LUInstanceStartup and lu.PrepareStart()) or
+                (key[0] is LUInstanceShutdown and lu.PrepareShutdown())):
+            node_ops.setdefault(key, []).append((idx, hm))
+          else:
+            self._FinishOp(idx, hm, feedback_fn, None)
+        except errors.GenericError, err:
+          self._FailOp(idx, err)
+
+      for (key, entries) in node_ops.items():
+        self._RunNodeOps(key, entries, feedback_fn)
+    finally:
+      self.cfg.FlushWrites(feedback_fn=feedback_fn)
+
+    return self.results
+
+
 def GetInstanceConsole(cluster, instance, primary_node, node_group):
   """Returns console information for an instance.
 
@@ -295,7 +295,9 @@ class ExtStorageQuery(QueryBase):
     valid_nodes = [node.uuid
                    for node in lu.cfg.GetAllNodesInfo().values()
                    if not node.offline and node.vm_capable]
-    pol = self._DiagnoseByProvider(lu.rpc.call_extstorage_diagnose(valid_nodes))
+    # Nodes not answering in time are reported like failed ones
+    pol = self._DiagnoseByProvider(
+      lu.rpc.call_extstorage_diagnose(valid_nodes, adaptive_timeout=True))
 
     data = {}
 
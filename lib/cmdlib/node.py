@@ -44,6 +44,7 @@ from ganeti.cmdlib.common import CheckParamsNotGlobal, \
   GetWantedNodes, MapInstanceLvsToNodes, RunPostHook, \
   FindFaultyInstanceDisks, CheckStorageTypeEnabled, CreateNewClientCert, \
   AddNodeCertToCandidateCerts, RemoveNodeCertFromCandidateCerts
+from ganeti.cmdlib.instance_utils import CheckNodeFreeMemory
 
 
 def _DecideSelfPromotion(lu, exceptions=None):
@@ -1073,12 +1074,23 @@ class LUNodeMigrate(LogicalUnit):
   REQ_BGL = False
 
   def CheckArguments(self):
-    pass
+    if (self.op.bandwidth_budget is not None and
+        self.op.bandwidth_budget < (self.op.max_parallel or 1)):
+      raise errors.OpPrereqError("A bandwidth budget of %s MiB/s is too small"
+                                 " for %s parallel migrations" %
+                                 (self.op.bandwidth_budget,
+                                  self.op.max_parallel or 1),
+                                 errors.ECODE_INVAL)
 
   def ExpandNames(self):
     (self.op.node_uuid, self.op.node_name) = \
       ExpandNodeUuidAndName(self.cfg, self.op.node_uuid, self.op.node_name)
 
+    if self.op.target_node is not None:
+      (self.op.target_node_uuid, self.op.target_node) = \
+        ExpandNodeUuidAndName(self.cfg, self.op.target_node_uuid,
+                              self.op.target_node)
+
     self.share_locks = ShareAll()
     self.needed_locks = {
       locking.LEVEL_NODE: [self.op.node_uuid],
@@ -1103,20 +1115,69 @@ class LUNodeMigrate(LogicalUnit):
     return (nl, nl)
 
   def CheckPrereq(self):
-    pass
+    """Check prerequisites.
+
+    Parallel migrations share the resource locks of their target nodes, so
+    each target node must have enough free memory for all instances
+    migrating onto it at once.
+
+    """
+    if self.op.max_parallel is None:
+      return
+
+    cluster = self.cfg.GetClusterInfo()
+    requested = {}
+    for inst in _GetNodePrimaryInstances(self.cfg, self.op.node_uuid):
+      if inst.disk_template in constants.DTS_INT_MIRROR:
+        target_node_uuid = inst.secondary_nodes[0]
+      elif (inst.disk_template in constants.DTS_EXT_MIRROR and
+            self.op.target_node is not None):
+        target_node_uuid = self.op.target_node_uuid
+      else:
+        # Either the iallocator chooses the target node for every single
+        # migration, or the instance can't be migrated at all
+        continue
+
+      key = (target_node_uuid, inst.hypervisor)
+      requested[key] = (requested.get(key, 0) +
+                        cluster.FillBE(inst)[constants.BE_MINMEM])
+
+    for ((target_node_uuid, hvname), memory) in sorted(requested.items()):
+      CheckNodeFreeMemory(self, target_node_uuid,
+                          "migrating instances from node %s" %
+                          self.op.node_name,
+                          memory, hvname, cluster.hvparams[hvname])
 
   def Exec(self, feedback_fn):
+    max_parallel = self.op.max_parallel
+
+    if self.op.bandwidth_budget is None:
+      migration_bandwidth = None
+    else:
+      # Concurrent migrations share the budget evenly
+      migration_bandwidth = self.op.bandwidth_budget / (max_parallel or 1)
+
     # Prepare jobs for migration instances
-    jobs = [
-      [opcodes.OpInstanceMigrate(
+    jobs = []
+    for inst in _GetNodePrimaryInstances(self.cfg, self.op.node_uuid):
+      if max_parallel is not None and len(jobs) >= max_parallel:
+        # Start only once the migration submitted max_parallel jobs earlier
+        # has finished, whatever its outcome
+        depends = [(-max_parallel, list(constants.JOBS_FINALIZED))]
+      else:
+        depends = None
+
+      jobs.append([opcodes.OpInstanceMigrate(
         instance_name=inst.name,
         mode=self.op.mode,
         live=self.op.live,
         iallocator=self.op.iallocator,
         target_node=self.op.target_node,
         allow_runtime_changes=self.op.allow_runtime_changes,
-        ignore_ipolicy=self.op.ignore_ipolicy)]
-      for inst in _GetNodePrimaryInstances(self.cfg, self.op.node_uuid)]
+        ignore_ipolicy=self.op.ignore_ipolicy,
+        parallel=max_parallel is not None,
+        migration_bandwidth=migration_bandwidth,
+        depends=depends)])
 
     # TODO: Run iallocator in this opcode and pass correct placement options to
     # OpInstanceMigrate. Since other jobs can modify the cluster between
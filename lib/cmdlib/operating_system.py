@@ -103,7 +103,9 @@ class OsQuery(QueryBase):
     valid_node_uuids = [node.uuid
                         for node in lu.cfg.GetAllNodesInfo().values()
                         if not node.offline and node.vm_capable]
-    pol = self._DiagnoseByOS(lu.rpc.call_os_diagnose(valid_node_uuids))
+    # Nodes not answering in time are reported like failed ones
+    pol = self._DiagnoseByOS(lu.rpc.call_os_diagnose(valid_node_uuids,
+                                                     adaptive_timeout=True))
     cluster = lu.cfg.GetClusterInfo()
 
     data = {}
@@ -40,6 +40,7 @@ import random
 import logging
 import time
 import itertools
+import threading
 
 from ganeti import errors
 from ganeti import locking
@@ -60,6 +61,21 @@ _config_lock = locking.SharedLock("ConfigWriter")
 # job id used for resource management at config upgrade time
 _UPGRADE_CONFIG_JID = "jid-cfg-upgrade"
 
+#: Per-thread total time spent writing and distributing the configuration
+_thread_write_time = threading.local()
+
+
+def GetThreadWriteTime():
+  """Returns the total time the calling thread spent writing the config.
+
+  This includes the time needed to distribute the configuration and ssconf
+  files to other nodes.
+
+  @rtype: float
+
+  """
+  return getattr(_thread_write_time, "total", 0.0)
+
 
 def _ValidateConfig(data):
   """Verifies that a configuration objects looks valid.
@@ -202,6 +218,7 @@ class ConfigWriter(object):
     self._last_cluster_serial = -1
     self._cfg_id = None
     self._context = None
+    self._deferred_writes = threading.local()
     self._OpenConfig(accept_foreign)
 
   def _GetRpc(self, address_list):
@@ -2467,12 +2484,40 @@ class ConfigWriter(object):
 
     return not bad
 
+  def DeferWrites(self):
+    """Defers configuration writes done by the calling thread.
+
+    Until L{FlushWrites} is called, modifications made by the calling thread
+    only update the in-memory configuration; the file is written and
+    distributed once when flushing.
+
+    """
+    self._deferred_writes.active = True
+    self._deferred_writes.pending = False
+
+  @locking.ssynchronized(_config_lock)
+  def FlushWrites(self, feedback_fn=None):
+    """Ends deferring writes and writes the configuration if needed.
+
+    """
+    pending = getattr(self._deferred_writes, "pending", False)
+    self._deferred_writes.active = False
+    self._deferred_writes.pending = False
+    if pending:
+      self._WriteConfig(feedback_fn=feedback_fn)
+
   def _WriteConfig(self, destination=None, feedback_fn=None):
     """Write the configuration data to persistent storage.
 
     """
     assert feedback_fn is None or callable(feedback_fn)
 
+    if destination is None and getattr(self._deferred_writes, "active", False):
+      self._deferred_writes.pending = True
+      return
+
+    start = time.time()
+
     # Warn on config errors, but don't abort the save - the
     # configuration has already been modified, and we can't revert;
     # the best we can do is to warn the user and save as is, leaving
@@ -2527,6 +2572,8 @@ class ConfigWriter(object):
 
       self._last_cluster_serial = self._config_data.cluster.serial_no
 
+    _thread_write_time.total = GetThreadWriteTime() + (time.time() - start)
+
   def _GetAllHvparamsStrings(self, hypervisors):
     """Get the hvparams of all given hypervisors from the config.
 
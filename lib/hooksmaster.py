@@ -23,6 +23,9 @@
 
 """
 
+import threading
+import time
+
 from ganeti import constants
 from ganeti import errors
 from ganeti import utils
@@ -44,6 +47,96 @@ def _RpcResultsToHooksResults(rpc_results):
               for (node, rpc_res) in rpc_results.items())
 
 
+class HooksManifestCache(object):
+  """Cache for the hook directories containing scripts on each node.
+
+  Nodes report which of their hook directories contain runnable scripts (see
+  L{backend.HooksRunner.GetManifest}). Using this information, running hooks
+  can be skipped on nodes without scripts for the hooks path. Reports are
+  kept for a limited time, so newly installed hook scripts may be ignored for
+  up to that long.
+
+  """
+  def __init__(self, ttl, _time_fn=time.time):
+    """Initializes this class.
+
+    @type ttl: number
+    @param ttl: Time in seconds for which a node's report is used
+
+    """
+    self._ttl = ttl
+    self._time_fn = _time_fn
+    self._lock = threading.Lock()
+    self._manifests = {}
+
+  def _GetManifests(self, manifest_fn, node_names):
+    """Returns the hook directories with scripts for a list of nodes.
+
+    @type manifest_fn: callable
+    @param manifest_fn: Function receiving a list of node names and returning
+      a dictionary mapping node names to their manifest; nodes whose manifest
+      couldn't be retrieved are left out
+    @rtype: dict
+    @return: Dictionary mapping node names to a set of directory names; nodes
+      whose manifest is not known are left out
+
+    """
+    now = self._time_fn()
+    result = {}
+    missing = []
+
+    self._lock.acquire()
+    try:
+      for name in node_names:
+        entry = self._manifests.get(name, None)
+        if entry is None or entry[0] <= now:
+          missing.append(name)
+        else:
+          result[name] = entry[1]
+    finally:
+      self._lock.release()
+
+    if missing:
+      fetched = dict((name, frozenset(manifest))
+                     for (name, manifest) in manifest_fn(missing).items())
+
+      self._lock.acquire()
+      try:
+        for (name, dirs) in fetched.items():
+          self._manifests[name] = (now + self._ttl, dirs)
+      finally:
+        self._lock.release()
+
+      result.update(fetched)
+
+    return result
+
+  def FilterNodes(self, manifest_fn, node_names, hpath, phase):
+    """Returns the nodes which may have hook scripts for a hooks path.
+
+    Nodes whose manifest couldn't be retrieved are always returned.
+
+    @type manifest_fn: callable
+    @param manifest_fn: See L{_GetManifests}
+    @type node_names: list of strings
+    @param node_names: Node names
+    @type hpath: string
+    @param hpath: Hooks path
+    @type phase: string
+    @param phase: Hooks phase
+    @rtype: list of strings
+
+    """
+    # Hook directories are named after the path and the phase, see
+    # L{backend.HooksRunner.RunHooks}
+    subdir = "%s-%s.d" % (hpath, phase)
+
+    manifests = self._GetManifests(manifest_fn, node_names)
+
+    return [name for name in node_names
+            if name not in manifests or subdir in manifests[name]]
+
+
 class HooksMaster(object):
   def __init__(self, opcode, hooks_path, nodes, hooks_execution_fn,
                hooks_results_adapt_fn, build_env_fn, log_fn, htype=None,
@@ -52,6 +52,7 @@ HTTP_PUT = "PUT"
 HTTP_DELETE = "DELETE"
 
 HTTP_ETAG = "ETag"
+HTTP_IF_NONE_MATCH = "If-None-Match"
 HTTP_HOST = "Host"
 HTTP_SERVER = "Server"
 HTTP_DATE = "Date"
@@ -64,9 +65,11 @@ HTTP_WWW_AUTHENTICATE = "WWW-Authenticate"
 HTTP_AUTHORIZATION = "Authorization"
 HTTP_AUTHENTICATION_INFO = "Authentication-Info"
 HTTP_ALLOW = "Allow"
+HTTP_ACCEPT = "Accept"
 
 HTTP_APP_OCTET_STREAM = "application/octet-stream"
 HTTP_APP_JSON = "application/json"
+HTTP_APP_GANETI_RPC = "application/x-ganeti-rpc"
 
 _SSL_UNEXPECTED_EOF = "Unexpected EOF"
 
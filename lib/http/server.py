@@ -85,6 +85,7 @@ class _HttpServerRequest(object):
     self.request_body = body
 
     # Response attributes
+    self.resp_code = http.HTTP_OK
     self.resp_headers = {}
 
     # Private data for request handler (useful in combination with
@@ -247,7 +248,7 @@ def _HandleServerRequestInner(handler, req_msg):
     if not isinstance(result, basestring):
       raise http.HttpError("Handler function didn't return string type")
 
-    return (http.HTTP_OK, handler_context.resp_headers, result)
+    return (handler_context.resp_code, handler_context.resp_headers, result)
   finally:
     # No reason to keep this any longer, even for exceptions
     handler_context.private = None
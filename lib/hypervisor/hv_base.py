@@ -39,12 +39,14 @@ dict is the same, see the docstring for L{BaseHypervisor.PARAMETERS}.
 
 import os
 import re
+import time
 import logging
 
 
 from ganeti import errors
 from ganeti import utils
 from ganeti import constants
+from ganeti import serializer
 
 
 def _IsCpuMaskWellFormed(cpu_mask):
@@ -152,6 +154,183 @@ def ParamInSet(required, my_set):
   return (required, fn, err, None, None)
 
 
+_SYSFS_NODE_RE = re.compile(r"^node(\d+)$")
+_SYSFS_CPU_RE = re.compile(r"^cpu(\d+)$")
+
+
+def _ListSysfsEntries(path, regex):
+  """Lists the numbered entries of a sysfs directory.
+
+  @type path: string
+  @param path: directory to list
+  @param regex: compiled regular expression with the entry number as its
+      first group
+  @rtype: list of (int, string)
+  @return: sorted list of (number, entry path); empty if the directory
+      does not exist
+
+  """
+  try:
+    names = os.listdir(path)
+  except EnvironmentError:
+    return []
+
+  result = []
+  for name in names:
+    m = regex.match(name)
+    if m:
+      result.append((int(m.group(1)), utils.PathJoin(path, name)))
+  return sorted(result)
+
+
+def _GetLinuxCpuTopology(cpudir):
+  """Computes the CPU topology from sysfs.
+
+  @type cpudir: string
+  @param cpudir: path of the sysfs CPU directory
+  @rtype: tuple or None
+  @return: (sockets, cores per socket, threads per core), or C{None} if the
+      topology is not exported
+
+  """
+  threads = {}
+  for (_, path) in _ListSysfsEntries(cpudir, _SYSFS_CPU_RE):
+    try:
+      package = int(utils.ReadOneLineFile(
+        utils.PathJoin(path, "topology", "physical_package_id")))
+      core = int(utils.ReadOneLineFile(
+        utils.PathJoin(path, "topology", "core_id")))
+    except (EnvironmentError, ValueError, errors.GenericError):
+      # Offline CPUs don't export their topology
+      continue
+    threads[(package, core)] = threads.get((package, core), 0) + 1
+
+  if not threads:
+    return None
+
+  sockets = len(set(package for (package, _) in threads))
+  return (sockets, len(threads) / sockets, max(threads.values()))
+
+
+def _GetLinuxNumaNodes(nodedir, hugepage_size):
+  """Collects per-NUMA node memory and CPU information from sysfs.
+
+  @type nodedir: string
+  @param nodedir: path of the sysfs NUMA node directory
+  @type hugepage_size: int or None
+  @param hugepage_size: size of a huge page in kB, if known
+  @rtype: list of dict
+  @return: one dict per NUMA node, see L{BaseHypervisor.GetLinuxNodeInfo};
+      empty if NUMA information is not exported or can't be read
+
+  """
+  result = []
+  for (node_id, path) in _ListSysfsEntries(nodedir, _SYSFS_NODE_RE):
+    try:
+      meminfo = utils.ReadFile(utils.PathJoin(path, "meminfo"))
+      cpulist = utils.ReadFile(utils.PathJoin(path, "cpulist")).strip()
+    except EnvironmentError, err:
+      logging.error("Failed to read NUMA node %s info: %s", node_id, err)
+      return []
+
+    # Lines look like "Node 0 MemTotal:       16306508 kB"
+    values = {}
+    for line in meminfo.splitlines():
+      splitfields = line.split(":", 1)
+      if len(splitfields) > 1 and splitfields[1].split():
+        values[splitfields[0].split()[-1]] = splitfields[1].split()[0]
+
+    try:
+      node = {
+        "id": node_id,
+        "memory_total": int(values["MemTotal"]) / 1024,
+        "memory_free": int(values["MemFree"]) / 1024,
+        "cpus": utils.ParseCpuMask(cpulist),
+        }
+      if hugepage_size is not None and "HugePages_Total" in values:
+        node["hugepages_total"] = \
+          int(values["HugePages_Total"]) * hugepage_size / 1024
+        node["hugepages_free"] = \
+          int(values["HugePages_Free"]) * hugepage_size / 1024
+    except (KeyError, ValueError, TypeError, errors.ParseError), err:
+      logging.error("Failed to parse NUMA node %s info: %s", node_id, err)
+      return []
+    result.append(node)
+
+  return result
+
+
+class TimedFileCache(object):
+  """Caches a value in a JSON file for a limited time.
+
+  The cache is kept in a file, as the node daemon forks for each request.
+
+  """
+  def __init__(self, filename, ttl):
+    """Initializes this class.
+
+    @type filename: string
+    @param filename: path of the cache file
+    @type ttl: float
+    @param ttl: number of seconds the cached value is valid for
+
+    """
+    self.filename = filename
+    self._ttl = ttl
+
+  def Get(self, key=None, _now=None):
+    """Returns the cached value.
+
+    @param key: value identifying how the cached value was retrieved, which
+      must be equal to the one it was stored with
+    @return: the cached value, or C{None} if there is no valid cache
+
+    """
+    if _now is None:
+      _now = time.time()
+
+    try:
+      cache = serializer.LoadJson(utils.ReadFile(self.filename))
+      age = _now - cache["timestamp"]
+      cached_key = cache["key"]
+      value = cache["value"]
+    except (EnvironmentError, ValueError, KeyError, TypeError):
+      return None
+
+    if cached_key != key or not 0 <= age < self._ttl:
+      return None
+
+    return value
+
+  def Put(self, value, key=None, _now=None):
+    """Caches a value.
+
+    @param value: the value, which must be serializable to JSON
+    @param key: see L{Get}
+    @type _now: float
+    @param _now: the time at which the value was retrieved
+
+    """
+    if _now is None:
+      _now = time.time()
+
+    try:
+      utils.WriteFile(self.filename,
+                      data=serializer.DumpJson({
+                        "timestamp": _now,
+                        "key": key,
+                        "value": value,
+                        }))
+    except EnvironmentError, err:
+      logging.warning("Can't write cache file %s: %s", self.filename, err)
+
+  def Invalidate(self):
+    """Removes the cached value.
+
+    """
+    utils.RemoveFile(self.filename)
+
+
 class HvInstanceState(object):
   RUNNING = 0
   SHUTDOWN = 1
@@ -273,6 +452,12 @@ class BaseHypervisor(object):
           - cpu_dom0: number of CPUs used by the node OS
           - cpu_nodes: number of NUMA domains
           - cpu_sockets: number of physical CPU sockets
+        and optionally:
+          - cpu_cores_per_socket: number of physical cores per socket
+          - cpu_threads_per_core: number of hardware threads per core
+          - hugepages_total: memory reserved for huge pages
+          - hugepages_free: memory available as free huge pages
+          - numa_nodes: per-NUMA node information, see L{GetLinuxNodeInfo}
 
     """
     raise NotImplementedError
@@ -493,7 +678,9 @@ class BaseHypervisor(object):
     raise NotImplementedError
 
   @staticmethod
-  def GetLinuxNodeInfo(meminfo="/proc/meminfo", cpuinfo="/proc/cpuinfo"):
+  def GetLinuxNodeInfo(meminfo="/proc/meminfo", cpuinfo="/proc/cpuinfo",
+                       nodedir="/sys/devices/system/node",
+                       cpudir="/sys/devices/system/cpu"):
     """For linux systems, return actual OS information.
 
     This is an abstraction for all non-hypervisor-based classes, where
@@ -506,6 +693,10 @@ class BaseHypervisor(object):
     @type meminfo: string
     @param cpuinfo: name of the file containing cpuinfo
     @type cpuinfo: string
+    @param nodedir: name of the sysfs directory containing the NUMA nodes
+    @type nodedir: string
+    @param cpudir: name of the sysfs directory containing the CPUs
+    @type cpudir: string
     @return: a dict with the following keys (values in MiB):
           - memory_total: the total memory size on the node
           - memory_free: the available memory on the node for instances
@@ -514,6 +705,16 @@ class BaseHypervisor(object):
           - cpu_dom0: number of CPUs used by the node OS
           - cpu_nodes: number of NUMA domains
           - cpu_sockets: number of physical CPU sockets
+          - hugepages_total: memory reserved for huge pages, if available
+          - hugepages_free: memory available as free huge pages, if
+            available
+        and, if the CPU topology is exported by the kernel:
+          - cpu_cores_per_socket: number of physical cores per socket
+          - cpu_threads_per_core: number of hardware threads per core
+        and, if NUMA information is exported by the kernel:
+          - numa_nodes: a list of dicts with the keys C{id}, C{memory_total},
+            C{memory_free}, C{cpus} (list of CPU IDs) and, if available,
+            C{hugepages_total} and C{hugepages_free}
 
     """
     try:
@@ -523,6 +724,7 @@ class BaseHypervisor(object):
 
     result = {}
     sum_free = 0
+    hugepages = {}
     try:
       for line in data:
         splitfields = line.split(":", 1)
@@ -536,11 +738,20 @@ class BaseHypervisor(object):
             sum_free += int(val.split()[0]) / 1024
           elif key == "Active":
             result["memory_dom0"] = int(val.split()[0]) / 1024
+          elif key in ("HugePages_Total", "HugePages_Free", "Hugepagesize"):
+            hugepages[key] = int(val.split()[0])
     except (ValueError, TypeError), err:
       raise errors.HypervisorError("Failed to compute memory usage: %s" %
                                    (err,))
     result["memory_free"] = sum_free
 
+    if len(hugepages) == 3:
+      # Hugepagesize is given in kB
+      result["hugepages_total"] = \
+        hugepages["HugePages_Total"] * hugepages["Hugepagesize"] / 1024
+      result["hugepages_free"] = \
+        hugepages["HugePages_Free"] * hugepages["Hugepagesize"] / 1024
+
     cpu_total = 0
     try:
       fh = open(cpuinfo)
@@ -554,9 +765,20 @@ class BaseHypervisor(object):
     result["cpu_total"] = cpu_total
     # We assume that the node OS can access all the CPUs
     result["cpu_dom0"] = cpu_total
-    # FIXME: export correct data here
-    result["cpu_nodes"] = 1
-    result["cpu_sockets"] = 1
+
+    topology = _GetLinuxCpuTopology(cpudir)
+    if topology is None:
+      result["cpu_sockets"] = 1
+    else:
+      (result["cpu_sockets"], result["cpu_cores_per_socket"],
+       result["cpu_threads_per_core"]) = topology
+
+    numa_nodes = _GetLinuxNumaNodes(nodedir, hugepages.get("Hugepagesize"))
+    if numa_nodes:
+      result["cpu_nodes"] = len(numa_nodes)
+      result["numa_nodes"] = numa_nodes
+    else:
+      result["cpu_nodes"] = 1
 
     return result
 
@@ -31,6 +31,7 @@ import tempfile
 import time
 import logging
 import pwd
+import select
 import struct
 import fcntl
 import shutil
@@ -38,6 +39,7 @@ import urllib2
 import socket
 import stat
 import StringIO
+import threading
 from bitarray import bitarray
 try:
   import affinity   # pylint: disable=F0401
@@ -64,6 +66,18 @@ from ganeti.utils import wrapper as utils_wrapper
 _KVM_NETWORK_SCRIPT = pathutils.CONF_DIR + "/kvm-vif-bridge"
 _KVM_START_PAUSED_FLAG = "-S"
 
+#: Used to bind automatically placed instances to a NUMA node
+_NUMACTL_PATH = "/usr/bin/numactl"
+
+#: Statuses reported by QMP's query-migrate while a migration is ongoing
+_QMP_MIGRATION_ACTIVE_STATUSES = frozenset([
+  "setup",
+  "active",
+  "pre-switchover",
+  "device",
+  "postcopy-active",
+  ])
+
 # TUN/TAP driver constants, taken from <linux/if_tun.h>
 # They are architecture-independent and already hardcoded in qemu-kvm source,
 # so we can safely include them here.
@@ -90,11 +104,13 @@ _SPICE_ADDITIONAL_PARAMS = frozenset([
 _AVAILABLE_PCI_SLOT = bitarray("0")
 
 # below constants show the format of runtime file
-# the nics are in second possition, while the disks in 4th (last)
+# the nics are in second possition, while the disks in 4th
 # moreover disk entries are stored as a list of in tuples
 # (L{objects.Disk}, link_name, uri)
+# the 5th (last) entry is the placement chosen on the current node, if any
 _KVM_NICS_RUNTIME_INDEX = 1
 _KVM_DISKS_RUNTIME_INDEX = 3
+_KVM_PLACEMENT_RUNTIME_INDEX = 4
 _DEVICE_RUNTIME_INDEX = {
   constants.HOTPLUG_TARGET_DISK: _KVM_DISKS_RUNTIME_INDEX,
   constants.HOTPLUG_TARGET_NIC: _KVM_NICS_RUNTIME_INDEX
@@ -173,7 +189,7 @@ def _GetExistingDeviceInfo(dev_type, device, runtime):
   @param dev_type: device type of param dev
   @type device: L{objects.Disk} or L{objects.NIC}
   @param device: the device object for which we generate a kvm name
-  @type runtime: tuple (cmd, nics, hvparams, disks)
+  @type runtime: tuple (cmd, nics, hvparams, disks, placement)
   @param runtime: the runtime data to search for the device
   @raise errors.HotplugError: in case the requested device does not
     exist (e.g. device has been added without --hotplug option) or
@@ -198,7 +214,7 @@ def _UpgradeSerializedRuntime(serialized_runtime):
 
   @type serialized_runtime: string
   @param serialized_runtime: raw text data read from actual runtime file
-  @return: (cmd, nic dicts, hvparams, bdev dicts)
+  @return: (cmd, nic dicts, hvparams, bdev dicts, placement)
   @rtype: tuple
 
   """
@@ -208,13 +224,17 @@ def _UpgradeSerializedRuntime(serialized_runtime):
     serialized_disks = loaded_runtime[3]
   else:
     serialized_disks = []
+  if len(loaded_runtime) >= 5:
+    placement = loaded_runtime[4]
+  else:
+    placement = None
 
   for nic in serialized_nics:
     # Add a dummy uuid slot if an pre-2.8 NIC is found
     if "uuid" not in nic:
       nic["uuid"] = utils.NewUUID()
 
-  return kvm_cmd, serialized_nics, hvparams, serialized_disks
+  return kvm_cmd, serialized_nics, hvparams, serialized_disks, placement
 
 
 def _AnalyzeSerializedRuntime(serialized_runtime):
@@ -222,17 +242,89 @@ def _AnalyzeSerializedRuntime(serialized_runtime):
 
   @type serialized_runtime: string
   @param serialized_runtime: raw text data read from actual runtime file
-  @return: (cmd, nics, hvparams, bdevs)
+  @return: (cmd, nics, hvparams, bdevs, placement)
   @rtype: tuple
 
   """
-  kvm_cmd, serialized_nics, hvparams, serialized_disks = \
+  kvm_cmd, serialized_nics, hvparams, serialized_disks, placement = \
     _UpgradeSerializedRuntime(serialized_runtime)
   kvm_nics = [objects.NIC.FromDict(snic) for snic in serialized_nics]
   kvm_disks = [(objects.Disk.FromDict(sdisk), link, uri)
                for sdisk, link, uri in serialized_disks]
 
-  return (kvm_cmd, kvm_nics, hvparams, kvm_disks)
+  return (kvm_cmd, kvm_nics, hvparams, kvm_disks, placement)
+
+
+def _ComputePlacement(numa_nodes, vcpus, memory, cpu_load):
+  """Chooses the NUMA node and CPUs to place an instance on.
+
+  Among the NUMA nodes with enough CPUs and free memory for the instance,
+  the one whose CPUs have the fewest vCPUs pinned to them is chosen, and the
+  one with the most free memory among equally loaded ones. Each vCPU is then
+  pinned to a different CPU of that node, least loaded ones first.
+
+  @type numa_nodes: list of dict
+  @param numa_nodes: NUMA nodes, as returned by
+      L{hv_base.BaseHypervisor.GetLinuxNodeInfo}
+  @type vcpus: int
+  @param vcpus: number of vCPUs of the instance
+  @type memory: int
+  @param memory: memory of the instance in MiB
+  @type cpu_load: dict of int:int
+  @param cpu_load: number of vCPUs of other instances pinned to each CPU
+  @rtype: dict or None
+  @return: the placement, a dict with the chosen NUMA node as C{node} and
+      the CPU of each vCPU as C{cpus}; C{None} if the instance doesn't fit
+      in any NUMA node
+
+  """
+  candidates = []
+  for node in numa_nodes:
+    cpus = node["cpus"]
+    if len(cpus) < vcpus or node["memory_free"] < memory:
+      continue
+    load = sum(cpu_load.get(cpu, 0) for cpu in cpus) / float(len(cpus))
+    candidates.append((load, -node["memory_free"], node["id"], cpus))
+
+  if not candidates:
+    return None
+
+  (_, _, node_id, cpus) = min(candidates)
+  chosen = sorted(cpus, key=lambda cpu: (cpu_load.get(cpu, 0), cpu))[:vcpus]
+
+  return {
+    "node": node_id,
+    "cpus": sorted(chosen),
+    }
+
+
+def _ParseQmpMigrationStatus(info):
+  """Builds a migration status from the result of QMP's query-migrate.
+
+  @type info: dict
+  @param info: the result of query-migrate
+  @rtype: L{objects.MigrationStatus} or None
+  @return: the migration status, with the amounts of RAM in kbytes, or
+      C{None} if the status is unknown
+
+  """
+  status = info.get("status")
+  if status in _QMP_MIGRATION_ACTIVE_STATUSES:
+    status = constants.HV_MIGRATION_ACTIVE
+  elif status not in constants.HV_KVM_MIGRATION_VALID_STATUSES:
+    return None
+
+  migration_status = objects.MigrationStatus(status=status)
+  ram = info.get("ram")
+  if ram:
+    migration_status.transferred_ram = ram["transferred"] / 1024
+    migration_status.remaining_ram = ram["remaining"] / 1024
+    migration_status.total_ram = ram["total"] / 1024
+    # Not reported by all QEMU versions
+    migration_status.dirty_rate = ram.get("dirty-pages-rate")
+    migration_status.iterations = ram.get("dirty-sync-count")
+
+  return migration_status
 
 
 def _GetTunFeatures(fd, _ioctl=fcntl.ioctl):
@@ -474,6 +566,17 @@ class MonitorSocket(object):
     self.sock.close()
 
 
+class QmpCommandError(errors.HypervisorError):
+  """A QMP command returned an error.
+
+  The connection to the monitor is still usable after this error.
+
+  """
+  def __init__(self, msg, error_class=None):
+    errors.HypervisorError.__init__(self, msg)
+    self.error_class = error_class
+
+
 class QmpConnection(MonitorSocket):
   """Connection to the QEMU Monitor using the QEMU Monitor Protocol (QMP).
 
@@ -626,15 +729,177 @@ class QmpConnection(MonitorSocket):
       response = self._Recv()
       err = response[self._ERROR_KEY]
       if err:
-        raise errors.HypervisorError("kvm: error executing the %s"
-                                     " command: %s (%s):" %
-                                     (command,
-                                      err[self._ERROR_DESC_KEY],
-                                      err[self._ERROR_CLASS_KEY]))
+        raise QmpCommandError("kvm: error executing the %s"
+                              " command: %s (%s):" %
+                              (command,
+                               err[self._ERROR_DESC_KEY],
+                               err[self._ERROR_CLASS_KEY]),
+                              error_class=err[self._ERROR_CLASS_KEY])
 
       elif not response[self._EVENT_KEY]:
         return response
 
+  def IsAlive(self):
+    """Checks whether the connection can still be used.
+
+    A connection is no longer usable once the peer closed it, e.g. because
+    the instance was stopped.
+
+    @rtype: bool
+
+    """
+    if not self._connected:
+      return False
+
+    try:
+      (readable, _, _) = select.select([self.sock], [], [], 0)
+      if readable and not self.sock.recv(1, socket.MSG_PEEK):
+        return False
+    except (socket.error, select.error):
+      return False
+
+    return True
+
+
+class _QmpSession(object):
+  """A QMP connection kept open by L{QmpSessionManager}.
+
+  """
+  def __init__(self, socket_id):
+    self.socket_id = socket_id
+    self.connection = None
+    self.lock = threading.Lock()
+
+  def Close(self):
+    """Closes the connection, if any.
+
+    Must be called with the session lock held.
+
+    """
+    if self.connection is not None:
+      self.connection.close()
+      self.connection = None
+
+
+class QmpSessionManager(object):
+  """Keeps QMP connections to running instances open for reuse.
+
+  Connecting to a monitor and negotiating its capabilities is only done for
+  the first command sent to an instance; further commands reuse the
+  connection. Commands for the same instance are serialized, commands for
+  different instances can be executed concurrently. A new connection is
+  established transparently if the monitor socket was re-created, e.g.
+  because the instance was restarted, or if the connection was closed.
+
+  """
+  def __init__(self, _connection_cls=QmpConnection):
+    self._connection_cls = _connection_cls
+    self._lock = threading.Lock()
+    self._sessions = {}
+
+  @staticmethod
+  def _GetSocketId(monitor_filename):
+    """Returns a value identifying the monitor socket.
+
+    @raise errors.HypervisorError: if the socket doesn't exist
+
+    """
+    try:
+      st = os.stat(monitor_filename)
+    except EnvironmentError, err:
+      if err.errno == errno.ENOENT:
+        raise errors.HypervisorError("No monitor socket found")
+      raise errors.HypervisorError("Error checking monitor socket: %s" %
+                                   utils.ErrnoOrStr(err))
+
+    return (st.st_dev, st.st_ino, st.st_ctime)
+
+  def _GetSession(self, monitor_filename):
+    """Returns the session for a monitor socket.
+
+    """
+    socket_id = self._GetSocketId(monitor_filename)
+
+    self._lock.acquire()
+    try:
+      session = self._sessions.get(monitor_filename, None)
+      if session is None or session.socket_id != socket_id:
+        # The socket was re-created; the stale connection of the old session
+        # (if any) is closed once the session is no longer referenced
+        session = _QmpSession(socket_id)
+        self._sessions[monitor_filename] = session
+      return session
+    finally:
+      self._lock.release()
+
+  def Execute(self, monitor_filename, command, arguments=None):
+    """Executes a QMP command.
+
+    @type monitor_filename: string
+    @param monitor_filename: path of the QMP socket
+    @type command: string
+    @param command: the command to execute
+    @type arguments: dict
+    @param arguments: arguments for the command
+    @rtype: L{QmpMessage}
+    @return: the response of the server
+    @raise errors.HypervisorError: when there are communication errors
+    @raise QmpCommandError: when the command returned an error
+
+    """
+    session = self._GetSession(monitor_filename)
+
+    session.lock.acquire()
+    try:
+      if session.connection is not None and \
+         not session.connection.IsAlive():
+        session.Close()
+
+      if session.connection is None:
+        connection = self._connection_cls(monitor_filename)
+        try:
+          connection.connect()
+        except:
+          connection.close()
+          raise
+        session.connection = connection
+
+      try:
+        return session.connection.Execute(command, arguments)
+      except QmpCommandError:
+        raise
+      except errors.HypervisorError:
+        # The connection is in an unknown state
+        session.Close()
+        raise
+    finally:
+      session.lock.release()
+
+  def Close(self, monitor_filename):
+    """Closes the connection to a monitor socket, if any.
+
+    """
+    self._lock.acquire()
+    try:
+      session = self._sessions.pop(monitor_filename, None)
+    finally:
+      self._lock.release()
+
+    if session is not None:
+      session.lock.acquire()
+      try:
+        session.Close()
+      finally:
+        session.lock.release()
+
+
+#: QMP connections kept open by this process
+_qmp_sessions = QmpSessionManager()
+
+#: Serializes placing instances and saving their placement, as instances
+#: can be started concurrently by the node daemon
+_placement_lock = threading.Lock()
+
 
 class KVMHypervisor(hv_base.BaseHypervisor):
   """KVM hypervisor interface
@@ -659,6 +924,12 @@ class KVMHypervisor(hv_base.BaseHypervisor):
   _CHROOT_QUARANTINE_DIR = _ROOT_DIR + "/chroot-quarantine"
   _DIRS = [_ROOT_DIR, _PIDS_DIR, _UIDS_DIR, _CTRL_DIR, _CONF_DIR, _NICS_DIR,
            _CHROOT_DIR, _CHROOT_QUARANTINE_DIR, _KEYMAP_DIR]
+  # Information about all running instances, see GetAllInstancesInfo
+  _INSTANCE_INFO_CACHE_FILE = _ROOT_DIR + "/instance-info.json"
+  _INSTANCE_INFO_CACHE_TTL = 3.0
+  _INSTANCE_INFO_MAX_PARALLEL = 16
+  # Outputs of kvm invocations, see _GetKVMOutput
+  _KVM_OUTPUT_CACHE_FILE = _ROOT_DIR + "/kvm-output.json"
 
   PARAMETERS = {
     constants.HV_KVM_PATH: hv_base.REQ_FILE_CHECK,
@@ -715,6 +986,8 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     constants.HV_MIGRATION_BANDWIDTH: hv_base.REQ_NONNEGATIVE_INT_CHECK,
     constants.HV_MIGRATION_DOWNTIME: hv_base.REQ_NONNEGATIVE_INT_CHECK,
     constants.HV_MIGRATION_MODE: hv_base.MIGRATION_MODE_CHECK,
+    constants.HV_KVM_MIGRATION_CAPS: hv_base.NO_CHECK,
+    constants.HV_KVM_MIGRATION_ESCALATION: hv_base.NO_CHECK,
     constants.HV_USE_LOCALTIME: hv_base.NO_CHECK,
     constants.HV_DISK_CACHE:
       hv_base.ParamInSet(True, constants.HT_VALID_CACHE_TYPES),
@@ -726,6 +999,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     constants.HV_VHOST_NET: hv_base.NO_CHECK,
     constants.HV_KVM_USE_CHROOT: hv_base.NO_CHECK,
     constants.HV_KVM_USER_SHUTDOWN: hv_base.NO_CHECK,
+    constants.HV_KVM_AUTO_PLACEMENT: hv_base.NO_CHECK,
     constants.HV_MEM_PATH: hv_base.OPT_DIR_CHECK,
     constants.HV_REBOOT_BEHAVIOR:
       hv_base.ParamInSet(True, constants.REBOOT_BEHAVIORS),
@@ -756,6 +1030,16 @@ class KVMHypervisor(hv_base.BaseHypervisor):
   _MIGRATION_INFO_MAX_BAD_ANSWERS = 5
   _MIGRATION_INFO_RETRY_DELAY = 2
 
+  # Escalation of migrations which don't converge: after
+  # _MIGRATION_ESCALATION_START passes over the guest RAM, bandwidth and
+  # downtime are doubled every _MIGRATION_ESCALATION_INTERVAL passes, at most
+  # _MIGRATION_ESCALATION_MAX_STEPS times; past that, the migration is
+  # switched to post-copy mode if enabled
+  _MIGRATION_ESCALATION_START = 5
+  _MIGRATION_ESCALATION_INTERVAL = 2
+  _MIGRATION_ESCALATION_MAX_STEPS = 4
+  _MIGRATION_CAP_POSTCOPY = "postcopy-ram"
+
   _VERSION_RE = re.compile(r"\b(\d+)\.(\d+)(\.(\d+))?\b")
 
   _CPU_INFO_RE = re.compile(r"cpu\s+\#(\d+).*thread_id\s*=\s*(\d+)", re.I)
@@ -767,6 +1051,10 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     staticmethod(lambda x: re.compile(r"^(%s)[ ]+.*PC" % x, re.M))
 
   _QMP_RE = re.compile(r"^-qmp\s", re.M)
+  # States, tracked by the KVM daemon, of an instance whose process is alive
+  _KVMD_ALIVE_STATES = frozenset(["running", "paused", "migrating"])
+  _HMP_COMMAND = "human-monitor-command"
+  _QMP_COMMAND_NOT_FOUND = "CommandNotFound"
   _SPICE_RE = re.compile(r"^-spice\s", re.M)
   _VHOST_RE = re.compile(r"^-net\s.*,vhost=on|off", re.M)
   _ENABLE_KVM_RE = re.compile(r"^-enable-kvm\s", re.M)
@@ -929,6 +1217,13 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     """
     return utils.PathJoin(cls._CTRL_DIR, "%s.qmp" % instance_name)
 
+  @classmethod
+  def _InstanceKvmdMonitor(cls, instance_name):
+    """Returns the instance QMP socket name used by the KVM daemon
+
+    """
+    return utils.PathJoin(cls._CTRL_DIR, "%s.kvmd" % instance_name)
+
   @classmethod
   def _InstanceShutdownMonitor(cls, instance_name):
     """Returns the instance QMP output filename
@@ -936,6 +1231,13 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     """
     return utils.PathJoin(cls._CTRL_DIR, "%s.shutdown" % instance_name)
 
+  @classmethod
+  def _InstanceStateFile(cls, instance_name):
+    """Returns the file in which the KVM daemon keeps the instance state
+
+    """
+    return utils.PathJoin(cls._CTRL_DIR, "%s.state" % instance_name)
+
   @staticmethod
   def _SocatUnixConsoleParams():
     """Returns the correct parameters for socat
@@ -1007,7 +1309,11 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     utils.RemoveFile(pidfile)
     utils.RemoveFile(cls._InstanceMonitor(instance_name))
     utils.RemoveFile(cls._InstanceSerial(instance_name))
+    cls._InstanceInfoCache().Invalidate()
+    _qmp_sessions.Close(cls._InstanceQmpMonitor(instance_name))
     utils.RemoveFile(cls._InstanceQmpMonitor(instance_name))
+    utils.RemoveFile(cls._InstanceKvmdMonitor(instance_name))
+    utils.RemoveFile(cls._InstanceStateFile(instance_name))
     utils.RemoveFile(cls._InstanceKVMRuntime(instance_name))
     utils.RemoveFile(cls._InstanceKeymapFile(instance_name))
     uid_file = cls._InstanceUidFile(instance_name)
@@ -1186,22 +1492,211 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     # Run CPU pinning, based on configured mask
     self._AssignCpuAffinity(cpu_mask, pid, thread_dict)
 
+  def _GetPinnedCpuLoad(self, exclude=None):
+    """Counts the vCPUs of automatically placed instances per CPU.
+
+    All instances with a saved runtime are considered, including those
+    which have been placed but whose KVM process hasn't been started yet.
+
+    @type exclude: string
+    @param exclude: name of an instance whose placement is ignored
+    @rtype: dict of int:int
+    @return: the number of vCPUs pinned to each CPU
+
+    """
+    cpu_load = {}
+    for filename in utils.ListVisibleFiles(self._CONF_DIR):
+      if not filename.endswith(".runtime"):
+        continue
+      instance_name = filename[:-len(".runtime")]
+      if instance_name == exclude:
+        continue
+      try:
+        serialized_runtime = self._ReadKVMRuntime(instance_name)
+        placement = _AnalyzeSerializedRuntime(serialized_runtime)[4]
+      except (errors.HypervisorError, ValueError, KeyError, TypeError), err:
+        logging.warning("Can't read the placement of instance %s: %s",
+                        instance_name, err)
+        continue
+      if placement:
+        for cpu in placement["cpus"]:
+          cpu_load[cpu] = cpu_load.get(cpu, 0) + 1
+    return cpu_load
+
+  def _PlaceInstance(self, instance, kvm_runtime):
+    """Chooses where to place an instance on this node.
+
+    Instances are only placed if C{auto_placement} is enabled and no explicit
+    CPU mask is given, otherwise any previous placement is dropped.
+
+    @type instance: L{objects.Instance}
+    @param instance: the instance to be placed
+    @type kvm_runtime: tuple
+    @param kvm_runtime: the KVM runtime of the instance
+    @rtype: tuple
+    @return: the KVM runtime with the new placement
+
+    """
+    kvm_cmd, kvm_nics, hvparams, kvm_disks, _ = kvm_runtime
+    up_hvp = objects.FillDict(instance.hvparams, hvparams)
+
+    placement = None
+    if (up_hvp.get(constants.HV_KVM_AUTO_PLACEMENT, False) and
+        up_hvp.get(constants.HV_CPU_MASK) in (None, "",
+                                              constants.CPU_PINNING_ALL)):
+      node_info = self.GetLinuxNodeInfo()
+      numa_nodes = node_info.get("numa_nodes")
+      if not numa_nodes:
+        # Without NUMA information, treat the node as a single NUMA domain
+        numa_nodes = [{
+          "id": 0,
+          "memory_free": node_info["memory_free"],
+          "cpus": range(node_info["cpu_total"]),
+          }]
+      placement = _ComputePlacement(numa_nodes,
+                                    instance.beparams[constants.BE_VCPUS],
+                                    instance.beparams[constants.BE_MAXMEM],
+                                    self._GetPinnedCpuLoad(
+                                      exclude=instance.name))
+      if placement is None:
+        logging.info("Instance %s doesn't fit in a single NUMA node, not"
+                     " placing it", instance.name)
+      else:
+        logging.info("Placing instance %s on NUMA node %s, CPUs %s",
+                     instance.name, placement["node"],
+                     utils.CommaJoin(placement["cpus"]))
+
+    return (kvm_cmd, kvm_nics, hvparams, kvm_disks, placement)
+
+  def _PlaceAndSaveKVMRuntime(self, instance, kvm_runtime):
+    """Places an instance and saves its KVM runtime.
+
+    Both steps are done while holding L{_placement_lock}, so that instances
+    placed concurrently see each other's placement.
+
+    @type instance: L{objects.Instance}
+    @param instance: the instance to be placed
+    @type kvm_runtime: tuple
+    @param kvm_runtime: the KVM runtime of the instance
+    @rtype: tuple
+    @return: the KVM runtime with the new placement
+
+    """
+    _placement_lock.acquire()
+    try:
+      kvm_runtime = self._PlaceInstance(instance, kvm_runtime)
+      self._SaveKVMRuntime(instance, kvm_runtime)
+    finally:
+      _placement_lock.release()
+
+    return kvm_runtime
+
+  @staticmethod
+  def _GetNumaBindCmd(placement):
+    """Returns the command prefix binding KVM to the placement's NUMA node.
+
+    @type placement: dict
+    @param placement: the placement of the instance
+    @rtype: list of strings
+
+    """
+    if not os.path.exists(_NUMACTL_PATH):
+      logging.warning("%s not found, not binding the instance to NUMA node %s",
+                      _NUMACTL_PATH, placement["node"])
+      return []
+
+    # Memory is allocated preferably, but not exclusively, from the NUMA node,
+    # so that the instance isn't killed if the node runs out of memory
+    return [_NUMACTL_PATH,
+            "--cpunodebind=%s" % placement["node"],
+            "--preferred=%s" % placement["node"],
+            "--"]
+
+  def _ExecuteCpuPlacement(self, instance_name, placement):
+    """Pins each vCPU of an instance to the CPU chosen by its placement.
+
+    @type instance_name: string
+    @param instance_name: name of instance
+    @type placement: dict
+    @param placement: the placement of the instance
+
+    """
+    if affinity is None:
+      logging.warning("affinity Python package not found, not pinning the"
+                      " vCPUs of instance %s", instance_name)
+      return
+
+    thread_dict = self._GetVcpuThreadIds(instance_name)
+    for (vcpu, cpu) in enumerate(placement["cpus"]):
+      if vcpu in thread_dict:
+        affinity.set_process_affinity_mask(thread_dict[vcpu],
+                                           self._BuildAffinityCpuMask([cpu]))
+
   def ListInstances(self, hvparams=None):
     """Get the list of running instances.
 
     We can do this by listing our live instances directory and
-    checking whether the associated kvm process is still alive.
+    checking whether the KVM daemon tracks the instance as alive or,
+    failing that, whether the associated kvm process is still alive.
 
     """
+    kvmd_alive = utils.IsDaemonAlive(constants.KVMD)
     result = []
     for name in os.listdir(self._PIDS_DIR):
-      if self._InstancePidAlive(name)[2] or self._IsUserShutdown(name):
+      if (self._GetTrackedState(name, kvmd_alive=kvmd_alive) in
+          self._KVMD_ALIVE_STATES or
+          self._InstancePidAlive(name)[2] or self._IsUserShutdown(name)):
         result.append(name)
     return result
 
+  @classmethod
+  def _GetTrackedState(cls, instance_name, kvmd_alive=None):
+    """Returns the instance state tracked by the KVM daemon.
+
+    The KVM daemon listens for the QMP events of each instance and keeps
+    the current state of the instance in its state file, which is removed
+    once the instance's process terminates. The state file is only taken
+    into account while the KVM daemon is running.
+
+    @type instance_name: string
+    @param instance_name: the instance name
+    @type kvmd_alive: bool or None
+    @param kvmd_alive: whether the KVM daemon is running, checked if not given
+    @rtype: string or None
+    @return: one of "running", "paused", "migrating" and "shutdown", or
+      C{None} if the instance state is not known
+
+    """
+    if kvmd_alive is None:
+      kvmd_alive = utils.IsDaemonAlive(constants.KVMD)
+
+    if not kvmd_alive:
+      return None
+
+    try:
+      return utils.ReadOneLineFile(cls._InstanceStateFile(instance_name))
+    except (EnvironmentError, errors.GenericError):
+      return None
+
   @classmethod
   def _IsUserShutdown(cls, instance_name):
-    return os.path.exists(cls._InstanceShutdownMonitor(instance_name))
+    """Returns whether the instance was shut down by the user.
+
+    The KVM daemon watches all instances, so the shutdown file is only taken
+    into account if user shutdown is enabled for the instance.
+
+    """
+    if not os.path.exists(cls._InstanceShutdownMonitor(instance_name)):
+      return False
+
+    try:
+      serialized_runtime = \
+        utils.ReadFile(cls._InstanceKVMRuntime(instance_name))
+      hvparams = _AnalyzeSerializedRuntime(serialized_runtime)[2]
+    except (EnvironmentError, ValueError, KeyError, TypeError):
+      return False
+
+    return bool(hvparams.get(constants.HV_KVM_USER_SHUTDOWN, False))
 
   @classmethod
   def _ClearUserShutdown(cls, instance_name):
@@ -1218,49 +1713,103 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     @return: (name, id, memory, vcpus, stat, times)
 
     """
-    _, pid, alive = self._InstancePidAlive(instance_name)
-    if not alive:
-      if self._IsUserShutdown(instance_name):
-        return (instance_name, -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN, 0)
-      else:
-        return None
+    pid = utils.ReadPidFile(self._InstancePidFile(instance_name))
+
+    (memory, vcpus) = (None, None)
+    if self._GetTrackedState(instance_name) not in self._KVMD_ALIVE_STATES:
+      try:
+        (cmd_instance, memory, vcpus) = self._InstancePidInfo(pid)
+      except errors.HypervisorError:
+        cmd_instance = None
+
+      if cmd_instance != instance_name:
+        if self._IsUserShutdown(instance_name):
+          return (instance_name, -1, 0, 0, hv_base.HvInstanceState.SHUTDOWN,
+                  0)
+        else:
+          return None
 
-    _, memory, vcpus = self._InstancePidInfo(pid)
     istat = hv_base.HvInstanceState.RUNNING
     times = 0
 
+    qmp_filename = self._InstanceQmpMonitor(instance_name)
     try:
-      qmp = QmpConnection(self._InstanceQmpMonitor(instance_name))
-      qmp.connect()
-      vcpus = len(qmp.Execute("query-cpus")[qmp.RETURN_KEY])
+      vcpus = len(_qmp_sessions.Execute(qmp_filename, "query-cpus")
+                  [QmpConnection.RETURN_KEY])
       # Will fail if ballooning is not enabled, but we can then just resort to
-      # the value above.
-      mem_bytes = qmp.Execute("query-balloon")[qmp.RETURN_KEY][qmp.ACTUAL_KEY]
+      # the value from the command line.
+      mem_bytes = (_qmp_sessions.Execute(qmp_filename, "query-balloon")
+                   [QmpConnection.RETURN_KEY][QmpConnection.ACTUAL_KEY])
       memory = mem_bytes / 1048576
     except errors.HypervisorError:
       pass
 
+    if memory is None or vcpus is None:
+      # The instance's process was not inspected as the KVM daemon tracks the
+      # instance, but QMP didn't provide all values
+      try:
+        (_, cmd_memory, cmd_vcpus) = self._InstancePidInfo(pid)
+      except errors.HypervisorError:
+        return None
+      if memory is None:
+        memory = cmd_memory
+      if vcpus is None:
+        vcpus = cmd_vcpus
+
     return (instance_name, pid, memory, vcpus, istat, times)
 
   def GetAllInstancesInfo(self, hvparams=None):
     """Get properties of all instances.
 
+    The instances are queried concurrently, and the result is cached for a
+    few seconds, as it is requested by every query for live instance data.
+    The cache is invalidated when an instance is started or stopped.
+
     @type hvparams: dict of strings
     @param hvparams: hypervisor parameter
     @return: list of tuples (name, id, memory, vcpus, stat, times)
 
     """
-    data = []
-    for name in os.listdir(self._PIDS_DIR):
+    cache = self._InstanceInfoCache()
+    data = cache.Get()
+    if data is not None:
+      return [tuple(info) for info in data]
+
+    # Unexpected errors, which must not escape the threads querying the
+    # instances
+    failures = []
+
+    def _GetInfo(name):
       try:
-        info = self.GetInstanceInfo(name)
+        return self.GetInstanceInfo(name)
       except errors.HypervisorError:
         # Ignore exceptions due to instances being shut down
-        continue
-      if info:
-        data.append(info)
+        return None
+      except Exception, err: # pylint: disable=W0703
+        logging.exception("Can't get information about instance %s", name)
+        failures.append((name, err))
+        return None
+
+    data = filter(None, utils.RunInParallel(_GetInfo,
+                                            os.listdir(self._PIDS_DIR),
+                                            self._INSTANCE_INFO_MAX_PARALLEL))
+    if failures:
+      raise errors.HypervisorError("Can't get information about instance"
+                                   " %s: %s" % failures[0])
+
+    cache.Put(data)
     return data
 
+  @classmethod
+  def _InstanceInfoCache(cls):
+    """Returns the cache of L{GetAllInstancesInfo}.
+
+    @rtype: L{hv_base.TimedFileCache}
+
+    """
+    return hv_base.TimedFileCache(cls._INSTANCE_INFO_CACHE_FILE,
+                                  cls._INSTANCE_INFO_CACHE_TTL)
+
   def _GenerateKVMBlockDevicesOptions(self, instance, kvm_disks,
                                       kvmhelp, devlist):
     """Generate KVM options regarding instance's block devices.
@@ -1751,7 +2300,9 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     hvparams = hvp
 
-    return (kvm_cmd, kvm_nics, hvparams, kvm_disks)
+    # The placement depends on the node the instance runs on, so it is only
+    # chosen right before starting the instance
+    return (kvm_cmd, kvm_nics, hvparams, kvm_disks, None)
 
   def _WriteKVMRuntime(self, instance_name, data):
     """Write an instance's KVM runtime
@@ -1777,13 +2328,13 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     """Save an instance's KVM runtime
 
     """
-    kvm_cmd, kvm_nics, hvparams, kvm_disks = kvm_runtime
+    kvm_cmd, kvm_nics, hvparams, kvm_disks, placement = kvm_runtime
 
     serialized_nics = [nic.ToDict() for nic in kvm_nics]
     serialized_disks = [(blk.ToDict(), link, uri)
                         for blk, link, uri in kvm_disks]
     serialized_form = serializer.Dump((kvm_cmd, serialized_nics, hvparams,
-                                      serialized_disks))
+                                      serialized_disks, placement))
 
     self._WriteKVMRuntime(instance.name, serialized_form)
 
@@ -1895,7 +2446,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     temp_files = []
 
-    kvm_cmd, kvm_nics, up_hvp, kvm_disks = kvm_runtime
+    kvm_cmd, kvm_nics, up_hvp, kvm_disks, placement = kvm_runtime
     # the first element of kvm_cmd is always the path to the kvm binary
     kvm_path = kvm_cmd[0]
     up_hvp = objects.FillDict(conf_hvp, up_hvp)
@@ -2001,6 +2552,10 @@ class KVMHypervisor(hv_base.BaseHypervisor):
       logging.debug("Enabling QMP")
       kvm_cmd.extend(["-qmp", "unix:%s,server,nowait" %
                       self._InstanceQmpMonitor(instance.name)])
+      # QMP serves a single client per socket, so the KVM daemon, which stays
+      # connected to keep track of the instance state, gets its own socket
+      kvm_cmd.extend(["-qmp", "unix:%s,server,nowait" %
+                      self._InstanceKvmdMonitor(instance.name)])
 
     # Configure the network now for starting instances and bridged interfaces,
     # during FinalizeMigration for incoming instances' routed interfaces
@@ -2029,6 +2584,9 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     if up_hvp.get(constants.HV_CPU_MASK, None):
       cpu_pinning = True
 
+    if placement:
+      kvm_cmd = self._GetNumaBindCmd(placement) + kvm_cmd
+
     if security_model == constants.HT_SM_POOL:
       ss = ssconf.SimpleStore()
       uid_pool = uidpool.ParseUidPool(ss.GetUidPool(), separator="\n")
@@ -2071,19 +2629,20 @@ class KVMHypervisor(hv_base.BaseHypervisor):
         raise errors.HypervisorError("Failed to open SPICE password file %s: %s"
                                      % (spice_password_file, err))
 
-      qmp = QmpConnection(self._InstanceQmpMonitor(instance.name))
-      qmp.connect()
       arguments = {
           "protocol": "spice",
           "password": spice_pwd,
       }
-      qmp.Execute("set_password", arguments)
+      _qmp_sessions.Execute(self._InstanceQmpMonitor(instance.name),
+                            "set_password", arguments)
 
     for filename in temp_files:
       utils.RemoveFile(filename)
 
     # If requested, set CPU affinity and resume instance execution
-    if cpu_pinning:
+    if placement:
+      self._ExecuteCpuPlacement(instance.name, placement)
+    elif cpu_pinning:
       self._ExecuteCpuAffinity(instance.name, up_hvp[constants.HV_CPU_MASK])
 
     start_memory = self._InstanceStartupMemory(instance)
@@ -2096,20 +2655,26 @@ class KVMHypervisor(hv_base.BaseHypervisor):
       # explicitly requested resume the vm status.
       self._CallMonitorCommand(instance.name, self._CONT_CMD)
 
+    self._InstanceInfoCache().Invalidate()
+
   @staticmethod
   def _StartKvmd(hvparams):
     """Ensure that the Kvm daemon is running.
 
+    The KVM daemon keeps track of the state of all instances, but it is only
+    required for instances with user shutdown enabled; for the others, the
+    instance processes are inspected if it isn't running.
+
     """
-    if hvparams is None \
-          or not hvparams[constants.HV_KVM_USER_SHUTDOWN] \
-          or utils.IsDaemonAlive(constants.KVMD):
+    if utils.IsDaemonAlive(constants.KVMD):
       return
 
     result = utils.RunCmd(constants.KVMD)
 
     if result.failed:
-      raise errors.HypervisorError("Failed to start KVM daemon")
+      if hvparams is not None and hvparams[constants.HV_KVM_USER_SHUTDOWN]:
+        raise errors.HypervisorError("Failed to start KVM daemon")
+      logging.warning("Failed to start KVM daemon: %s", result.fail_reason)
 
   def StartInstance(self, instance, block_devices, startup_paused):
     """Start an instance.
@@ -2120,21 +2685,47 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     kvmhelp = self._GetKVMOutput(kvmpath, self._KVMOPT_HELP)
     kvm_runtime = self._GenerateKVMRuntime(instance, block_devices,
                                            startup_paused, kvmhelp)
-    self._SaveKVMRuntime(instance, kvm_runtime)
+    kvm_runtime = self._PlaceAndSaveKVMRuntime(instance, kvm_runtime)
     self._ExecuteKVMRuntime(instance, kvm_runtime, kvmhelp)
 
   @classmethod
   def _CallMonitorCommand(cls, instance_name, command):
     """Invoke a command on the instance monitor.
 
+    The command is sent using QMP's C{human-monitor-command} over a
+    connection kept open by L{QmpSessionManager}. Instances without a QMP
+    socket, or whose QEMU doesn't support C{human-monitor-command}, are sent
+    the command through the human monitor socket.
+
+    """
+    qmp_filename = cls._InstanceQmpMonitor(instance_name)
+    if os.path.exists(qmp_filename):
+      try:
+        output = _qmp_sessions.Execute(qmp_filename, cls._HMP_COMMAND,
+                                       {"command-line": command})
+      except QmpCommandError, err:
+        if err.error_class != cls._QMP_COMMAND_NOT_FOUND:
+          raise errors.HypervisorError("Failed to send command '%s' to"
+                                       " instance '%s': %s" %
+                                       (command, instance_name, err))
+      except errors.HypervisorError, err:
+        raise errors.HypervisorError("Failed to send command '%s' to"
+                                     " instance '%s': %s" %
+                                     (command, instance_name, err))
+      else:
+        return utils.RunResult(0, None, output[QmpConnection.RETURN_KEY], "",
+                               command, None, None)
+
+    return cls._CallHumanMonitorCommand(instance_name, command)
+
+  @classmethod
+  def _CallHumanMonitorCommand(cls, instance_name, command):
+    """Invoke a command on the instance's human monitor socket.
+
     """
-    # TODO: Replace monitor calls with QMP once KVM >= 0.14 is the minimum
-    # version. The monitor protocol is designed for human consumption, whereas
-    # QMP is made for programmatic usage. In the worst case QMP can also
-    # execute monitor commands. As it is, all calls to socat take at least
-    # 500ms and likely more: socat can't detect the end of the reply and waits
-    # for 500ms of no data received before exiting (500 ms is the default for
-    # the "-t" parameter).
+    # All calls to socat take at least 500ms and likely more: socat can't
+    # detect the end of the reply and waits for 500ms of no data received
+    # before exiting (500 ms is the default for the "-t" parameter).
     socat = ("echo %s | %s STDIO UNIX-CONNECT:%s" %
              (utils.ShellQuote(command),
               constants.SOCAT_PATH,
@@ -2204,7 +2795,9 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     """
     try:
-      output = self._CallMonitorCommand(instance.name, self._INFO_VERSION_CMD)
+      # The version is parsed from the human monitor's greeting
+      output = self._CallHumanMonitorCommand(instance.name,
+                                             self._INFO_VERSION_CMD)
     except errors.HypervisorError:
       raise errors.HotplugError("Instance is probably down")
 
@@ -2218,7 +2811,9 @@ class KVMHypervisor(hv_base.BaseHypervisor):
       raise errors.HotplugError("Hotplug not supported for qemu versions < 1.0")
 
   def _CallHotplugCommand(self, name, cmd):
-    output = self._CallMonitorCommand(name, cmd)
+    # File descriptors passed with "getfd" are only known to the human
+    # monitor they were sent to, and hotplug commands can span several lines
+    output = self._CallHumanMonitorCommand(name, cmd)
     # TODO: parse output and check if succeeded
     for line in output.stdout.splitlines():
       logging.info("%s", line)
@@ -2352,12 +2947,79 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     optlist, can_fail = cls._KVMOPTS_CMDS[option]
 
+    binary_id = cls._GetKVMBinaryId(kvm_path)
+    cache = cls._ReadKVMOutputCache()
+    entry = cache.get(kvm_path, None)
+    if not (isinstance(entry, dict) and entry.get("id", None) == binary_id and
+            isinstance(entry.get("outputs", None), dict)):
+      entry = {"id": binary_id, "outputs": {}}
+    elif option in entry["outputs"]:
+      return entry["outputs"][option]
+
     result = utils.RunCmd([kvm_path] + optlist)
-    if result.failed and not can_fail:
-      raise errors.HypervisorError("Unable to get KVM %s output" %
-                                    " ".join(optlist))
+    if result.failed:
+      if not can_fail:
+        raise errors.HypervisorError("Unable to get KVM %s output" %
+                                      " ".join(optlist))
+    elif binary_id is not None:
+      entry["outputs"][option] = result.output
+      cache[kvm_path] = entry
+      cls._WriteKVMOutputCache(cache)
+
     return result.output
 
+  @staticmethod
+  def _GetKVMBinaryId(kvm_path):
+    """Returns a value identifying the kvm binary.
+
+    Symbolic links are resolved, so that replacing the binary a link points
+    to is detected. The binary isn't run, as avoiding that is the point of
+    caching its output.
+
+    @rtype: list or None
+    @return: resolved path, device, inode, modification time and size of the
+      binary, or C{None} if they can't be determined
+
+    """
+    real_path = os.path.realpath(kvm_path)
+    try:
+      st = os.stat(real_path)
+    except EnvironmentError:
+      return None
+
+    return [real_path, st.st_dev, st.st_ino, st.st_mtime, st.st_size]
+
+  @classmethod
+  def _ReadKVMOutputCache(cls):
+    """Reads the cached outputs of kvm invocations.
+
+    @rtype: dict
+    @return: dictionary of kvm path to a dictionary containing the binary's
+      identity (see L{_GetKVMBinaryId}) as "id" and the outputs per option
+      as "outputs"
+
+    """
+    try:
+      cache = serializer.LoadJson(utils.ReadFile(cls._KVM_OUTPUT_CACHE_FILE))
+    except (EnvironmentError, ValueError):
+      return {}
+
+    if not isinstance(cache, dict):
+      return {}
+
+    return cache
+
+  @classmethod
+  def _WriteKVMOutputCache(cls, cache):
+    """Writes the cached outputs of kvm invocations.
+
+    """
+    try:
+      utils.WriteFile(cls._KVM_OUTPUT_CACHE_FILE,
+                      data=serializer.DumpJson(cache))
+    except EnvironmentError, err:
+      logging.warning("Can't cache the output of kvm: %s", err)
+
   @classmethod
   def _GetKVMVersion(cls, kvm_path):
     """Return the installed KVM version.
@@ -2399,6 +3061,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
       else:
         cls._CallMonitorCommand(name, "system_powerdown")
     cls._ClearUserShutdown(instance.name)
+    cls._InstanceInfoCache().Invalidate()
 
   def StopInstance(self, instance, force=False, retry=False, name=None):
     """Stop an instance.
@@ -2433,8 +3096,8 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     # ...now we can safely call StopInstance...
     if not self.StopInstance(instance):
       self.StopInstance(instance, force=True)
-    # ...and finally we can save it again, and execute it...
-    self._SaveKVMRuntime(instance, kvm_runtime)
+    # ...and finally we can place it again, save it, and execute it...
+    kvm_runtime = self._PlaceAndSaveKVMRuntime(instance, kvm_runtime)
     kvmpath = instance.hvparams[constants.HV_KVM_PATH]
     kvmhelp = self._GetKVMOutput(kvmpath, self._KVMOPT_HELP)
     self._ExecuteKVMRuntime(instance, kvm_runtime, kvmhelp)
@@ -2462,11 +3125,19 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     """
     kvm_runtime = self._LoadKVMRuntime(instance, serialized_runtime=info)
+    # The placement on the source node doesn't apply here, so the instance is
+    # placed again and its runtime, which now describes the process on this
+    # node, is saved
+    kvm_runtime = self._PlaceAndSaveKVMRuntime(instance, kvm_runtime)
     incoming_address = (target, instance.hvparams[constants.HV_MIGRATION_PORT])
     kvmpath = instance.hvparams[constants.HV_KVM_PATH]
     kvmhelp = self._GetKVMOutput(kvmpath, self._KVMOPT_HELP)
     self._ExecuteKVMRuntime(instance, kvm_runtime, kvmhelp,
                             incoming=incoming_address)
+    # Some capabilities, e.g. post-copy or compression, must be enabled on
+    # both sides of the migration
+    if os.path.exists(self._InstanceQmpMonitor(instance.name)):
+      self._SetMigrationCapabilities(instance.name, instance.hvparams)
 
   def FinalizeMigrationDst(self, instance, info, success):
     """Finalize the instance migration on the target node.
@@ -2496,7 +3167,8 @@ class KVMHypervisor(hv_base.BaseHypervisor):
         except errors.HypervisorError, err:
           logging.warning(str(err))
 
-      self._WriteKVMRuntime(instance.name, info)
+      # The runtime, including the placement chosen on this node, has already
+      # been saved by AcceptInstance
     else:
       self.StopInstance(instance, force=True)
 
@@ -2522,6 +3194,16 @@ class KVMHypervisor(hv_base.BaseHypervisor):
     if not alive:
       raise errors.HypervisorError("Instance not running, cannot migrate")
 
+    qmp_filename = self._InstanceQmpMonitor(instance_name)
+    if os.path.exists(qmp_filename):
+      if not live:
+        _qmp_sessions.Execute(qmp_filename, "stop")
+      self._SetMigrationCapabilities(instance_name, instance.hvparams)
+      self._SetMigrationParameters(instance_name, instance.hvparams, 0)
+      _qmp_sessions.Execute(qmp_filename, "migrate",
+                            {"uri": "tcp:%s:%s" % (target, port)})
+      return
+
     if not live:
       self._CallMonitorCommand(instance_name, "stop")
 
@@ -2566,6 +3248,10 @@ class KVMHypervisor(hv_base.BaseHypervisor):
              progress info that can be retrieved from the hypervisor
 
     """
+    qmp_filename = self._InstanceQmpMonitor(instance.name)
+    if os.path.exists(qmp_filename):
+      return self._GetQmpMigrationStatus(instance, qmp_filename)
+
     info_command = "info migrate"
     for _ in range(self._MIGRATION_INFO_MAX_BAD_ANSWERS):
       result = self._CallMonitorCommand(instance.name, info_command)
@@ -2583,6 +3269,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
           match = self._MIGRATION_PROGRESS_RE.search(result.stdout)
           if match:
             migration_status.transferred_ram = match.group("transferred")
+            migration_status.remaining_ram = match.group("remaining")
             migration_status.total_ram = match.group("total")
 
           return migration_status
@@ -2593,6 +3280,173 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     return objects.MigrationStatus(status=constants.HV_MIGRATION_FAILED)
 
+  def _GetQmpMigrationStatus(self, instance, qmp_filename):
+    """Get the migration status using QMP.
+
+    Migrations which don't converge are escalated if requested, see
+    L{_EscalateMigration}.
+
+    @type instance: L{objects.Instance}
+    @param instance: the instance that is being migrated
+    @type qmp_filename: string
+    @param qmp_filename: path of the instance's QMP socket
+    @rtype: L{objects.MigrationStatus}
+
+    """
+    for _ in range(self._MIGRATION_INFO_MAX_BAD_ANSWERS):
+      try:
+        info = _qmp_sessions.Execute(qmp_filename, "query-migrate")[
+                 QmpConnection.RETURN_KEY]
+      except errors.HypervisorError, err:
+        logging.warning("KVM: failed to query the migration status: %s", err)
+      else:
+        migration_status = _ParseQmpMigrationStatus(info)
+        if migration_status is not None:
+          if (migration_status.status == constants.HV_MIGRATION_ACTIVE and
+              instance.hvparams[constants.HV_KVM_MIGRATION_ESCALATION]):
+            try:
+              self._EscalateMigration(instance, info["status"],
+                                      migration_status.iterations)
+            except errors.HypervisorError, err:
+              # Not fatal, the migration may still converge
+              logging.warning("KVM: failed to escalate the migration of"
+                              " instance %s: %s", instance.name, err)
+          return migration_status
+
+        logging.warning("KVM: unknown migration status '%s'",
+                        info.get("status"))
+
+      time.sleep(self._MIGRATION_INFO_RETRY_DELAY)
+
+    return objects.MigrationStatus(status=constants.HV_MIGRATION_FAILED)
+
+  @classmethod
+  def _GetMigrationEscalationStep(cls, iterations):
+    """Computes how far a migration should be escalated.
+
+    @type iterations: int
+    @param iterations: number of passes over the guest RAM so far
+    @rtype: int
+    @return: the escalation step; 0 means no escalation, steps beyond
+        L{_MIGRATION_ESCALATION_MAX_STEPS} mean switching to post-copy
+
+    """
+    if iterations < cls._MIGRATION_ESCALATION_START:
+      return 0
+    return 1 + ((iterations - cls._MIGRATION_ESCALATION_START) /
+                cls._MIGRATION_ESCALATION_INTERVAL)
+
+  def _EscalateMigration(self, instance, qmp_status, iterations):
+    """Helps a migration which doesn't converge to complete.
+
+    Since the node daemon doesn't keep state between requests, the escalation
+    step is derived from the number of passes over the guest RAM done so far.
+
+    @type instance: L{objects.Instance}
+    @param instance: the instance that is being migrated
+    @type qmp_status: string
+    @param qmp_status: the migration status as reported by QMP
+    @type iterations: int or None
+    @param iterations: number of passes over the guest RAM so far
+
+    """
+    if iterations is None:
+      return
+
+    step = self._GetMigrationEscalationStep(iterations)
+    if step == 0:
+      return
+
+    if step <= self._MIGRATION_ESCALATION_MAX_STEPS:
+      self._SetMigrationParameters(instance.name, instance.hvparams, step)
+    elif (qmp_status == "active" and
+          self._MIGRATION_CAP_POSTCOPY in
+            self._GetMigrationCapabilities(instance.name, enabled=True)):
+      logging.info("Migration of instance %s doesn't converge, switching to"
+                   " post-copy", instance.name)
+      _qmp_sessions.Execute(self._InstanceQmpMonitor(instance.name),
+                            "migrate-start-postcopy")
+
+  def _GetMigrationCapabilities(self, instance_name, enabled=False):
+    """Returns the migration capabilities supported by an instance's QEMU.
+
+    @type instance_name: string
+    @param instance_name: name of the instance
+    @type enabled: bool
+    @param enabled: whether to only return the enabled capabilities
+    @rtype: set of strings
+
+    """
+    try:
+      caps = _qmp_sessions.Execute(self._InstanceQmpMonitor(instance_name),
+                                   "query-migrate-capabilities")[
+                                     QmpConnection.RETURN_KEY]
+    except QmpCommandError, err:
+      logging.info("Can't query migration capabilities of instance %s: %s",
+                   instance_name, err)
+      return set()
+
+    return set(cap["capability"] for cap in caps
+               if cap["state"] or not enabled)
+
+  def _SetMigrationCapabilities(self, instance_name, hvparams):
+    """Enables the migration capabilities requested for an instance.
+
+    Capabilities not supported by the instance's QEMU are skipped.
+
+    @type instance_name: string
+    @param instance_name: name of the instance
+    @type hvparams: dict
+    @param hvparams: the instance's hypervisor parameters
+
+    """
+    requested = [cap for cap in
+                 hvparams[constants.HV_KVM_MIGRATION_CAPS].split(":") if cap]
+    if not requested:
+      return
+
+    supported = self._GetMigrationCapabilities(instance_name)
+    caps = []
+    for cap in requested:
+      if cap in supported:
+        caps.append({"capability": cap, "state": True})
+      else:
+        logging.warning("Migration capability %s not supported for instance"
+                        " %s, ignoring it", cap, instance_name)
+
+    if caps:
+      _qmp_sessions.Execute(self._InstanceQmpMonitor(instance_name),
+                            "migrate-set-capabilities", {"capabilities": caps})
+
+  def _SetMigrationParameters(self, instance_name, hvparams, step):
+    """Sets the migration bandwidth and downtime of an instance.
+
+    @type instance_name: string
+    @param instance_name: name of the instance
+    @type hvparams: dict
+    @param hvparams: the instance's hypervisor parameters
+    @type step: int
+    @param step: escalation step; bandwidth and downtime are doubled for
+        each step
+
+    """
+    factor = 2 ** step
+    bandwidth = hvparams[constants.HV_MIGRATION_BANDWIDTH] * factor * 1048576
+    downtime = hvparams[constants.HV_MIGRATION_DOWNTIME] * factor
+    qmp_filename = self._InstanceQmpMonitor(instance_name)
+
+    try:
+      _qmp_sessions.Execute(qmp_filename, "migrate-set-parameters", {
+        "max-bandwidth": bandwidth,
+        "downtime-limit": downtime,
+        })
+    except QmpCommandError:
+      # QEMU before 2.8 only supports the older, separate commands
+      _qmp_sessions.Execute(qmp_filename, "migrate_set_speed",
+                            {"value": bandwidth})
+      _qmp_sessions.Execute(qmp_filename, "migrate_set_downtime",
+                            {"value": downtime / 1000.0})
+
   def BalloonInstanceMemory(self, instance, mem):
     """Balloon an instance memory to a certain value.
 
@@ -2603,6 +3457,7 @@ class KVMHypervisor(hv_base.BaseHypervisor):
 
     """
     self._CallMonitorCommand(instance.name, "balloon %d" % mem)
+    self._InstanceInfoCache().Invalidate()
 
   def GetNodeInfo(self, hvparams=None):
     """Return information about the node.
@@ -27,6 +27,7 @@ import logging
 import errno
 import string # pylint: disable=W0402
 import shutil
+import time
 from cStringIO import StringIO
 
 from ganeti import constants
@@ -223,6 +224,8 @@ def _ParseNodeInfo(info):
         - nr_cpus: total number of CPUs
         - nr_nodes: in a NUMA system, the number of domains
         - nr_sockets: the number of physical CPU sockets in the node
+        - cpu_cores_per_socket: the number of physical cores per socket
+        - cpu_threads_per_core: the number of hardware threads per core
         - hv_version: the hypervisor version in the form (major, minor)
 
   """
@@ -260,6 +263,8 @@ def _ParseNodeInfo(info):
 
   if None not in [cores_per_socket, threads_per_core, nr_cpus]:
     result["cpu_sockets"] = nr_cpus / (cores_per_socket * threads_per_core)
+    result["cpu_cores_per_socket"] = cores_per_socket
+    result["cpu_threads_per_core"] = threads_per_core
 
   if memory_free is not None:
     result["memory_free"] = memory_free
@@ -379,6 +384,11 @@ class XenHypervisor(hv_base.BaseHypervisor):
   _NICS_DIR = _ROOT_DIR + "/nic" # contains NICs' info
   _DIRS = [_ROOT_DIR, _NICS_DIR]
 
+  #: File caching the list of domains, shared by the node daemon's processes
+  _INSTANCE_LIST_CACHE_FILE = _ROOT_DIR + "/instance-list.json"
+  #: Time in seconds during which the cached list of domains is used
+  _INSTANCE_LIST_CACHE_TTL = 3.0
+
   ANCILLARY_FILES = [
     XEND_CONFIG_FILE,
     XL_CONFIG_FILE,
@@ -388,7 +398,8 @@ class XenHypervisor(hv_base.BaseHypervisor):
     XL_CONFIG_FILE,
     ]
 
-  def __init__(self, _cfgdir=None, _run_cmd_fn=None, _cmd=None):
+  def __init__(self, _cfgdir=None, _run_cmd_fn=None, _cmd=None,
+               _cache_file=None):
     hv_base.BaseHypervisor.__init__(self)
 
     if _cfgdir is None:
@@ -403,6 +414,12 @@ class XenHypervisor(hv_base.BaseHypervisor):
 
     self._cmd = _cmd
 
+    if _cache_file is None:
+      _cache_file = self._INSTANCE_LIST_CACHE_FILE
+
+    self._instance_list_cache = \
+      hv_base.TimedFileCache(_cache_file, self._INSTANCE_LIST_CACHE_TTL)
+
   @staticmethod
   def _GetCommandFromHvparams(hvparams):
     """Returns the Xen command extracted from the given hvparams.
@@ -569,12 +586,29 @@ class XenHypervisor(hv_base.BaseHypervisor):
   def _GetInstanceList(self, include_node, hvparams):
     """Wrapper around module level L{_GetAllInstanceList}.
 
+    The list of domains is cached for a few seconds, as it is requested
+    several times by most operations and by every query for live instance
+    data. The cache is invalidated whenever a domain is created, destroyed,
+    migrated or modified through this class.
+
     @type hvparams: dict of strings
     @param hvparams: hypervisor parameters to be used on this node
 
     """
-    return _GetAllInstanceList(lambda: self._RunXen(["list"], hvparams),
-                               include_node)
+    cmd = self._GetCommand(hvparams)
+
+    instance_list = self._instance_list_cache.Get(key=cmd)
+    if instance_list is None:
+      now = time.time()
+      instance_list = _GetAllInstanceList(lambda: self._RunXen(["list"],
+                                                               hvparams),
+                                          True)
+      self._instance_list_cache.Put(instance_list, key=cmd, _now=now)
+
+    if include_node:
+      return instance_list
+    else:
+      return [data for data in instance_list if data[0] != _DOM0_NAME]
 
   def ListInstances(self, hvparams=None):
     """Get the list of running instances.
@@ -643,6 +677,7 @@ class XenHypervisor(hv_base.BaseHypervisor):
     cmd.append(self._ConfigFileName(instance.name))
 
     result = self._RunXen(cmd, instance.hvparams)
+    self._instance_list_cache.Invalidate()
     if result.failed:
       # Move the Xen configuration file to the log directory to avoid
       # leaving a stale config file behind.
@@ -680,7 +715,10 @@ class XenHypervisor(hv_base.BaseHypervisor):
       logging.info("Failed to shutdown instance %s, not running", name)
       return None
 
-    return self._RunXen(["shutdown", "-w", name], hvparams)
+    try:
+      return self._RunXen(["shutdown", "-w", name], hvparams)
+    finally:
+      self._instance_list_cache.Invalidate()
 
   def _DestroyInstance(self, name, hvparams):
     """Destroy an instance if the instance if the instance exists.
@@ -697,7 +735,10 @@ class XenHypervisor(hv_base.BaseHypervisor):
       logging.info("Failed to destroy instance %s, does not exist", name)
       return None
 
-    return self._RunXen(["destroy", name], hvparams)
+    try:
+      return self._RunXen(["destroy", name], hvparams)
+    finally:
+      self._instance_list_cache.Invalidate()
 
   # Destroy a domain only if necessary
   #
@@ -760,12 +801,14 @@ class XenHypervisor(hv_base.BaseHypervisor):
                                    " not running" % instance.name)
 
     result = self._RunXen(["reboot", instance.name], instance.hvparams)
+    self._instance_list_cache.Invalidate()
     if result.failed:
       raise errors.HypervisorError("Failed to reboot instance %s: %s, %s" %
                                    (instance.name, result.fail_reason,
                                     result.output))
 
     def _CheckInstance():
+      self._instance_list_cache.Invalidate()
       new_info = self.GetInstanceInfo(instance.name, hvparams=instance.hvparams)
 
       # check if the domain ID has changed or the run time has decreased
@@ -793,6 +836,7 @@ class XenHypervisor(hv_base.BaseHypervisor):
 
     """
     result = self._RunXen(["mem-set", instance.name, mem], instance.hvparams)
+    self._instance_list_cache.Invalidate()
     if result.failed:
       raise errors.HypervisorError("Failed to balloon instance %s: %s (%s)" %
                                    (instance.name, result.fail_reason,
@@ -909,6 +953,7 @@ class XenHypervisor(hv_base.BaseHypervisor):
     """
     if success:
       self._WriteConfigFile(instance.name, info)
+    self._instance_list_cache.Invalidate()
 
   def MigrateInstance(self, cluster_name, instance, target, live):
     """Migrate an instance to a target node.
@@ -968,6 +1013,7 @@ class XenHypervisor(hv_base.BaseHypervisor):
     args.extend([instance_name, target])
 
     result = self._RunXen(args, hvparams)
+    self._instance_list_cache.Invalidate()
     if result.failed:
       raise errors.HypervisorError("Failed to migrate instance %s: %s" %
                                    (instance_name, result.output))
@@ -984,6 +1030,7 @@ class XenHypervisor(hv_base.BaseHypervisor):
 
     """
     # pylint: disable=W0613
+    self._instance_list_cache.Invalidate()
     if success:
       # remove old xen file after migration succeeded
       try:
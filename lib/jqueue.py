@@ -25,7 +25,8 @@ Locking: there's a single, large lock in the L{JobQueue} class. It's
 used by all other classes in this module.
 
 @var JOBQUEUE_THREADS: the number of worker threads we start for
-    processing jobs
+    processing jobs; also the default for the minimum and maximum number of
+    workers used by L{_JobQueueWorkerPool}
 
 """
 
@@ -36,6 +37,7 @@ import weakref
 import threading
 import itertools
 import operator
+import heapq
 
 try:
   # pylint: disable=E0611
@@ -68,6 +70,30 @@ from ganeti import vcluster
 
 JOBQUEUE_THREADS = 25
 
+#: Half-life of the lock wait and execution times considered when sizing the
+#: worker pool (seconds)
+_AUTOSCALE_HALF_LIFE = 60.0
+
+#: Minimum time after resizing the worker pool before it may be shrunk
+#: (seconds)
+_AUTOSCALE_SHRINK_DELAY = 30.0
+
+#: If opcodes recently spent more than this share of their time waiting for
+#: locks, the worker pool isn't grown as more workers would only contend for
+#: the same locks
+_AUTOSCALE_MAX_LOCK_WAIT_RATIO = 0.5
+
+#: Number of idle workers kept in addition to the busy ones
+_AUTOSCALE_SPARE_WORKERS = 2
+
+#: Number of queued jobs of the same priority considered by the lock-aware
+#: scheduler
+_SCHEDULER_LOOKAHEAD = 10
+
+#: Number of times the lock-aware scheduler may pass over a job before it's
+#: run regardless of its locks
+_SCHEDULER_MAX_SKIPS = 5
+
 # member lock names to be passed to @ssynchronized decorator
 _LOCK = "_lock"
 _QUEUE = "_queue"
@@ -136,11 +162,14 @@ class _QueuedOpCode(object):
   @ivar start_timestamp: timestamp for the start of the execution
   @ivar exec_timestamp: timestamp for the actual LU Exec() function invocation
   @ivar stop_timestamp: timestamp for the end of the execution
+  @ivar profile: dictionary mapping execution phases to the time spent in
+    them, summed over all attempts; C{None} unless profiling is enabled (see
+    L{mcpu.SetProfilingEnabled})
 
   """
   __slots__ = ["input", "status", "result", "log", "priority",
                "start_timestamp", "exec_timestamp", "end_timestamp",
-               "__weakref__"]
+               "profile", "__weakref__"]
 
   def __init__(self, op):
     """Initializes instances of this class.
@@ -156,6 +185,7 @@ class _QueuedOpCode(object):
     self.start_timestamp = None
     self.exec_timestamp = None
     self.end_timestamp = None
+    self.profile = None
 
     # Get initial priority (it might change during the lifetime of this opcode)
     self.priority = getattr(op, "priority", constants.OP_PRIO_DEFAULT)
@@ -178,6 +208,7 @@ class _QueuedOpCode(object):
     obj.start_timestamp = state.get("start_timestamp", None)
     obj.exec_timestamp = state.get("exec_timestamp", None)
     obj.end_timestamp = state.get("end_timestamp", None)
+    obj.profile = state.get("profile", None)
     obj.priority = state.get("priority", constants.OP_PRIO_DEFAULT)
     return obj
 
@@ -196,6 +227,7 @@ class _QueuedOpCode(object):
       "start_timestamp": self.start_timestamp,
       "exec_timestamp": self.exec_timestamp,
       "end_timestamp": self.end_timestamp,
+      "profile": self.profile,
       "priority": self.priority,
       }
 
@@ -652,6 +684,24 @@ class _OpExecCallbacks(mcpu.OpExecCbBase):
     # Locking is done in job queue
     return self._queue.SubmitManyJobs(jobs)
 
+  @locking.ssynchronized(_QUEUE, shared=1)
+  def RecordProfile(self, spans):
+    """Merges an execution profile into the opcode.
+
+    Profiles of multiple execution attempts, e.g. after a timeout while
+    acquiring locks, are summed up.
+
+    """
+    if self._op.profile is None:
+      profile = {}
+    else:
+      profile = self._op.profile.copy()
+
+    for (name, duration) in spans.items():
+      profile[name] = profile.get(name, 0.0) + duration
+
+    self._op.profile = profile
+
 
 class _JobChangesChecker(object):
   def __init__(self, fields, prev_job_info, prev_log_serial):
@@ -1100,6 +1150,29 @@ class _JobProcessor(object):
 
     return result
 
+  def _RecordOpcodeTimes(self, op, start, had_exec_timestamp):
+    """Reports the time spent waiting for locks and executing an opcode.
+
+    @type op: L{_QueuedOpCode}
+    @param op: Opcode object
+    @type start: float
+    @param start: Time at which execution of the opcode was attempted
+    @type had_exec_timestamp: bool
+    @param had_exec_timestamp: Whether the opcode had started executing
+      before this attempt
+
+    """
+    end = time.time()
+
+    if op.exec_timestamp is None or had_exec_timestamp:
+      # Locks weren't acquired during this attempt
+      (lock_wait, exec_time) = (end - start, 0.0)
+    else:
+      exec_start = utils.MergeTime(op.exec_timestamp)
+      (lock_wait, exec_time) = (exec_start - start, end - exec_start)
+
+    self.queue.RecordOpcodeTimes(lock_wait, exec_time)
+
   def _ExecOpCodeUnlocked(self, opctx):
     """Processes one opcode and returns the result.
 
@@ -1110,11 +1183,17 @@ class _JobProcessor(object):
 
     timeout = opctx.GetNextLockTimeout()
 
+    start = time.time()
+    had_exec_timestamp = op.exec_timestamp is not None
+
     try:
-      # Make sure not to hold queue lock while calling ExecOpCode
-      result = self.opexec_fn(op.input,
-                              _OpExecCallbacks(self.queue, self.job, op),
-                              timeout=timeout)
+      try:
+        # Make sure not to hold queue lock while calling ExecOpCode
+        result = self.opexec_fn(op.input,
+                                _OpExecCallbacks(self.queue, self.job, op),
+                                timeout=timeout)
+      finally:
+        self._RecordOpcodeTimes(op, start, had_exec_timestamp)
     except mcpu.LockAcquireTimeout:
       assert timeout is not None, "Received timeout for blocking acquire"
       logging.debug("Couldn't acquire locks in %0.6fs", timeout)
@@ -1393,6 +1472,9 @@ class _JobQueueWorker(workerpool.BaseWorker):
     finally:
       job.processor_lock.release()
 
+      # This worker may have been the last one busy
+      self.pool.Autoscale()
+
   def _RunTaskInner(self, job):
     """Executes a job.
 
@@ -1411,8 +1493,16 @@ class _JobQueueWorker(workerpool.BaseWorker):
     wrap_execop_fn = compat.partial(self._WrapExecOpCode, setname_fn,
                                     proc.ExecOpCode)
 
-    _EvaluateJobProcessorResult(queue.depmgr, job,
-                                _JobProcessor(queue, wrap_execop_fn, job)())
+    if queue.context.glm.fair:
+      # Locks are handed out in order, retrying would lose the place in queue
+      strategy_factory = mcpu.BlockingLockStrategy
+    else:
+      strategy_factory = mcpu.LockAttemptTimeoutStrategy
+
+    jobproc = _JobProcessor(queue, wrap_execop_fn, job,
+                            _timeout_strategy_factory=strategy_factory)
+
+    _EvaluateJobProcessorResult(queue.depmgr, job, jobproc())
 
   @staticmethod
   def _WrapExecOpCode(setname_fn, execop_fn, op, *args, **kwargs):
@@ -1445,16 +1535,379 @@ class _JobQueueWorker(workerpool.BaseWorker):
     return "/".join(parts)
 
 
+def _GetNextOpcode(job):
+  """Returns the opcode of a job which is going to be processed next.
+
+  @type job: L{_QueuedJob}
+  @rtype: L{_QueuedOpCode} or None
+
+  """
+  if job.cur_opctx:
+    return job.cur_opctx.op
+
+  for op in job.ops:
+    if op.status not in constants.OPS_FINALIZED:
+      return op
+
+  return None
+
+
+def _GetNodeUuidFn(cfg):
+  """Returns a function expanding node names into node UUIDs.
+
+  The function is meant to be used for a single scheduling pass. The nodes
+  are read from the configuration only once, when the first name is
+  expanded, so that the configuration isn't queried for every job looked at.
+
+  @type cfg: L{config.ConfigWriter}
+  @rtype: callable
+  @return: Function returning the UUID of a node given its (possibly short)
+    name, or C{None} for unknown nodes
+
+  """
+  uuids = []
+
+  def _GetNodeUuid(node_name):
+    if not uuids:
+      uuids.append(dict((node.name, node.uuid)
+                        for node in cfg.GetAllNodesInfo().values()))
+    name_to_uuid = uuids[0]
+    return name_to_uuid.get(utils.MatchNameComponent(node_name,
+                                                     name_to_uuid.keys(),
+                                                     case_sensitive=False))
+
+  return _GetNodeUuid
+
+
+def _CheckJobLocksAvailable(glm, node_uuid_fn, job):
+  """Checks whether the locks likely needed by a job are available.
+
+  See L{mcpu.GetLockHints}.
+
+  @type glm: L{locking.GanetiLockManager}
+  @type node_uuid_fn: callable
+  @param node_uuid_fn: Function expanding node names, see L{_GetNodeUuidFn}
+  @type job: L{_QueuedJob}
+  @rtype: bool
+
+  """
+  op = _GetNextOpcode(job)
+  if op is None:
+    return True
+
+  hints = mcpu.GetLockHints(op.input, node_uuid_fn=node_uuid_fn)
+
+  return compat.all(glm.check_available(level, names, shared=shared)
+                    for (level, names, shared) in hints)
+
+
+def _PickTask(tasks, check_fn, skips):
+  """Chooses a task to run among several candidates.
+
+  The first task whose locks are available is chosen. If no such task
+  exists, the first task is used. Tasks which have already been passed over
+  L{_SCHEDULER_MAX_SKIPS} times are chosen regardless of their locks.
+
+  @type tasks: list
+  @param tasks: Task entries as used by L{workerpool.WorkerPool}, in the order
+    in which they'd be run without considering locks
+  @type check_fn: callable
+  @param check_fn: Function called with a task's arguments, returning whether
+    its locks are available
+  @type skips: dict
+  @param skips: Number of times a task was passed over, keyed by task ID;
+    updated by this function
+  @rtype: int
+  @return: Index of the chosen task
+
+  """
+  chosen = None
+  fallback = None
+
+  for (idx, (_, _, task_id, args)) in enumerate(tasks):
+    if args is None:
+      # Abandoned entry
+      continue
+
+    if fallback is None:
+      fallback = idx
+
+    if skips.get(task_id, 0) >= _SCHEDULER_MAX_SKIPS or check_fn(*args):
+      chosen = idx
+      break
+
+  if chosen is None:
+    if fallback is None:
+      # Only abandoned entries
+      return 0
+
+    chosen = fallback
+
+  for (_, _, task_id, args) in tasks[:chosen]:
+    if args is not None:
+      skips[task_id] = skips.get(task_id, 0) + 1
+
+  skips.pop(tasks[chosen][2], None)
+
+  return chosen
+
+
+class _WorkerPoolPolicy(object):
+  """Policy for sizing the job queue worker pool.
+
+  The pool is grown when there are runnable jobs waiting for a worker, unless
+  opcodes recently spent most of their time waiting for locks rather than
+  executing (i.e. running RPCs). It is shrunk to the number of busy workers
+  plus a few spare ones if it hasn't been resized for a while. The size is
+  always kept between the configured minimum and maximum.
+
+  Not thread-safe, the caller must serialize access.
+
+  """
+  def __init__(self, min_workers, max_workers, _time_fn=time.time):
+    """Initializes this class.
+
+    @type min_workers: int
+    @param min_workers: Minimum number of workers
+    @type max_workers: int
+    @param max_workers: Maximum number of workers
+
+    """
+    assert 0 < min_workers <= max_workers
+
+    self.min_workers = min_workers
+    self.max_workers = max_workers
+    self.resizes = 0
+
+    self._time_fn = _time_fn
+    self._lock_wait = 0.0
+    self._exec_time = 0.0
+    self._last_update = None
+    self._last_resize = None
+
+  def _Decay(self, now):
+    """Decays the recorded lock wait and execution times.
+
+    """
+    if self._last_update is not None and now > self._last_update:
+      factor = 0.5 ** ((now - self._last_update) / _AUTOSCALE_HALF_LIFE)
+      self._lock_wait *= factor
+      self._exec_time *= factor
+
+    self._last_update = now
+
+  def RecordOpcode(self, lock_wait, exec_time):
+    """Records how long an opcode waited for locks and executed.
+
+    @type lock_wait: float
+    @param lock_wait: Time spent waiting for locks (seconds)
+    @type exec_time: float
+    @param exec_time: Time spent executing (seconds)
+
+    """
+    self._Decay(self._time_fn())
+    self._lock_wait += max(0.0, lock_wait)
+    self._exec_time += max(0.0, exec_time)
+
+  def GetTimes(self):
+    """Returns the recent lock wait and execution times.
+
+    @rtype: tuple; (float, float)
+
+    """
+    self._Decay(self._time_fn())
+    return (self._lock_wait, self._exec_time)
+
+  def GetLockWaitRatio(self):
+    """Returns the share of recent opcode time spent waiting for locks.
+
+    @rtype: float
+
+    """
+    (lock_wait, exec_time) = self.GetTimes()
+
+    if lock_wait + exec_time <= 0:
+      return 0.0
+
+    return lock_wait / (lock_wait + exec_time)
+
+  def ComputeSize(self, num_workers, num_busy, num_pending):
+    """Computes the number of workers the pool should have.
+
+    @type num_workers: int
+    @param num_workers: Current number of workers
+    @type num_busy: int
+    @param num_busy: Number of workers busy with a task
+    @type num_pending: int
+    @param num_pending: Number of tasks waiting for a worker
+    @rtype: int
+
+    """
+    now = self._time_fn()
+
+    if num_pending and self.GetLockWaitRatio() > _AUTOSCALE_MAX_LOCK_WAIT_RATIO:
+      # More workers would only wait for the same locks
+      wanted = num_workers
+    else:
+      wanted = num_busy + num_pending + _AUTOSCALE_SPARE_WORKERS
+
+    wanted = min(self.max_workers, max(self.min_workers, wanted))
+
+    if wanted < num_workers:
+      if (self._last_resize is not None and
+          now - self._last_resize < _AUTOSCALE_SHRINK_DELAY):
+        # Don't shrink right after having changed the size
+        return num_workers
+
+      # Never stop workers busy with a task
+      wanted = max(wanted, num_busy)
+
+    if wanted != num_workers:
+      self._last_resize = now
+      self.resizes += 1
+
+    return wanted
+
+
 class _JobQueueWorkerPool(workerpool.WorkerPool):
   """Simple class implementing a job-processing workerpool.
 
+  The number of workers is adjusted according to L{_WorkerPoolPolicy}
+  whenever a task is added or finished.
+
   """
-  def __init__(self, queue):
-    super(_JobQueueWorkerPool, self).__init__("Jq",
-                                              JOBQUEUE_THREADS,
+  def __init__(self, queue, min_workers=JOBQUEUE_THREADS,
+               max_workers=JOBQUEUE_THREADS, lock_aware=False):
+    """Initializes this class.
+
+    @type min_workers: int
+    @param min_workers: Minimum number of workers
+    @type max_workers: int
+    @param max_workers: Maximum number of workers
+    @type lock_aware: bool
+    @param lock_aware: Whether to prefer jobs whose locks are available (see
+      L{_PopTaskUnlocked})
+
+    """
+    self._policy = _WorkerPoolPolicy(min_workers, max_workers)
+    self._lock_aware = lock_aware
+    self._skips = {}
+
+    super(_JobQueueWorkerPool, self).__init__("Jq", min_workers,
                                               _JobQueueWorker)
     self.queue = queue
 
+  def _AutoscaleUnlocked(self):
+    """Resizes the pool as suggested by the sizing policy.
+
+    """
+    if not (self._active and self._workers):
+      # Shutting down
+      return
+
+    (num_workers, num_busy, num_pending) = self._GetWorkerCountsUnlocked()
+
+    wanted = self._policy.ComputeSize(num_workers, num_busy, num_pending)
+
+    if wanted != num_workers:
+      logging.info("Resizing job queue worker pool from %s to %s workers"
+                   " (%s busy, %s jobs waiting, %0.2f lock wait ratio)",
+                   num_workers, wanted, num_busy, num_pending,
+                   self._policy.GetLockWaitRatio())
+      self._ResizeUnlocked(wanted, wait=False)
+
+  def _PopTaskUnlocked(self):
+    """Removes the next job to be run from the queue and returns it.
+
+    With lock-aware scheduling, up to L{_SCHEDULER_LOOKAHEAD} jobs of the
+    highest queued priority are considered and a job whose locks appear to
+    be available is preferred over jobs which would block a worker while
+    waiting for locks (see L{_PickTask}).
+
+    """
+    if not self._lock_aware:
+      return super(_JobQueueWorkerPool, self)._PopTaskUnlocked()
+
+    candidates = [heapq.heappop(self._tasks)]
+
+    while (self._tasks and len(candidates) < _SCHEDULER_LOOKAHEAD and
+           self._tasks[0][0] == candidates[0][0]):
+      candidates.append(heapq.heappop(self._tasks))
+
+    context = self.queue.context
+    task = candidates.pop(_PickTask(candidates,
+                                    compat.partial(_CheckJobLocksAvailable,
+                                                   context.glm,
+                                                   _GetNodeUuidFn(context.cfg)),
+                                    self._skips))
+
+    # Return the other candidates to the queue
+    for other in candidates:
+      heapq.heappush(self._tasks, other)
+
+    # Forget about jobs which are no longer queued
+    for task_id in [task_id for task_id in self._skips
+                    if task_id not in self._taskdata]:
+      del self._skips[task_id]
+
+    return task
+
+  def _AddTaskUnlocked(self, args, priority, task_id):
+    """Adds a task and resizes the pool if necessary.
+
+    """
+    super(_JobQueueWorkerPool, self)._AddTaskUnlocked(args, priority, task_id)
+    self._AutoscaleUnlocked()
+
+  def Autoscale(self):
+    """Resizes the pool as suggested by the sizing policy.
+
+    """
+    self._lock.acquire()
+    try:
+      self._AutoscaleUnlocked()
+    finally:
+      self._lock.release()
+
+  def RecordOpcode(self, lock_wait, exec_time):
+    """Records how long an opcode waited for locks and executed.
+
+    See L{_WorkerPoolPolicy.RecordOpcode}.
+
+    """
+    self._lock.acquire()
+    try:
+      self._policy.RecordOpcode(lock_wait, exec_time)
+    finally:
+      self._lock.release()
+
+  def GetStatistics(self):
+    """Returns statistics about the pool.
+
+    @rtype: dict
+    @return: Dictionary with statistics, see L{query.QUEUE_FIELDS}
+
+    """
+    self._lock.acquire()
+    try:
+      (num_workers, num_busy, num_pending) = self._GetWorkerCountsUnlocked()
+      (lock_wait, exec_time) = self._policy.GetTimes()
+
+      return {
+        "name": self._name,
+        "workers": num_workers,
+        "workers_busy": num_busy,
+        "workers_min": self._policy.min_workers,
+        "workers_max": self._policy.max_workers,
+        "jobs_pending": num_pending,
+        "lock_wait": lock_wait,
+        "exec_time": exec_time,
+        "lock_wait_ratio": self._policy.GetLockWaitRatio(),
+        "resizes": self._policy.resizes,
+        }
+    finally:
+      self._lock.release()
+
 
 class _JobDependencyManager:
   """Keeps track of job dependencies.
@@ -1646,7 +2099,8 @@ class JobQueue(object):
   """Queue used to manage the jobs.
 
   """
-  def __init__(self, context):
+  def __init__(self, context, min_workers=JOBQUEUE_THREADS,
+               max_workers=JOBQUEUE_THREADS, lock_aware_scheduling=False):
     """Constructor for JobQueue.
 
     The constructor will initialize the job queue object and then
@@ -1657,6 +2111,14 @@ class JobQueue(object):
     @type context: GanetiContext
     @param context: the context object for access to the configuration
         data and other ganeti objects
+    @type min_workers: int
+    @param min_workers: Minimum number of job worker threads
+    @type max_workers: int
+    @param max_workers: Maximum number of job worker threads; if higher than
+        C{min_workers}, the number of workers is adjusted to the load
+    @type lock_aware_scheduling: bool
+    @param lock_aware_scheduling: Whether to prefer running jobs whose locks
+        are available over jobs which would wait for locks
 
     """
     self.context = context
@@ -1706,7 +2168,9 @@ class JobQueue(object):
     self.context.glm.AddToLockMonitor(self.depmgr)
 
     # Setup worker pool
-    self._wpool = _JobQueueWorkerPool(self)
+    self._wpool = _JobQueueWorkerPool(self, min_workers=min_workers,
+                                      max_workers=max_workers,
+                                      lock_aware=lock_aware_scheduling)
 
   def _PickupJobUnlocked(self, job_id):
     """Load a job from the job queue
@@ -2553,6 +3017,31 @@ class JobQueue(object):
 
     return self._wpool.HasRunningTasks()
 
+  def RecordOpcodeTimes(self, lock_wait, exec_time):
+    """Records how long an opcode waited for locks and executed.
+
+    Used for sizing the worker pool. Doesn't need the queue lock.
+
+    @type lock_wait: float
+    @param lock_wait: Time spent waiting for locks (seconds)
+    @type exec_time: float
+    @param exec_time: Time spent executing (seconds)
+
+    """
+    self._wpool.RecordOpcode(lock_wait, exec_time)
+
+  def QueryStatistics(self, fields):
+    """Queries statistics about the job queue worker pool.
+
+    @type fields: list of strings
+    @param fields: List of fields to return, see L{query.QUEUE_FIELDS}
+
+    """
+    qobj = query.Query(query.QUEUE_FIELDS, fields)
+    data = query.QueueQueryData(self._wpool.GetStatistics())
+
+    return query.GetQueryResponse(qobj, data)
+
   def AcceptingJobsUnlocked(self):
     """Returns whether jobs are accepted.
 
@@ -47,6 +47,26 @@ _DELETED_TEXT = "deleted"
 
 _DEFAULT_PRIORITY = 0
 
+#: Conditions based on pipes, see L{PipeCondition}
+CONDITION_PIPE = "pipe"
+
+#: Conditions based on locks for blocking waits, see L{LockCondition}
+CONDITION_LOCK = "lock"
+
+CONDITION_TYPES = compat.UniqueFrozenset([
+  CONDITION_PIPE,
+  CONDITION_LOCK,
+  ])
+
+#: Upper bounds (in seconds) of the buckets used for lock wait time histograms
+LOCK_WAIT_BUCKETS = [0.001, 0.01, 0.1, 1.0, 10.0, 60.0, 600.0]
+
+#: Whether lock statistics are collected, see L{SetStatisticsEnabled}
+_statistics_enabled = False
+
+#: Per-thread data, used for knowing which opcode a thread is executing
+_thread_context = threading.local()
+
 #: Minimum timeout required to consider scheduling a pending acquisition
 #: (seconds)
 _LOCK_ACQUIRE_MIN_TIMEOUT = (1.0 / 1000)
@@ -63,6 +83,40 @@ _LS_ACQUIRE_MODES = compat.UniqueFrozenset([
   ])
 
 
+def SetStatisticsEnabled(enabled):
+  """Enables or disables the collection of lock statistics.
+
+  When disabled, the only overhead is a check of a module-global variable on
+  every acquire. Statistics already collected are kept.
+
+  @type enabled: bool
+
+  """
+  global _statistics_enabled # pylint: disable=W0603
+  _statistics_enabled = bool(enabled)
+
+
+def SetOpcodeContext(op_id):
+  """Sets the opcode executed by the calling thread.
+
+  Lock statistics are broken down by opcode using this information.
+
+  @type op_id: string or None
+  @param op_id: Opcode ID (e.g. C{OP_INSTANCE_STARTUP}) or C{None}
+
+  """
+  _thread_context.op_id = op_id
+
+
+def _GetOpcodeContext():
+  """Returns the opcode executed by the calling thread.
+
+  @rtype: string or None
+
+  """
+  return getattr(_thread_context, "op_id", None)
+
+
 def ssynchronized(mylock, shared=0):
   """Shared Synchronization decorator.
 
@@ -366,6 +420,24 @@ class PipeCondition(_BaseCondition):
 
     return bool(self._waiters)
 
+  def add_waiter(self):
+    """Registers the calling thread as a waiter without waiting.
+
+    The thread is removed again by L{wait} or L{remove_waiter}.
+
+    """
+    self._check_owned()
+
+    self._waiters.add(threading.currentThread())
+
+  def remove_waiter(self):
+    """Unregisters the calling thread as a waiter.
+
+    """
+    self._check_owned()
+
+    self._waiters.discard(threading.currentThread())
+
   def __repr__(self):
     return ("<%s.%s waiters=%s at %#x>" %
             (self.__class__.__module__, self.__class__.__name__,
@@ -385,6 +457,242 @@ class _PipeConditionWithMode(PipeCondition):
     PipeCondition.__init__(self, lock)
 
 
+class SingleNotifyLockCondition(SingleNotifyPipeCondition):
+  """Condition which can only be notified once, using locks for blocking waits.
+
+  Waits without a timeout block on a lock allocated for each waiter, which
+  uses no file descriptors and is woken up by releasing the lock. Python's
+  locks can not be acquired with a timeout, therefore waits with a timeout
+  fall back to the pipe shared by all such waiters (see
+  L{SingleNotifyPipeCondition}).
+
+  """
+  __slots__ = [
+    "_waiter_locks",
+    ]
+
+  def __init__(self, lock):
+    """Initializes this class.
+
+    """
+    SingleNotifyPipeCondition.__init__(self, lock)
+    self._waiter_locks = []
+
+  def wait(self, timeout):
+    """Wait for a notification.
+
+    @type timeout: float or None
+    @param timeout: Waiting timeout (can be None)
+
+    """
+    if timeout is not None:
+      SingleNotifyPipeCondition.wait(self, timeout)
+      return
+
+    self._check_owned()
+    self._check_unnotified()
+
+    waiter = threading.Lock()
+    waiter.acquire()
+    self._waiter_locks.append(waiter)
+
+    state = self._release_save()
+    try:
+      # Blocks until the lock is released by L{notifyAll}
+      waiter.acquire()
+    finally:
+      # Re-acquire lock
+      self._acquire_restore(state)
+
+  def notifyAll(self): # pylint: disable=C0103
+    """Notify all waiters.
+
+    """
+    SingleNotifyPipeCondition.notifyAll(self)
+
+    for waiter in self._waiter_locks:
+      waiter.release()
+
+    self._waiter_locks = []
+
+
+class LockCondition(PipeCondition):
+  """Group-only non-polling condition with counters, using locks.
+
+  Same as L{PipeCondition}, but blocking waits don't need any file
+  descriptors (see L{SingleNotifyLockCondition}).
+
+  """
+  __slots__ = []
+
+  _single_condition_class = SingleNotifyLockCondition
+
+
+class _LockConditionWithMode(LockCondition):
+  __slots__ = [
+    "shared",
+    ]
+
+  def __init__(self, lock, shared):
+    """Initializes this class.
+
+    """
+    self.shared = shared
+    LockCondition.__init__(self, lock)
+
+
+#: Condition implementations for the wait queues of L{SharedLock}
+_CONDITION_CLASSES = {
+  CONDITION_PIPE: _PipeConditionWithMode,
+  CONDITION_LOCK: _LockConditionWithMode,
+  }
+
+
+def SetConditionType(kind):
+  """Selects the condition implementation used for waiting on locks.
+
+  Only affects locks whose pending acquires start waiting afterwards.
+
+  @type kind: string
+  @param kind: One of L{CONDITION_TYPES}
+
+  """
+  try:
+    cls = _CONDITION_CLASSES[kind]
+  except KeyError:
+    raise errors.ProgrammerError("Unknown condition type '%s'" % kind)
+
+  SharedLock.condition_class = cls
+
+
+class _LockStatistics(object):
+  """Contention statistics for a single lock.
+
+  All methods must be called with the lock's internal lock held.
+
+  """
+  __slots__ = [
+    "acquires",
+    "timeouts",
+    "wait_total",
+    "wait_max",
+    "wait_hist",
+    "hold_total",
+    "hold_max",
+    "holders",
+    "by_opcode",
+    "blocked_by",
+    ]
+
+  def __init__(self):
+    """Initializes this class.
+
+    """
+    self.acquires = 0
+    self.timeouts = 0
+    self.wait_total = 0.0
+    self.wait_max = 0.0
+    self.wait_hist = [0] * (len(LOCK_WAIT_BUCKETS) + 1)
+    self.hold_total = 0.0
+    self.hold_max = 0.0
+
+    # Thread to (acquire time, opcode ID)
+    self.holders = {}
+
+    # Opcode ID to [acquires, timeouts, wait time, hold time]
+    self.by_opcode = {}
+
+    # (waiting opcode ID, owning opcode ID) to number of times
+    self.blocked_by = {}
+
+  def _GetOpcodeEntry(self, op_id):
+    """Returns the per-opcode counters for an opcode.
+
+    """
+    try:
+      return self.by_opcode[op_id]
+    except KeyError:
+      entry = self.by_opcode[op_id] = [0, 0, 0.0, 0.0]
+      return entry
+
+  def RecordBlocked(self, op_id):
+    """Records a pending acquire having to wait for the current owners.
+
+    """
+    for (_, owner_op_id) in self.holders.values():
+      key = (op_id, owner_op_id)
+      self.blocked_by[key] = self.blocked_by.get(key, 0) + 1
+
+  def RecordAcquire(self, op_id, waited, now):
+    """Records a successful acquire by the current thread.
+
+    """
+    for (idx, upper) in enumerate(LOCK_WAIT_BUCKETS):
+      if waited <= upper:
+        break
+    else:
+      idx = len(LOCK_WAIT_BUCKETS)
+
+    self.acquires += 1
+    self.wait_total += waited
+    self.wait_max = max(self.wait_max, waited)
+    self.wait_hist[idx] += 1
+
+    entry = self._GetOpcodeEntry(op_id)
+    entry[0] += 1
+    entry[2] += waited
+
+    self.holders[threading.currentThread()] = (now, op_id)
+
+  def RecordTimeout(self, op_id, waited):
+    """Records an acquire which timed out.
+
+    """
+    self.timeouts += 1
+    self.wait_total += waited
+
+    entry = self._GetOpcodeEntry(op_id)
+    entry[1] += 1
+    entry[2] += waited
+
+  def RecordRelease(self, now):
+    """Records the current thread releasing the lock.
+
+    """
+    try:
+      (start, op_id) = self.holders.pop(threading.currentThread())
+    except KeyError:
+      # Acquired while statistics were disabled
+      return
+
+    held = max(0.0, now - start)
+
+    self.hold_total += held
+    self.hold_max = max(self.hold_max, held)
+    self._GetOpcodeEntry(op_id)[3] += held
+
+  def ToDict(self):
+    """Returns a snapshot of the statistics.
+
+    @rtype: dict
+
+    """
+    return {
+      "acquires": self.acquires,
+      "timeouts": self.timeouts,
+      "wait_total": self.wait_total,
+      "wait_max": self.wait_max,
+      "wait_hist": zip(LOCK_WAIT_BUCKETS + [None], self.wait_hist),
+      "hold_total": self.hold_total,
+      "hold_max": self.hold_max,
+      "opcodes": sorted([op_id] + values
+                        for (op_id, values) in self.by_opcode.items()),
+      "blocked_by": sorted([waiting, owning, count]
+                           for ((waiting, owning), count) in
+                             self.blocked_by.items()),
+      }
+
+
 class SharedLock(object):
   """Implements a shared lock.
 
@@ -413,11 +721,13 @@ class SharedLock(object):
     "__pending_by_prio",
     "__pending_shared",
     "__shr",
+    "__stats",
     "__time_fn",
     "name",
     ]
 
-  __condition_class = _PipeConditionWithMode
+  #: Condition class for pending acquires, see L{SetConditionType}
+  condition_class = _LockConditionWithMode
 
   def __init__(self, name, monitor=None, _time_fn=time.time):
     """Construct a new SharedLock.
@@ -449,6 +759,9 @@ class SharedLock(object):
     # is this lock in the deleted state?
     self.__deleted = False
 
+    # Contention statistics, allocated when first needed
+    self.__stats = None
+
     # Register with lock monitor
     if monitor:
       logging.debug("Adding lock %s to monitor", name)
@@ -516,6 +829,39 @@ class SharedLock(object):
     finally:
       self.__lock.release()
 
+  def GetLockStatistics(self):
+    """Retrieves contention statistics for querying locks.
+
+    @rtype: list of tuples
+    @return: List containing a tuple of lock name and statistics (see
+      L{_LockStatistics.ToDict}) if any were collected
+
+    """
+    self.__lock.acquire()
+    try:
+      if self.__stats is None:
+        return []
+
+      return [(self.name, self.__stats.ToDict())]
+    finally:
+      self.__lock.release()
+
+  def __get_stats(self):
+    """Returns the statistics object, creating it if necessary.
+
+    """
+    if self.__stats is None:
+      self.__stats = _LockStatistics()
+
+    return self.__stats
+
+  def __record_release(self):
+    """Records the current thread releasing the lock.
+
+    """
+    if self.__stats is not None:
+      self.__stats.RecordRelease(self.__time_fn())
+
   def __check_deleted(self):
     """Raises an exception if the lock has been deleted.
 
@@ -580,6 +926,23 @@ class SharedLock(object):
     finally:
       self.__lock.release()
 
+  def is_available(self, shared=0):
+    """Checks whether the lock could currently be acquired without waiting.
+
+    The result is only a hint, other threads can acquire or release the lock
+    at any time.
+
+    @param shared: Whether to check for acquiring the lock in shared mode
+
+    """
+    self.__lock.acquire()
+    try:
+      (_, prioqueue) = self.__find_first_pending_queue()
+
+      return prioqueue is None and self.__can_acquire(shared)
+    finally:
+      self.__lock.release()
+
   def _check_empty(self):
     """Checks whether there are any pending acquires.
 
@@ -664,18 +1027,46 @@ class SharedLock(object):
     # Remove empty entries from queue
     self.__find_first_pending_queue()
 
+    if _statistics_enabled:
+      stats = self.__get_stats()
+      op_id = _GetOpcodeContext()
+    else:
+      stats = None
+      op_id = None
+
     # Check whether someone else holds the lock or there are pending acquires.
     if not self.__pending and self.__can_acquire(shared):
       # Apparently not, can acquire lock directly.
       self.__do_acquire(shared)
+      if stats:
+        stats.RecordAcquire(op_id, 0.0, self.__time_fn())
       return True
 
     # The lock couldn't be acquired right away, so if a timeout is given and is
     # considered too short, return right away as scheduling a pending
     # acquisition is quite expensive
     if timeout is not None and timeout < _LOCK_ACQUIRE_MIN_TIMEOUT:
+      if stats:
+        stats.RecordTimeout(op_id, 0.0)
       return False
 
+    (wait_condition, prioqueue) = self.__enqueue_unlocked(shared, priority)
+
+    return self.__wait_unlocked(wait_condition, prioqueue, shared, timeout,
+                                priority, stats, op_id)
+
+  def __enqueue_unlocked(self, shared, priority, at_tail=False):
+    """Adds a pending acquire to the queue.
+
+    Shared acquires on the same priority share a condition.
+
+    @type at_tail: bool
+    @param at_tail: Whether the acquire must be queued behind all other
+      pending acquires on the same priority, even if it is a shared one
+    @return: Tuple containing the condition to wait on and the queue it was
+      added to
+
+    """
     prioqueue = self.__pending_by_prio.get(priority, None)
 
     if shared:
@@ -683,6 +1074,12 @@ class SharedLock(object):
       wait_condition = self.__pending_shared.get(priority, None)
       assert (wait_condition is None or
               (wait_condition.shared and wait_condition in prioqueue))
+
+      if (at_tail and wait_condition is not None and
+          prioqueue[-1] is not wait_condition):
+        # Further shared acquires will use the new condition
+        del self.__pending_shared[priority]
+        wait_condition = None
     else:
       wait_condition = None
 
@@ -694,7 +1091,7 @@ class SharedLock(object):
         heapq.heappush(self.__pending, (priority, prioqueue))
         self.__pending_by_prio[priority] = prioqueue
 
-      wait_condition = self.__condition_class(self.__lock, shared)
+      wait_condition = self.condition_class(self.__lock, shared)
       prioqueue.append(wait_condition)
 
       if shared:
@@ -703,9 +1100,40 @@ class SharedLock(object):
         assert priority not in self.__pending_shared
         self.__pending_shared[priority] = wait_condition
 
+    return (wait_condition, prioqueue)
+
+  def __dequeue_unused(self, wait_condition, prioqueue, priority):
+    """Removes a condition from the queue if there are no more waiters.
+
+    """
+    if wait_condition.has_waiting():
+      return
+
+    was_on_top = self.__is_on_top(wait_condition)
+
+    prioqueue.remove(wait_condition)
+    if self.__pending_shared.get(priority, None) is wait_condition:
+      # Remove from list of shared acquires if it wasn't while releasing
+      # (e.g. on lock deletion)
+      del self.__pending_shared[priority]
+
+    if (was_on_top and not self.__deleted and
+        self.__exc is None and not self.__shr):
+      # The lock is not held by anyone, e.g. after a reservation was
+      # cancelled, so the next pending acquire can go ahead
+      self.__notify_topmost()
+
+  def __wait_unlocked(self, wait_condition, prioqueue, shared, timeout,
+                      priority, stats, op_id):
+    """Waits for a queued acquire to be at the top of the queue.
+
+    """
     wait_start = self.__time_fn()
     acquired = False
 
+    if stats:
+      stats.RecordBlocked(op_id)
+
     try:
       # Wait until we become the topmost acquire in the queue or the timeout
       # expires.
@@ -725,13 +1153,14 @@ class SharedLock(object):
         wait_condition.wait(timeout)
         self.__check_deleted()
     finally:
-      # Remove condition from queue if there are no more waiters
-      if not wait_condition.has_waiting():
-        prioqueue.remove(wait_condition)
-        if wait_condition.shared:
-          # Remove from list of shared acquires if it wasn't while releasing
-          # (e.g. on lock deletion)
-          self.__pending_shared.pop(priority, None)
+      self.__dequeue_unused(wait_condition, prioqueue, priority)
+
+    if stats:
+      now = self.__time_fn()
+      if acquired:
+        stats.RecordAcquire(op_id, now - wait_start, now)
+      else:
+        stats.RecordTimeout(op_id, now - wait_start)
 
     return acquired
 
@@ -763,6 +1192,101 @@ class SharedLock(object):
     finally:
       self.__lock.release()
 
+  def _reserve(self, shared=0, priority=None):
+    """Queues a pending acquire without waiting for it.
+
+    The calling thread takes its place in the queue of pending acquires just
+    as if it had called L{acquire}. Later acquires, even on other threads,
+    queue up behind it until the reservation is either used by
+    L{_acquire_reserved} or cancelled with L{_cancel_reservation}.
+
+    Unlike acquires, reservations never overtake earlier pending acquires,
+    not even ones with a lower priority. This keeps the order of threads
+    reserving several locks consistent across all of them.
+
+    @type shared: integer (0/1) used as a boolean
+    @param shared: whether to acquire in shared mode
+    @type priority: integer
+    @param priority: Priority for acquiring lock
+    @return: Opaque reservation object
+
+    """
+    if priority is None:
+      priority = _DEFAULT_PRIORITY
+
+    self.__lock.acquire()
+    try:
+      self.__check_deleted()
+
+      assert not self.__is_owned(), ("double acquire() on a non-recursive lock"
+                                     " %s" % self.name)
+
+      # Remove empty entries from queue
+      self.__find_first_pending_queue()
+
+      if self.__pending:
+        priority = max(priority, max(prio for (prio, _) in self.__pending))
+
+      (wait_condition, prioqueue) = \
+        self.__enqueue_unlocked(shared, priority, at_tail=True)
+      wait_condition.add_waiter()
+
+      return (wait_condition, prioqueue, shared, priority)
+    finally:
+      self.__lock.release()
+
+  def _acquire_reserved(self, reservation, timeout=None, test_notify=None):
+    """Acquires a lock using a reservation made with L{_reserve}.
+
+    The reservation is consumed whether the lock could be acquired or not.
+
+    @param reservation: Reservation returned by L{_reserve}
+    @type timeout: float
+    @param timeout: maximum waiting time before giving up
+    @type test_notify: callable or None
+    @param test_notify: Special callback function for unittesting
+
+    """
+    (wait_condition, prioqueue, shared, priority) = reservation
+
+    self.__lock.acquire()
+    try:
+      if __debug__ and callable(test_notify):
+        test_notify()
+
+      wait_condition.remove_waiter()
+
+      if self.__deleted:
+        self.__dequeue_unused(wait_condition, prioqueue, priority)
+        self.__check_deleted()
+
+      if _statistics_enabled:
+        stats = self.__get_stats()
+        op_id = _GetOpcodeContext()
+      else:
+        stats = None
+        op_id = None
+
+      return self.__wait_unlocked(wait_condition, prioqueue, shared, timeout,
+                                  priority, stats, op_id)
+    finally:
+      self.__lock.release()
+
+  def _cancel_reservation(self, reservation):
+    """Gives up a reservation made with L{_reserve}.
+
+    @param reservation: Reservation returned by L{_reserve}
+
+    """
+    (wait_condition, prioqueue, _, priority) = reservation
+
+    self.__lock.acquire()
+    try:
+      wait_condition.remove_waiter()
+      self.__dequeue_unused(wait_condition, prioqueue, priority)
+    finally:
+      self.__lock.release()
+
   def downgrade(self):
     """Changes the lock mode from exclusive to shared.
 
@@ -805,111 +1329,482 @@ class SharedLock(object):
     finally:
       self.__lock.release()
 
-  def release(self):
-    """Release a Shared Lock.
+  def release(self):
+    """Release a Shared Lock.
+
+    You must have acquired the lock, either in shared or in exclusive mode,
+    before calling this function.
+
+    """
+    self.__lock.acquire()
+    try:
+      assert self.__is_exclusive() or self.__is_sharer(), \
+        "Cannot release non-owned lock"
+
+      self.__record_release()
+
+      # Autodetect release type
+      if self.__is_exclusive():
+        self.__exc = None
+        notify = True
+      else:
+        self.__shr.remove(threading.currentThread())
+        notify = not self.__shr
+
+      # Notify topmost condition in queue if there are no owners left (for
+      # shared locks)
+      if notify:
+        self.__notify_topmost()
+    finally:
+      self.__lock.release()
+
+  def __notify_topmost(self):
+    """Notifies topmost condition in queue of pending acquires.
+
+    """
+    (priority, prioqueue) = self.__find_first_pending_queue()
+    if prioqueue:
+      cond = prioqueue[0]
+      cond.notifyAll()
+      if self.__pending_shared.get(priority, None) is cond:
+        # Prevent further shared acquires from sneaking in while waiters are
+        # notified
+        del self.__pending_shared[priority]
+
+  def _notify_topmost(self):
+    """Exported version of L{__notify_topmost}.
+
+    """
+    self.__lock.acquire()
+    try:
+      return self.__notify_topmost()
+    finally:
+      self.__lock.release()
+
+  def delete(self, timeout=None, priority=None):
+    """Delete a Shared Lock.
+
+    This operation will declare the lock for removal. First the lock will be
+    acquired in exclusive mode if you don't already own it, then the lock
+    will be put in a state where any future and pending acquire() fail.
+
+    @type timeout: float
+    @param timeout: maximum waiting time before giving up
+    @type priority: integer
+    @param priority: Priority for acquiring lock
+
+    """
+    if priority is None:
+      priority = _DEFAULT_PRIORITY
+
+    self.__lock.acquire()
+    try:
+      assert not self.__is_sharer(), "Cannot delete() a lock while sharing it"
+
+      self.__check_deleted()
+
+      # The caller is allowed to hold the lock exclusively already.
+      acquired = self.__is_exclusive()
+
+      if not acquired:
+        acquired = self.__acquire_unlocked(0, timeout, priority)
+
+      if acquired:
+        assert self.__is_exclusive() and not self.__is_sharer(), \
+          "Lock wasn't acquired in exclusive mode"
+
+        self.__record_release()
+
+        self.__deleted = True
+        self.__exc = None
+
+        assert not (self.__exc or self.__shr), "Found owner during deletion"
+
+        # Notify all acquires. They'll throw an error.
+        for (_, prioqueue) in self.__pending:
+          for cond in prioqueue:
+            cond.notifyAll()
+
+        assert self.__deleted
+
+      return acquired
+    finally:
+      self.__lock.release()
+
+  def _release_save(self):
+    shared = self.__is_sharer()
+    self.release()
+    return shared
+
+  def _acquire_restore(self, shared):
+    self.acquire(shared=shared)
+
+
+#: Modes of L{IntentLock}
+MODE_INTENT_SHARED = "intent-shared"
+MODE_INTENT_EXCLUSIVE = "intent-exclusive"
+MODE_SHARED = _SHARED_TEXT
+MODE_EXCLUSIVE = _EXCLUSIVE_TEXT
+
+#: Modes which can be held at the same time as a given mode
+_INTENT_COMPATIBLE = {
+  MODE_INTENT_SHARED: compat.UniqueFrozenset([
+    MODE_INTENT_SHARED,
+    MODE_INTENT_EXCLUSIVE,
+    MODE_SHARED,
+    ]),
+  MODE_INTENT_EXCLUSIVE: compat.UniqueFrozenset([
+    MODE_INTENT_SHARED,
+    MODE_INTENT_EXCLUSIVE,
+    ]),
+  MODE_SHARED: compat.UniqueFrozenset([
+    MODE_INTENT_SHARED,
+    MODE_SHARED,
+    ]),
+  MODE_EXCLUSIVE: frozenset(),
+  }
+
+#: Order in which modes held at the same time are reported
+_INTENT_MODE_ORDER = [
+  MODE_EXCLUSIVE,
+  MODE_SHARED,
+  MODE_INTENT_EXCLUSIVE,
+  MODE_INTENT_SHARED,
+  ]
+
+
+class IntentLock(object):
+  """Implements a lock with intention modes.
+
+  In addition to the shared and exclusive modes known from L{SharedLock}, the
+  lock can be acquired with the intention of acquiring shared
+  (L{MODE_INTENT_SHARED}) or exclusive (L{MODE_INTENT_EXCLUSIVE}) locks further
+  down in a hierarchy, e.g. on members of a L{LockSet}. Holding the lock in
+  shared or exclusive mode is then equivalent to holding all locks below it in
+  the same mode. Modes are compatible as follows::
+
+                      intent-shared  intent-exclusive  shared  exclusive
+    intent-shared     yes            yes               yes     no
+    intent-exclusive  yes            yes               no      no
+    shared            yes            no                yes     no
+    exclusive         no             no                no      no
+
+  Pending acquires are handled in order of priority and arrival. Pending
+  acquires with the same mode and priority are grouped and notified together.
+
+  @type name: string
+  @ivar name: the name of the lock
+
+  """
+  __slots__ = [
+    "__weakref__",
+    "__counts",
+    "__lock",
+    "__owners",
+    "__pending",
+    "__pending_by_prio",
+    "__pending_group",
+    "__time_fn",
+    "name",
+    ]
+
+  def __init__(self, name, monitor=None, _time_fn=time.time):
+    """Initializes this class.
+
+    @param name: the name of the lock
+    @type monitor: L{LockMonitor}
+    @param monitor: Lock monitor with which to register
+
+    """
+    object.__init__(self)
+
+    self.name = name
+
+    # Used for unittesting
+    self.__time_fn = _time_fn
+
+    # Internal lock
+    self.__lock = threading.Lock()
+
+    # Queue containing waiting acquires, see L{SharedLock}; entries in the
+    # per-priority queues are tuples of mode and condition
+    self.__pending = []
+    self.__pending_by_prio = {}
+    self.__pending_group = {}
+
+    # Current lock holders and the number of holders per mode
+    self.__owners = {}
+    self.__counts = dict((mode, 0) for mode in _INTENT_COMPATIBLE)
+
+    # Register with lock monitor
+    if monitor:
+      logging.debug("Adding lock %s to monitor", name)
+      monitor.RegisterLock(self)
+
+  def __repr__(self):
+    return ("<%s.%s name=%s at %#x>" %
+            (self.__class__.__module__, self.__class__.__name__,
+             self.name, id(self)))
+
+  def GetLockInfo(self, requested):
+    """Retrieves information for querying locks.
+
+    @type requested: set
+    @param requested: Requested information, see C{query.LQ_*}
+
+    """
+    self.__lock.acquire()
+    try:
+      mode = None
+      owner_names = None
+      pending = None
+
+      if query.LQ_MODE in requested and self.__owners:
+        mode = ",".join(i for i in _INTENT_MODE_ORDER if self.__counts[i])
+
+      if query.LQ_OWNER in requested and self.__owners:
+        owner_names = [i.getName() for i in self.__owners.keys()]
+
+      if query.LQ_PENDING in requested:
+        pending = []
+
+        for (_, prioqueue) in sorted(self.__pending):
+          for (pendmode, cond) in prioqueue:
+            pending.append((pendmode, [i.getName()
+                                       for i in cond.get_waiting()]))
+
+      return [(self.name, mode, owner_names, pending)]
+    finally:
+      self.__lock.release()
+
+  def __can_acquire(self, mode):
+    """Determine whether lock can be acquired in a certain mode.
+
+    """
+    compatible = _INTENT_COMPATIBLE[mode]
+
+    return compat.all(count == 0 or other in compatible
+                      for (other, count) in self.__counts.items())
+
+  def __find_first_pending_queue(self):
+    """Tries to find the topmost queued entry with pending acquires.
+
+    Removes empty entries while going through the list.
+
+    """
+    while self.__pending:
+      (priority, prioqueue) = self.__pending[0]
+
+      if prioqueue:
+        return (priority, prioqueue)
+
+      # Remove empty queue
+      heapq.heappop(self.__pending)
+      del self.__pending_by_prio[priority]
+
+    return (None, None)
+
+  def __is_on_top(self, cond):
+    """Checks whether the passed condition is on top of the queue.
+
+    The caller must make sure the queue isn't empty.
+
+    """
+    (_, prioqueue) = self.__find_first_pending_queue()
+
+    return cond == prioqueue[0][1]
+
+  def __notify_topmost(self):
+    """Notifies topmost pending acquire if it can go ahead.
+
+    """
+    (priority, prioqueue) = self.__find_first_pending_queue()
+    if prioqueue:
+      (mode, cond) = prioqueue[0]
+      if self.__can_acquire(mode):
+        cond.notifyAll()
+        if self.__pending_group.get((priority, mode), None) is cond:
+          # Prevent further acquires from joining while waiters are notified
+          del self.__pending_group[(priority, mode)]
+
+  def __do_acquire(self, mode):
+    """Actually acquire the lock.
+
+    """
+    self.__owners[threading.currentThread()] = mode
+    self.__counts[mode] += 1
 
-    You must have acquired the lock, either in shared or in exclusive mode,
-    before calling this function.
+  def get_owned_mode(self):
+    """Returns the mode in which the current thread owns the lock.
+
+    @return: One of the C{MODE_*} constants or C{None}
 
     """
     self.__lock.acquire()
     try:
-      assert self.__is_exclusive() or self.__is_sharer(), \
-        "Cannot release non-owned lock"
-
-      # Autodetect release type
-      if self.__is_exclusive():
-        self.__exc = None
-        notify = True
-      else:
-        self.__shr.remove(threading.currentThread())
-        notify = not self.__shr
-
-      # Notify topmost condition in queue if there are no owners left (for
-      # shared locks)
-      if notify:
-        self.__notify_topmost()
+      return self.__owners.get(threading.currentThread(), None)
     finally:
       self.__lock.release()
 
-  def __notify_topmost(self):
-    """Notifies topmost condition in queue of pending acquires.
+  def is_owned(self, mode=None):
+    """Is the current thread somehow owning the lock?
+
+    @param mode: Mode to check for; C{None} for any mode
 
     """
-    (priority, prioqueue) = self.__find_first_pending_queue()
-    if prioqueue:
-      cond = prioqueue[0]
-      cond.notifyAll()
-      if cond.shared:
-        # Prevent further shared acquires from sneaking in while waiters are
-        # notified
-        self.__pending_shared.pop(priority, None)
+    owned_mode = self.get_owned_mode()
 
-  def _notify_topmost(self):
-    """Exported version of L{__notify_topmost}.
+    if mode is None:
+      return owned_mode is not None
+
+    return owned_mode == mode
+
+  def is_available(self, mode):
+    """Checks whether the lock could currently be acquired without waiting.
+
+    The result is only a hint, other threads can acquire or release the lock
+    at any time.
+
+    @param mode: One of the C{MODE_*} constants
 
     """
     self.__lock.acquire()
     try:
-      return self.__notify_topmost()
+      (_, prioqueue) = self.__find_first_pending_queue()
+
+      return prioqueue is None and self.__can_acquire(mode)
     finally:
       self.__lock.release()
 
-  def delete(self, timeout=None, priority=None):
-    """Delete a Shared Lock.
-
-    This operation will declare the lock for removal. First the lock will be
-    acquired in exclusive mode if you don't already own it, then the lock
-    will be put in a state where any future and pending acquire() fail.
+  def acquire(self, mode, timeout=None, priority=None):
+    """Acquires the lock.
 
+    @param mode: One of the C{MODE_*} constants
     @type timeout: float
     @param timeout: maximum waiting time before giving up
     @type priority: integer
     @param priority: Priority for acquiring lock
 
     """
+    assert mode in _INTENT_COMPATIBLE, "Invalid mode %r" % mode
+
     if priority is None:
       priority = _DEFAULT_PRIORITY
 
     self.__lock.acquire()
     try:
-      assert not self.__is_sharer(), "Cannot delete() a lock while sharing it"
+      assert threading.currentThread() not in self.__owners, \
+        ("double acquire() on a non-recursive lock %s" % self.name)
 
-      self.__check_deleted()
+      # Remove empty entries from queue
+      self.__find_first_pending_queue()
 
-      # The caller is allowed to hold the lock exclusively already.
-      acquired = self.__is_exclusive()
+      if not self.__pending and self.__can_acquire(mode):
+        self.__do_acquire(mode)
+        return True
 
-      if not acquired:
-        acquired = self.__acquire_unlocked(0, timeout, priority)
+      if timeout is not None and timeout < _LOCK_ACQUIRE_MIN_TIMEOUT:
+        return False
 
-      if acquired:
-        assert self.__is_exclusive() and not self.__is_sharer(), \
-          "Lock wasn't acquired in exclusive mode"
+      prioqueue = self.__pending_by_prio.get(priority, None)
 
-        self.__deleted = True
-        self.__exc = None
+      if mode == MODE_EXCLUSIVE:
+        wait_condition = None
+      else:
+        # Group with other pending acquires in the same mode
+        wait_condition = self.__pending_group.get((priority, mode), None)
 
-        assert not (self.__exc or self.__shr), "Found owner during deletion"
+      if wait_condition is None:
+        if prioqueue is None:
+          prioqueue = []
+          heapq.heappush(self.__pending, (priority, prioqueue))
+          self.__pending_by_prio[priority] = prioqueue
 
-        # Notify all acquires. They'll throw an error.
-        for (_, prioqueue) in self.__pending:
-          for cond in prioqueue:
-            cond.notifyAll()
+        wait_condition = \
+          SharedLock.condition_class(self.__lock, mode != MODE_EXCLUSIVE)
+        prioqueue.append((mode, wait_condition))
 
-        assert self.__deleted
+        if mode != MODE_EXCLUSIVE:
+          self.__pending_group[(priority, mode)] = wait_condition
+
+      wait_start = self.__time_fn()
+      acquired = False
+
+      try:
+        while True:
+          if self.__is_on_top(wait_condition) and self.__can_acquire(mode):
+            self.__do_acquire(mode)
+            acquired = True
+            break
+
+          if (timeout is not None and
+              utils.TimeoutExpired(wait_start, timeout,
+                                   _time_fn=self.__time_fn)):
+            break
+
+          wait_condition.wait(timeout)
+      finally:
+        # Remove condition from queue if there are no more waiters
+        if not wait_condition.has_waiting():
+          was_on_top = self.__is_on_top(wait_condition)
+
+          prioqueue.remove((mode, wait_condition))
+          if self.__pending_group.get((priority, mode), None) is \
+             wait_condition:
+            del self.__pending_group[(priority, mode)]
+
+          if was_on_top:
+            # Compatible acquires queued behind can go ahead
+            self.__notify_topmost()
 
       return acquired
     finally:
       self.__lock.release()
 
-  def _release_save(self):
-    shared = self.__is_sharer()
-    self.release()
-    return shared
+  def downgrade(self, mode):
+    """Changes the lock to a weaker mode.
 
-  def _acquire_restore(self, shared):
-    self.acquire(shared=shared)
+    A mode is weaker if it is compatible with all modes the current mode is
+    compatible with, e.g. exclusive mode can be changed to any other mode and
+    shared mode to intent-shared mode.
+
+    @param mode: One of the C{MODE_*} constants
+
+    """
+    self.__lock.acquire()
+    try:
+      thread = threading.currentThread()
+
+      assert thread in self.__owners, "Lock must be owned"
+
+      old_mode = self.__owners[thread]
+
+      assert \
+        _INTENT_COMPATIBLE[mode].issuperset(_INTENT_COMPATIBLE[old_mode]), \
+        "Can't change lock %s from %s to %s" % (self.name, old_mode, mode)
+
+      self.__counts[old_mode] -= 1
+      self.__do_acquire(mode)
+
+      self.__notify_topmost()
+    finally:
+      self.__lock.release()
+
+  def release(self):
+    """Releases the lock.
+
+    """
+    self.__lock.acquire()
+    try:
+      mode = self.__owners.pop(threading.currentThread(), None)
+
+      assert mode is not None, "Cannot release unheld lock %s" % self.name
+
+      self.__counts[mode] -= 1
+
+      self.__notify_topmost()
+    finally:
+      self.__lock.release()
 
 
 # Whenever we want to acquire a full LockSet we pass None as the value
@@ -969,6 +1864,20 @@ class _AcquireTimeout(Exception):
   """
 
 
+def _CancelReservations(acquire_list, reservations):
+  """Cancels reservations made by L{LockSet._reserve_all}.
+
+  @param acquire_list: List of tuples containing lock name and lock object
+  @type reservations: dict
+  @param reservations: Reservations by lock name
+
+  """
+  for (lname, lock) in acquire_list:
+    reservation = reservations.pop(lname, None)
+    if reservation is not None:
+      lock._cancel_reservation(reservation)
+
+
 class LockSet:
   """Implements a set of locks.
 
@@ -983,13 +1892,24 @@ class LockSet:
   @ivar name: the name of the lockset
 
   """
-  def __init__(self, members, name, monitor=None):
+  def __init__(self, members, name, monitor=None, fair=False, intent=False):
     """Constructs a new LockSet.
 
+    With C{intent} enabled, the lockset-internal lock is an L{IntentLock}.
+    Acquiring the whole set then only acquires the internal lock in shared or
+    exclusive mode, while acquiring individual locks requires holding it in
+    the corresponding intent mode. Locks of the set owned as a whole are only
+    acquired individually when part of them is released or downgraded.
+
     @type members: list of strings
     @param members: initial members of the set
     @type monitor: L{LockMonitor}
     @param monitor: Lock monitor with which to register member locks
+    @type fair: boolean
+    @param fair: Whether to queue for all requested locks at once (see
+      L{_reserve_all})
+    @type intent: boolean
+    @param intent: Whether to use intent modes for the lockset-internal lock
 
     """
     assert members is not None, "members parameter is not a list"
@@ -998,8 +1918,16 @@ class LockSet:
     # Lock monitor
     self.__monitor = monitor
 
+    # Used to queue for several locks in one atomic step
+    self.__fair = fair
+    self.__reserve_lock = threading.Lock()
+
     # Used internally to guarantee coherency
-    self.__lock = SharedLock(self._GetLockName("[lockset]"), monitor=monitor)
+    self.__intent = intent
+    if intent:
+      self.__lock = IntentLock(self._GetLockName("[lockset]"), monitor=monitor)
+    else:
+      self.__lock = SharedLock(self._GetLockName("[lockset]"), monitor=monitor)
 
     # The lockdict indexes the relationship name -> lock
     # The order-of-locking is implied by the alphabetical order of names
@@ -1061,6 +1989,21 @@ class LockSet:
     if isinstance(names, basestring):
       names = [names]
 
+    if names and self.__intent and self.owning_all():
+      missing = frozenset(names) - frozenset(self.__names())
+      if missing:
+        raise errors.LockError("Non-existing lock '%s' in set '%s' (it may"
+                               " have been removed)" %
+                               (utils.CommaJoin(missing), self.name))
+
+      # All locks are owned in the mode of the internal lock
+      if shared < 0:
+        return True
+      elif shared:
+        return self.__lock.is_owned(mode=MODE_SHARED)
+      else:
+        return self.__lock.is_owned(mode=MODE_EXCLUSIVE)
+
     # Avoid check if no locks are owned anyway
     if names and self.is_owned():
       candidates = []
@@ -1079,6 +2022,46 @@ class LockSet:
     else:
       return False
 
+  def check_available(self, names, shared=0):
+    """Checks whether locks of the set could be acquired without waiting.
+
+    The result is only a hint, other threads can acquire or release locks at
+    any time. Names of locks which are not in the set are ignored.
+
+    @type names: list of strings or None
+    @param names: Names of the locks to check, C{None} for the whole set
+    @param shared: Whether to check for acquiring the locks in shared mode
+    @rtype: bool
+
+    """
+    if self.__intent:
+      if names is None:
+        if shared:
+          return self.__lock.is_available(MODE_SHARED)
+        else:
+          return self.__lock.is_available(MODE_EXCLUSIVE)
+
+      if shared:
+        intent_mode = MODE_INTENT_SHARED
+      else:
+        intent_mode = MODE_INTENT_EXCLUSIVE
+
+      if not self.__lock.is_available(intent_mode):
+        return False
+
+    elif names is None and not self.__lock.is_available(shared=1):
+      return False
+
+    # Not holding the internal lock, the dictionary may change at any time
+    lockdict = self.__lockdict.copy()
+
+    if names is None:
+      locks = lockdict.values()
+    else:
+      locks = [lockdict[name] for name in names if name in lockdict]
+
+    return compat.all(lock.is_available(shared=shared) for lock in locks)
+
   def owning_all(self):
     """Checks whether current thread owns internal lock.
 
@@ -1089,6 +2072,9 @@ class LockSet:
     @rtype: boolean
 
     """
+    if self.__intent:
+      return self.__lock.get_owned_mode() in (MODE_SHARED, MODE_EXCLUSIVE)
+
     return self.__lock.is_owned()
 
   def _add_owned(self, name=None):
@@ -1118,6 +2104,15 @@ class LockSet:
 
   def list_owned(self):
     """Get the set of resource names owned by the current thread"""
+    if self.__intent and self.owning_all():
+      return set(self.__names())
+
+    return self.__list_owned_members()
+
+  def __list_owned_members(self):
+    """Get the set of individually acquired locks owned by the current thread.
+
+    """
     if self.is_owned():
       return self.__owners[threading.currentThread()].copy()
     else:
@@ -1125,7 +2120,7 @@ class LockSet:
 
   def _release_and_delete_owned(self):
     """Release and delete all resources owned by the current thread"""
-    for lname in self.list_owned():
+    for lname in self.__list_owned_members():
       lock = self.__lockdict[lname]
       if lock.is_owned():
         lock.release()
@@ -1151,7 +2146,10 @@ class LockSet:
     release_lock = False
     if not self.__lock.is_owned():
       release_lock = True
-      self.__lock.acquire(shared=1)
+      if self.__intent:
+        self.__lock.acquire(MODE_INTENT_SHARED)
+      else:
+        self.__lock.acquire(shared=1)
     try:
       result = self.__names()
     finally:
@@ -1215,6 +2213,11 @@ class LockSet:
         (mode, _, timeout_fn) = \
           _GetLsAcquireModeAndTimeouts(False, timeout, opportunistic)
 
+        if self.__intent:
+          return self.__acquire_with_intent(names, mode, shared, priority,
+                                            timeout_fn, timeout_fn,
+                                            test_notify)
+
         return self.__acquire_inner(names, mode, shared, priority,
                                     timeout_fn, test_notify)
 
@@ -1222,6 +2225,14 @@ class LockSet:
         (mode, ls_timeout_fn, timeout_fn) = \
           _GetLsAcquireModeAndTimeouts(True, timeout, opportunistic)
 
+        if self.__intent:
+          if mode == _LS_ACQUIRE_OPPORTUNISTIC:
+            return self.__acquire_with_intent(None, mode, shared, priority,
+                                              ls_timeout_fn, timeout_fn,
+                                              test_notify)
+
+          return self.__acquire_whole(shared, priority, ls_timeout_fn)
+
         # If no names are given acquire the whole set by not letting new names
         # being added before we release, and getting the current list of names.
         # Some of them may then be deleted later, but we'll cope with this.
@@ -1252,6 +2263,92 @@ class LockSet:
     except _AcquireTimeout:
       return None
 
+  def __acquire_whole(self, shared, priority, timeout_fn):
+    """Acquires the whole set using the internal lock only.
+
+    Only used with intent locking.
+
+    """
+    if shared:
+      mode = MODE_SHARED
+    else:
+      mode = MODE_EXCLUSIVE
+
+    if not self.__lock.acquire(mode, timeout=timeout_fn(), priority=priority):
+      raise _AcquireTimeout()
+
+    try:
+      # note we own the set-lock
+      self._add_owned()
+    except:
+      self.__lock.release()
+      raise
+
+    return set(self.__names())
+
+  def __acquire_with_intent(self, names, mode, shared, priority,
+                            ls_timeout_fn, timeout_fn, test_notify):
+    """Acquires individual locks after announcing the intention to do so.
+
+    Only used with intent locking.
+
+    @param names: Names of the locks to be acquired, C{None} for all
+    @param ls_timeout_fn: Function returning the timeout for acquiring the
+      internal lock
+
+    """
+    if shared:
+      intent_mode = MODE_INTENT_SHARED
+    else:
+      intent_mode = MODE_INTENT_EXCLUSIVE
+
+    if not self.__lock.acquire(intent_mode, timeout=ls_timeout_fn(),
+                               priority=priority):
+      raise _AcquireTimeout()
+
+    try:
+      self._add_owned()
+
+      if names is None:
+        names = self.__names()
+
+      acquired = self.__acquire_inner(names, mode, shared, priority,
+                                      timeout_fn, test_notify)
+    except:
+      self.__lock.release()
+      self._del_owned()
+      raise
+
+    if not acquired:
+      # Not keeping the intention without owning any lock
+      self.__lock.release()
+      self._del_owned()
+
+    return acquired
+
+  def __deescalate(self, names):
+    """Replaces ownership of the whole set by ownership of individual locks.
+
+    The locks are acquired in the mode the whole set is owned in and the
+    internal lock is changed to the corresponding intent mode. No other
+    thread can own any of the locks in a conflicting mode or wait for them.
+
+    @param names: Names of the locks to acquire
+
+    """
+    assert self.__intent and self.owning_all()
+
+    shared = int(self.__lock.is_owned(mode=MODE_SHARED))
+
+    for lname in sorted(names):
+      self.__lockdict[lname].acquire(shared=shared)
+      self._add_owned(name=lname)
+
+    if shared:
+      self.__lock.downgrade(MODE_INTENT_SHARED)
+    else:
+      self.__lock.downgrade(MODE_INTENT_EXCLUSIVE)
+
   def __acquire_inner(self, names, mode, shared, priority,
                       timeout_fn, test_notify):
     """Inner logic for acquiring a number of locks.
@@ -1297,6 +2394,12 @@ class LockSet:
       else:
         acquire_list.append((lname, lock))
 
+    if (self.__fair and mode != _LS_ACQUIRE_OPPORTUNISTIC and
+        len(acquire_list) > 1):
+      reservations = self._reserve_all(acquire_list, mode, shared, priority)
+    else:
+      reservations = {}
+
     # This will hold the locknames we effectively acquired.
     acquired = set()
 
@@ -1314,11 +2417,17 @@ class LockSet:
 
         timeout = timeout_fn()
 
+        reservation = reservations.pop(lname, None)
+
         try:
           # raises LockError if the lock was deleted
-          acq_success = lock.acquire(shared=shared, timeout=timeout,
-                                     priority=priority,
-                                     test_notify=test_notify_fn)
+          if reservation is None:
+            acq_success = lock.acquire(shared=shared, timeout=timeout,
+                                       priority=priority,
+                                       test_notify=test_notify_fn)
+          else:
+            acq_success = lock._acquire_reserved(reservation, timeout=timeout,
+                                                 test_notify=test_notify_fn)
         except errors.LockError:
           if mode in (_LS_ACQUIRE_ALL, _LS_ACQUIRE_OPPORTUNISTIC):
             # We are acquiring the whole set, it doesn't matter if this
@@ -1359,9 +2468,44 @@ class LockSet:
       # Release all owned locks
       self._release_and_delete_owned()
       raise
+    finally:
+      # Give up the place in the queue of locks which weren't acquired
+      _CancelReservations(acquire_list, reservations)
 
     return acquired
 
+  def _reserve_all(self, acquire_list, mode, shared, priority):
+    """Queues pending acquires for a number of locks in one step.
+
+    All reservations are made while holding a set-wide lock, therefore two
+    threads queueing for overlapping locks are queued in the same order on
+    every lock. Locks are then handed out in priority and FIFO order without
+    the need for retrying with increasing timeouts.
+
+    @param acquire_list: List of tuples containing lock name and lock object
+    @param mode: Lock acquisition mode (one of L{_LS_ACQUIRE_MODES})
+    @return: Dictionary containing lock name as key and reservation as value
+
+    """
+    reservations = {}
+
+    self.__reserve_lock.acquire()
+    try:
+      for (lname, lock) in acquire_list:
+        try:
+          reservations[lname] = lock._reserve(shared=shared, priority=priority)
+        except errors.LockError:
+          if mode == _LS_ACQUIRE_EXACT:
+            _CancelReservations(acquire_list, reservations)
+            raise errors.LockError("Lock '%s' not found in set '%s' (it may"
+                                   " have been removed)" % (lname, self.name))
+
+          # Deleted locks are ignored when acquiring the whole set
+    finally:
+      self.__reserve_lock.release()
+
+    return reservations
+
   def downgrade(self, names=None):
     """Downgrade a set of resource locks from exclusive to shared mode.
 
@@ -1385,11 +2529,29 @@ class LockSet:
         ("downgrade() on unheld resources %s (set %s)" %
          (names.difference(owned), self.name))
 
+    if self.__intent:
+      if self.__lock.is_owned(mode=MODE_EXCLUSIVE):
+        if names.issuperset(owned):
+          self.__lock.downgrade(MODE_SHARED)
+          return True
+
+        self.__deescalate(owned)
+
+      if not self.__lock.is_owned(mode=MODE_INTENT_EXCLUSIVE):
+        # Owning the whole set in shared mode or shared locks only
+        return True
+
     for lockname in names:
       self.__lockdict[lockname].downgrade()
 
+    if self.__intent:
+      # Have all locks been downgraded?
+      if not compat.any(self.__lockdict[lname].is_owned(shared=0)
+                        for lname in owned):
+        self.__lock.downgrade(MODE_INTENT_SHARED)
+
     # Do we own the lockset in exclusive mode?
-    if self.__lock.is_owned(shared=0):
+    elif self.__lock.is_owned(shared=0):
       # Have all locks been downgraded?
       if not compat.any(lock.is_owned(shared=0)
                         for lock in self.__lockdict.values()):
@@ -1424,6 +2586,29 @@ class LockSet:
                "release() on unheld resources %s (set %s)" %
                (names.difference(self.list_owned()), self.name))
 
+    if self.__intent:
+      if self.owning_all():
+        keep = self.list_owned() - names
+        if not keep:
+          self.__lock.release()
+          self._del_owned()
+          return
+
+        # Only part of the set is released
+        self.__deescalate(keep)
+        return
+
+      for lockname in names:
+        self.__lockdict[lockname].release()
+        self._del_owned(name=lockname)
+
+      if not self.__list_owned_members():
+        # Intention is no longer needed
+        self.__lock.release()
+        self._del_owned()
+
+      return
+
     # First of all let's release the "all elements" lock, if set.
     # After this 'add' can work again
     if self.__lock.is_owned():
@@ -1447,8 +2632,13 @@ class LockSet:
     @param shared: is the pre-acquisition shared?
 
     """
+    if self.__intent:
+      owning_exclusive = self.__lock.is_owned(mode=MODE_EXCLUSIVE)
+    else:
+      owning_exclusive = self.__lock.is_owned(shared=0)
+
     # Check we don't already own locks at this level
-    assert not self.is_owned() or self.__lock.is_owned(shared=0), \
+    assert not self.is_owned() or owning_exclusive, \
       ("Cannot add locks if the set %s is only partially owned, or shared" %
        self.name)
 
@@ -1461,7 +2651,14 @@ class LockSet:
     release_lock = False
     if not self.__lock.is_owned():
       release_lock = True
-      self.__lock.acquire()
+      if self.__intent:
+        # Owners of individual locks are not affected by new locks
+        self.__lock.acquire(MODE_INTENT_EXCLUSIVE)
+      else:
+        self.__lock.acquire()
+    elif self.__intent:
+      # New locks are owned as part of the whole set
+      acquired = False
 
     try:
       invalid_names = set(self.__names()).intersection(names)
@@ -1497,7 +2694,12 @@ class LockSet:
     finally:
       # Only release __lock if we were not holding it previously.
       if release_lock:
-        self.__lock.release()
+        if self.__intent and self.__list_owned_members():
+          # Keep the intention for the newly acquired locks
+          if shared:
+            self.__lock.downgrade(MODE_INTENT_SHARED)
+        else:
+          self.__lock.release()
 
     return True
 
@@ -1528,6 +2730,30 @@ class LockSet:
 
     removed = []
 
+    release_lock = False
+    if self.__intent and not self.is_owned():
+      # Prevent the set from being acquired as a whole while locks are deleted
+      release_lock = True
+      self.__lock.acquire(MODE_INTENT_EXCLUSIVE)
+
+    try:
+      self.__remove_inner(names, removed)
+    finally:
+      if release_lock:
+        self.__lock.release()
+
+    if (self.__intent and self.is_owned() and not self.owning_all() and
+        not self.__list_owned_members()):
+      # All individually owned locks were removed
+      self.__lock.release()
+      self._del_owned()
+
+    return removed
+
+  def __remove_inner(self, names, removed):
+    """Inner logic for removing locks from the set.
+
+    """
     for lname in names:
       # Calling delete() acquires the lock exclusively if we don't already own
       # it, and causes all pending and subsequent lock acquires to fail. It's
@@ -1551,11 +2777,9 @@ class LockSet:
         # it's the job of the one who actually deleted it.
         del self.__lockdict[lname]
         # And let's remove it from our private list if we owned it.
-        if self.is_owned():
+        if lname in self.__list_owned_members():
           self._del_owned(name=lname)
 
-    return removed
-
 
 # Locking levels, must be acquired in increasing order. Current rules are:
 # - At level LEVEL_CLUSTER resides the Big Ganeti Lock (BGL) which must be
@@ -1629,7 +2853,8 @@ class GanetiLockManager(object):
   """
   _instance = None
 
-  def __init__(self, node_uuids, nodegroups, instance_names, networks):
+  def __init__(self, node_uuids, nodegroups, instance_names, networks,
+               fair=False):
     """Constructs a new GanetiLockManager object.
 
     There should be only a GanetiLockManager object at any time, so this
@@ -1638,6 +2863,10 @@ class GanetiLockManager(object):
     @param node_uuids: list of node UUIDs
     @param nodegroups: list of nodegroup uuids
     @param instance_names: list of instance names
+    @type fair: boolean
+    @param fair: Whether to queue for all locks of a level at once, granting
+      them in priority and FIFO order instead of relying on callers retrying
+      with timeouts
 
     """
     assert self.__class__._instance is None, \
@@ -1646,18 +2875,21 @@ class GanetiLockManager(object):
     self.__class__._instance = self
 
     self._monitor = LockMonitor()
+    self.fair = fair
+
+    lsfn = compat.partial(LockSet, monitor=self._monitor, fair=fair)
 
     # The keyring contains all the locks, at their level and in the correct
-    # locking order.
+    # locking order. Levels with a lock per node or instance use intent
+    # locking, so acquiring all their locks doesn't depend on the cluster size.
     self.__keyring = {
-      LEVEL_CLUSTER: LockSet([BGL], "cluster", monitor=self._monitor),
-      LEVEL_NODE: LockSet(node_uuids, "node", monitor=self._monitor),
-      LEVEL_NODE_RES: LockSet(node_uuids, "node-res", monitor=self._monitor),
-      LEVEL_NODEGROUP: LockSet(nodegroups, "nodegroup", monitor=self._monitor),
-      LEVEL_INSTANCE: LockSet(instance_names, "instance",
-                              monitor=self._monitor),
-      LEVEL_NETWORK: LockSet(networks, "network", monitor=self._monitor),
-      LEVEL_NODE_ALLOC: LockSet([NAL], "node-alloc", monitor=self._monitor),
+      LEVEL_CLUSTER: lsfn([BGL], "cluster"),
+      LEVEL_NODE: lsfn(node_uuids, "node", intent=True),
+      LEVEL_NODE_RES: lsfn(node_uuids, "node-res", intent=True),
+      LEVEL_NODEGROUP: lsfn(nodegroups, "nodegroup"),
+      LEVEL_INSTANCE: lsfn(instance_names, "instance", intent=True),
+      LEVEL_NETWORK: lsfn(networks, "network"),
+      LEVEL_NODE_ALLOC: lsfn([NAL], "node-alloc"),
       }
 
     assert compat.all(ls.name == LEVEL_NAMES[level]
@@ -1711,6 +2943,14 @@ class GanetiLockManager(object):
     """
     return self.__keyring[level].check_owned(names, shared=shared)
 
+  def check_available(self, level, names, shared=0):
+    """Checks whether locks at a certain level could be acquired right away.
+
+    @see: L{LockSet.check_available}
+
+    """
+    return self.__keyring[level].check_available(names, shared=shared)
+
   def owning_all(self, level):
     """Checks whether current thread owns all locks at a certain level.
 
@@ -1938,6 +3178,28 @@ class LockMonitor(object):
             for (provider, num) in items
             for (idx, info) in enumerate(provider.GetLockInfo(requested))]
 
+  def _GetLockStatistics(self):
+    """Get contention statistics from all locks providing them.
+
+    @rtype: dict
+    @return: Dictionary with lock names as keys
+
+    """
+    self._lock.acquire(shared=1)
+    try:
+      providers = self._locks.keys()
+    finally:
+      self._lock.release()
+
+    result = {}
+
+    for provider in providers:
+      fn = getattr(provider, "GetLockStatistics", None)
+      if fn:
+        result.update(fn())
+
+    return result
+
   def _Query(self, fields):
     """Queries information from all locks.
 
@@ -1947,13 +3209,19 @@ class LockMonitor(object):
     """
     qobj = query.Query(query.LOCK_FIELDS, fields)
 
+    requested = qobj.RequestedData()
+
     # Get all data with internal lock held and then sort by name and incoming
     # order
-    lockinfo = sorted(self._GetLockInfo(qobj.RequestedData()),
-                      key=_MonitorSortKey)
+    lockinfo = sorted(self._GetLockInfo(requested), key=_MonitorSortKey)
+
+    if query.LQ_STATS in requested:
+      stats = self._GetLockStatistics()
+    else:
+      stats = None
 
     # Extract lock information and build query data
-    return (qobj, query.LockQueryData(map(compat.fst, lockinfo)))
+    return (qobj, query.LockQueryData(map(compat.fst, lockinfo), stats=stats))
 
   def QueryLocks(self, fields):
     """Queries information from all locks.
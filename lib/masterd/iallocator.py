@@ -57,6 +57,17 @@ _NEVAC_FAILED = \
 _NEVAC_RESULT = ht.TAnd(ht.TIsLength(3),
                         ht.TItems([_NEVAC_MOVED, _NEVAC_FAILED, _JOB_LIST]))
 
+#: Optional node topology data, as (hypervisor key, iallocator key); these
+#: are only passed to the iallocator if exported by the hypervisor
+_NODE_TOPOLOGY_KEYS = [
+  ("cpu_sockets", "total_sockets"),
+  ("cpu_cores_per_socket", "cores_per_socket"),
+  ("cpu_threads_per_core", "threads_per_core"),
+  ("hugepages_total", "total_hugepages"),
+  ("hugepages_free", "free_hugepages"),
+  ("numa_nodes", "numa_nodes"),
+  ]
+
 _INST_NAME = ("name", ht.TNonEmptyString)
 _INST_UUID = ("inst_uuid", ht.TNonEmptyString)
 
@@ -707,6 +718,9 @@ class IAllocator(object):
           "i_pri_memory": i_p_mem,
           "i_pri_up_memory": i_p_up_mem,
           }
+        for (hv_key, key) in _NODE_TOPOLOGY_KEYS:
+          if hv_key in hv_info:
+            pnr_dyn[key] = hv_info[hv_key]
         pnr_dyn.update(node_results[ninfo.name])
         node_results[ninfo.name] = pnr_dyn
 
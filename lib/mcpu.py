@@ -44,6 +44,8 @@ from ganeti import cmdlib
 from ganeti import locking
 from ganeti import utils
 from ganeti import compat
+from ganeti import config
+import ganeti.rpc.node as rpc
 
 
 _OP_PREFIX = "Op"
@@ -62,6 +64,72 @@ _NODE_ALLOC_MODE_WHITELIST = compat.UniqueFrozenset([
   cmdlib.LUOobCommand,
   ])
 
+#: Whether to record execution profiles for opcodes
+_profiling_enabled = False
+
+
+def SetProfilingEnabled(enabled):
+  """Enables or disables recording of per-opcode execution profiles.
+
+  @type enabled: bool
+
+  """
+  global _profiling_enabled # pylint: disable=W0603
+  _profiling_enabled = enabled
+
+
+#: Cache for the hook directories containing scripts on each node, C{None}
+#: to always run hooks on all nodes
+_hooks_manifest_cache = None
+
+
+def SetHooksManifestTTL(ttl):
+  """Configures skipping hooks on nodes without hook scripts.
+
+  @type ttl: number
+  @param ttl: Time in seconds for which the list of hook directories
+    containing scripts reported by a node is used; 0 to always run hooks on
+    all nodes
+
+  """
+  global _hooks_manifest_cache # pylint: disable=W0603
+
+  if ttl > 0:
+    _hooks_manifest_cache = hooksmaster.HooksManifestCache(ttl)
+  else:
+    _hooks_manifest_cache = None
+
+
+def _RunHooksWithManifest(cache, manifest_fn, hooks_execution_fn, node_list,
+                          hpath, phase, env):
+  """Runs hooks only on nodes which have scripts for them.
+
+  Nodes without hook scripts for the hooks path get an empty result, just as
+  if the hooks had been run there.
+
+  @type cache: L{hooksmaster.HooksManifestCache}
+  @param manifest_fn: RPC function retrieving the manifests of nodes
+  @param hooks_execution_fn: RPC function running the hooks
+
+  """
+  def _GetManifests(node_names):
+    return dict((name, result.payload)
+                for (name, result) in manifest_fn(node_names).items()
+                if not result.fail_msg)
+
+  run_nodes = cache.FilterNodes(_GetManifests, node_list, hpath, phase)
+
+  if run_nodes:
+    results = hooks_execution_fn(run_nodes, hpath, phase, env)
+  else:
+    results = {}
+
+  for name in frozenset(node_list) - frozenset(run_nodes):
+    results[name] = rpc.RpcResult(data=(True, []), node=name,
+                                  call="hooks_runner")
+
+  return results
+
 
 class LockAcquireTimeout(Exception):
   """Exception to report timeouts on acquiring locks.
@@ -139,6 +207,23 @@ class LockAttemptTimeoutStrategy(object):
     return timeout
 
 
+class BlockingLockStrategy(object):
+  """Lock acquire strategy always using blocking acquires.
+
+  Used with a fair lock manager (see L{locking.GanetiLockManager}), which
+  queues pending acquires in priority and FIFO order. Giving up after a
+  timeout would only lose the place in the queue.
+
+  """
+  __slots__ = []
+
+  def NextAttempt(self): # pylint: disable=R0201
+    """Returns the timeout for the next attempt.
+
+    """
+    return None
+
+
 class OpExecCbBase: # pylint: disable=W0232
   """Base class for OpCode execution callbacks.
 
@@ -170,6 +255,73 @@ class OpExecCbBase: # pylint: disable=W0232
     """
     raise NotImplementedError
 
+  def RecordProfile(self, spans):
+    """Called with the execution profile of the opcode.
+
+    This is only called if profiling is enabled (see L{SetProfilingEnabled}),
+    once for every execution attempt.
+
+    @type spans: dict
+    @param spans: Dictionary mapping span names to durations, see
+      L{OpProfile}
+
+    """
+
+
+class OpProfile(object):
+  """Execution profile of a single opcode.
+
+  A profile consists of named spans, each holding the wall clock time (in
+  seconds) spent in one phase of the opcode's execution, e.g. C{lock/node} for
+  acquiring node locks or C{hooks_pre} for running the pre-phase hooks. The
+  C{rpc} and C{config_write} spans overlap with the other ones.
+
+  """
+  def __init__(self, _time_fn=time.time, _rpc_time_fn=rpc.GetThreadRpcTime,
+               _write_time_fn=config.GetThreadWriteTime):
+    """Initializes this class.
+
+    """
+    self._time_fn = _time_fn
+    self._rpc_time_fn = _rpc_time_fn
+    self._write_time_fn = _write_time_fn
+    self._rpc_start = _rpc_time_fn()
+    self._write_start = _write_time_fn()
+    self.spans = {}
+
+  def Add(self, name, duration):
+    """Adds time to a span.
+
+    @type name: string
+    @param name: Span name
+    @type duration: float
+    @param duration: Time in seconds
+
+    """
+    self.spans[name] = self.spans.get(name, 0.0) + duration
+
+  def Run(self, name, fn, *args, **kwargs):
+    """Calls a function and adds the time it took to a span.
+
+    """
+    start = self._time_fn()
+    try:
+      return fn(*args, **kwargs)
+    finally:
+      self.Add(name, self._time_fn() - start)
+
+  def Finish(self):
+    """Finishes the profile.
+
+    @rtype: dict
+    @return: Dictionary mapping span names to durations
+
+    """
+    self.Add("rpc", self._rpc_time_fn() - self._rpc_start)
+    self.Add("config_write", self._write_time_fn() - self._write_start)
+
+    return self.spans
+
 
 def _LUNameForOpName(opname):
   """Computes the LU name for a given OpCode name.
@@ -288,6 +440,53 @@ def _VerifyLocks(lu, glm, _mode_whitelist=_NODE_ALLOC_MODE_WHITELIST,
            " or node resources")
 
 
+def GetLockHints(op, node_uuid_fn=None):
+  """Estimates the locks an opcode will need without running its LU.
+
+  The locks actually acquired are only known once the LU has declared them
+  in C{ExpandNames} and C{DeclareLocks}, which requires the configuration
+  and, for some LUs, locks. This estimate only considers the Big Ganeti Lock
+  and the instance and node directly named by the opcode's parameters, which
+  are assumed to be needed exclusively. Short instance names aren't
+  expanded.
+
+  @type op: L{opcodes.OpCode}
+  @type node_uuid_fn: callable
+  @param node_uuid_fn: Function returning the UUID of a node given its
+    (possibly short) name, or C{None} for unknown nodes; if not given, only
+    node UUIDs set in the opcode are considered, which is rarely the case
+    for submitted opcodes
+  @rtype: list of tuples; (level, names, shared)
+  @return: Lock levels, lists of lock names and whether they are needed in
+    shared mode
+
+  """
+  lu_class = Processor.DISPATCH_TABLE.get(op.__class__, None)
+  if lu_class is None:
+    return []
+
+  hints = [(locking.LEVEL_CLUSTER, [locking.BGL], int(not lu_class.REQ_BGL))]
+
+  if isinstance(op, opcodes.OpInstanceBatch):
+    instance_names = [getattr(sub_op, "instance_name", None)
+                      for sub_op in op.ops]
+  else:
+    instance_names = [getattr(op, "instance_name", None)]
+  instance_names = filter(None, instance_names)
+  if instance_names:
+    hints.append((locking.LEVEL_INSTANCE, instance_names, 0))
+
+  node_uuid = getattr(op, "node_uuid", None)
+  if not node_uuid and node_uuid_fn is not None:
+    node_name = getattr(op, "node_name", None)
+    if node_name:
+      node_uuid = node_uuid_fn(node_name)
+  if node_uuid:
+    hints.append((locking.LEVEL_NODE, [node_uuid], 0))
+
+  return hints
+
+
 class Processor(object):
   """Object which runs OpCodes"""
   DISPATCH_TABLE = _ComputeDispatchTable()
@@ -307,6 +506,7 @@ class Processor(object):
     self.rpc = context.rpc
     self.hmclass = hooksmaster.HooksMaster
     self._enable_locks = enable_locks
+    self._profile = None
 
   def _CheckLocksEnabled(self):
     """Checks if locking is enabled.
@@ -317,6 +517,15 @@ class Processor(object):
     if not self._enable_locks:
       raise errors.ProgrammerError("Attempted to use disabled locks")
 
+  def _Profiled(self, name, fn, *args, **kwargs):
+    """Calls a function, recording its duration if profiling is enabled.
+
+    """
+    if self._profile is None:
+      return fn(*args, **kwargs)
+
+    return self._profile.Run(name, fn, *args, **kwargs)
+
   def _AcquireLocks(self, level, names, shared, opportunistic, timeout):
     """Acquires locks via the Ganeti lock manager.
 
@@ -341,9 +550,10 @@ class Processor(object):
     else:
       priority = None
 
-    acquired = self.context.glm.acquire(level, names, shared=shared,
-                                        timeout=timeout, priority=priority,
-                                        opportunistic=opportunistic)
+    acquired = self._Profiled("lock/%s" % locking.LEVEL_NAMES[level],
+                              self.context.glm.acquire, level, names,
+                              shared=shared, timeout=timeout,
+                              priority=priority, opportunistic=opportunistic)
 
     if acquired is None:
       raise LockAcquireTimeout()
@@ -355,10 +565,11 @@ class Processor(object):
 
     """
     write_count = self.context.cfg.write_count
-    lu.CheckPrereq()
+    self._Profiled("check_prereq", lu.CheckPrereq)
 
     hm = self.BuildHooksManager(lu)
-    h_results = hm.RunPhase(constants.HOOKS_PHASE_PRE)
+    h_results = self._Profiled("hooks_pre", hm.RunPhase,
+                               constants.HOOKS_PHASE_PRE)
     lu.HooksCallBack(constants.HOOKS_PHASE_PRE, h_results,
                      self.Log, None)
 
@@ -376,19 +587,29 @@ class Processor(object):
       submit_mj_fn = _FailingSubmitManyJobs
 
     try:
-      result = _ProcessResult(submit_mj_fn, lu.op, lu.Exec(self.Log))
-      h_results = hm.RunPhase(constants.HOOKS_PHASE_POST)
+      result = _ProcessResult(submit_mj_fn, lu.op,
+                              self._Profiled("exec", lu.Exec, self.Log))
+      h_results = self._Profiled("hooks_post", hm.RunPhase,
+                                 constants.HOOKS_PHASE_POST)
       result = lu.HooksCallBack(constants.HOOKS_PHASE_POST, h_results,
                                 self.Log, result)
     finally:
       # FIXME: This needs locks if not lu_class.REQ_BGL
       if write_count != self.context.cfg.write_count:
-        hm.RunConfigUpdate()
+        self._Profiled("hooks_config", hm.RunConfigUpdate)
 
     return result
 
   def BuildHooksManager(self, lu):
-    return self.hmclass.BuildFromLu(lu.rpc.call_hooks_runner, lu)
+    hooks_execution_fn = lu.rpc.call_hooks_runner
+
+    if _hooks_manifest_cache is not None:
+      hooks_execution_fn = compat.partial(_RunHooksWithManifest,
+                                          _hooks_manifest_cache,
+                                          lu.rpc.call_hooks_manifest,
+                                          hooks_execution_fn)
+
+    return self.hmclass.BuildFromLu(hooks_execution_fn, lu)
 
   def _LockAndExecLU(self, lu, level, calc_timeout):
     """Execute a Logical Unit, with the needed locks.
@@ -517,6 +738,9 @@ class Processor(object):
       calc_timeout = utils.RunningTimeout(timeout, False).Remaining
 
     self._cbs = cbs
+    if _profiling_enabled:
+      self._profile = OpProfile()
+    locking.SetOpcodeContext(op.OP_ID)
     try:
       if self._enable_locks:
         # Acquire the Big Ganeti Lock exclusively if this LU requires it,
@@ -530,7 +754,7 @@ class Processor(object):
 
       try:
         lu = lu_class(self, op, self.context, self.rpc)
-        lu.ExpandNames()
+        self._Profiled("expand_names", lu.ExpandNames)
         assert lu.needed_locks is not None, "needed_locks not set by LU"
 
         try:
@@ -545,6 +769,11 @@ class Processor(object):
           assert self._enable_locks
           self.context.glm.release(locking.LEVEL_CLUSTER)
     finally:
+      locking.SetOpcodeContext(None)
+      if self._profile is not None:
+        if cbs:
+          cbs.RecordProfile(self._profile.Finish())
+        self._profile = None
       self._cbs = None
 
     self._CheckLUResult(op, result)
@@ -2118,7 +2118,10 @@ class MigrationStatus(ConfigObject):
   __slots__ = [
     "status",
     "transferred_ram",
+    "remaining_ram",
     "total_ram",
+    "dirty_rate",
+    "iterations",
     ]
 
 
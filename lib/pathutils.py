@@ -82,6 +82,7 @@ CRYPTO_KEYS_DIR = RUN_DIR + "/crypto"
 IMPORT_EXPORT_DIR = RUN_DIR + "/import-export"
 INSTANCE_STATUS_FILE = RUN_DIR + "/instance-status"
 INSTANCE_REASON_DIR = RUN_DIR + "/instance-reason"
+RAPI_RESPONSE_CACHE_DIR = RUN_DIR + "/rapi-cache"
 #: User-id pool lock directory (used user IDs have a corresponding lock file in
 #: this directory)
 UIDPOOL_LOCKDIR = RUN_DIR + "/uid-pool"
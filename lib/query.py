@@ -96,7 +96,8 @@ from ganeti.constants import (QFT_UNKNOWN, QFT_TEXT, QFT_BOOL, QFT_NUMBER,
 
 (LQ_MODE,
  LQ_OWNER,
- LQ_PENDING) = range(10, 13)
+ LQ_PENDING,
+ LQ_STATS) = range(10, 14)
 
 (GQ_CONFIG,
  GQ_NODE,
@@ -1153,18 +1154,30 @@ _NODE_LIVE_FIELDS = {
   "bootid": ("BootID", QFT_TEXT, "bootid",
              "Random UUID renewed for each system reboot, can be used"
              " for detecting reboots by tracking changes"),
+  "ccores": ("CCores", QFT_NUMBER, "cpu_cores_per_socket",
+             "Number of physical cores per CPU socket (if exported by"
+             " hypervisor)"),
   "cnodes": ("CNodes", QFT_NUMBER, "cpu_nodes",
              "Number of NUMA domains on node (if exported by hypervisor)"),
   "cnos": ("CNOs", QFT_NUMBER, "cpu_dom0",
             "Number of logical processors used by the node OS (dom0 for Xen)"),
   "csockets": ("CSockets", QFT_NUMBER, "cpu_sockets",
                "Number of physical CPU sockets (if exported by hypervisor)"),
+  "cthreads": ("CThreads", QFT_NUMBER, "cpu_threads_per_core",
+               "Number of hardware threads per physical core (if exported by"
+               " hypervisor)"),
   "ctotal": ("CTotal", QFT_NUMBER, "cpu_total", "Number of logical processors"),
   "dfree": ("DFree", QFT_UNIT, "storage_free",
             "Available storage space in storage unit"),
   "dtotal": ("DTotal", QFT_UNIT, "storage_size",
              "Total storage space in storage unit used for instance disk"
              " allocation"),
+  "hpfree": ("HpFree", QFT_UNIT, "hugepages_free",
+             "Memory available as free huge pages (if exported by"
+             " hypervisor)"),
+  "hptotal": ("HpTotal", QFT_UNIT, "hugepages_total",
+              "Total memory reserved for huge pages (if exported by"
+              " hypervisor)"),
   "spfree": ("SpFree", QFT_NUMBER, "spindles_free",
              "Available spindles in volume group (exclusive storage only)"),
   "sptotal": ("SpTotal", QFT_NUMBER, "spindles_total",
@@ -1175,6 +1188,8 @@ _NODE_LIVE_FIELDS = {
             "Amount of memory used by node (dom0 for Xen)"),
   "mtotal": ("MTotal", QFT_UNIT, "memory_total",
              "Total amount of memory of physical machine"),
+  "numa": ("NUMA", QFT_OTHER, "numa_nodes",
+           "Memory and CPUs of each NUMA domain (if exported by hypervisor)"),
   }
 
 
@@ -1269,7 +1284,7 @@ def _GetStatsField(field, kind, data):
 
   If the value is not found, L{_FS_UNAVAIL} is returned. If the field kind is
   numeric a conversion to integer is attempted. If that fails, L{_FS_UNAVAIL}
-  is returned.
+  is returned. Values of kind L{QFT_OTHER} are returned unmodified.
 
   @param field: Live field name
   @param kind: Data kind, one of L{constants.QFT_ALL}
@@ -1282,7 +1297,7 @@ def _GetStatsField(field, kind, data):
   except KeyError:
     return _FS_UNAVAIL
 
-  if kind == QFT_TEXT:
+  if kind in (QFT_TEXT, QFT_OTHER):
     return value
 
   assert kind in (QFT_NUMBER, QFT_UNIT)
@@ -2256,11 +2271,16 @@ class LockQueryData:
   """Data container for lock data queries.
 
   """
-  def __init__(self, lockdata):
+  def __init__(self, lockdata, stats=None):
     """Initializes this class.
 
+    @param lockdata: List of (name, mode, owners, pending) tuples
+    @type stats: dict or None
+    @param stats: Contention statistics per lock name
+
     """
     self.lockdata = lockdata
+    self.stats = stats
 
   def __iter__(self):
     """Iterate over all locks.
@@ -2294,6 +2314,28 @@ def _GetLockPending(_, data):
   return pending
 
 
+def _GetLockStat(name):
+  """Returns a field function to return a contention statistic of a lock.
+
+  @type name: string
+  @param name: Statistic name
+
+  """
+  def fn(ctx, (lock_name, _, __, ___)):
+    """Get statistic value for lock.
+
+    """
+    if not ctx.stats:
+      return _FS_UNAVAIL
+
+    try:
+      return ctx.stats[lock_name][name]
+    except KeyError:
+      return _FS_UNAVAIL
+
+  return fn
+
+
 def _BuildLockFields():
   """Builds list of fields for lock queries.
 
@@ -2311,6 +2353,235 @@ def _BuildLockFields():
     (_MakeField("pending", "Pending", QFT_OTHER,
                 "Threads waiting for the lock"),
      LQ_PENDING, 0, _GetLockPending),
+    (_MakeField("acquires", "Acquires", QFT_NUMBER,
+                "Number of successful acquisitions (requires lock statistics"
+                " to be enabled in the master daemon)"),
+     LQ_STATS, 0, _GetLockStat("acquires")),
+    (_MakeField("timeouts", "Timeouts", QFT_NUMBER,
+                "Number of acquisitions which timed out"),
+     LQ_STATS, 0, _GetLockStat("timeouts")),
+    (_MakeField("wait_total", "WaitTotal", QFT_NUMBER,
+                "Total time spent waiting for the lock, including"
+                " acquisitions which timed out (seconds)"),
+     LQ_STATS, 0, _GetLockStat("wait_total")),
+    (_MakeField("wait_max", "WaitMax", QFT_NUMBER,
+                "Longest wait for the lock (seconds)"),
+     LQ_STATS, 0, _GetLockStat("wait_max")),
+    (_MakeField("wait_hist", "WaitHistogram", QFT_OTHER,
+                "Histogram of wait times of successful acquisitions as a list"
+                " of (upper bound in seconds, count) pairs; the last bucket"
+                " has no upper bound"),
+     LQ_STATS, 0, _GetLockStat("wait_hist")),
+    (_MakeField("hold_total", "HoldTotal", QFT_NUMBER,
+                "Total time the lock was held (seconds)"),
+     LQ_STATS, 0, _GetLockStat("hold_total")),
+    (_MakeField("hold_max", "HoldMax", QFT_NUMBER,
+                "Longest time the lock was held (seconds)"),
+     LQ_STATS, 0, _GetLockStat("hold_max")),
+    (_MakeField("opcodes", "Opcodes", QFT_OTHER,
+                "Statistics per opcode as a list of (opcode, acquires,"
+                " timeouts, wait time, hold time) entries"),
+     LQ_STATS, 0, _GetLockStat("opcodes")),
+    (_MakeField("blocked_by", "BlockedBy", QFT_OTHER,
+                "How often acquisitions had to wait for the lock's owners as"
+                " a list of (waiting opcode, owning opcode, count) entries"),
+     LQ_STATS, 0, _GetLockStat("blocked_by")),
+    ], [])
+
+
+class RpcQueryData:
+  """Data container for RPC statistics queries.
+
+  """
+  def __init__(self, entries):
+    """Initializes this class.
+
+    @type entries: list of tuples
+    @param entries: List of (procedure, node, statistics, histogram) tuples
+
+    """
+    self.entries = entries
+
+  def __iter__(self):
+    """Iterate over all entries.
+
+    """
+    return iter(self.entries)
+
+
+def _GetRpcStat(name):
+  """Returns a field function to return a statistic value of an RPC entry.
+
+  @type name: string
+  @param name: Statistic name
+
+  """
+  return lambda _, (procedure, node, stats, histogram): stats[name]
+
+
+def EstimateLatencyPercentile(histogram, latency_max, percentile):
+  """Estimates a percentile from a latency histogram.
+
+  The estimate is the upper bound of the histogram bucket containing the
+  percentile, limited by the highest latency seen.
+
+  @type histogram: list of tuples
+  @param histogram: List of (upper bound, count) pairs, the upper bound of the
+    last bucket being C{None}
+  @type latency_max: number
+  @param latency_max: Highest latency seen
+  @type percentile: number
+  @param percentile: Percentile (0-100)
+
+  """
+  wanted = sum(map(compat.snd, histogram)) * percentile / 100.0
+  count = 0
+
+  for (upper, num) in histogram:
+    count += num
+    if num and count >= wanted:
+      if upper is None:
+        break
+      return min(upper, latency_max)
+
+  return latency_max
+
+
+def _GetRpcAvgLatency(_, (procedure, node, stats, histogram)):
+  """Returns the average latency of successful requests of an RPC entry.
+
+  """
+  successful = stats["calls"] - stats["failures"]
+
+  if not successful:
+    return 0.0
+
+  return stats["latency_total"] / successful
+
+
+def _GetRpcLatencyPercentile(percentile):
+  """Returns a field function estimating a latency percentile.
+
+  @type percentile: number
+  @param percentile: Percentile (0-100)
+
+  """
+  return lambda _, (procedure, node, stats, histogram): \
+    EstimateLatencyPercentile(histogram, stats["latency_max"], percentile)
+
+
+def _BuildRpcFields():
+  """Builds list of fields for RPC statistics queries.
+
+  """
+  return _PrepareFieldList([
+    (_MakeField("name", "Name", QFT_TEXT,
+                "Procedure and node name, separated by a slash"), None, 0,
+     lambda ctx, (procedure, node, stats, histogram):
+       "%s/%s" % (procedure, node)),
+    (_MakeField("procedure", "Procedure", QFT_TEXT, "Procedure name"), None, 0,
+     lambda ctx, (procedure, node, stats, histogram): procedure),
+    (_MakeField("node", "Node", QFT_TEXT, "Node name"), None, QFF_HOSTNAME,
+     lambda ctx, (procedure, node, stats, histogram): node),
+    (_MakeField("calls", "Calls", QFT_NUMBER, "Number of requests made"),
+     None, 0, _GetRpcStat("calls")),
+    (_MakeField("failures", "Failures", QFT_NUMBER,
+                "Number of failed requests"),
+     None, 0, _GetRpcStat("failures")),
+    (_MakeField("timeouts", "Timeouts", QFT_NUMBER,
+                "Number of requests which failed after reaching their"
+                " read timeout"),
+     None, 0, _GetRpcStat("timeouts")),
+    (_MakeField("bytes_sent", "BytesSent", QFT_NUMBER,
+                "Total size of request bodies in bytes"),
+     None, 0, _GetRpcStat("bytes_sent")),
+    (_MakeField("bytes_received", "BytesRecv", QFT_NUMBER,
+                "Total size of response bodies in bytes"),
+     None, 0, _GetRpcStat("bytes_received")),
+    (_MakeField("latency_total", "LatTotal", QFT_NUMBER,
+                "Total time spent in successful requests (seconds)"),
+     None, 0, _GetRpcStat("latency_total")),
+    (_MakeField("latency_avg", "LatAvg", QFT_NUMBER,
+                "Average latency of successful requests (seconds)"),
+     None, 0, _GetRpcAvgLatency),
+    (_MakeField("latency_max", "LatMax", QFT_NUMBER,
+                "Highest latency of a successful request (seconds)"),
+     None, 0, _GetRpcStat("latency_max")),
+    ] + [
+    (_MakeField("latency_p%s" % percentile, "LatP%s" % percentile, QFT_NUMBER,
+                "Estimated %sth percentile of the latency of successful"
+                " requests (seconds)" % percentile),
+     None, 0, _GetRpcLatencyPercentile(percentile))
+    for percentile in [50, 90, 99]
+    ] + [
+    (_MakeField("latency_hist", "LatHistogram", QFT_OTHER,
+                "Latency histogram of successful requests as a list of"
+                " (upper bound in seconds, number of requests) pairs; the"
+                " last bucket has no upper bound"),
+     None, 0, lambda ctx, (procedure, node, stats, histogram): histogram),
+    ], [])
+
+
+class QueueQueryData:
+  """Data container for job queue statistics queries.
+
+  """
+  def __init__(self, stats):
+    """Initializes this class.
+
+    @type stats: dict
+    @param stats: Statistics of the job queue worker pool
+
+    """
+    self.stats = stats
+
+  def __iter__(self):
+    """Iterate over the single statistics entry.
+
+    """
+    return iter([self.stats])
+
+
+def _GetQueueStat(name):
+  """Returns a field function to return a job queue statistic.
+
+  @type name: string
+  @param name: Statistic name
+
+  """
+  return lambda _, stats: stats[name]
+
+
+def _BuildQueueFields():
+  """Builds list of fields for job queue statistics queries.
+
+  """
+  fields = [
+    ("name", "Name", QFT_TEXT, "Name of the worker pool"),
+    ("workers", "Workers", QFT_NUMBER, "Number of worker threads"),
+    ("workers_busy", "Busy", QFT_NUMBER,
+     "Number of worker threads busy with a job"),
+    ("workers_min", "MinWorkers", QFT_NUMBER,
+     "Minimum number of worker threads"),
+    ("workers_max", "MaxWorkers", QFT_NUMBER,
+     "Maximum number of worker threads"),
+    ("jobs_pending", "Pending", QFT_NUMBER,
+     "Number of runnable jobs waiting for a worker thread"),
+    ("lock_wait", "LockWait", QFT_NUMBER,
+     "Recent time spent by opcodes waiting for locks, decaying with a"
+     " half-life of one minute (seconds)"),
+    ("exec_time", "ExecTime", QFT_NUMBER,
+     "Recent time spent by opcodes executing after having acquired their"
+     " locks, decaying with a half-life of one minute (seconds)"),
+    ("lock_wait_ratio", "LockWaitRatio", QFT_NUMBER,
+     "Share of the recent opcode time spent waiting for locks"),
+    ("resizes", "Resizes", QFT_NUMBER,
+     "Number of times the number of worker threads was changed"),
+    ]
+
+  return _PrepareFieldList([
+    (_MakeField(name, title, kind, doc), None, 0, _GetQueueStat(name))
+    for (name, title, kind, doc) in fields
     ], [])
 
 
@@ -2547,6 +2818,30 @@ def _PerJobOp(fn):
   return _JobUnavail(compat.partial(_PerJobOpInner, fn))
 
 
+def _GetOpLockWait(op):
+  """Returns the total time an opcode spent waiting for locks.
+
+  Only available if the opcode was executed with profiling enabled (see
+  L{mcpu.SetProfilingEnabled}).
+
+  """
+  if op.profile is None:
+    return None
+
+  return sum(duration for (name, duration) in op.profile.items()
+             if name.startswith("lock/"))
+
+
+def _GetOpExecTime(op):
+  """Returns the time an opcode spent in its logical unit's C{Exec} method.
+
+  """
+  if op.profile is None:
+    return None
+
+  return op.profile.get("exec", None)
+
+
 def _JobTimestampInner(fn, job):
   """Converts unavailable timestamp to L{_FS_UNAVAIL}.
 
@@ -2602,6 +2897,16 @@ def _BuildJobFields():
     (_MakeField("opend", "OpCode_end", QFT_OTHER,
                 "List of opcode execution end timestamps"),
      None, 0, _PerJobOp(operator.attrgetter("end_timestamp"))),
+    (_MakeField("opprofile", "OpCode_profile", QFT_OTHER,
+                "List of per-opcode execution profiles (only if profiling is"
+                " enabled)"),
+     None, 0, _PerJobOp(operator.attrgetter("profile"))),
+    (_MakeField("oplockwait", "OpCode_lockwait", QFT_OTHER,
+                "List of per-opcode lock wait times in seconds"),
+     None, 0, _PerJobOp(_GetOpLockWait)),
+    (_MakeField("opexectime", "OpCode_exectime", QFT_OTHER,
+                "List of per-opcode execution times in seconds"),
+     None, 0, _PerJobOp(_GetOpExecTime)),
     (_MakeField("oppriority", "OpCode_prio", QFT_OTHER,
                 "List of opcode priorities"),
      None, 0, _PerJobOp(operator.attrgetter("priority"))),
@@ -2877,6 +3182,12 @@ INSTANCE_FIELDS = _BuildInstanceFields()
 #: Fields available for lock queries
 LOCK_FIELDS = _BuildLockFields()
 
+#: Fields available for RPC statistics queries
+RPC_FIELDS = _BuildRpcFields()
+
+#: Fields available for job queue statistics queries
+QUEUE_FIELDS = _BuildQueueFields()
+
 #: Fields available for node group queries
 GROUP_FIELDS = _BuildGroupFields()
 
@@ -2907,6 +3218,8 @@ ALL_FIELDS = {
   constants.QR_JOB: JOB_FIELDS,
   constants.QR_EXPORT: EXPORT_FIELDS,
   constants.QR_NETWORK: NETWORK_FIELDS,
+  constants.QR_RPC: RPC_FIELDS,
+  constants.QR_QUEUE: QUEUE_FIELDS,
   }
 
 #: All available field lists
@@ -28,6 +28,7 @@
 # C0103: Invalid name, since the R_* names are not conforming
 
 import logging
+import os
 
 from ganeti import luxi
 import ganeti.rpc.errors as rpcerr
@@ -119,6 +120,83 @@ def MapBulkFields(itemslist, fields):
   return items_details
 
 
+def _FormatFileValidator(stat):
+  """Formats the parts of a file's status relevant for cache validation.
+
+  """
+  return "%s:%s:%s:%s" % (stat.st_dev, stat.st_ino, stat.st_size,
+                          stat.st_mtime)
+
+
+def GetConfigValidator(_stat_fn=os.stat):
+  """Returns a cache validator for data derived from the configuration.
+
+  The configuration is always replaced atomically and its serial number is
+  increased on every write, hence the identity of the configuration file
+  changes together with the serial number. Using it avoids having to parse
+  the whole configuration or talk to the master daemon.
+
+  @rtype: string or None
+  @return: Validator or C{None} if the configuration file can't be accessed
+
+  """
+  try:
+    stat = _stat_fn(pathutils.CLUSTER_CONF_FILE)
+  except EnvironmentError, err:
+    logging.debug("Can't stat configuration file: %s", err)
+    return None
+
+  return "config:%s" % _FormatFileValidator(stat)
+
+
+def GetJobQueueValidator(job_id=None, _stat_fn=os.stat,
+                         _read_fn=utils.ReadOneLineFile):
+  """Returns a cache validator for data derived from the job queue.
+
+  Job files are replaced atomically on every update. Without a job ID the
+  validator is built from the job queue serial and the queue directory,
+  which changes whenever a job is added, updated or archived.
+
+  @type job_id: string or None
+  @param job_id: Job ID
+  @rtype: string or None
+  @return: Validator or C{None} if the job queue can't be accessed
+
+  """
+  try:
+    if job_id is None:
+      serial = _read_fn(pathutils.JOB_QUEUE_SERIAL_FILE, strict=True)
+      stat = _stat_fn(pathutils.QUEUE_DIR)
+      return "queue:%s:%s" % (serial, _FormatFileValidator(stat))
+
+    if not constants.JOB_FILE_RE.match("job-%s" % job_id):
+      return None
+
+    stat = _stat_fn(utils.PathJoin(pathutils.QUEUE_DIR, "job-%s" % job_id))
+  except (EnvironmentError, errors.GenericError), err:
+    logging.debug("Can't access job queue: %s", err)
+    return None
+
+  return "job:%s:%s" % (job_id, _FormatFileValidator(stat))
+
+
+def FormatETag(path, validator):
+  """Builds an entity tag for a response.
+
+  @type path: string
+  @param path: Request path, including query arguments
+  @type validator: string
+  @param validator: Cache validator as returned by
+    L{ResourceBase.GetCacheValidator}
+  @rtype: string
+  @return: Quoted entity tag
+
+  """
+  digest = compat.sha1_hash("%s\0%s" % (path, validator)).hexdigest()
+
+  return "\"%s\"" % digest
+
+
 def FillOpcode(opcls, body, static, rename=None):
   """Fills an opcode with body parameters.
 
@@ -256,6 +334,10 @@ class ResourceBase(object):
   POST_ACCESS = [rapi.RAPI_ACCESS_WRITE]
   DELETE_ACCESS = [rapi.RAPI_ACCESS_WRITE]
 
+  #: Whether GET responses may be served from the RAPI daemon's short-lived
+  #: response cache
+  GET_CACHEABLE = False
+
   def __init__(self, items, queryargs, req, _client_cls=None):
     """Generic resource constructor.
 
@@ -351,6 +433,20 @@ class ResourceBase(object):
     """
     return bool(self._checkIntVariable("dry-run"))
 
+  def GetCacheValidator(self):
+    """Returns a validator for the data returned by a GET request.
+
+    The validator must change whenever the returned data may change. It is
+    used for computing entity tags and for validating cached responses.
+
+    @rtype: string or None
+    @return: Validator or C{None} if the data can't be validated cheaply
+      (e.g. because it contains live data from nodes)
+
+    """
+    # Could be a function, pylint: disable=R0201
+    return None
+
   def GetClient(self, query=True):
     """Wrapper for L{luxi.Client} with HTTP-specific error handling.
 
@@ -290,6 +290,14 @@ class R_2_jobs(baserlib.ResourceBase):
   """/2/jobs resource.
 
   """
+  GET_CACHEABLE = True
+
+  def GetCacheValidator(self):
+    """Jobs are validated using the job queue.
+
+    """
+    return baserlib.GetJobQueueValidator()
+
   def GET(self):
     """Returns a dictionary of jobs.
 
@@ -311,6 +319,14 @@ class R_2_jobs_id(baserlib.ResourceBase):
   """/2/jobs/[job_id] resource.
 
   """
+  GET_CACHEABLE = True
+
+  def GetCacheValidator(self):
+    """A job is validated using its job file.
+
+    """
+    return baserlib.GetJobQueueValidator(job_id=self.items[0])
+
   def GET(self):
     """Returns a job status.
 
@@ -392,6 +408,18 @@ class R_2_nodes(baserlib.OpcodeResource):
   """/2/nodes resource.
 
   """
+  GET_CACHEABLE = True
+
+  def GetCacheValidator(self):
+    """Node lists are validated using the configuration.
+
+    Bulk data contains live data and can't be validated.
+
+    """
+    if self.useBulk():
+      return None
+
+    return baserlib.GetConfigValidator()
 
   def GET(self):
     """Returns a list of all nodes.
@@ -659,6 +687,7 @@ class R_2_networks(baserlib.OpcodeResource):
   POST_RENAME = {
     "name": "network_name",
     }
+  GET_CACHEABLE = True
 
   def GetPostOpInput(self):
     """Create a network.
@@ -669,6 +698,12 @@ class R_2_networks(baserlib.OpcodeResource):
       "dry_run": self.dryRun(),
       })
 
+  def GetCacheValidator(self):
+    """Networks are validated using the configuration.
+
+    """
+    return baserlib.GetConfigValidator()
+
   def GET(self):
     """Returns a list of all networks.
 
@@ -774,6 +809,7 @@ class R_2_groups(baserlib.OpcodeResource):
   POST_RENAME = {
     "name": "group_name",
     }
+  GET_CACHEABLE = True
 
   def GetPostOpInput(self):
     """Create a node group.
@@ -785,6 +821,12 @@ class R_2_groups(baserlib.OpcodeResource):
       "dry_run": self.dryRun(),
       })
 
+  def GetCacheValidator(self):
+    """Node groups are validated using the configuration.
+
+    """
+    return baserlib.GetConfigValidator()
+
   def GET(self):
     """Returns a list of all node groups.
 
@@ -912,6 +954,18 @@ class R_2_instances(baserlib.OpcodeResource):
     "os": "os_type",
     "name": "instance_name",
     }
+  GET_CACHEABLE = True
+
+  def GetCacheValidator(self):
+    """Instance lists are validated using the configuration.
+
+    Bulk data contains live data and can't be validated.
+
+    """
+    if self.useBulk():
+      return None
+
+    return baserlib.GetConfigValidator()
 
   def GET(self):
     """Returns a list of all available instances.
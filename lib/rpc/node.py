@@ -36,6 +36,8 @@ import base64
 import pycurl
 import threading
 import copy
+import time
+import math
 
 from ganeti import utils
 from ganeti import objects
@@ -50,6 +52,7 @@ from ganeti import compat
 from ganeti import rpc_defs
 from ganeti import pathutils
 from ganeti import vcluster
+from ganeti import query
 
 # Special module generated at build time
 from ganeti import _generated_rpc
@@ -58,14 +61,41 @@ from ganeti import _generated_rpc
 import ganeti.http.client  # pylint: disable=W0611
 
 
+_RPC_CLIENT_ACCEPT = \
+  "Accept: %s, %s" % (http.HTTP_APP_GANETI_RPC, http.HTTP_APP_JSON)
+
 _RPC_CLIENT_HEADERS = [
   "Content-type: %s" % http.HTTP_APP_JSON,
+  _RPC_CLIENT_ACCEPT,
+  "Expect:",
+  ]
+
+#: Headers for requests sent as framed documents, see L{serializer.DumpFramed}
+_RPC_CLIENT_HEADERS_FRAMED = [
+  "Content-type: %s" % http.HTTP_APP_GANETI_RPC,
+  _RPC_CLIENT_ACCEPT,
   "Expect:",
   ]
 
 #: Special value to describe an offline host
 _OFFLINE = object()
 
+#: Upper bounds (in seconds) of the buckets used for RPC latency histograms
+RPC_LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0]
+
+#: Minimum number of successful requests to a node before its latency is used
+#: to compute adaptive timeouts
+_ADAPTIVE_TIMEOUT_MIN_SAMPLES = 10
+
+#: Latency percentile on which adaptive timeouts are based
+_ADAPTIVE_TIMEOUT_PERCENTILE = 99
+
+#: Factor applied to the latency percentile for adaptive timeouts
+_ADAPTIVE_TIMEOUT_FACTOR = 4
+
+#: Lower bound for adaptive timeouts (in seconds)
+_ADAPTIVE_TIMEOUT_MIN = 10
+
 
 def Init():
   """Initializes the module-global HTTP client manager.
@@ -126,6 +156,26 @@ def RunWithRPC(fn):
   return wrapper
 
 
+class _CompressedData(tuple):
+  """Compressed data as encoded for JSON bodies.
+
+  Keeps the raw compressed data for use in framed bodies, which can
+  transport it without base64 encoding.
+
+  """
+  def __new__(cls, raw):
+    """Creates a new instance.
+
+    @type raw: str
+    @param raw: Data compressed with zlib
+
+    """
+    obj = tuple.__new__(cls, (constants.RPC_ENCODING_ZLIB_BASE64,
+                              base64.b64encode(raw)))
+    obj.raw = raw
+    return obj
+
+
 def _Compress(_, data):
   """Compresses a string for transport over RPC.
 
@@ -142,8 +192,50 @@ def _Compress(_, data):
     return (constants.RPC_ENCODING_NONE, data)
 
   # Compress with zlib and encode in base64
-  return (constants.RPC_ENCODING_ZLIB_BASE64,
-          base64.b64encode(zlib.compress(data, 3)))
+  return _CompressedData(zlib.compress(data, 3))
+
+
+def _ExtractBlobs(value, blobs):
+  """Replaces compressed data with references to blobs.
+
+  @param value: Encoded RPC arguments
+  @type blobs: list
+  @param blobs: Receives the raw compressed data
+
+  """
+  if isinstance(value, _CompressedData):
+    blobs.append(value.raw)
+    return (constants.RPC_ENCODING_ZLIB_RAW,
+            serializer.FramedBlobRef(len(blobs) - 1))
+  elif isinstance(value, (list, tuple)):
+    return [_ExtractBlobs(i, blobs) for i in value]
+  elif isinstance(value, dict):
+    return dict((key, _ExtractBlobs(i, blobs)) for (key, i) in value.items())
+  else:
+    return value
+
+
+def _DumpFramedBody(value):
+  """Serializes RPC arguments into a framed document.
+
+  Compressed data is sent as blobs instead of base64-encoded strings.
+
+  """
+  blobs = []
+  data = _ExtractBlobs(value, blobs)
+  return serializer.DumpFramed(data, blobs)
+
+
+def _LoadResponseBody(body):
+  """Decodes the body of an RPC response.
+
+  Nodes accepting framed bodies also respond with framed documents.
+
+  """
+  if serializer.IsFramed(body):
+    return serializer.LoadFramed(body)
+
+  return serializer.LoadJson(body)
 
 
 class RpcResult(object):
@@ -342,8 +434,221 @@ def _NodeConfigResolver(single_node_fn, all_nodes_fn, node_uuids, opts):
             for uuid in node_uuids]
 
 
+class _RpcStatisticsEntry(object):
+  """Statistics for calls of one procedure on one node.
+
+  """
+  __slots__ = [
+    "calls",
+    "failures",
+    "timeouts",
+    "bytes_sent",
+    "bytes_received",
+    "latency_total",
+    "latency_max",
+    "histogram",
+    "last_timed_out",
+    ]
+
+  def __init__(self, num_buckets):
+    """Initializes this class.
+
+    """
+    self.calls = 0
+    self.failures = 0
+    self.timeouts = 0
+    self.bytes_sent = 0
+    self.bytes_received = 0
+    self.latency_total = 0.0
+    self.latency_max = 0.0
+    self.histogram = [0] * num_buckets
+    self.last_timed_out = False
+
+
+class RpcStatistics(object):
+  """Collects latency and payload statistics for RPC calls.
+
+  Statistics are kept per procedure and node in the process making the calls,
+  usually the master daemon.
+
+  """
+  def __init__(self, buckets=None):
+    """Initializes this class.
+
+    @type buckets: list of numbers
+    @param buckets: Upper bounds (in seconds) of the latency histogram buckets,
+      defaults to L{RPC_LATENCY_BUCKETS}; an additional bucket without upper
+      bound is always added
+
+    """
+    if buckets is None:
+      buckets = RPC_LATENCY_BUCKETS
+
+    assert list(buckets) == sorted(buckets)
+
+    self._buckets = list(buckets) + [None]
+    self._lock = threading.Lock()
+    self._entries = {}
+
+  def Record(self, procedure, node, latency, bytes_sent, bytes_received,
+             failed, timed_out):
+    """Records the outcome of a single request.
+
+    @type procedure: string
+    @param procedure: Procedure name
+    @type node: string
+    @param node: Node name
+    @type latency: float
+    @param latency: Time in seconds until the request completed; only taken
+      into account for successful requests
+    @type bytes_sent: int
+    @param bytes_sent: Size of request body
+    @type bytes_received: int
+    @param bytes_received: Size of response body
+    @type failed: bool
+    @param failed: Whether the request failed
+    @type timed_out: bool
+    @param timed_out: Whether the request ran into its read timeout
+
+    """
+    for (idx, upper) in enumerate(self._buckets):
+      if upper is None or latency <= upper:
+        break
+
+    self._lock.acquire()
+    try:
+      key = (procedure, node)
+
+      entry = self._entries.get(key, None)
+      if entry is None:
+        entry = self._entries[key] = _RpcStatisticsEntry(len(self._buckets))
+
+      entry.calls += 1
+      if failed:
+        entry.failures += 1
+      else:
+        entry.latency_total += latency
+        entry.latency_max = max(entry.latency_max, latency)
+        entry.histogram[idx] += 1
+      if timed_out:
+        entry.timeouts += 1
+      entry.last_timed_out = timed_out
+      entry.bytes_sent += bytes_sent
+      entry.bytes_received += bytes_received
+    finally:
+      self._lock.release()
+
+  def GetEntries(self):
+    """Returns a snapshot of all statistics.
+
+    @rtype: list of tuples
+    @return: List of (procedure, node, statistics, histogram) tuples;
+      statistics are dictionaries keyed by L{_RpcStatisticsEntry} attribute
+      names, the histogram is a list of (upper bound, count) pairs
+
+    """
+    self._lock.acquire()
+    try:
+      return [(procedure, node,
+               dict((name, getattr(entry, name))
+                    for name in _RpcStatisticsEntry.__slots__
+                    if name != "histogram"),
+               zip(self._buckets, entry.histogram))
+              for ((procedure, node), entry) in self._entries.items()]
+    finally:
+      self._lock.release()
+
+  def GetAdaptiveTimeout(self, procedure, nodes, timeout):
+    """Computes a timeout based on the latency observed for a procedure.
+
+    The adaptive timeout is a multiple of the highest estimated latency
+    percentile among the given nodes, but never lower than
+    L{_ADAPTIVE_TIMEOUT_MIN} nor higher than the given timeout. The given
+    timeout is used as-is if there are not enough successful requests to one
+    of the nodes or if the last request to one of them timed out; the latter
+    gives slow nodes a chance to answer every other time instead of being cut
+    off forever.
+
+    @type procedure: string
+    @param procedure: Procedure name
+    @type nodes: list of strings
+    @param nodes: Node names
+    @type timeout: int
+    @param timeout: Default timeout for the procedure
+    @rtype: int
+
+    """
+    latency = 0.0
+
+    self._lock.acquire()
+    try:
+      for node in nodes:
+        entry = self._entries.get((procedure, node), None)
+
+        if (entry is None or entry.last_timed_out or
+            (entry.calls - entry.failures) < _ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+          return timeout
+
+        latency = max(latency, query.EstimateLatencyPercentile(
+          zip(self._buckets, entry.histogram), entry.latency_max,
+          _ADAPTIVE_TIMEOUT_PERCENTILE))
+    finally:
+      self._lock.release()
+
+    return min(timeout, max(_ADAPTIVE_TIMEOUT_MIN,
+                            int(math.ceil(latency * _ADAPTIVE_TIMEOUT_FACTOR))))
+
+  def Reset(self):
+    """Discards all collected statistics.
+
+    """
+    self._lock.acquire()
+    try:
+      self._entries.clear()
+    finally:
+      self._lock.release()
+
+  def QueryStatistics(self, fields):
+    """Queries collected statistics.
+
+    @type fields: list of strings
+    @param fields: List of fields to return, see L{query.RPC_FIELDS}
+
+    """
+    qobj = query.Query(query.RPC_FIELDS, fields)
+
+    return query.GetQueryResponse(qobj, query.RpcQueryData(self.GetEntries()))
+
+
+#: Module-global statistics for all RPC calls made by this process
+_STATISTICS = RpcStatistics()
+
+
+def QueryStatistics(fields):
+  """Queries statistics about RPC calls made by this process.
+
+  See L{RpcStatistics.QueryStatistics}.
+
+  """
+  return _STATISTICS.QueryStatistics(fields)
+
+
+#: Per-thread total time spent waiting for RPC responses
+_thread_rpc_time = threading.local()
+
+
+def GetThreadRpcTime():
+  """Returns the total time the calling thread spent waiting for RPC calls.
+
+  @rtype: float
+
+  """
+  return getattr(_thread_rpc_time, "total", 0.0)
+
+
 class _RpcProcessor:
-  def __init__(self, resolver, port, lock_monitor_cb=None):
+  def __init__(self, resolver, port, lock_monitor_cb=None, _stats=None,
+               _time_fn=time.time):
     """Initializes this class.
 
     @param resolver: callable accepting a list of node UUIDs or hostnames,
@@ -355,16 +660,51 @@ class _RpcProcessor:
     @param lock_monitor_cb: Callable for registering with lock monitor
 
     """
+    if _stats is None:
+      _stats = _STATISTICS
+
     self._resolver = resolver
     self._port = port
     self._lock_monitor_cb = lock_monitor_cb
+    self._framed_nodes = set()
+    self._stats = _stats
+    self._time_fn = _time_fn
+
+  def SupportsFramedBody(self, node):
+    """Returns whether a node is known to accept framed request bodies.
+
+    Nodes signal support by responding with a framed document.
+
+    @type node: string
+    @param node: Node UUID or hostname as passed to L{__call__}
+
+    """
+    return node in self._framed_nodes
+
+  def _UpdateFramedNodes(self, requests):
+    """Records which nodes support framed bodies.
+
+    """
+    for (name, req) in requests.items():
+      if not (req.success and req.resp_status_code == http.HTTP_OK):
+        continue
+
+      if serializer.IsFramed(req.resp_body):
+        self._framed_nodes.add(name)
+      elif name in self._framed_nodes:
+        # The node daemon was downgraded
+        logging.warning("Node %s no longer supports framed RPC bodies", name)
+        self._framed_nodes.discard(name)
 
   @staticmethod
-  def _PrepareRequests(hosts, port, procedure, body, read_timeout):
+  def _PrepareRequests(hosts, port, procedure, body, read_timeout,
+                       completion_cb=None):
     """Prepares requests by sorting offline hosts into separate list.
 
     @type body: dict
     @param body: a dictionary with per-host body data
+    @param completion_cb: Callback for request completion, see
+      L{http.client.HttpClientRequest}
 
     """
     results = {}
@@ -383,17 +723,49 @@ class _RpcProcessor:
                                            offline=True,
                                            call=procedure)
       else:
+        post_data = body[original_name]
+
+        if serializer.IsFramed(post_data):
+          headers = _RPC_CLIENT_HEADERS_FRAMED
+        else:
+          headers = _RPC_CLIENT_HEADERS
+
         requests[original_name] = \
           http.client.HttpClientRequest(str(ip), port,
                                         http.HTTP_POST, str("/%s" % procedure),
-                                        headers=_RPC_CLIENT_HEADERS,
-                                        post_data=body[original_name],
+                                        headers=headers,
+                                        post_data=post_data,
                                         read_timeout=read_timeout,
                                         nicename="%s/%s" % (name, procedure),
-                                        curl_config_fn=_ConfigRpcCurl)
+                                        curl_config_fn=_ConfigRpcCurl,
+                                        completion_cb=completion_cb)
 
     return (results, requests)
 
+  def _RecordStatistics(self, hosts, requests, procedure, read_timeout, start,
+                        completed):
+    """Records latency and payload sizes of finished requests.
+
+    @param completed: Dictionary containing the completion time per request;
+      requests not listed are assumed to have finished just now
+
+    """
+    now = self._time_fn()
+    names = dict((original_name, name) for (name, _, original_name) in hosts)
+
+    for (original_name, req) in requests.items():
+      latency = max(0.0, completed.get(req, now) - start)
+      failed = not (req.success and req.resp_status_code == http.HTTP_OK)
+
+      if req.resp_body is None:
+        received = 0
+      else:
+        received = len(req.resp_body)
+
+      self._stats.Record(procedure, names[original_name], latency,
+                         len(req.post_data), received, failed,
+                         failed and latency >= read_timeout)
+
   @staticmethod
   def _CombineResults(results, requests, procedure):
     """Combines pre-computed results for offline hosts with actual call results.
@@ -401,7 +773,7 @@ class _RpcProcessor:
     """
     for name, req in requests.items():
       if req.success and req.resp_status_code == http.HTTP_OK:
-        host_result = RpcResult(data=serializer.LoadJson(req.resp_body),
+        host_result = RpcResult(data=_LoadResponseBody(req.resp_body),
                                 node=name, call=procedure)
       else:
         # TODO: Better error reporting
@@ -419,7 +791,7 @@ class _RpcProcessor:
     return results
 
   def __call__(self, nodes, procedure, body, read_timeout, resolver_opts,
-               _req_process_fn=None):
+               adaptive_timeout=False, _req_process_fn=None):
     """Makes an RPC request to a number of nodes.
 
     @type nodes: sequence
@@ -430,6 +802,12 @@ class _RpcProcessor:
     @param body: dictionary with request bodies per host
     @type read_timeout: int or None
     @param read_timeout: Read timeout for request
+    @type adaptive_timeout: bool
+    @param adaptive_timeout: Whether to shorten the read timeout according to
+      the latency observed for the nodes (see
+      L{RpcStatistics.GetAdaptiveTimeout}); nodes not answering in time are
+      reported as failed, so this is only suitable for callers which can cope
+      with partial results, such as queries
     @rtype: dictionary
     @return: a dictionary mapping host names to rpc.RpcResult objects
 
@@ -440,12 +818,36 @@ class _RpcProcessor:
     if _req_process_fn is None:
       _req_process_fn = http.client.ProcessRequests
 
+    hosts = self._resolver(nodes, resolver_opts)
+    completed = {}
+
+    if adaptive_timeout:
+      timeout = self._stats.GetAdaptiveTimeout(procedure,
+                                               [name for (name, ip, _) in hosts
+                                                if ip is not _OFFLINE],
+                                               read_timeout)
+      if timeout < read_timeout:
+        logging.debug("Using adaptive timeout of %s seconds instead of %s for"
+                      " procedure %s", timeout, read_timeout, procedure)
+        read_timeout = timeout
+
+    def _RecordCompletion(req):
+      completed[req] = self._time_fn()
+
     (results, requests) = \
-      self._PrepareRequests(self._resolver(nodes, resolver_opts), self._port,
-                            procedure, body, read_timeout)
+      self._PrepareRequests(hosts, self._port, procedure, body, read_timeout,
+                            completion_cb=_RecordCompletion)
+
+    start = self._time_fn()
 
     _req_process_fn(requests.values(), lock_monitor_cb=self._lock_monitor_cb)
 
+    _thread_rpc_time.total = GetThreadRpcTime() + (self._time_fn() - start)
+
+    self._RecordStatistics(hosts, requests, procedure, read_timeout, start,
+                           completed)
+    self._UpdateFramedNodes(requests)
+
     assert not frozenset(results).intersection(requests)
 
     return self._CombineResults(results, requests, procedure)
@@ -461,6 +863,7 @@ class _RpcClientBase:
                          netutils.GetDaemonPort(constants.NODED),
                          lock_monitor_cb=lock_monitor_cb)
     self._proc = compat.partial(proc, _req_process_fn=_req_process_fn)
+    self._supports_framed_fn = proc.SupportsFramedBody
     self._encoder = compat.partial(self._EncodeArg, encoder_fn)
 
   @staticmethod
@@ -473,9 +876,25 @@ class _RpcClientBase:
     else:
       return encoder_fn(argkind)(node, value)
 
-  def _Call(self, cdef, node_list, args):
+  @staticmethod
+  def _SerializeBody(framed, value):
+    """Serializes encoded arguments into a request body.
+
+    @type framed: bool
+    @param framed: Whether to create a framed document instead of JSON
+
+    """
+    if framed:
+      return _DumpFramedBody(value)
+
+    return serializer.DumpJson(value)
+
+  def _Call(self, cdef, node_list, args, adaptive_timeout=False):
     """Entry point for automatically generated RPC wrappers.
 
+    @type adaptive_timeout: bool
+    @param adaptive_timeout: See L{_RpcProcessor.__call__}
+
     """
     (procedure, _, resolver_opts, timeout, argdefs,
      prep_fn, postproc_fn, _) = cdef
@@ -493,19 +912,36 @@ class _RpcClientBase:
     if len(args) != len(argdefs):
       raise errors.ProgrammerError("Number of passed arguments doesn't match")
 
-    if prep_fn is None:
-      prep_fn = lambda _, args: args
-    assert callable(prep_fn)
-
-    # encode the arguments for each node individually, pass them and the node
-    # name to the prep_fn, and serialise its return value
+    argkinds = map(compat.snd, argdefs)
     encode_args_fn = lambda node: map(compat.partial(self._encoder, node),
-                                      zip(map(compat.snd, argdefs), args))
-    pnbody = dict((n, serializer.DumpJson(prep_fn(n, encode_args_fn(n))))
-                  for n in node_list)
+                                      zip(argkinds, args))
+
+    if (prep_fn is None and len(node_list) > 1 and
+        compat.all(kind is None or kind in rpc_defs.ED_NODE_INDEPENDENT
+                   for kind in argkinds)):
+      # the body is the same for all nodes, hence encode and serialise it only
+      # once per format and share it between all requests
+      encoded = encode_args_fn(None)
+      bodies = {}
+      pnbody = {}
+      for n in node_list:
+        framed = self._supports_framed_fn(n)
+        if framed not in bodies:
+          bodies[framed] = self._SerializeBody(framed, encoded)
+        pnbody[n] = bodies[framed]
+    else:
+      if prep_fn is None:
+        prep_fn = lambda _, args: args
+      assert callable(prep_fn)
+
+      # encode the arguments for each node individually, pass them and the node
+      # name to the prep_fn, and serialise its return value
+      pnbody = dict((n, self._SerializeBody(self._supports_framed_fn(n),
+                                            prep_fn(n, encode_args_fn(n))))
+                    for n in node_list)
 
     result = self._proc(node_list, procedure, pnbody, read_timeout,
-                        req_resolver_opts)
+                        req_resolver_opts, adaptive_timeout=adaptive_timeout)
 
     if postproc_fn:
       return dict(map(lambda (key, value): (key, postproc_fn(value)),
@@ -792,6 +1228,8 @@ class RpcRunner(_RpcClientBase,
       # Encoders requiring configuration object
       rpc_defs.ED_INST_DICT: self._InstDict,
       rpc_defs.ED_INST_DICT_HVP_BEP_DP: self._InstDictHvpBepDp,
+      rpc_defs.ED_INST_DICT_LIST: self._InstDictList,
+      rpc_defs.ED_MULTI_INST_DICT_HVP_BEP_DP: self._MultiInstDictHvpBepDp,
       rpc_defs.ED_INST_DICT_OSP_DP: self._InstDictOspDp,
       rpc_defs.ED_NIC_DICT: self._NicDict,
       rpc_defs.ED_DEVICE_DICT: self._DeviceDict,
@@ -891,6 +1329,19 @@ class RpcRunner(_RpcClientBase,
     """
     return self._InstDict(node, instance, hvp=hvp, bep=bep)
 
+  def _InstDictList(self, node, instances):
+    """Wrapper for L{_InstDict} converting a list of instances.
+
+    """
+    return [self._InstDict(node, instance) for instance in instances]
+
+  def _MultiInstDictHvpBepDp(self, node, instances_hvp_bep):
+    """Wrapper for L{_InstDictHvpBepDp} converting a list of instances.
+
+    """
+    return [self._InstDictHvpBepDp(node, inst_hvp_bep)
+            for inst_hvp_bep in instances_hvp_bep]
+
   def _InstDictOspDp(self, node, (instance, osparams)):
     """Wrapper for L{_InstDict}.
 
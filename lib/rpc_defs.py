@@ -73,7 +73,22 @@ ACCEPT_OFFLINE_NODE = object()
  ED_MULTI_DISKS_DICT_DP,
  ED_SINGLE_DISK_DICT_DP,
  ED_NIC_DICT,
- ED_DEVICE_DICT) = range(1, 17)
+ ED_DEVICE_DICT,
+ ED_INST_DICT_LIST,
+ ED_MULTI_INST_DICT_HVP_BEP_DP) = range(1, 19)
+
+#: Argument kinds whose encoded value doesn't depend on the target node; calls
+#: using only these (and no custom body encoder) send the same body to all
+#: nodes, which is then only encoded once
+ED_NODE_INDEPENDENT = frozenset([
+  ED_OBJECT_DICT,
+  ED_OBJECT_DICT_LIST,
+  ED_FILE_DETAILS,
+  ED_FINALIZE_EXPORT_DISKS,
+  ED_COMPRESS,
+  ED_BLOCKDEV_RENAME,
+  ED_NIC_DICT,
+  ])
 
 
 def _Prepare(calls):
@@ -242,6 +257,11 @@ _INSTANCE_CALLS = [
     ("timeout", None, None),
     ("reason", None, "The reason for the shutdown"),
     ], None, None, "Stops an instance"),
+  ("instance_shutdown_multi", SINGLE, None, constants.RPC_TMO_SLOW, [
+    ("instances", ED_INST_DICT_LIST, "List of instance objects"),
+    ("timeout", None, None),
+    ("reason", None, "The reason for the shutdown"),
+    ], None, None, "Stops several instances concurrently"),
   ("instance_balloon_memory", SINGLE, None, constants.RPC_TMO_NORMAL, [
     ("instance", ED_INST_DICT, "Instance object"),
     ("memory", None, None),
@@ -270,7 +290,7 @@ _INSTANCE_CALLS = [
     ], None, None, "Finalize any target-node migration specific operation"),
   ("instance_migrate", SINGLE, None, constants.RPC_TMO_SLOW, [
     ("cluster_name", None, "Cluster name"),
-    ("instance", ED_INST_DICT, "Instance object"),
+    ("instance_hvp_bep", ED_INST_DICT_HVP_BEP_DP, None),
     ("target", None, "Target node name"),
     ("live", None, "Whether the migration should be done live or not"),
     ], None, None, "Migrate an instance"),
@@ -280,13 +300,19 @@ _INSTANCE_CALLS = [
     ("live", None, "Whether the user requested a live migration or not"),
     ], None, None, "Finalize the instance migration on the source node"),
   ("instance_get_migration_status", SINGLE, None, constants.RPC_TMO_SLOW, [
-    ("instance", ED_INST_DICT, "Instance object"),
+    ("instance_hvp_bep", ED_INST_DICT_HVP_BEP_DP, None),
     ], None, _MigrationStatusPostProc, "Report migration status"),
   ("instance_start", SINGLE, None, constants.RPC_TMO_NORMAL, [
     ("instance_hvp_bep", ED_INST_DICT_HVP_BEP_DP, None),
     ("startup_paused", None, None),
     ("reason", None, "The reason for the startup"),
     ], None, None, "Starts an instance"),
+  ("instance_start_multi", SINGLE, None, constants.RPC_TMO_SLOW, [
+    ("instances_hvp_bep", ED_MULTI_INST_DICT_HVP_BEP_DP,
+     "List of (instance, hvparams, beparams) tuples"),
+    ("startup_paused", None, None),
+    ("reason", None, "The reason for the startup"),
+    ], None, None, "Starts several instances concurrently"),
   ("instance_os_add", SINGLE, None, constants.RPC_TMO_1DAY, [
     ("instance_osp", ED_INST_DICT_OSP_DP, None),
     ("reinstall", None, None),
@@ -543,6 +569,8 @@ _MISC_CALLS = [
     ("phase", None, None),
     ("env", None, None),
     ], None, None, "Call the hooks runner"),
+  ("hooks_manifest", MULTI, None, constants.RPC_TMO_URGENT, [], None, None,
+   "Returns the hook directories containing scripts"),
   ("iallocator_runner", SINGLE, None, constants.RPC_TMO_NORMAL, [
     ("name", None, "Iallocator name"),
     ("idata", None, "JSON-encoded input string"),
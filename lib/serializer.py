@@ -30,6 +30,8 @@ backend (currently json).
 # function and not a constant
 
 import re
+import struct
+import zlib
 
 # Python 2.6 and above contain a JSON module based on simplejson. Unfortunately
 # the standard library version is significantly slower than the external
@@ -44,6 +46,27 @@ from ganeti import utils
 
 _RE_EOLSP = re.compile("[ \t]+$", re.MULTILINE)
 
+#: Magic prefix of framed documents; a JSON document can't start with a NUL
+#: byte, hence framed and plain JSON documents can be told apart
+_FRAMED_MAGIC = "\0GNT"
+_FRAMED_VERSION = 1
+
+#: Header of framed documents (magic, version, flags, length of JSON part,
+#: number of blobs)
+_FRAMED_HEADER = "!4sBBII"
+
+#: Length prefix of blobs in framed documents
+_FRAMED_BLOB_LENGTH = "!I"
+
+#: Flag set if the JSON part of a framed document is compressed
+_FRAMED_FLAG_ZLIB = 0x01
+
+#: JSON parts smaller than this are not compressed
+_FRAMED_COMPRESS_MIN = 4096
+
+#: Key used for referencing blobs from within the JSON part
+_FRAMED_BLOB_KEY = "__ganeti_blob__"
+
 
 def DumpJson(data):
   """Serialize a given object.
@@ -72,6 +95,136 @@ def LoadJson(txt):
   return simplejson.loads(txt)
 
 
+def FramedBlobRef(index):
+  """Returns a reference to a blob in a framed document.
+
+  @type index: int
+  @param index: Index of the blob in the list passed to L{DumpFramed}
+
+  """
+  return {
+    _FRAMED_BLOB_KEY: index,
+    }
+
+
+def IsFramed(txt):
+  """Checks whether a string contains a framed document.
+
+  """
+  return txt.startswith(_FRAMED_MAGIC)
+
+
+def DumpFramed(data, blobs=None, compress_min=_FRAMED_COMPRESS_MIN):
+  """Serialize an object and binary data into a framed document.
+
+  The object is encoded as JSON, compressed if it's large enough, and
+  followed by the length-prefixed blobs. Blobs are transported as they
+  are and can be referenced from within the object using
+  L{FramedBlobRef}, avoiding the overhead of encoding binary data for
+  JSON.
+
+  @param data: the data to serialize
+  @type blobs: list of strings
+  @param blobs: binary data to send along
+  @type compress_min: int
+  @param compress_min: the JSON part is compressed if it is at least this
+    long
+  @return: the framed document
+
+  """
+  if blobs is None:
+    blobs = []
+
+  flags = 0
+  doc = simplejson.dumps(data)
+
+  if len(doc) >= compress_min:
+    flags |= _FRAMED_FLAG_ZLIB
+    doc = zlib.compress(doc, 1)
+
+  parts = [struct.pack(_FRAMED_HEADER, _FRAMED_MAGIC, _FRAMED_VERSION, flags,
+                       len(doc), len(blobs)),
+           doc]
+
+  for blob in blobs:
+    parts.append(struct.pack(_FRAMED_BLOB_LENGTH, len(blob)))
+    parts.append(blob)
+
+  return "".join(parts)
+
+
+def LoadFramed(txt):
+  """Unserialize a framed document.
+
+  References to blobs are replaced with the blobs' contents.
+
+  @param txt: the framed document as created by L{DumpFramed}
+  @return: the original data
+  @raise errors.ParseError: if L{txt} is not a valid framed document
+
+  """
+  header_size = struct.calcsize(_FRAMED_HEADER)
+  length_size = struct.calcsize(_FRAMED_BLOB_LENGTH)
+
+  if len(txt) < header_size:
+    raise errors.ParseError("Framed document is too short")
+
+  (magic, version, flags, doc_len, blob_count) = \
+    struct.unpack(_FRAMED_HEADER, txt[:header_size])
+
+  if magic != _FRAMED_MAGIC:
+    raise errors.ParseError("Not a framed document")
+
+  if version != _FRAMED_VERSION:
+    raise errors.ParseError("Unsupported framed document version %s" %
+                            version)
+
+  offset = header_size + doc_len
+  doc = txt[header_size:offset]
+  if (len(doc) != doc_len or
+      blob_count * length_size > len(txt) - offset):
+    raise errors.ParseError("Framed document is truncated")
+
+  blobs = []
+  for _ in range(blob_count):
+    prefix = txt[offset:offset + length_size]
+    if len(prefix) != length_size:
+      raise errors.ParseError("Framed document is truncated")
+    (blob_len, ) = struct.unpack(_FRAMED_BLOB_LENGTH, prefix)
+    offset += length_size
+    blob = txt[offset:offset + blob_len]
+    if len(blob) != blob_len:
+      raise errors.ParseError("Blob in framed document is truncated")
+    offset += blob_len
+    blobs.append(blob)
+
+  if offset != len(txt):
+    raise errors.ParseError("Trailing data after framed document")
+
+  if flags & _FRAMED_FLAG_ZLIB:
+    try:
+      doc = zlib.decompress(doc)
+    except zlib.error, err:
+      raise errors.ParseError("Can't decompress framed document: %s" % err)
+
+  def _ResolveBlob(obj):
+    if len(obj) == 1 and _FRAMED_BLOB_KEY in obj:
+      index = obj[_FRAMED_BLOB_KEY]
+      if (isinstance(index, bool) or not isinstance(index, (int, long)) or
+          not 0 <= index < len(blobs)):
+        raise errors.ParseError("Invalid blob reference %r in framed"
+                                " document" % (index, ))
+      return blobs[index]
+    return obj
+
+  try:
+    if not blobs:
+      return simplejson.loads(doc)
+    return simplejson.loads(doc, object_hook=_ResolveBlob)
+  except ValueError, err:
+    raise errors.ParseError("Invalid JSON in framed document: %s" % err)
+
+
 def DumpSignedJson(data, key, salt=None, key_selector=None):
   """Serialize a given object and authenticate it.
 
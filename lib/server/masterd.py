@@ -238,8 +238,14 @@ class MasterServer(daemon.AsyncStreamServer):
     # maximum number to avoid breaking for lack of file descriptors or memory.
     MasterClientHandler(self, connected_socket, client_address, self.family)
 
-  def setup_queue(self):
-    self.context = GanetiContext()
+  def setup_queue(self, fair_locks=False,
+                  min_job_workers=jqueue.JOBQUEUE_THREADS,
+                  max_job_workers=jqueue.JOBQUEUE_THREADS,
+                  lock_aware_scheduling=False):
+    self.context = GanetiContext(fair_locks=fair_locks,
+                                 min_job_workers=min_job_workers,
+                                 max_job_workers=max_job_workers,
+                                 lock_aware_scheduling=lock_aware_scheduling)
     self.request_workers = workerpool.WorkerPool("ClientReq",
                                                  CLIENT_REQUEST_WORKERS,
                                                  ClientRequestWorker)
@@ -360,6 +366,16 @@ class ClientOps:
           raise errors.OpPrereqError("Lock queries can't be filtered",
                                      errors.ECODE_INVAL)
         return context.glm.QueryLocks(fields)
+      elif what == constants.QR_RPC:
+        if qfilter is not None:
+          raise errors.OpPrereqError("RPC statistics can't be filtered",
+                                     errors.ECODE_INVAL)
+        return rpc.QueryStatistics(fields)
+      elif what == constants.QR_QUEUE:
+        if qfilter is not None:
+          raise errors.OpPrereqError("Job queue statistics can't be filtered",
+                                     errors.ECODE_INVAL)
+        return queue.QueryStatistics(fields)
       elif what == constants.QR_JOB:
         return queue.QueryJobs(fields, qfilter)
       elif what in constants.QR_VIA_LUXI:
@@ -447,12 +463,26 @@ class GanetiContext(object):
   # we do want to ensure a singleton here
   _instance = None
 
-  def __init__(self):
+  def __init__(self, fair_locks=False,
+               min_job_workers=jqueue.JOBQUEUE_THREADS,
+               max_job_workers=jqueue.JOBQUEUE_THREADS,
+               lock_aware_scheduling=False):
     """Constructs a new GanetiContext object.
 
     There should be only a GanetiContext object at any time, so this
     function raises an error if this is not the case.
 
+    @type fair_locks: boolean
+    @param fair_locks: Whether locks should be granted in priority and FIFO
+      order (see L{locking.GanetiLockManager})
+    @type min_job_workers: int
+    @param min_job_workers: Minimum number of job worker threads
+    @type max_job_workers: int
+    @param max_job_workers: Maximum number of job worker threads
+    @type lock_aware_scheduling: boolean
+    @param lock_aware_scheduling: Whether to prefer running jobs whose locks
+      are available (see L{jqueue.JobQueue})
+
     """
     assert self.__class__._instance is None, "double GanetiContext instance"
 
@@ -464,7 +494,8 @@ class GanetiContext(object):
       self.cfg.GetNodeList(),
       self.cfg.GetNodeGroupList(),
       [inst.name for inst in self.cfg.GetAllInstancesInfo().values()],
-      self.cfg.GetNetworkList())
+      self.cfg.GetNetworkList(),
+      fair=fair_locks)
 
     self.cfg.SetContext(self)
 
@@ -472,7 +503,9 @@ class GanetiContext(object):
     self.rpc = rpc.RpcRunner(self.cfg, self.glm.AddToLockMonitor)
 
     # Job queue
-    self.jobqueue = jqueue.JobQueue(self)
+    self.jobqueue = jqueue.JobQueue(
+      self, min_workers=min_job_workers, max_workers=max_job_workers,
+      lock_aware_scheduling=lock_aware_scheduling)
 
     # setting this also locks the class against attribute modifications
     self.__class__._instance = self
@@ -639,6 +672,15 @@ def CheckMasterd(options, args):
     print >> sys.stderr, ("Usage: %s [-f] [-d]" % sys.argv[0])
     sys.exit(constants.EXIT_FAILURE)
 
+  if not 0 < options.min_job_workers <= options.max_job_workers:
+    print >> sys.stderr, ("The minimum number of job workers must be positive"
+                          " and not higher than the maximum")
+    sys.exit(constants.EXIT_FAILURE)
+
+  if options.hooks_manifest_ttl < 0:
+    print >> sys.stderr, "The hooks manifest TTL must not be negative"
+    sys.exit(constants.EXIT_FAILURE)
+
   ssconf.CheckMaster(options.debug)
 
   try:
@@ -711,6 +753,10 @@ def PrepMasterd(options, _):
   # concurrent execution.
   utils.RemoveFile(pathutils.MASTER_SOCKET)
 
+  locking.SetStatisticsEnabled(options.lock_stats)
+  mcpu.SetProfilingEnabled(options.opcode_profiling)
+  mcpu.SetHooksManifestTTL(options.hooks_manifest_ttl)
+
   mainloop = daemon.Mainloop()
   master = MasterServer(pathutils.MASTER_SOCKET, options.uid, options.gid)
   return (mainloop, master)
@@ -724,7 +770,10 @@ def ExecMasterd(options, args, prep_data): # pylint: disable=W0613
   try:
     rpc.Init()
     try:
-      master.setup_queue()
+      master.setup_queue(fair_locks=options.fair_locks,
+                         min_job_workers=options.min_job_workers,
+                         max_job_workers=options.max_job_workers,
+                         lock_aware_scheduling=options.lock_aware_scheduling)
       try:
         mainloop.Run(shutdown_wait_fn=master.WaitForShutdown)
       finally:
@@ -750,5 +799,34 @@ def Main():
   parser.add_option("--yes-do-it", dest="yes_do_it",
                     help="Override interactive check for --no-voting",
                     default=False, action="store_true")
+  parser.add_option("--lock-stats", dest="lock_stats",
+                    help="Collect contention statistics for locks",
+                    default=False, action="store_true")
+  parser.add_option("--fair-locks", dest="fair_locks",
+                    help="Queue for all locks of a level at once and grant"
+                    " them in priority and FIFO order",
+                    default=False, action="store_true")
+  parser.add_option("--min-job-workers", dest="min_job_workers",
+                    help="Minimum number of threads executing jobs",
+                    default=jqueue.JOBQUEUE_THREADS, type="int")
+  parser.add_option("--max-job-workers", dest="max_job_workers",
+                    help="Maximum number of threads executing jobs; the"
+                    " number is adjusted to the load between the minimum"
+                    " and maximum",
+                    default=jqueue.JOBQUEUE_THREADS, type="int")
+  parser.add_option("--lock-aware-scheduling", dest="lock_aware_scheduling",
+                    help="Prefer running jobs whose locks are available over"
+                    " jobs which would have to wait for locks",
+                    default=False, action="store_true")
+  parser.add_option("--opcode-profiling", dest="opcode_profiling",
+                    help="Record the time spent in the individual phases of"
+                    " every opcode's execution",
+                    default=False, action="store_true")
+  parser.add_option("--hooks-manifest-ttl", dest="hooks_manifest_ttl",
+                    help="Only run hooks on nodes having scripts for them,"
+                    " using the list of hook directories reported by each"
+                    " node for the given number of seconds (default: 0,"
+                    " always run hooks on all nodes)",
+                    default=0, type="float")
   daemon.GenericMain(constants.MASTERD, parser, CheckMasterd, PrepMasterd,
                      ExecMasterd, multithreaded=True)
@@ -139,6 +139,39 @@ def _DefaultAlternative(value, default):
   return default
 
 
+def _AcceptsFramedBody(headers):
+  """Checks whether the client accepts framed response bodies.
+
+  @param headers: Request headers
+
+  """
+  accept = headers.get(http.HTTP_ACCEPT, None)
+  if not accept:
+    return False
+
+  return http.HTTP_APP_GANETI_RPC in [i.split(";")[0].strip()
+                                      for i in accept.split(",")]
+
+
+def _LoadRequestBody(headers, body):
+  """Decodes the body of an RPC request.
+
+  Bodies are JSON documents unless the client, knowing that this node
+  supports them, sent a framed document (see L{serializer.DumpFramed}).
+
+  @param headers: Request headers
+  @type body: string
+  @param body: Request body
+
+  """
+  content_type = headers.get(http.HTTP_CONTENT_TYPE, http.HTTP_APP_JSON)
+
+  if content_type == http.HTTP_APP_GANETI_RPC:
+    return serializer.LoadFramed(body)
+
+  return serializer.LoadJson(body)
+
+
 class MlockallRequestExecutor(http.server.HttpServerRequestExecutor):
   """Subclass ensuring request handlers are locked in RAM.
 
@@ -179,7 +212,8 @@ class NodeRequestHandler(http.server.HttpServerHandler):
       raise http.HttpNotFound()
 
     try:
-      result = (True, method(serializer.LoadJson(req.request_body)))
+      result = (True, method(_LoadRequestBody(req.request_headers,
+                                              req.request_body)))
 
     except backend.RPCFail, err:
       # our custom failure exception; str(err) works fine if the
@@ -198,6 +232,10 @@ class NodeRequestHandler(http.server.HttpServerHandler):
       logging.exception("Error in RPC call")
       result = (False, "Error while executing backend function: %s" % str(err))
 
+    if _AcceptsFramedBody(req.request_headers):
+      req.resp_headers[http.HTTP_CONTENT_TYPE] = http.HTTP_APP_GANETI_RPC
+      return serializer.DumpFramed(result)
+
     return serializer.DumpJson(result)
 
   # the new block devices  --------------------------
@@ -597,6 +635,16 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     _extendReasonTrail(trail, "shutdown")
     return backend.InstanceShutdown(instance, timeout, trail)
 
+  @staticmethod
+  def perspective_instance_shutdown_multi(params):
+    """Shutdown several instances.
+
+    """
+    (idicts, timeout, trail) = params
+    instances = [objects.Instance.FromDict(idict) for idict in idicts]
+    _extendReasonTrail(trail, "shutdown")
+    return backend.InstanceShutdownMulti(instances, timeout, trail)
+
   @staticmethod
   def perspective_instance_start(params):
     """Start an instance.
@@ -607,6 +655,16 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     _extendReasonTrail(trail, "start")
     return backend.StartInstance(instance, startup_paused, trail)
 
+  @staticmethod
+  def perspective_instance_start_multi(params):
+    """Start several instances.
+
+    """
+    (idicts, startup_paused, trail) = params
+    instances = [objects.Instance.FromDict(idict) for idict in idicts]
+    _extendReasonTrail(trail, "start")
+    return backend.StartInstanceMulti(instances, startup_paused, trail)
+
   @staticmethod
   def perspective_hotplug_device(params):
     """Hotplugs device to a running instance.
@@ -988,6 +1046,13 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     hr = backend.HooksRunner()
     return hr.RunHooks(hpath, phase, env)
 
+  @staticmethod
+  def perspective_hooks_manifest(params):
+    """Returns the hook directories containing scripts.
+
+    """
+    return backend.HooksRunner().GetManifest()
+
   # iallocator -----------------
 
   @staticmethod
@@ -1165,7 +1230,7 @@ class NodeRequestHandler(http.server.HttpServerHandler):
     return backend.CleanupImportExport(params[0])
 
 
-def CheckNoded(_, args):
+def CheckNoded(options, args):
   """Initial checks whether to run or exit with a failure.
 
   """
@@ -1173,6 +1238,16 @@ def CheckNoded(_, args):
     print >> sys.stderr, ("Usage: %s [-f] [-d] [-p port] [-b ADDRESS]" %
                           sys.argv[0])
     sys.exit(constants.EXIT_FAILURE)
+  if options.hooks_parallel < 1:
+    print >> sys.stderr, "The number of parallel hook scripts must be positive"
+    sys.exit(constants.EXIT_FAILURE)
+  if options.hooks_timeout is not None and options.hooks_timeout <= 0:
+    print >> sys.stderr, "The hook script timeout must be positive"
+    sys.exit(constants.EXIT_FAILURE)
+  if options.instance_ops_parallel < 1:
+    print >> sys.stderr, ("The number of instances started or stopped in"
+                          " parallel must be positive")
+    sys.exit(constants.EXIT_FAILURE)
   try:
     codecs.lookup("string-escape")
   except LookupError:
@@ -1257,6 +1332,9 @@ def PrepNoded(options, _):
     # startup of the whole node daemon because of this
     logging.critical("Can't init/verify the queue, proceeding anyway: %s", err)
 
+  backend.SetHooksExecution(options.hooks_parallel, options.hooks_timeout)
+  backend.SetInstanceOpsParallel(options.instance_ops_parallel)
+
   handler = NodeRequestHandler()
 
   mainloop = daemon.Mainloop()
@@ -1293,6 +1371,18 @@ def Main():
   parser.add_option("--no-mlock", dest="mlock",
                     help="Do not mlock the node memory in ram",
                     default=True, action="store_false")
+  parser.add_option("--hooks-parallel", dest="hooks_parallel",
+                    help="Maximum number of hook scripts of a directory to"
+                    " run at the same time",
+                    default=1, type="int")
+  parser.add_option("--hooks-timeout", dest="hooks_timeout",
+                    help="Time in seconds after which hook scripts are"
+                    " killed (default: no timeout)",
+                    default=None, type="float")
+  parser.add_option("--instance-ops-parallel", dest="instance_ops_parallel",
+                    help="Maximum number of instances started or stopped at"
+                    " the same time by multi-instance requests",
+                    default=4, type="int")
 
   daemon.GenericMain(constants.NODED, parser, CheckNoded, PrepNoded, ExecNoded,
                      default_ssl_cert=pathutils.NODED_CERT_FILE,
@@ -32,6 +32,7 @@ import sys
 import os
 import os.path
 import errno
+import time
 
 try:
   from pyinotify import pyinotify # pylint: disable=E0611
@@ -55,6 +56,13 @@ import ganeti.http.auth   # pylint: disable=W0611
 import ganeti.http.server
 
 
+#: Number of seconds for which responses are kept in the response cache
+_RESPONSE_CACHE_TTL = 2.0
+
+#: Name of the file recording the last time expired responses were removed
+_RESPONSE_CACHE_MARKER = ".expired"
+
+
 class RemoteApiRequestContext(object):
   """Data structure for Remote API requests.
 
@@ -66,6 +74,136 @@ class RemoteApiRequestContext(object):
     self.body_data = None
 
 
+class ResponseCache(object):
+  """Short-lived cache for GET responses.
+
+  Requests are handled in forked child processes, hence the cache is kept in
+  a directory shared by all of them. Entries are keyed by the request path,
+  including query arguments, and are only used if they are younger than the
+  cache's lifetime and their validator is still the same. Expired entries
+  are removed when new ones are stored, at most once per lifetime.
+
+  """
+  def __init__(self, cache_dir, ttl=_RESPONSE_CACHE_TTL, _time_fn=time.time):
+    """Initializes this class.
+
+    @type cache_dir: string
+    @param cache_dir: Directory for storing cached responses
+    @type ttl: number
+    @param ttl: Number of seconds for which a response is valid
+
+    """
+    self._cache_dir = cache_dir
+    self._ttl = ttl
+    self._time_fn = _time_fn
+
+  def _GetFilename(self, path):
+    """Returns the name of the file used for caching a request path.
+
+    """
+    return utils.PathJoin(self._cache_dir,
+                          compat.sha1_hash(path).hexdigest())
+
+  def Get(self, path, validator):
+    """Looks up a cached response.
+
+    @type path: string
+    @param path: Request path
+    @type validator: string or None
+    @param validator: Current validator of the resource
+    @rtype: string or None
+    @return: Cached response body or C{None}
+
+    """
+    filename = self._GetFilename(path)
+
+    try:
+      entry = serializer.LoadJson(utils.ReadFile(filename))
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        logging.warning("Can't read cached response from %s: %s",
+                        filename, err)
+      return None
+    except Exception, err: # pylint: disable=W0703
+      logging.warning("Invalid cached response in %s: %s", filename, err)
+      utils.RemoveFile(filename)
+      return None
+
+    (timestamp, cached_path, cached_validator, body) = entry
+
+    if abs(self._time_fn() - timestamp) > self._ttl:
+      utils.RemoveFile(filename)
+      return None
+
+    if cached_path != path or cached_validator != validator:
+      return None
+
+    return body
+
+  def _RemoveExpired(self, now):
+    """Removes expired entries from the cache directory.
+
+    The directory is only scanned if the previous scan, as recorded by the
+    modification time of a marker file, is older than the cache's lifetime.
+
+    @type now: number
+    @param now: Current time
+
+    """
+    marker = utils.PathJoin(self._cache_dir, _RESPONSE_CACHE_MARKER)
+
+    try:
+      if abs(now - os.stat(marker).st_mtime) <= self._ttl:
+        return
+    except EnvironmentError, err:
+      if err.errno != errno.ENOENT:
+        logging.warning("Can't check response cache marker %s: %s",
+                        marker, err)
+        return
+
+    try:
+      utils.WriteFile(marker, data="", mode=0600)
+      os.utime(marker, (now, now))
+
+      for name in os.listdir(self._cache_dir):
+        if name == _RESPONSE_CACHE_MARKER:
+          continue
+
+        filename = utils.PathJoin(self._cache_dir, name)
+        try:
+          if abs(now - os.stat(filename).st_mtime) > self._ttl:
+            utils.RemoveFile(filename)
+        except EnvironmentError, err:
+          if err.errno != errno.ENOENT:
+            raise
+    except EnvironmentError, err:
+      logging.warning("Can't remove expired responses from %s: %s",
+                      self._cache_dir, err)
+
+  def Put(self, path, validator, body):
+    """Stores a response in the cache.
+
+    @type path: string
+    @param path: Request path
+    @type validator: string or None
+    @param validator: Validator of the resource
+    @type body: string
+    @param body: Response body
+
+    """
+    now = self._time_fn()
+    filename = self._GetFilename(path)
+    data = serializer.DumpJson((now, path, validator, body))
+
+    self._RemoveExpired(now)
+
+    try:
+      utils.WriteFile(filename, data=data, mode=0600)
+      os.utime(filename, (now, now))
+    except EnvironmentError, err:
+      logging.warning("Can't write cached response to %s: %s", filename, err)
+
+
 class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
                        http.server.HttpServerHandler):
   """REST Request Handler Class.
@@ -73,7 +211,8 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
   """
   AUTH_REALM = "Ganeti Remote API"
 
-  def __init__(self, user_fn, reqauth, _client_cls=None):
+  def __init__(self, user_fn, reqauth, response_cache=None,
+               _client_cls=None):
     """Initializes this class.
 
     @type user_fn: callable
@@ -81,6 +220,8 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
       L{http.auth.PasswordFileUser} or C{None} if user is not found
     @type reqauth: bool
     @param reqauth: Whether to require authentication
+    @type response_cache: L{ResponseCache} or None
+    @param response_cache: Cache for GET responses
 
     """
     # pylint: disable=W0233
@@ -91,6 +232,7 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
     self._resmap = connector.Mapper()
     self._user_fn = user_fn
     self._reqauth = reqauth
+    self._response_cache = response_cache
 
   @staticmethod
   def FormatErrorMessage(values):
@@ -193,6 +335,29 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
     else:
       ctx.body_data = None
 
+    cacheable = (req.request_method.upper() == http.HTTP_GET and
+                 ctx.handler.GET_CACHEABLE and
+                 not ctx.handler.useLocking())
+
+    if cacheable:
+      validator = ctx.handler.GetCacheValidator()
+
+      if validator is not None:
+        etag = baserlib.FormatETag(req.request_path, validator)
+        req.resp_headers[http.HTTP_ETAG] = etag
+
+        if _MatchETag(req.request_headers.get(http.HTTP_IF_NONE_MATCH), etag):
+          # RFC2616, 10.3.5: "The 304 response MUST NOT contain a
+          # message-body", hence this is not sent as an error
+          req.resp_code = http.HTTP_NOT_MODIFIED
+          return ""
+
+      if self._response_cache:
+        body = self._response_cache.Get(req.request_path, validator)
+        if body is not None:
+          req.resp_headers[http.HTTP_CONTENT_TYPE] = http.HTTP_APP_JSON
+          return body
+
     try:
       result = ctx.handler_fn()
     except rpcerr.TimeoutError:
@@ -202,7 +367,29 @@ class RemoteApiHandler(http.auth.HttpServerRequestAuthentication,
 
     req.resp_headers[http.HTTP_CONTENT_TYPE] = http.HTTP_APP_JSON
 
-    return serializer.DumpJson(result)
+    body = serializer.DumpJson(result)
+
+    if cacheable and self._response_cache:
+      self._response_cache.Put(req.request_path, validator, body)
+
+    return body
+
+
+def _MatchETag(header, etag):
+  """Checks whether an entity tag matches an C{If-None-Match} header.
+
+  @type header: string or None
+  @param header: Value of C{If-None-Match} header
+  @type etag: string
+  @param etag: Current entity tag
+
+  """
+  if not header:
+    return False
+
+  tags = [i.strip() for i in header.split(",")]
+
+  return "*" in tags or etag in tags
 
 
 class RapiUsers:
@@ -327,7 +514,10 @@ def PrepRapi(options, _):
 
   users = RapiUsers()
 
-  handler = RemoteApiHandler(users.Get, options.reqauth)
+  response_cache = ResponseCache(pathutils.RAPI_RESPONSE_CACHE_DIR)
+
+  handler = RemoteApiHandler(users.Get, options.reqauth,
+                             response_cache=response_cache)
 
   # Setup file watcher (it'll be driven by asyncore)
   SetupFileWatcher(pathutils.RAPI_USERS_FILE,
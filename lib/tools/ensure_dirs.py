@@ -178,6 +178,8 @@ def GetPaths():
     (pathutils.RAPI_USERS_FILE, FILE, 0640,
      getent.rapi_uid, getent.masterd_gid, False),
     (pathutils.RUN_DIR, DIR, 0775, getent.masterd_uid, getent.daemons_gid),
+    (pathutils.RAPI_RESPONSE_CACHE_DIR, DIR, 0700,
+     getent.rapi_uid, getent.rapi_gid),
     (pathutils.SOCKET_DIR, DIR, 0770, getent.masterd_uid, getent.daemons_gid),
     (pathutils.MASTER_SOCKET, FILE, 0660,
      getent.masterd_uid, getent.daemons_gid, False),
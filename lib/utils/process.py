@@ -31,6 +31,7 @@ import select
 import logging
 import signal
 import resource
+import threading
 
 from cStringIO import StringIO
 
@@ -699,15 +700,83 @@ def _RunCmdFile(cmd, env, via_shell, output, cwd, noclose_fds):
   return status
 
 
-def RunParts(dir_name, env=None, reset_env=False):
+def _RunPartsScript(fname, env=None, reset_env=False, timeout=None):
+  """Runs a single script for L{RunParts}.
+
+  @rtype: tuple; (string, L{RunResult} or string)
+  @return: one of L{constants.RUNPARTS_STATUS} and either the result of
+    running the script or an error message
+
+  """
+  try:
+    result = RunCmd([fname], env=env, reset_env=reset_env, timeout=timeout)
+  except Exception, err: # pylint: disable=W0703
+    return (constants.RUNPARTS_ERR, str(err))
+  else:
+    return (constants.RUNPARTS_RUN, result)
+
+
+def RunInParallel(fn, items, max_parallel):
+  """Calls a function for a number of items using a limited number of threads.
+
+  The function must not raise exceptions.
+
+  @type fn: callable
+  @param fn: function receiving one item as its parameter
+  @type items: list
+  @param items: items to call C{fn} for
+  @type max_parallel: int
+  @param max_parallel: maximum number of concurrent calls
+  @rtype: list
+  @return: the return values of C{fn} in the order of C{items}
+
+  """
+  results = [None] * len(items)
+  pending = list(enumerate(items))
+  lock = threading.Lock()
+
+  def _Worker():
+    while True:
+      lock.acquire()
+      try:
+        if not pending:
+          return
+        (idx, item) = pending.pop(0)
+      finally:
+        lock.release()
+
+      results[idx] = fn(item)
+
+  threads = [threading.Thread(target=_Worker)
+             for _ in range(min(max_parallel, len(items)))]
+
+  for thread in threads:
+    thread.start()
+
+  for thread in threads:
+    thread.join()
+
+  return results
+
+
+def RunParts(dir_name, env=None, reset_env=False, max_parallel=1,
+             timeout=None):
   """Run Scripts or programs in a directory
 
+  Scripts are started in alphabetical order. If more than one script may run
+  at the same time, a script can therefore not rely on its predecessors
+  having finished.
+
   @type dir_name: string
   @param dir_name: absolute path to a directory
   @type env: dict
   @param env: The environment to use
   @type reset_env: boolean
   @param reset_env: whether to reset or keep the default os environment
+  @type max_parallel: int
+  @param max_parallel: maximum number of scripts to run at the same time
+  @type timeout: number or None
+  @param timeout: if not None, time in seconds after which a script is killed
   @rtype: list of tuples
   @return: list of (name, (one of RUNDIR_STATUS), RunResult)
 
@@ -720,18 +789,29 @@ def RunParts(dir_name, env=None, reset_env=False):
     logging.warning("RunParts: skipping %s (cannot list: %s)", dir_name, err)
     return rr
 
+  # Tuples of index in result list, name and path
+  scripts = []
+
   for relname in sorted(dir_contents):
     fname = utils_io.PathJoin(dir_name, relname)
     if not (constants.EXT_PLUGIN_MASK.match(relname) is not None and
             utils_wrapper.IsExecutable(fname)):
       rr.append((relname, constants.RUNPARTS_SKIP, None))
     else:
-      try:
-        result = RunCmd([fname], env=env, reset_env=reset_env)
-      except Exception, err: # pylint: disable=W0703
-        rr.append((relname, constants.RUNPARTS_ERR, str(err)))
-      else:
-        rr.append((relname, constants.RUNPARTS_RUN, result))
+      scripts.append((len(rr), relname, fname))
+      rr.append(None)
+
+  run_fn = compat.partial(_RunPartsScript, env=env, reset_env=reset_env,
+                          timeout=timeout)
+  fnames = [fname for (_, _, fname) in scripts]
+
+  if max_parallel > 1 and len(fnames) > 1:
+    results = RunInParallel(run_fn, fnames, max_parallel)
+  else:
+    results = map(run_fn, fnames)
+
+  for ((idx, relname, _), (status, result)) in zip(scripts, results):
+    rr[idx] = (relname, status, result)
 
   return rr
 
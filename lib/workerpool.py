@@ -265,8 +265,8 @@ class WorkerPool(object):
   def __init__(self, name, num_workers, worker_class):
     """Constructor for worker pool.
 
-    @param num_workers: number of workers to be started
-        (dynamic resizing is not yet implemented)
+    @param num_workers: number of workers to be started, see L{Resize} for
+        changing it later
     @param worker_class: the class to be instantiated for workers;
         should derive from L{BaseWorker}
 
@@ -294,8 +294,6 @@ class WorkerPool(object):
     # Start workers
     self.Resize(num_workers)
 
-  # TODO: Implement dynamic resizing?
-
   def _WaitWhileQuiescingUnlocked(self):
     """Wait until the worker pool has finished quiescing.
 
@@ -469,6 +467,15 @@ class WorkerPool(object):
     finally:
       self._lock.release()
 
+  def _PopTaskUnlocked(self):
+    """Removes the next task to be run from the queue and returns it.
+
+    Can be overridden to run tasks in a different order. The queue must not
+    be empty.
+
+    """
+    return heapq.heappop(self._tasks)
+
   def _WaitForTaskUnlocked(self, worker):
     """Waits for a task for a worker.
 
@@ -484,7 +491,7 @@ class WorkerPool(object):
       if self._active and self._tasks:
         # Get task from queue and tell pool about it
         try:
-          task = heapq.heappop(self._tasks)
+          task = self._PopTaskUnlocked()
         finally:
           self._worker_to_pool.notifyAll()
 
@@ -562,9 +569,15 @@ class WorkerPool(object):
 
     return "%s%d" % (self._name, self._last_worker_id)
 
-  def _ResizeUnlocked(self, num_workers):
+  def _ResizeUnlocked(self, num_workers, wait=True):
     """Changes the number of workers.
 
+    When reducing the number of workers, idle workers are terminated first.
+    Workers busy with a task terminate once the task is done.
+
+    @type wait: bool
+    @param wait: Whether to wait for terminating workers to finish
+
     """
     assert num_workers >= 0, "num_workers must be >= 0"
 
@@ -582,16 +595,33 @@ class WorkerPool(object):
         termworkers = self._workers[:]
         del self._workers[:]
       else:
-        # TODO: Implement partial downsizing
-        raise NotImplementedError()
-        #termworkers = ...
+        # Sort idle workers first (the sort is stable, so the oldest workers
+        # are kept within each group)
+        # pylint: disable=W0212
+        termworkers = sorted(self._workers,
+                             key=lambda w: w._HasRunningTaskUnlocked())
+        del termworkers[current_count - num_workers:]
+        for worker in termworkers:
+          self._workers.remove(worker)
 
       self._termworkers += termworkers
 
       # Notify workers that something has changed
       self._pool_to_worker.notifyAll()
 
-      # Join all terminating workers
+    elif current_count < num_workers:
+      # Create (num_workers - current_count) new workers
+      for _ in range(num_workers - current_count):
+        worker = self._worker_class(self, self._NewWorkerIdUnlocked())
+        self._workers.append(worker)
+        worker.start()
+
+    if wait and self._termworkers:
+      # Join all terminating workers, including those left behind by earlier
+      # calls not waiting for them. Create copy of list to iterate over while
+      # lock isn't held.
+      termworkers = self._termworkers[:]
+
       self._lock.release()
       try:
         for worker in termworkers:
@@ -611,25 +641,54 @@ class WorkerPool(object):
 
       assert not self._termworkers, "Zombie worker detected"
 
-    elif current_count < num_workers:
-      # Create (num_workers - current_count) new workers
-      for _ in range(num_workers - current_count):
-        worker = self._worker_class(self, self._NewWorkerIdUnlocked())
-        self._workers.append(worker)
-        worker.start()
+    elif self._termworkers:
+      # Forget about workers which have terminated in the meantime
+      self._termworkers = [worker for worker in self._termworkers
+                           if worker.isAlive()]
 
-  def Resize(self, num_workers):
+  def Resize(self, num_workers, wait=True):
     """Changes the number of workers in the pool.
 
     @param num_workers: the new number of workers
+    @type wait: bool
+    @param wait: Whether to wait for terminating workers to finish; if
+      C{False}, workers busy with a task finish it in the background
+
+    """
+    self._lock.acquire()
+    try:
+      return self._ResizeUnlocked(num_workers, wait=wait)
+    finally:
+      self._lock.release()
+
+  def GetWorkerCounts(self):
+    """Returns the number of workers and tasks.
+
+    @rtype: tuple; (int, int, int)
+    @return: Number of workers, number of workers busy with a task and number
+      of tasks waiting for a worker
 
     """
     self._lock.acquire()
     try:
-      return self._ResizeUnlocked(num_workers)
+      return self._GetWorkerCountsUnlocked()
     finally:
       self._lock.release()
 
+  def _GetWorkerCountsUnlocked(self):
+    """Returns the number of workers and tasks.
+
+    See L{GetWorkerCounts}.
+
+    """
+    busy = len([worker for worker in self._workers
+                if worker._HasRunningTaskUnlocked()]) # pylint: disable=W0212
+
+    # Abandoned entries (see L{ChangeTaskPriority}) have no arguments
+    pending = len([task for task in self._tasks if task[3] is not None])
+
+    return (len(self._workers), busy, pending)
+
   def TerminateWorkers(self):
     """Terminate all worker threads.
 
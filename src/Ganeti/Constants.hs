@@ -1265,6 +1265,10 @@ rpcEncodingNone = 0
 rpcEncodingZlibBase64 :: Int
 rpcEncodingZlibBase64 = 1
 
+-- | Zlib-compressed data sent as a blob in a framed RPC body
+rpcEncodingZlibRaw :: Int
+rpcEncodingZlibRaw = 2
+
 -- * Timeout table
 --
 -- Various time constants for the timeout table
@@ -1586,6 +1590,15 @@ hvKvmUseChroot = "use_chroot"
 hvKvmUserShutdown :: String
 hvKvmUserShutdown = "user_shutdown"
 
+hvKvmAutoPlacement :: String
+hvKvmAutoPlacement = "auto_placement"
+
+hvKvmMigrationCaps :: String
+hvKvmMigrationCaps = "migration_caps"
+
+hvKvmMigrationEscalation :: String
+hvKvmMigrationEscalation = "migration_escalation"
+
 hvMemPath :: String
 hvMemPath = "mem_path"
 
@@ -1743,6 +1756,9 @@ hvsParameterTypes = Map.fromList
   , (hvKvmSpiceZlibGlzImgCompr,         VTypeString)
   , (hvKvmUseChroot,                    VTypeBool)
   , (hvKvmUserShutdown,                 VTypeBool)
+  , (hvKvmAutoPlacement,                VTypeBool)
+  , (hvKvmMigrationCaps,                VTypeString)
+  , (hvKvmMigrationEscalation,          VTypeBool)
   , (hvMemPath,                         VTypeString)
   , (hvMigrationBandwidth,              VTypeInt)
   , (hvMigrationDowntime,               VTypeInt)
@@ -3415,6 +3431,16 @@ qrNode = "node"
 qrOs :: String
 qrOs = "os"
 
+-- | Statistics about the job queue worker pool of the master daemon; only
+-- available directly from the master daemon
+qrQueue :: String
+qrQueue = "queue"
+
+-- | Statistics about RPC calls made by the master daemon; only available
+-- directly from the master daemon
+qrRpc :: String
+qrRpc = "rpc"
+
 -- | List of resources which can be queried using 'Ganeti.OpCodes.OpQuery'
 qrViaOp :: FrozenSet String
 qrViaOp =
@@ -3740,6 +3766,9 @@ hvcDefaults =
           , (hvVhostNet,                        PyValueEx False)
           , (hvKvmUseChroot,                    PyValueEx False)
           , (hvKvmUserShutdown,                 PyValueEx False)
+          , (hvKvmAutoPlacement,                PyValueEx False)
+          , (hvKvmMigrationCaps,                PyValueEx "")
+          , (hvKvmMigrationEscalation,          PyValueEx False)
           , (hvMemPath,                         PyValueEx "")
           , (hvRebootBehavior,                  PyValueEx instanceRebootAllowed)
           , (hvCpuMask,                         PyValueEx cpuPinningAll)
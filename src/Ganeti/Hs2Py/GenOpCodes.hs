@@ -59,6 +59,7 @@ showPyClass (OpCodeDescriptor name typ doc fields dsc) =
   let
     baseclass
       | name == "OpInstanceMultiAlloc" = "OpInstanceMultiAllocBase"
+      | name == "OpInstanceBatch" = "OpInstanceBatchBase"
       | otherwise = "OpCode"
     opDscField
       | null dsc = ""
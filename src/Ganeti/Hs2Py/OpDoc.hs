@@ -248,6 +248,10 @@ opInstanceMultiAlloc :: String
 opInstanceMultiAlloc =
   "Allocates multiple instances."
 
+opInstanceBatch :: String
+opInstanceBatch =
+  "Runs operations on multiple instances using a single lock acquisition."
+
 opInstanceReinstall :: String
 opInstanceReinstall =
   "Reinstall an instance's OS."
@@ -172,6 +172,8 @@ $(buildObject "QueuedOpCode" "qo"
     simpleField "exec_timestamp"  [t| Timestamp   |]
   , optionalNullSerField $
     simpleField "end_timestamp"   [t| Timestamp   |]
+  , optionalNullSerField $
+    simpleField "profile"         [t| Container Double |]
   ])
 
 $(buildObject "QueuedJob" "qj"
@@ -197,6 +199,7 @@ queuedOpCodeFromMetaOpCode op =
                , qoStartTimestamp = Nothing
                , qoEndTimestamp = Nothing
                , qoExecTimestamp = Nothing
+               , qoProfile = Nothing
                }
 
 -- | From a job-id and a list of op-codes create a job. This is
@@ -16,6 +16,13 @@ directory.  Otherwise, when the communication terminates, that same
 file is removed.  The communication terminates when the KVM instance
 stops or crashes.
 
+While the communication lasts, the monitor also keeps track of the
+state of the instance, based on the reply to a status query and on the
+stop, resume, shutdown, and migration events, and writes it to the
+state file in the KVM control directory.  The state file is removed
+when the communication terminates.  This allows the hypervisor code to
+determine the state of an instance without inspecting its process.
+
 The directory and file watching uses inotify to track down events on
 the KVM control directory and its parents.  There is a directory
 crawler that will try to add a watch to the KVM control directory if
@@ -56,6 +63,7 @@ import Control.Applicative ((<$>))
 import Control.Exception (try)
 import Control.Concurrent
 import Control.Monad (unless, when)
+import Data.Char (isSpace)
 import Data.List
 import Data.Set (Set)
 import qualified Data.Set as Set (delete, empty, insert, member)
@@ -69,6 +77,7 @@ import qualified AutoConf
 import qualified Ganeti.Constants as Constants
 import qualified Ganeti.Logging as Logging
 import qualified Ganeti.UDSServer as UDSServer
+import Ganeti.Utils (atomicWriteFile)
 
 type Lock = MVar ()
 type Monitors = MVar (Set FilePath)
@@ -85,25 +94,89 @@ isPrefixPath x y =
 monitorGreeting :: String
 monitorGreeting = "{\"execute\": \"qmp_capabilities\"}"
 
+monitorQueryStatus :: String
+monitorQueryStatus = "{\"execute\": \"query-status\"}"
+
 -- | KVM control directory containing the Qmp sockets.
 monitorDir :: String
 monitorDir = AutoConf.localstatedir </> "run/ganeti/kvm-hypervisor/ctrl/"
 
+-- | Extension of the Qmp sockets dedicated to the KVM daemon, which
+-- are created next to the Qmp sockets used by the hypervisor code, as
+-- Qmp only serves one client per socket.
 monitorExtension :: String
-monitorExtension = ".qmp"
+monitorExtension = ".kvmd"
 
 isMonitorPath :: FilePath -> Bool
 isMonitorPath = (== monitorExtension) . takeExtension
 
+-- | Extension of the Qmp sockets used by the hypervisor code.
+legacyMonitorExtension :: String
+legacyMonitorExtension = ".qmp"
+
+-- | @legacyMonitors files@ returns the Qmp sockets among @files@ of
+-- the instances without a Qmp socket dedicated to the KVM daemon,
+-- that is, instances started before the KVM daemon had its own
+-- socket.
+legacyMonitors :: [FilePath] -> [FilePath]
+legacyMonitors files =
+  [ file | file <- files
+         , takeExtension file == legacyMonitorExtension
+         , replaceExtension file monitorExtension `notElem` files ]
+
 shutdownExtension :: String
 shutdownExtension = ".shutdown"
 
 shutdownPath :: String -> String
 shutdownPath = (`replaceExtension` shutdownExtension)
 
+stateExtension :: String
+stateExtension = ".state"
+
+statePath :: String -> String
+statePath = (`replaceExtension` stateExtension)
+
+isStatePath :: FilePath -> Bool
+isStatePath = (== stateExtension) . takeExtension
+
 touchFile :: FilePath -> IO ()
 touchFile file = withFile file WriteMode (const . return $ ())
 
+removeFileIfExists :: FilePath -> IO ()
+removeFileIfExists file =
+  (try (removeFile file) :: IO (Either IOError ())) >> return ()
+
+-- * Instance states
+
+-- | State of a KVM instance, as tracked by its monitor.
+data InstanceState = Running | Paused | Migrating | Shutdown
+  deriving (Eq, Show)
+
+-- | Name of an 'InstanceState', as written to the state file.
+instanceStateName :: InstanceState -> String
+instanceStateName Running = "running"
+instanceStateName Paused = "paused"
+instanceStateName Migrating = "migrating"
+instanceStateName Shutdown = "shutdown"
+
+-- | @runStateToInstanceState runState@ converts the run state
+-- @runState@, as returned by the Qmp status query, to an
+-- 'InstanceState'.
+runStateToInstanceState :: String -> InstanceState
+runStateToInstanceState "running" = Running
+runStateToInstanceState "inmigrate" = Migrating
+runStateToInstanceState "finish-migrate" = Migrating
+runStateToInstanceState "shutdown" = Shutdown
+runStateToInstanceState _ = Paused
+
+-- | @writeState monitorFile state@ writes @state@ to the state file
+-- of the Qmp socket @monitorFile@.
+writeState :: FilePath -> InstanceState -> IO ()
+writeState monitorFile state =
+  do Logging.logDebug $ "Instance state of " ++ show monitorFile ++
+       " is " ++ instanceStateName state
+     atomicWriteFile (statePath monitorFile) (instanceStateName state ++ "\n")
+
 -- * Monitors for Qmp sockets
 
 -- | @parseQmp isPowerdown isShutdown isStop str@ parses the packet
@@ -125,17 +198,60 @@ parseQmp isPowerdown isShutdown isStop str =
   in
    (isPowerdown', isShutdown', isStop')
 
--- | @receiveQmp handle@ listens for Qmp events on @handle@ and, when
--- @handle@ is closed, it returns 'True' if a user shutdown event was
--- received, and 'False' otherwise.
-receiveQmp :: Handle -> IO Bool
-receiveQmp handle = isUserShutdown <$> receive False False False
+-- | @qmpStatus str@ returns the value of the first status field of the
+-- Qmp packet @str@, if any.
+qmpStatus :: String -> Maybe String
+qmpStatus = findStatus . filter (not . isSpace)
+  where key = "\"status\":\""
+
+        findStatus [] = Nothing
+        findStatus str@(_:rest)
+          | key `isPrefixOf` str =
+            Just . takeWhile (/= '"') $ drop (length key) str
+          | otherwise = findStatus rest
+
+-- | @isQmpEvent name str@ determines whether the Qmp packet @str@ is
+-- the event @name@.
+isQmpEvent :: String -> String -> Bool
+isQmpEvent name str =
+  ("\"event\":\"" ++ name ++ "\"") `isInfixOf` filter (not . isSpace) str
+
+-- | @isMigrationEnd str@ determines whether the Qmp packet @str@ is a
+-- migration event reporting the end of a migration.
+isMigrationEnd :: String -> Bool
+isMigrationEnd str =
+  isQmpEvent "MIGRATION" str &&
+  maybe False (`elem` ["completed", "failed", "cancelled"]) (qmpStatus str)
+
+-- | @parseQmpState state str@ parses the packet @str@ and returns the
+-- state of the instance after that packet, given its state @state@
+-- before that packet.
+parseQmpState :: Maybe InstanceState -> String -> Maybe InstanceState
+parseQmpState state str
+  | isQmpEvent "STOP" str = Just Paused
+  | isQmpEvent "RESUME" str = Just Running
+  | isQmpEvent "SHUTDOWN" str = Just Shutdown
+  | isQmpEvent "MIGRATION" str =
+    case qmpStatus str of
+      Just status | status `elem` ["setup", "active"] -> Just Migrating
+      _ -> state
+  | "\"return\":" `isInfixOf` filter (not . isSpace) str =
+    maybe state (Just . runStateToInstanceState) (qmpStatus str)
+  | otherwise = state
+
+-- | @receiveQmp monitorFile handle@ listens for Qmp events on @handle@
+-- for Qmp socket @monitorFile@, keeping the state file of that socket
+-- up to date, and, when @handle@ is closed, it returns 'True' if a
+-- user shutdown event was received, and 'False' otherwise.
+receiveQmp :: FilePath -> Handle -> IO Bool
+receiveQmp monitorFile handle =
+  isUserShutdown <$> receive False False False Nothing
   where -- | A user shutdown consists of a shutdown event with no
         -- prior powerdown event and no stop event.
         isUserShutdown (isShutdown, isPowerdown, isStop)
           = isPowerdown && not isShutdown && not isStop
 
-        receive isPowerdown isShutdown isStop =
+        receive isPowerdown isShutdown isStop state =
           do res <- try $ hGetLine handle
              case res of
                Left err -> do
@@ -145,8 +261,17 @@ receiveQmp handle = isUserShutdown <$> receive False False False
                Right str -> do
                  let (isPowerdown', isShutdown', isStop') =
                        parseQmp isPowerdown isShutdown isStop str
+                     state' = parseQmpState state str
                  Logging.logDebug $ "Receive QMP message: " ++ str
-                 receive isPowerdown' isShutdown' isStop'
+                 case state' of
+                   Just s | state' /= state -> writeState monitorFile s
+                   _ -> return ()
+                 -- the run state after a migration depends on whether
+                 -- the instance was running before the migration
+                 when (isMigrationEnd str) $ do
+                   hPutStrLn handle monitorQueryStatus
+                   hFlush handle
+                 receive isPowerdown' isShutdown' isStop' state'
 
 -- | @detectMonitor monitorFile handle@ listens for Qmp events on
 -- @handle@ for Qmp socket @monitorFile@ and, when communcation
@@ -156,7 +281,8 @@ receiveQmp handle = isUserShutdown <$> receive False False False
 detectMonitor :: FilePath -> Handle -> IO ()
 detectMonitor monitorFile handle =
   do let shutdownFile = shutdownPath monitorFile
-     res <- receiveQmp handle
+     res <- receiveQmp monitorFile handle
+     removeFileIfExists $ statePath monitorFile
      if res
        then do
          Logging.logInfo $ "Detect user shutdown, creating file " ++
@@ -165,14 +291,16 @@ detectMonitor monitorFile handle =
        else do
          Logging.logInfo $ "Detect admin shutdown, removing file " ++
            show shutdownFile
-         (try (removeFile shutdownFile) :: IO (Either IOError ())) >> return ()
+         removeFileIfExists shutdownFile
 
 -- | @runMonitor monitorFile@ creates a monitor for the Qmp socket
--- @monitorFile@ and calls 'detectMonitor'.
+-- @monitorFile@, queries the current state of the instance, and calls
+-- 'detectMonitor'.
 runMonitor :: FilePath -> IO ()
 runMonitor monitorFile =
   do handle <- UDSServer.openClientSocket Constants.luxiDefRwto monitorFile
      hPutStrLn handle monitorGreeting
+     hPutStrLn handle monitorQueryStatus
      hFlush handle
      detectMonitor monitorFile handle
      UDSServer.closeClientSocket handle
@@ -250,11 +378,18 @@ handleDir lock monitors curDir tarDir event =
 
 -- | Simulates file creation events for the Qmp sockets that already
 -- exist in @dir@.
+--
+-- Instances started before the KVM daemon had its own Qmp socket are
+-- monitored through the Qmp socket of the hypervisor code instead.
+-- This is only done here, and not upon inotify events, because the
+-- socket of the KVM daemon of a new instance might be created after
+-- the socket of the hypervisor code.
 recapDir :: Lock -> Monitors -> FilePath -> IO ()
 recapDir lock monitors dir =
   do files <- getDirectoryContents dir
      let files' = filter isMonitorPath files
      mapM_ sendEvent files'
+     mapM_ (ensureMonitor monitors . (dir </>)) $ legacyMonitors files
   where sendEvent file =
           handleTargetEvent lock monitors dir Created { isDirectory = False
                                                       , filePath = file }
@@ -297,11 +432,21 @@ rewatchDir lock tarDir inotify =
   do watchDir lock tarDir inotify
      rewatchDir lock tarDir inotify
 
+-- | Removes the state files left in @dir@ by a previous run of the KVM
+-- daemon, given that the states they contain might be outdated.
+cleanStateFiles :: FilePath -> IO ()
+cleanStateFiles dir =
+  do exists <- doesDirectoryExist dir
+     when exists $ do
+       files <- getDirectoryContents dir
+       mapM_ (removeFileIfExists . (dir </>)) $ filter isStatePath files
+
 -- * Starting point
 
 startWith :: FilePath -> IO ()
 startWith dir =
   do lock <- newEmptyMVar
+     cleanStateFiles dir
      withINotify (rewatchDir lock dir)
 
 start :: IO ()
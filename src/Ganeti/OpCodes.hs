@@ -399,6 +399,8 @@ $(genOpCode "OpCode"
      , pAllowRuntimeChgs
      , pIgnoreIpolicy
      , pIallocator
+     , pMaxParallelMigrations
+     , pMigrationBandwidthBudget
      ],
      "node_name")
   , ("OpNodeEvacuate",
@@ -463,6 +465,12 @@ $(genOpCode "OpCode"
      , pMultiAllocInstances
      ],
      [])
+  , ("OpInstanceBatch",
+     [t| [(Bool, JSValue)] |],
+     OpDoc.opInstanceBatch,
+     [ pBatchOps
+     ],
+     [])
   , ("OpInstanceReinstall",
      [t| () |],
      OpDoc.opInstanceReinstall,
@@ -568,6 +576,8 @@ $(genOpCode "OpCode"
      , pMigrationCleanup
      , pIallocator
      , pAllowFailover
+     , pMigrationParallel
+     , pMigrationBandwidth
      ],
      "instance_name")
   , ("OpInstanceMove",
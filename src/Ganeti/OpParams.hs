@@ -82,6 +82,10 @@ module Ganeti.OpParams
   , pNoRemember
   , pMigrationTargetNode
   , pMigrationTargetNodeUuid
+  , pMigrationParallel
+  , pMigrationBandwidth
+  , pMaxParallelMigrations
+  , pMigrationBandwidthBudget
   , pMoveTargetNode
   , pMoveTargetNodeUuid
   , pMoveCompress
@@ -186,6 +190,7 @@ module Ganeti.OpParams
   , pStartInstance
   , pInstTags
   , pMultiAllocInstances
+  , pBatchOps
   , pTempOsParams
   , pTempHvParams
   , pTempBeParams
@@ -945,6 +950,30 @@ pMigrationTargetNodeUuid =
   withDoc "Target node UUID for instance migration/failover" $
   optionalNEStringField "target_node_uuid"
 
+pMigrationParallel :: Field
+pMigrationParallel =
+  withDoc "Whether to allow other migrations involving the same nodes\
+          \ to run concurrently" .
+  renameField "MigrationParallel" $
+  defaultFalse "parallel"
+
+pMigrationBandwidth :: Field
+pMigrationBandwidth =
+  withDoc "Bandwidth limit for this migration in MiB/s, overriding the\
+          \ hypervisor parameter" .
+  optionalField $ simpleField "migration_bandwidth" [t| Positive Int |]
+
+pMaxParallelMigrations :: Field
+pMaxParallelMigrations =
+  withDoc "Maximum number of instances to migrate concurrently" .
+  optionalField $ simpleField "max_parallel" [t| Positive Int |]
+
+pMigrationBandwidthBudget :: Field
+pMigrationBandwidthBudget =
+  withDoc "Total migration bandwidth in MiB/s shared by the concurrent\
+          \ migrations off the node" .
+  optionalField $ simpleField "bandwidth_budget" [t| Positive Int |]
+
 pAllowRuntimeChgs :: Field
 pAllowRuntimeChgs =
   withDoc "Whether to allow runtime changes while migrating" $
@@ -1167,6 +1196,13 @@ pMultiAllocInstances =
   defaultField [| [] |] $
   simpleField "instances"[t| [JSValue] |]
 
+pBatchOps :: Field
+pBatchOps =
+  withDoc "List of instance opcodes to run in a batch, each on a different\
+          \ instance" .
+  renameField "BatchOps" $
+  simpleField "ops" [t| [JSValue] |]
+
 pOpportunisticLocking :: Field
 pOpportunisticLocking =
   withDoc "Whether to employ opportunistic locking for nodes, meaning\
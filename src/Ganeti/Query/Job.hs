@@ -29,11 +29,15 @@ module Ganeti.Query.Job
   , wantArchived
   ) where
 
+import Control.Monad ((>=>))
+import Data.List (isPrefixOf)
+import qualified Data.Map as Map
 import qualified Text.JSON as J
 
 import Ganeti.BasicTypes
 import qualified Ganeti.Constants as C
 import Ganeti.JQueue
+import Ganeti.JSON
 import Ganeti.Query.Common
 import Ganeti.Query.Language
 import Ganeti.Query.Types
@@ -81,6 +85,17 @@ opsOptGetter f =
                                          Nothing -> J.JSNull
                                          Just a -> J.showJSON a) . qjOps)
 
+-- | Computes the total time an opcode spent waiting for locks, based
+-- on its profile.
+profileLockWait :: Container Double -> Double
+profileLockWait =
+  sum . Map.elems . Map.filterWithKey (\k _ -> "lock/" `isPrefixOf` k) .
+  fromContainer
+
+-- | Returns the time an opcode spent in its logical unit's Exec method.
+profileExecTime :: Container Double -> Maybe Double
+profileExecTime = Map.lookup "exec" . fromContainer
+
 -- | Archived field name.
 archivedField :: String
 archivedField = "archived"
@@ -120,6 +135,15 @@ jobFields =
   , (FieldDefinition "opend" "OpCode_end" QFTOther
        "List of opcode execution end timestamps",
      opsOptGetter qoEndTimestamp, QffNormal)
+  , (FieldDefinition "opprofile" "OpCode_profile" QFTOther
+       "List of per-opcode execution profiles (only if profiling is enabled)",
+     opsOptGetter qoProfile, QffNormal)
+  , (FieldDefinition "oplockwait" "OpCode_lockwait" QFTOther
+       "List of per-opcode lock wait times in seconds",
+     opsOptGetter (fmap profileLockWait . qoProfile), QffNormal)
+  , (FieldDefinition "opexectime" "OpCode_exectime" QFTOther
+       "List of per-opcode execution times in seconds",
+     opsOptGetter (qoProfile >=> profileExecTime), QffNormal)
   , (FieldDefinition "oppriority" "OpCode_prio" QFTOther
        "List of opcode priorities", opsGetter qoPriority, QffNormal)
   , (FieldDefinition "summary" "Summary" QFTOther
@@ -47,6 +47,39 @@ lockFields =
      FieldSimple rsNormal, QffNormal)
   , (FieldDefinition "pending" "Pending" QFTOther "Jobs waiting for the lock",
      FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "acquires" "Acquires" QFTNumber
+       "Number of successful acquisitions (requires lock statistics\
+       \ to be enabled in the master daemon)",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "timeouts" "Timeouts" QFTNumber
+       "Number of acquisitions which timed out",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "wait_total" "WaitTotal" QFTNumber
+       "Total time spent waiting for the lock, including\
+       \ acquisitions which timed out (seconds)",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "wait_max" "WaitMax" QFTNumber
+       "Longest wait for the lock (seconds)",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "wait_hist" "WaitHistogram" QFTOther
+       "Histogram of wait times of successful acquisitions as a list\
+       \ of (upper bound in seconds, count) pairs; the last bucket\
+       \ has no upper bound",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "hold_total" "HoldTotal" QFTNumber
+       "Total time the lock was held (seconds)",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "hold_max" "HoldMax" QFTNumber
+       "Longest time the lock was held (seconds)",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "opcodes" "Opcodes" QFTOther
+       "Statistics per opcode as a list of (opcode, acquires,\
+       \ timeouts, wait time, hold time) entries",
+     FieldSimple rsNormal, QffNormal)
+  , (FieldDefinition "blocked_by" "BlockedBy" QFTOther
+       "How often acquisitions had to wait for the lock's owners as\
+       \ a list of (waiting opcode, owning opcode, count) entries",
+     FieldSimple rsNormal, QffNormal)
   ]
 
 -- | The lock fields map.
@@ -56,18 +56,27 @@ nodeLiveFieldsDefs =
   [ ("bootid", "BootID", QFTText, "bootid",
      "Random UUID renewed for each system reboot, can be used\
      \ for detecting reboots by tracking changes")
+  , ("ccores", "CCores", QFTNumber, "cpu_cores_per_socket",
+     "Number of physical cores per CPU socket (if exported by hypervisor)")
   , ("cnodes", "CNodes", QFTNumber, "cpu_nodes",
      "Number of NUMA domains on node (if exported by hypervisor)")
   , ("cnos", "CNOs", QFTNumber, "cpu_dom0",
      "Number of logical processors used by the node OS (dom0 for Xen)")
   , ("csockets", "CSockets", QFTNumber, "cpu_sockets",
      "Number of physical CPU sockets (if exported by hypervisor)")
+  , ("cthreads", "CThreads", QFTNumber, "cpu_threads_per_core",
+     "Number of hardware threads per physical core (if exported by\
+     \ hypervisor)")
   , ("ctotal", "CTotal", QFTNumber, "cpu_total",
      "Number of logical processors")
   , ("dfree", "DFree", QFTUnit, "storage_free",
      "Available storage space on storage unit")
   , ("dtotal", "DTotal", QFTUnit, "storage_size",
      "Total storage space on storage unit for instance disk allocation")
+  , ("hpfree", "HpFree", QFTUnit, "hugepages_free",
+     "Memory available as free huge pages (if exported by hypervisor)")
+  , ("hptotal", "HpTotal", QFTUnit, "hugepages_total",
+     "Total memory reserved for huge pages (if exported by hypervisor)")
   , ("spfree", "SpFree", QFTNumber, "spindles_free",
      "Available spindles in volume group (exclusive storage only)")
   , ("sptotal", "SpTotal", QFTNumber, "spindles_total",
@@ -78,6 +87,8 @@ nodeLiveFieldsDefs =
      "Amount of memory used by node (dom0 for Xen)")
   , ("mtotal", "MTotal", QFTUnit, "memory_total",
      "Total amount of memory of physical machine")
+  , ("numa", "NUMA", QFTOther, "numa_nodes",
+     "Memory and CPUs of each NUMA domain (if exported by hypervisor)")
   ]
 
 -- | Helper function to extract an attribute from a maybe StorageType
@@ -111,12 +122,16 @@ getStorageInfoForType sinfos stype = listToMaybe $ filter
 nodeLiveFieldExtract :: FieldName -> RpcResultNodeInfo -> J.JSValue
 nodeLiveFieldExtract "bootid" res =
   J.showJSON $ rpcResNodeInfoBootId res
+nodeLiveFieldExtract "ccores" res =
+  getMaybeJsonHead (rpcResNodeInfoHvInfo res) hvInfoCpuCoresPerSocket
 nodeLiveFieldExtract "cnodes" res =
   jsonHead (rpcResNodeInfoHvInfo res) hvInfoCpuNodes
 nodeLiveFieldExtract "cnos" res =
   jsonHead (rpcResNodeInfoHvInfo res) hvInfoCpuDom0
 nodeLiveFieldExtract "csockets" res =
   jsonHead (rpcResNodeInfoHvInfo res) hvInfoCpuSockets
+nodeLiveFieldExtract "cthreads" res =
+  getMaybeJsonHead (rpcResNodeInfoHvInfo res) hvInfoCpuThreadsPerCore
 nodeLiveFieldExtract "ctotal" res =
   jsonHead (rpcResNodeInfoHvInfo res) hvInfoCpuTotal
 nodeLiveFieldExtract "dfree" res =
@@ -125,6 +140,10 @@ nodeLiveFieldExtract "dfree" res =
 nodeLiveFieldExtract "dtotal" res =
   getAttrFromStorageInfo storageInfoStorageSize (getStorageInfoForDefault
       (rpcResNodeInfoStorageInfo res))
+nodeLiveFieldExtract "hpfree" res =
+  getMaybeJsonHead (rpcResNodeInfoHvInfo res) hvInfoHugepagesFree
+nodeLiveFieldExtract "hptotal" res =
+  getMaybeJsonHead (rpcResNodeInfoHvInfo res) hvInfoHugepagesTotal
 nodeLiveFieldExtract "spfree" res =
   getAttrFromStorageInfo storageInfoStorageFree (getStorageInfoForType
       (rpcResNodeInfoStorageInfo res) StorageLvmPv)
@@ -137,6 +156,8 @@ nodeLiveFieldExtract "mnode" res =
   jsonHead (rpcResNodeInfoHvInfo res) hvInfoMemoryDom0
 nodeLiveFieldExtract "mtotal" res =
   jsonHead (rpcResNodeInfoHvInfo res) hvInfoMemoryTotal
+nodeLiveFieldExtract "numa" res =
+  getMaybeJsonHead (rpcResNodeInfoHvInfo res) hvInfoNumaNodes
 nodeLiveFieldExtract _ _ = J.JSNull
 
 -- | Helper for extracting field from RPC result.
@@ -270,7 +291,8 @@ storageFields = ["dtotal", "dfree", "spfree", "sptotal"]
 -- | Hypervisor-related query fields
 hypervisorFields :: [String]
 hypervisorFields = ["mnode", "mfree", "mtotal",
-                    "cnodes", "csockets", "cnos", "ctotal"]
+                    "cnodes", "csockets", "cnos", "ctotal",
+                    "ccores", "cthreads", "hpfree", "hptotal", "numa"]
 
 -- | Check if it is required to include domain-specific entities (for example
 -- storage units for storage info, hypervisor specs for hypervisor info)
@@ -60,6 +60,7 @@ module Ganeti.Rpc
   , RpcResultInstanceList(..)
 
   , HvInfo(..)
+  , NumaNodeInfo(..)
   , StorageInfo(..)
   , RpcCallNodeInfo(..)
   , RpcResultNodeInfo(..)
@@ -441,6 +442,16 @@ $(buildObject "StorageInfo" "storageInfo"
   , optionalField $ simpleField "storage_size" [t| Int |]
   ])
 
+-- | Per-NUMA node information, as described in hv_base.py.
+$(buildObject "NumaNodeInfo" "numaNodeInfo"
+  [ simpleField "id" [t| Int |]
+  , simpleField "memory_total" [t| Int |]
+  , simpleField "memory_free" [t| Int |]
+  , simpleField "cpus" [t| [Int] |]
+  , optionalField $ simpleField "hugepages_total" [t| Int |]
+  , optionalField $ simpleField "hugepages_free" [t| Int |]
+  ])
+
 -- | We only provide common fields as described in hv_base.py.
 $(buildObject "HvInfo" "hvInfo"
   [ simpleField "memory_total" [t| Int |]
@@ -450,6 +461,11 @@ $(buildObject "HvInfo" "hvInfo"
   , simpleField "cpu_nodes" [t| Int |]
   , simpleField "cpu_sockets" [t| Int |]
   , simpleField "cpu_dom0" [t| Int |]
+  , optionalField $ simpleField "cpu_cores_per_socket" [t| Int |]
+  , optionalField $ simpleField "cpu_threads_per_core" [t| Int |]
+  , optionalField $ simpleField "hugepages_total" [t| Int |]
+  , optionalField $ simpleField "hugepages_free" [t| Int |]
+  , optionalField $ simpleField "numa_nodes" [t| [NumaNodeInfo] |]
   ])
 
 $(buildObject "RpcResultNodeInfo" "rpcResNodeInfo"
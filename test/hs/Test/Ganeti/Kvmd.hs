@@ -59,7 +59,7 @@ delayKvmd = threadDelay 1000000
 detectShutdown :: (Handle -> IO ()) -> IO Bool
 detectShutdown putFn =
   do monitorDir <- TestCommon.getTempFileName "ganeti"
-     let monitor = "instance.qmp"
+     let monitor = "instance" ++ Kvmd.monitorExtension
          monitorFile = monitorDir </> monitor
          shutdownFile = Kvmd.shutdownPath monitorFile
      -- ensure the KVM directory exists
@@ -109,7 +109,52 @@ case_DetectUserShutdown =
   where putMessage handle =
           hPrint handle "SHUTDOWN"
 
+case_ParseQmpState :: Assertion
+case_ParseQmpState =
+  do Just Kvmd.Running @=? Kvmd.parseQmpState Nothing
+       "{\"return\": {\"status\": \"running\", \"singlestep\": false,\
+       \ \"running\": true}}"
+     Just Kvmd.Paused @=? Kvmd.parseQmpState Nothing
+       "{\"return\": {\"status\": \"prelaunch\", \"singlestep\": false,\
+       \ \"running\": false}}"
+     Nothing @=? Kvmd.parseQmpState Nothing "{\"return\": {}}"
+     Just Kvmd.Paused @=? Kvmd.parseQmpState (Just Kvmd.Running)
+       (event "STOP" "")
+     Just Kvmd.Running @=? Kvmd.parseQmpState (Just Kvmd.Paused)
+       (event "RESUME" "")
+     Just Kvmd.Shutdown @=? Kvmd.parseQmpState (Just Kvmd.Running)
+       (event "SHUTDOWN" "")
+     Just Kvmd.Migrating @=? Kvmd.parseQmpState (Just Kvmd.Running)
+       (event "MIGRATION" ", \"data\": {\"status\": \"active\"}")
+     Just Kvmd.Migrating @=? Kvmd.parseQmpState (Just Kvmd.Migrating)
+       (event "MIGRATION" ", \"data\": {\"status\": \"completed\"}")
+     Just Kvmd.Running @=? Kvmd.parseQmpState (Just Kvmd.Running)
+       (event "POWERDOWN" "")
+  where event name extra =
+          "{\"timestamp\": {\"seconds\": 1397220425, \"microseconds\": 0},\
+          \ \"event\": \"" ++ name ++ "\"" ++ extra ++ "}"
+
+case_IsMigrationEnd :: Assertion
+case_IsMigrationEnd =
+  do assertBool "Migration end not detected" $ Kvmd.isMigrationEnd
+       "{\"event\": \"MIGRATION\", \"data\": {\"status\": \"failed\"}}"
+     assertBool "Migration end detected for an active migration" .
+       not $ Kvmd.isMigrationEnd
+       "{\"event\": \"MIGRATION\", \"data\": {\"status\": \"active\"}}"
+     assertBool "Migration end detected for a status reply" .
+       not $ Kvmd.isMigrationEnd
+       "{\"return\": {\"status\": \"completed\"}}"
+
+case_LegacyMonitors :: Assertion
+case_LegacyMonitors =
+  assertEqual "Unexpected legacy monitors" ["old.qmp"] $
+    Kvmd.legacyMonitors
+      ["old.qmp", "old.state", "new.qmp", "new.kvmd", "other.shutdown"]
+
 TestHelper.testSuite "Kvmd"
   [ 'case_DetectAdminShutdown
   , 'case_DetectUserShutdown
+  , 'case_ParseQmpState
+  , 'case_IsMigrationEnd
+  , 'case_LegacyMonitors
   ]
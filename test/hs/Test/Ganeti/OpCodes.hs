@@ -39,6 +39,7 @@ import Control.Monad
 import Data.Char
 import Data.List
 import qualified Data.Map as Map
+import Data.Ord (comparing)
 import qualified Text.JSON as J
 import Text.Printf (printf)
 
@@ -76,6 +77,22 @@ arbitraryOpTagsDel = do
   kind <- arbitrary
   OpCodes.OpTagsDel kind <$> genTags <*> genOpCodesTagName kind
 
+arbitraryOpInstanceStartup :: Gen (Maybe NonEmptyString) -> Gen OpCodes.OpCode
+arbitraryOpInstanceStartup genUuid =
+  OpCodes.OpInstanceStartup <$> genFQDN <*> genUuid <*>
+    arbitrary <*> arbitrary <*> pure emptyJSObject <*>
+    pure emptyJSObject <*> arbitrary <*> arbitrary
+
+arbitraryOpInstanceShutdown :: Gen (Maybe NonEmptyString) -> Gen OpCodes.OpCode
+arbitraryOpInstanceShutdown genUuid =
+  OpCodes.OpInstanceShutdown <$> genFQDN <*> genUuid <*>
+    arbitrary <*> arbitrary <*> arbitrary <*> arbitrary
+
+arbitraryOpInstanceReboot :: Gen (Maybe NonEmptyString) -> Gen OpCodes.OpCode
+arbitraryOpInstanceReboot genUuid =
+  OpCodes.OpInstanceReboot <$> genFQDN <*> genUuid <*>
+    arbitrary <*> arbitrary <*> arbitrary
+
 $(genArbitrary ''OpCodes.ReplaceDisksMode)
 
 $(genArbitrary ''DiskAccess)
@@ -138,7 +155,7 @@ instance Arbitrary OpCodes.OpCode where
         OpCodes.OpInstanceMigrate <$> genFQDN <*> return Nothing <*>
           arbitrary <*> arbitrary <*> genMaybe genNodeNameNE <*>
           return Nothing <*> arbitrary <*> arbitrary <*> arbitrary <*>
-          genMaybe genNameNE <*> arbitrary
+          genMaybe genNameNE <*> arbitrary <*> arbitrary <*> arbitrary
       "OP_TAGS_GET" ->
         arbitraryOpTagsGet
       "OP_TAGS_SEARCH" ->
@@ -225,7 +242,8 @@ instance Arbitrary OpCodes.OpCode where
       "OP_NODE_MIGRATE" ->
         OpCodes.OpNodeMigrate <$> genNodeNameNE <*> return Nothing <*>
           arbitrary <*> arbitrary <*> genMaybe genNodeNameNE <*>
-          return Nothing <*> arbitrary <*> arbitrary <*> genMaybe genNameNE
+          return Nothing <*> arbitrary <*> arbitrary <*> genMaybe genNameNE <*>
+          arbitrary <*> arbitrary
       "OP_NODE_EVACUATE" ->
         OpCodes.OpNodeEvacuate <$> arbitrary <*> genNodeNameNE <*>
           return Nothing <*> genMaybe genNodeNameNE <*> return Nothing <*>
@@ -246,6 +264,8 @@ instance Arbitrary OpCodes.OpCode where
       "OP_INSTANCE_MULTI_ALLOC" ->
         OpCodes.OpInstanceMultiAlloc <$> arbitrary <*> genMaybe genNameNE <*>
         pure []
+      "OP_INSTANCE_BATCH" ->
+        OpCodes.OpInstanceBatch <$> resize 5 (listOf1 genBatchOp)
       "OP_INSTANCE_REINSTALL" ->
         OpCodes.OpInstanceReinstall <$> genFQDN <*> return Nothing <*>
           arbitrary <*> genMaybe genNameNE <*> genMaybe (pure emptyJSObject)
@@ -256,15 +276,11 @@ instance Arbitrary OpCodes.OpCode where
         OpCodes.OpInstanceRename <$> genFQDN <*> return Nothing <*>
           genNodeNameNE <*> arbitrary <*> arbitrary
       "OP_INSTANCE_STARTUP" ->
-        OpCodes.OpInstanceStartup <$> genFQDN <*> return Nothing <*>
-          arbitrary <*> arbitrary <*> pure emptyJSObject <*>
-          pure emptyJSObject <*> arbitrary <*> arbitrary
+        arbitraryOpInstanceStartup $ return Nothing
       "OP_INSTANCE_SHUTDOWN" ->
-        OpCodes.OpInstanceShutdown <$> genFQDN <*> return Nothing <*>
-          arbitrary <*> arbitrary <*> arbitrary <*> arbitrary
+        arbitraryOpInstanceShutdown $ return Nothing
       "OP_INSTANCE_REBOOT" ->
-        OpCodes.OpInstanceReboot <$> genFQDN <*> return Nothing <*>
-          arbitrary <*> arbitrary <*> arbitrary
+        arbitraryOpInstanceReboot $ return Nothing
       "OP_INSTANCE_MOVE" ->
         OpCodes.OpInstanceMove <$> genFQDN <*> return Nothing <*>
           arbitrary <*> arbitrary <*> genNodeNameNE <*> return Nothing <*>
@@ -381,6 +397,26 @@ instance Arbitrary OpCodes.CommonOpParams where
                 arbitrary <*> resize 5 arbitrary <*> genMaybe genName <*>
                 genReasonTrail
 
+-- | Generates a serialised opcode for a batch. All optional parameters
+-- are set and the keys are sorted, so that the result is left unchanged
+-- by the Python side filling in defaults and re-serialising it with
+-- sorted keys.
+genBatchOp :: Gen J.JSValue
+genBatchOp = do
+  let genUuid = Just <$> genNameNE
+  op <- oneof [ arbitraryOpInstanceStartup genUuid
+              , arbitraryOpInstanceShutdown genUuid
+              , arbitraryOpInstanceReboot genUuid
+              ]
+  params <- OpCodes.CommonOpParams <$> (Just <$> arbitrary) <*>
+              (Just <$> arbitrary) <*> arbitrary <*> resize 5 arbitrary <*>
+              genMaybe genName <*> genReasonTrail
+  case J.showJSON (OpCodes.MetaOpCode params op) of
+    J.JSObject obj ->
+      return . J.JSObject . J.toJSObject . sortBy (comparing fst) $
+        J.fromJSObject obj
+    other -> fail $ "Opcode not serialised as an object: " ++ show other
+
 -- * Helper functions
 
 -- | Empty JSObject.
@@ -502,6 +538,7 @@ case_py_compat_types = do
   py_stdout <-
      runPython "from ganeti import opcodes\n\
                \from ganeti import serializer\n\
+               \import simplejson\n\
                \import sys\n\
                \op_data = serializer.Load(sys.stdin.read())\n\
                \decoded = [opcodes.OpCode.LoadOpCode(o) for o in op_data]\n\
@@ -509,7 +546,7 @@ case_py_compat_types = do
                \  op.Validate(True)\n\
                \encoded = [(op.Summary(), op.__getstate__())\n\
                \           for op in decoded]\n\
-               \print serializer.Dump(encoded)" serialized
+               \print simplejson.dumps(encoded, sort_keys=True)" serialized
      >>= checkPythonResult
   let deserialised =
         J.decode py_stdout::J.Result [(String, OpCodes.MetaOpCode)]
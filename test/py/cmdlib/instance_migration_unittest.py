@@ -24,6 +24,7 @@
 """
 
 from ganeti import constants
+from ganeti import locking
 from ganeti import objects
 from ganeti import opcodes
 
@@ -97,6 +98,41 @@ class TestLUInstanceMigrate(CmdlibTestCase):
     op = self.CopyOpCode(self.op)
     self.ExecOpCode(op)
 
+  def testParallelLocks(self):
+    op = self.CopyOpCode(self.op, parallel=True)
+    (node_res, shared) = self.RunWithLockedLU(
+      op, lambda lu: (lu.owned_locks(locking.LEVEL_NODE_RES),
+                      lu.share_locks[locking.LEVEL_NODE_RES]))
+
+    self.assertEqual(node_res, set([self.master.uuid, self.snode.uuid]))
+    self.assertTrue(shared)
+
+  def testMigrationBandwidth(self):
+    inst = self.cfg.AddNewInstance(
+      disk_template=constants.DT_DRBD8, admin_state=constants.ADMINST_UP,
+      secondary_node=self.snode, hypervisor=constants.HT_KVM,
+      hvparams={constants.HV_KVM_MIGRATION_ESCALATION: True})
+    op = self.CopyOpCode(self.op,
+                         instance_name=inst.name,
+                         migration_bandwidth=100)
+    self.ExecOpCode(op)
+
+    (_, _, (_, hvp, _), _, _) = self.rpc.call_instance_migrate.call_args[0]
+    self.assertEqual(hvp, {
+      constants.HV_MIGRATION_BANDWIDTH: 100,
+      constants.HV_KVM_MIGRATION_ESCALATION: False,
+      })
+
+  def testMigrationBandwidthUnsupported(self):
+    op = self.CopyOpCode(self.op,
+                         migration_bandwidth=100)
+    self.ExecOpCode(op)
+
+    (_, _, (_, hvp, _), _, _) = self.rpc.call_instance_migrate.call_args[0]
+    self.assertEqual(hvp, None)
+    self.mcpu.assertLogContainsRegex("does not support limiting the migration"
+                                     " bandwidth")
+
 
 class TestLUInstanceFailover(CmdlibTestCase):
   def setUp(self):
@@ -2385,5 +2385,130 @@ class TestLUInstanceChangeGroup(CmdlibTestCase):
     self.ExecOpCode(op)
 
 
+class TestLUInstanceBatch(CmdlibTestCase):
+  def setUp(self):
+    super(TestLUInstanceBatch, self).setUp()
+
+    self.inst1 = self.cfg.AddNewInstance(admin_state=constants.ADMINST_UP)
+    self.inst2 = self.cfg.AddNewInstance(admin_state=constants.ADMINST_UP)
+
+    self.rpc.call_instance_shutdown_multi.side_effect = \
+      lambda node, instances, *_: \
+        self.RpcResultsBuilder() \
+          .CreateSuccessfulNodeResult(node, [(True, None)] * len(instances))
+    self.rpc.call_blockdev_shutdown.side_effect = \
+      lambda node, *_: self.RpcResultsBuilder() \
+                         .CreateSuccessfulNodeResult(node)
+
+  def testEmpty(self):
+    op = opcodes.OpInstanceBatch(ops=[])
+    self.ExecOpCodeExpectOpPrereqError(op, "No operations given")
+
+  def testNotBatchable(self):
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceReinstall(instance_name=self.inst1.name),
+      ])
+    self.ExecOpCodeExpectOpPrereqError(op, "can't be batched")
+
+  def testDuplicateInstance(self):
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceShutdown(instance_name=self.inst1.name),
+      opcodes.OpInstanceReboot(instance_name=self.inst1.name),
+      ])
+    self.ExecOpCodeExpectOpPrereqError(op, "is given more than once")
+
+  def testDuplicateInstanceShortName(self):
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceShutdown(instance_name=self.inst1.name),
+      opcodes.OpInstanceReboot(instance_name=self.inst1.name.split(".")[0]),
+      ])
+    self.ExecOpCodeExpectOpPrereqError(op, "is given more than once")
+
+  def testShutdown(self):
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceShutdown(instance_name=self.inst1.name),
+      opcodes.OpInstanceShutdown(instance_name=self.inst2.name),
+      ])
+    result = self.ExecOpCode(op)
+
+    self.assertEqual(result, [(True, None), (True, None)])
+    self.assertEqual(self.rpc.call_instance_shutdown_multi.call_count, 1)
+    self.assertFalse(self.rpc.call_instance_shutdown.called)
+    for inst in [self.inst1, self.inst2]:
+      self.assertEqual(self.cfg.GetInstanceInfo(inst.uuid).admin_state,
+                       constants.ADMINST_DOWN)
+
+  def testShutdownReasons(self):
+    # Each sub-opcode has its own reason trail, as set by the command line
+    # client, which must not prevent sending a single RPC
+    ops = []
+    for (inst, timestamp) in [(self.inst1, 1000), (self.inst2, 2000)]:
+      ops.append(opcodes.OpInstanceShutdown(
+        instance_name=inst.name,
+        reason=[(constants.OPCODE_REASON_SRC_CLIENT + ":gnt-instance",
+                 "shutdown", timestamp)]))
+    reason = [(constants.OPCODE_REASON_SRC_CLIENT + ":gnt-instance",
+               "shutdown", 3000)]
+    op = opcodes.OpInstanceBatch(ops=ops, reason=reason)
+    result = self.ExecOpCode(op)
+
+    self.assertEqual(result, [(True, None), (True, None)])
+    self.assertEqual(self.rpc.call_instance_shutdown_multi.call_count, 1)
+    (node_uuid, instances, _, call_reason) = \
+      self.rpc.call_instance_shutdown_multi.call_args[0]
+    self.assertEqual(node_uuid, self.master.uuid)
+    self.assertEqual([inst.uuid for inst in instances],
+                     [self.inst1.uuid, self.inst2.uuid])
+    self.assertEqual(call_reason[:len(reason)], reason)
+
+  def testPerInstanceFailure(self):
+    inst3 = self.cfg.AddNewInstance(admin_state=constants.ADMINST_OFFLINE)
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceShutdown(instance_name=self.inst1.name),
+      opcodes.OpInstanceShutdown(instance_name=inst3.name),
+      ])
+    result = self.ExecOpCode(op)
+
+    self.assertEqual(len(result), 2)
+    self.assertEqual(result[0], (True, None))
+    (success, msg) = result[1]
+    self.assertFalse(success)
+    self.assertTrue("offline" in msg)
+    self.assertEqual(self.rpc.call_instance_shutdown_multi.call_count, 1)
+
+  def testStartupFailure(self):
+    self.cfg.MarkInstanceDown(self.inst1.uuid)
+    self.cfg.MarkInstanceDown(self.inst2.uuid)
+    self.rpc.call_instance_info.return_value = \
+      self.RpcResultsBuilder() \
+        .CreateSuccessfulNodeResult(self.master, {})
+    self.rpc.call_node_info.return_value = \
+      self.RpcResultsBuilder() \
+        .AddSuccessfulNode(self.master,
+                           (NotImplemented, NotImplemented,
+                            ({"memory_free": 10000}, ))) \
+        .Build()
+    self.rpc.call_blockdev_assemble.return_value = \
+      self.RpcResultsBuilder() \
+        .CreateSuccessfulNodeResult(self.master, ("/dev/mock", "/var/mock"))
+    self.rpc.call_instance_start_multi.return_value = \
+      self.RpcResultsBuilder() \
+        .CreateSuccessfulNodeResult(self.master,
+                                    [(True, None), (False, "mock error")])
+
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceStartup(instance_name=self.inst1.name),
+      opcodes.OpInstanceStartup(instance_name=self.inst2.name),
+      ])
+    result = self.ExecOpCode(op)
+
+    self.assertEqual(result[0], (True, None))
+    (success, msg) = result[1]
+    self.assertFalse(success)
+    self.assertTrue("mock error" in msg)
+    self.assertEqual(self.rpc.call_instance_start_multi.call_count, 1)
+    self.assertFalse(self.rpc.call_instance_start.called)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -270,5 +270,84 @@ class TestLUNodeAdd(CmdlibTestCase):
     self.ExecOpCodeExpectOpExecError(op, "Can't get version information from"
                                      " node %s" % self.node_add.name)
 
+
+class TestLUNodeMigrate(CmdlibTestCase):
+  def setUp(self):
+    super(TestLUNodeMigrate, self).setUp()
+
+    for _ in range(3):
+      self.cfg.AddNewInstance(primary_node=self.master)
+
+    self.op = opcodes.OpNodeMigrate(node_name=self.master.name)
+
+  def _GetJobs(self, op):
+    return self.RunWithLockedLU(op, lambda lu: lu.Exec(None).jobs)
+
+  def testSequential(self):
+    jobs = self._GetJobs(self.op)
+
+    self.assertEqual(len(jobs), 3)
+    for (op, ) in jobs:
+      self.assertFalse(op.parallel)
+      self.assertEqual(op.migration_bandwidth, None)
+      self.assertEqual(op.depends, None)
+
+  def testParallel(self):
+    op = self.CopyOpCode(self.op, max_parallel=2, bandwidth_budget=100)
+    jobs = self._GetJobs(op)
+
+    self.assertEqual(len(jobs), 3)
+    for (op, ) in jobs:
+      self.assertTrue(op.parallel)
+      self.assertEqual(op.migration_bandwidth, 50)
+    self.assertEqual([op.depends for (op, ) in jobs], [
+      None,
+      None,
+      [(-2, list(constants.JOBS_FINALIZED))],
+      ])
+
+  def testBandwidthBudgetTooSmall(self):
+    op = self.CopyOpCode(self.op, max_parallel=4, bandwidth_budget=2)
+    self.ExecOpCodeExpectOpPrereqError(op, "bandwidth budget of 2 MiB/s is too"
+                                       " small for 4 parallel migrations")
+
+  def _SetUpParallelMemory(self, memory_free):
+    snode = self.cfg.AddNewNode()
+    for _ in range(2):
+      self.cfg.AddNewInstance(disk_template=constants.DT_DRBD8,
+                              admin_state=constants.ADMINST_UP,
+                              secondary_node=snode,
+                              beparams={constants.BE_MINMEM: 600,
+                                        constants.BE_MAXMEM: 600})
+
+    hv_info = ("bootid", [], ({"memory_free": memory_free}, ))
+    self.rpc.call_node_info.return_value = \
+      self.RpcResultsBuilder() \
+        .AddSuccessfulNode(snode, hv_info) \
+        .Build()
+
+    return snode
+
+  def testParallelMemory(self):
+    snode = self._SetUpParallelMemory(1200)
+    op = self.CopyOpCode(self.op, max_parallel=2)
+    self.ExecOpCode(op)
+
+    self.assertEqual(self.rpc.call_node_info.call_count, 1)
+    self.assertEqual(self.rpc.call_node_info.call_args[0][0], [snode.uuid])
+
+  def testParallelNotEnoughMemory(self):
+    self._SetUpParallelMemory(1000)
+    op = self.CopyOpCode(self.op, max_parallel=2)
+    self.ExecOpCodeExpectOpPrereqError(op, "needed 1200 MiB, available 1000"
+                                       " MiB")
+
+  def testSequentialMemoryNotChecked(self):
+    self._SetUpParallelMemory(1000)
+    self.ExecOpCode(self.op)
+
+    self.assertFalse(self.rpc.call_node_info.called)
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
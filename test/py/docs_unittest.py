@@ -58,6 +58,7 @@ RAPI_OPCODE_EXCLUDE = compat.UniqueFrozenset([
   opcodes.OpClusterActivateMasterIp,
   opcodes.OpClusterDeactivateMasterIp,
   opcodes.OpExtStorageDiagnose,
+  opcodes.OpInstanceBatch,
 
   # Difficult if not impossible
   opcodes.OpClusterDestroy,
@@ -707,6 +707,51 @@ class TestInstanceConsoleInfo(unittest.TestCase):
     self.assertTrue(res["i2"]["kind"] == "bHy")
 
 
+class TestInstanceOpsMulti(unittest.TestCase):
+  def setUp(self):
+    self.instances = [objects.Instance(name="inst%s.example.com" % i)
+                      for i in range(5)]
+
+  @staticmethod
+  def _FailSome(instance, *_):
+    if instance.name == "inst1.example.com":
+      raise backend.RPCFail("Hypervisor error")
+    elif instance.name == "inst3.example.com":
+      raise errors.HypervisorError("Unexpected error")
+
+  def testStart(self):
+    with mock.patch.object(backend, "StartInstance",
+                           side_effect=self._FailSome) as start_fn:
+      result = backend.StartInstanceMulti(self.instances, False, ["trail"],
+                                          max_parallel=3)
+    self.assertEqual(result, [
+      (True, None),
+      (False, "Hypervisor error"),
+      (True, None),
+      (False, "Unexpected error"),
+      (True, None),
+      ])
+    self.assertEqual(start_fn.call_count, len(self.instances))
+    self.assertEqual(sorted(call[0][0].name
+                            for call in start_fn.call_args_list),
+                     sorted(inst.name for inst in self.instances))
+    for call in start_fn.call_args_list:
+      self.assertEqual(call[0][1:], (False, ["trail"]))
+
+  def testShutdown(self):
+    with mock.patch.object(backend, "InstanceShutdown",
+                           side_effect=self._FailSome) as shutdown_fn:
+      result = backend.InstanceShutdownMulti(self.instances, 120, ["trail"])
+    self.assertEqual([success for (success, _) in result],
+                     [True, False, True, False, True])
+    self.assertEqual(shutdown_fn.call_count, len(self.instances))
+    for call in shutdown_fn.call_args_list:
+      self.assertEqual(call[0][1:], (120, ["trail"]))
+
+  def testEmpty(self):
+    self.assertEqual(backend.StartInstanceMulti([], False, []), [])
+
+
 class TestGetHvInfo(unittest.TestCase):
 
   def setUp(self):
@@ -176,6 +176,28 @@ class TestConfigRunner(unittest.TestCase):
     self.failUnlessRaises(errors.ConfigurationError, cfg.Update, fake_instance,
                           None)
 
+  def testDeferWrites(self):
+    cfg = self._get_object()
+    node = cfg.GetNodeInfo(cfg.GetNodeList()[0])
+    write_count = cfg.write_count
+
+    cfg.DeferWrites()
+    cfg.Update(node, None)
+    cfg.Update(node, None)
+    self.assertEqual(cfg.write_count, write_count)
+
+    cfg.FlushWrites()
+    self.assertEqual(cfg.write_count, write_count + 1)
+
+    # Nothing pending, nothing to write
+    cfg.DeferWrites()
+    cfg.FlushWrites()
+    self.assertEqual(cfg.write_count, write_count + 1)
+
+    # Writes are no longer deferred
+    cfg.Update(node, None)
+    self.assertEqual(cfg.write_count, write_count + 2)
+
   def testUpgradeSave(self):
     """Test that any modification done during upgrading is saved back"""
     cfg = self._get_object()
@@ -197,6 +197,89 @@ class TestHooksRunner(unittest.TestCase):
                            [(self._rname(fname), HKR_SUCCESS, env_exp)])
 
 
+  def testParallel(self):
+    hr = backend.HooksRunner(hooks_base_dir=self.tmpdir, max_parallel=3)
+    for phase in (constants.HOOKS_PHASE_PRE, constants.HOOKS_PHASE_POST):
+      expect = []
+      for (fbase, ecode, rs) in [("00succ", 0, HKR_SUCCESS),
+                                 ("10fail", 1, HKR_FAIL),
+                                 ("20inv.", 0, HKR_SKIP),
+                                 ("30succ", 0, HKR_SUCCESS),
+                                 ]:
+        fname = "%s/%s" % (self.ph_dirs[phase], fbase)
+        f = open(fname, "w")
+        f.write("#!/bin/sh\nexit %d\n" % ecode)
+        f.close()
+        self.torm.append((fname, False))
+        os.chmod(fname, 0700)
+        expect.append((self._rname(fname), rs, ""))
+      self.assertEqual(hr.RunHooks(self.hpath, phase, {}), expect)
+
+  def testManifest(self):
+    self.assertEqual(self.hr.GetManifest(), [])
+
+    # Not runnable
+    fname = "%s/10inv." % self.ph_dirs[constants.HOOKS_PHASE_PRE]
+    os.symlink("/bin/true", fname)
+    self.torm.append((fname, False))
+    self.assertEqual(self.hr.GetManifest(), [])
+
+    for name in ["20succ", "30succ"]:
+      fname = "%s/%s" % (self.ph_dirs[constants.HOOKS_PHASE_POST], name)
+      os.symlink("/bin/true", fname)
+      self.torm.append((fname, False))
+    self.assertEqual(self.hr.GetManifest(), ["%s-post.d" % self.hpath])
+
+  def testManifestNoBaseDir(self):
+    hr = backend.HooksRunner(hooks_base_dir="%s/nonexistent" % self.tmpdir)
+    self.assertEqual(hr.GetManifest(), [])
+
+
+class TestHooksManifestCache(unittest.TestCase):
+  def setUp(self):
+    self.clock = testutils.FakeClock()
+    self.cache = hooksmaster.HooksManifestCache(60, _time_fn=self.clock)
+    self.manifests = {
+      "node1": ["instance-start-pre.d"],
+      "node2": ["instance-start-post.d"],
+      "node3": [],
+      }
+    self.calls = []
+
+  def _GetManifests(self, node_names):
+    self.calls.append(sorted(node_names))
+    return dict((name, self.manifests[name]) for name in node_names
+                if name in self.manifests)
+
+  def _Filter(self, phase):
+    return self.cache.FilterNodes(self._GetManifests,
+                                  ["node1", "node2", "node3", "node4"],
+                                  "instance-start", phase)
+
+  def test(self):
+    self.assertEqual(self._Filter(constants.HOOKS_PHASE_PRE),
+                     ["node1", "node4"])
+    self.assertEqual(self._Filter(constants.HOOKS_PHASE_POST),
+                     ["node2", "node4"])
+
+    # The manifest of node4 couldn't be retrieved, so it's always asked for
+    self.assertEqual(self.calls, [["node1", "node2", "node3", "node4"],
+                                  ["node4"]])
+
+  def testExpire(self):
+    self.assertEqual(self._Filter(constants.HOOKS_PHASE_PRE),
+                     ["node1", "node4"])
+
+    self.manifests["node3"] = ["instance-start-pre.d"]
+    self.clock.now += 30
+    self.assertEqual(self._Filter(constants.HOOKS_PHASE_PRE),
+                     ["node1", "node4"])
+
+    self.clock.now += 30
+    self.assertEqual(self._Filter(constants.HOOKS_PHASE_PRE),
+                     ["node1", "node3", "node4"])
+
+
 def FakeHooksRpcSuccess(node_list, hpath, phase, env):
   """Fake call_hooks_runner function.
 
@@ -26,8 +26,10 @@ import tempfile
 import unittest
 import socket
 import os
+import shutil
 import struct
 import re
+import mock
 
 from ganeti import serializer
 from ganeti import constants
@@ -199,6 +201,268 @@ class TestQmp(testutils.GanetiTestCase):
       self.assertEqual(response, msg)
 
 
+class TestQmpSessionManager(testutils.GanetiTestCase):
+  def setUp(self):
+    testutils.GanetiTestCase.setUp(self)
+    self.tmpdir = tempfile.mkdtemp()
+    self.socket_filename = utils.PathJoin(self.tmpdir, "qmp")
+
+  def tearDown(self):
+    testutils.GanetiTestCase.tearDown(self)
+    shutil.rmtree(self.tmpdir)
+
+  def testReuseConnection(self):
+    server_responses = [
+      '{"return": {"running": true, "singlestep": false}}\r\n',
+      '{"event": "RESUME", "timestamp": {}}\r\n'
+      '{"return": "QEMU 1.7.0 monitor"}\r\n',
+      ]
+
+    # The stub only accepts a single connection
+    qmp_stub = QmpStub(self.socket_filename, server_responses)
+    qmp_stub.start()
+
+    manager = hv_kvm.QmpSessionManager()
+    response = manager.Execute(self.socket_filename, "query-status")
+    self.assertEqual(response[hv_kvm.QmpConnection.RETURN_KEY],
+                     {"running": True, "singlestep": False})
+    response = manager.Execute(self.socket_filename, "human-monitor-command",
+                               {"command-line": "info version"})
+    self.assertEqual(response[hv_kvm.QmpConnection.RETURN_KEY],
+                     "QEMU 1.7.0 monitor")
+
+    manager.Close(self.socket_filename)
+    qmp_stub.join()
+
+  def testMissingSocket(self):
+    manager = hv_kvm.QmpSessionManager()
+    self.assertRaises(errors.HypervisorError, manager.Execute,
+                      self.socket_filename, "query-status")
+
+  def testIsAlive(self):
+    qmp = hv_kvm.QmpConnection(self.socket_filename)
+    self.assertFalse(qmp.IsAlive())
+
+    (qmp.sock, peer) = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    qmp._connected = True
+    self.assertTrue(qmp.IsAlive())
+
+    # Pending data doesn't make the connection unusable
+    peer.send('{"event": "STOP"}\r\n')
+    self.assertTrue(qmp.IsAlive())
+    qmp.sock.recv(4096)
+
+    peer.close()
+    self.assertFalse(qmp.IsAlive())
+    qmp.close()
+
+
+class TestInstanceInfoCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+    class _KVMHypervisor(hv_kvm.KVMHypervisor):
+      _INSTANCE_INFO_CACHE_FILE = utils.PathJoin(self.tmpdir, "info.json")
+
+    self.hv = _KVMHypervisor
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _GetHv(self, info_fn):
+    pids_dir = utils.PathJoin(self.tmpdir, "pid")
+    os.mkdir(pids_dir)
+    for name in ["inst1.example.com", "inst2.example.com"]:
+      utils.WriteFile(utils.PathJoin(pids_dir, name), data="")
+
+    class _KVMHypervisor(self.hv):
+      _PIDS_DIR = pids_dir
+
+      def __init__(self):
+        # Skip creating the hypervisor's directories
+        pass
+
+      def GetInstanceInfo(self, instance_name, hvparams=None):
+        return info_fn(instance_name)
+
+    return _KVMHypervisor()
+
+  def testGetAllInstancesInfo(self):
+    def _GetInfo(name):
+      if name == "inst2.example.com":
+        raise errors.HypervisorError("Instance was shut down")
+      return (name, 1234, 1024, 2, "running", 0)
+
+    info_fn = testutils.CallCounter(_GetInfo)
+    hv = self._GetHv(info_fn)
+    expected = [("inst1.example.com", 1234, 1024, 2, "running", 0)]
+    self.assertEqual(hv.GetAllInstancesInfo(), expected)
+    self.assertEqual(info_fn.Count(), 2)
+
+    # The cached result is used until invalidated
+    self.assertEqual(hv.GetAllInstancesInfo(), expected)
+    self.assertEqual(info_fn.Count(), 2)
+    self.hv._InstanceInfoCache().Invalidate()
+    self.assertEqual(hv.GetAllInstancesInfo(), expected)
+    self.assertEqual(info_fn.Count(), 4)
+
+  def testGetAllInstancesInfoUnexpectedError(self):
+    def _GetInfo(name):
+      if name == "inst2.example.com":
+        raise ValueError("Unexpected error")
+      return (name, 1234, 1024, 2, "running", 0)
+
+    hv = self._GetHv(_GetInfo)
+    self.assertRaises(errors.HypervisorError, hv.GetAllInstancesInfo)
+    self.assertTrue(self.hv._InstanceInfoCache().Get() is None)
+
+
+class TestTrackedState(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.ctrl_dir = utils.PathJoin(self.tmpdir, "ctrl")
+    self.pids_dir = utils.PathJoin(self.tmpdir, "pid")
+    os.mkdir(self.ctrl_dir)
+    os.mkdir(self.pids_dir)
+
+    class _KVMHypervisor(hv_kvm.KVMHypervisor):
+      _CTRL_DIR = self.ctrl_dir
+      _CONF_DIR = self.ctrl_dir
+      _PIDS_DIR = self.pids_dir
+
+    self.hv = _KVMHypervisor
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _WriteState(self, name, state):
+    utils.WriteFile(self.hv._InstanceStateFile(name), data="%s\n" % state)
+
+  def testGetTrackedState(self):
+    self.assertTrue(self.hv._GetTrackedState("inst1.example.com",
+                                             kvmd_alive=True) is None)
+    self._WriteState("inst1.example.com", "paused")
+    self.assertEqual(self.hv._GetTrackedState("inst1.example.com",
+                                              kvmd_alive=True), "paused")
+    self.assertTrue(self.hv._GetTrackedState("inst1.example.com",
+                                             kvmd_alive=False) is None)
+    utils.WriteFile(self.hv._InstanceStateFile("inst2.example.com"), data="")
+    self.assertTrue(self.hv._GetTrackedState("inst2.example.com",
+                                             kvmd_alive=True) is None)
+
+  @mock.patch("ganeti.utils.IsDaemonAlive", return_value=True)
+  def testListInstances(self, _):
+    for (name, state) in [("inst1.example.com", "running"),
+                          ("inst2.example.com", "migrating"),
+                          ("inst3.example.com", "shutdown"),
+                          ("inst4.example.com", None)]:
+      utils.WriteFile(self.hv._InstancePidFile(name), data="0\n")
+      if state is not None:
+        self._WriteState(name, state)
+
+    hv = self.hv()
+    with mock.patch.object(self.hv, "_InstancePidAlive",
+                           return_value=(None, 0, False)) as pid_alive_fn:
+      self.assertEqual(sorted(hv.ListInstances()),
+                       ["inst1.example.com", "inst2.example.com"])
+    # Only instances not tracked as alive by the KVM daemon are inspected
+    self.assertEqual(sorted(call[0][0]
+                            for call in pid_alive_fn.call_args_list),
+                     ["inst3.example.com", "inst4.example.com"])
+
+  def testUserShutdownDisabled(self):
+    name = "inst1.example.com"
+    utils.WriteFile(self.hv._InstanceShutdownMonitor(name), data="")
+    self.assertFalse(self.hv._IsUserShutdown(name))
+
+    for (user_shutdown, expected) in [(False, False), (True, True)]:
+      runtime = serializer.DumpJson([["kvm"], [], {
+        constants.HV_KVM_USER_SHUTDOWN: user_shutdown,
+        }, []])
+      utils.WriteFile(self.hv._InstanceKVMRuntime(name), data=runtime)
+      self.assertEqual(self.hv._IsUserShutdown(name), expected)
+
+
+class TestKVMOutputCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.kvm_path = utils.PathJoin(self.tmpdir, "kvm")
+    self.emulator_path = utils.PathJoin(self.tmpdir, "qemu")
+    self.counter = utils.PathJoin(self.tmpdir, "counter")
+
+    class _KVMHypervisor(hv_kvm.KVMHypervisor):
+      _KVM_OUTPUT_CACHE_FILE = utils.PathJoin(self.tmpdir, "output.json")
+
+    self.hv = _KVMHypervisor
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _WriteKvm(self, version, path=None):
+    if path is None:
+      path = self.kvm_path
+    utils.WriteFile(path, mode=0700,
+                    data=("#!/bin/sh\n"
+                          "echo >> %s\n"
+                          "echo \"QEMU emulator version %s\"\n" %
+                          (self.counter, version)))
+
+  def _GetRuns(self):
+    return len(utils.ReadFile(self.counter).splitlines())
+
+  def test(self):
+    self._WriteKvm("1.7.0")
+    for _ in range(3):
+      output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+      self.assertEqual(output, "QEMU emulator version 1.7.0\n")
+    self.assertEqual(self._GetRuns(), 1)
+
+    # Other options are cached separately
+    self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_MLIST)
+    self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_MLIST)
+    self.assertEqual(self._GetRuns(), 2)
+
+    # Replacing the binary invalidates the cache
+    self._WriteKvm("2.0.10")
+    output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+    self.assertEqual(output, "QEMU emulator version 2.0.10\n")
+    self.assertEqual(self._GetRuns(), 3)
+
+  def testNoProcessOnHit(self):
+    self._WriteKvm("1.7.0")
+    self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+
+    with mock.patch("ganeti.utils.RunCmd",
+                    side_effect=AssertionError("kvm was run")):
+      output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+    self.assertEqual(output, "QEMU emulator version 1.7.0\n")
+
+  def testSymlink(self):
+    os.symlink(self.emulator_path, self.kvm_path)
+    self._WriteKvm("1.7.0", path=self.emulator_path)
+    for _ in range(2):
+      output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+      self.assertEqual(output, "QEMU emulator version 1.7.0\n")
+    self.assertEqual(self._GetRuns(), 1)
+
+    # Replacing the binary the link points to invalidates the cache
+    self._WriteKvm("2.0.10", path=self.emulator_path)
+    output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+    self.assertEqual(output, "QEMU emulator version 2.0.10\n")
+    self.assertEqual(self._GetRuns(), 2)
+
+  def testCorruptCache(self):
+    self._WriteKvm("1.7.0")
+    utils.WriteFile(self.hv._KVM_OUTPUT_CACHE_FILE, data="[1, 2")
+    output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+    self.assertEqual(output, "QEMU emulator version 1.7.0\n")
+
+    utils.WriteFile(self.hv._KVM_OUTPUT_CACHE_FILE,
+                    data=serializer.DumpJson({self.kvm_path: []}))
+    output = self.hv._GetKVMOutput(self.kvm_path, self.hv._KVMOPT_HELP)
+    self.assertEqual(output, "QEMU emulator version 1.7.0\n")
+
+
 class TestConsole(unittest.TestCase):
   def _Test(self, instance, node, group, hvparams):
     cons = hv_kvm.KVMHypervisor.GetInstanceConsole(instance, node, group,
@@ -440,6 +704,200 @@ class TestGetRuntimeInfo(unittest.TestCase):
     (devinfo, _, __) = hv_kvm._GetExistingDeviceInfo(target, device, runtime)
     self.assertTrue(devinfo.pci==5)
 
+  def testPlacement(self):
+    runtime = self._GetRuntime()
+    self.assertEqual(runtime[hv_kvm._KVM_PLACEMENT_RUNTIME_INDEX], None)
+
+    placement = {"node": 1, "cpus": [4, 5]}
+    data = serializer.Load(testutils.ReadTestData("kvm_runtime.json"))
+    data.append(placement)
+    runtime = hv_kvm._AnalyzeSerializedRuntime(serializer.Dump(data))
+    self.assertEqual(runtime[hv_kvm._KVM_PLACEMENT_RUNTIME_INDEX], placement)
+
+
+class TestPinnedCpuLoad(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+    class _KVMHypervisor(hv_kvm.KVMHypervisor):
+      _CONF_DIR = self.tmpdir
+
+    self.hv = _KVMHypervisor()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _WriteRuntime(self, name, placement):
+    data = serializer.Load(testutils.ReadTestData("kvm_runtime.json"))
+    data.append(placement)
+    utils.WriteFile(self.hv._InstanceKVMRuntime(name),
+                    data=serializer.Dump(data))
+
+  def testGetPinnedCpuLoad(self):
+    # Instances are counted whether or not they're running already
+    self._WriteRuntime("inst1.example.com", {"node": 0, "cpus": [0, 1]})
+    self._WriteRuntime("inst2.example.com", {"node": 0, "cpus": [1, 2]})
+    self._WriteRuntime("inst3.example.com", None)
+    utils.WriteFile(utils.PathJoin(self.tmpdir, "inst4.example.com.serial"),
+                    data="")
+
+    self.assertEqual(self.hv._GetPinnedCpuLoad(), {0: 1, 1: 2, 2: 1})
+    self.assertEqual(self.hv._GetPinnedCpuLoad(exclude="inst2.example.com"),
+                     {0: 1, 1: 1})
+
+  def testPlaceAndSaveLocked(self):
+    def _Place(_, kvm_runtime):
+      self.assertTrue(hv_kvm._placement_lock.locked())
+      return kvm_runtime
+
+    def _Save(*_):
+      self.assertTrue(hv_kvm._placement_lock.locked())
+
+    with mock.patch.object(self.hv, "_PlaceInstance", side_effect=_Place):
+      with mock.patch.object(self.hv, "_SaveKVMRuntime",
+                             side_effect=_Save) as save_fn:
+        self.assertEqual(self.hv._PlaceAndSaveKVMRuntime(None, "runtime"),
+                         "runtime")
+    self.assertEqual(save_fn.call_count, 1)
+    self.assertFalse(hv_kvm._placement_lock.locked())
+
+
+class TestQmpMigration(unittest.TestCase):
+  def setUp(self):
+    class _KVMHypervisor(hv_kvm.KVMHypervisor):
+      _DIRS = []
+
+    self.hv = _KVMHypervisor()
+    self.hvparams = {
+      constants.HV_MIGRATION_BANDWIDTH: 32,
+      constants.HV_MIGRATION_DOWNTIME: 30,
+      constants.HV_KVM_MIGRATION_CAPS: "auto-converge:postcopy-ram",
+      constants.HV_KVM_MIGRATION_ESCALATION: True,
+      }
+    self.commands = []
+    self.capabilities = [{"capability": "auto-converge", "state": False},
+                         {"capability": "xbzrle", "state": False}]
+
+  def _Execute(self, _, command, arguments=None):
+    self.commands.append((command, arguments))
+    if command == "query-migrate-capabilities":
+      return hv_kvm.QmpMessage({"return": self.capabilities})
+    elif command == "migrate-set-parameters" and self.old_qemu:
+      raise hv_kvm.QmpCommandError("Invalid parameter", "GenericError")
+    return hv_kvm.QmpMessage({"return": {}})
+
+  def testParseStatus(self):
+    fn = hv_kvm._ParseQmpMigrationStatus
+    self.assertTrue(fn({"status": "none"}) is None)
+    self.assertEqual(fn({"status": "setup"}).status,
+                     constants.HV_MIGRATION_ACTIVE)
+    self.assertEqual(fn({"status": "failed"}).status,
+                     constants.HV_MIGRATION_FAILED)
+
+    ms = fn({
+      "status": "active",
+      "ram": {
+        "transferred": 2048 * 1024,
+        "remaining": 1024 * 1024,
+        "total": 4096 * 1024,
+        "dirty-pages-rate": 1500,
+        "dirty-sync-count": 3,
+        },
+      })
+    self.assertEqual(ms.status, constants.HV_MIGRATION_ACTIVE)
+    self.assertEqual((ms.transferred_ram, ms.remaining_ram, ms.total_ram),
+                     (2048, 1024, 4096))
+    self.assertEqual((ms.dirty_rate, ms.iterations), (1500, 3))
+
+    ms = fn({
+      "status": "postcopy-active",
+      "ram": {"transferred": 0, "remaining": 0, "total": 0},
+      })
+    self.assertEqual(ms.status, constants.HV_MIGRATION_ACTIVE)
+    self.assertTrue(ms.dirty_rate is None)
+    self.assertTrue(ms.iterations is None)
+
+  def testEscalationStep(self):
+    fn = self.hv._GetMigrationEscalationStep
+    self.assertEqual([fn(i) for i in range(12)],
+                     [0, 0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4])
+
+  def testSetCapabilities(self):
+    with mock.patch.object(hv_kvm._qmp_sessions, "Execute",
+                           side_effect=self._Execute):
+      self.hv._SetMigrationCapabilities("inst1.example.com", self.hvparams)
+    # Unsupported capabilities are skipped
+    self.assertEqual(self.commands[-1], ("migrate-set-capabilities", {
+      "capabilities": [{"capability": "auto-converge", "state": True}],
+      }))
+
+  def testSetParameters(self):
+    for old_qemu in [False, True]:
+      self.old_qemu = old_qemu
+      self.commands = []
+      with mock.patch.object(hv_kvm._qmp_sessions, "Execute",
+                             side_effect=self._Execute):
+        self.hv._SetMigrationParameters("inst1.example.com", self.hvparams, 2)
+      bandwidth = 4 * 32 * 1024 * 1024
+      if old_qemu:
+        self.assertEqual(self.commands[1:], [
+          ("migrate_set_speed", {"value": bandwidth}),
+          ("migrate_set_downtime", {"value": 0.12}),
+          ])
+      else:
+        self.assertEqual(self.commands, [
+          ("migrate-set-parameters", {"max-bandwidth": bandwidth,
+                                      "downtime-limit": 120}),
+          ])
+
+  def testEscalatePostcopy(self):
+    instance = objects.Instance(name="inst1.example.com",
+                                hvparams=self.hvparams)
+    self.old_qemu = False
+    with mock.patch.object(hv_kvm._qmp_sessions, "Execute",
+                           side_effect=self._Execute):
+      self.hv._EscalateMigration(instance, "active", 13)
+      self.assertFalse("migrate-start-postcopy" in
+                       [cmd for (cmd, _) in self.commands])
+
+      self.capabilities.append({"capability": "postcopy-ram", "state": True})
+      self.hv._EscalateMigration(instance, "active", 13)
+      self.assertEqual(self.commands[-1], ("migrate-start-postcopy", None))
+
+      self.commands = []
+      self.hv._EscalateMigration(instance, "active", 2)
+      self.assertEqual(self.commands, [])
+
+
+class TestComputePlacement(unittest.TestCase):
+  _NODES = [
+    {"id": 0, "memory_total": 8192, "memory_free": 2048, "cpus": [0, 1, 2, 3]},
+    {"id": 1, "memory_total": 8192, "memory_free": 4096, "cpus": [4, 5, 6, 7]},
+    {"id": 2, "memory_total": 1024, "memory_free": 1024, "cpus": []},
+    ]
+
+  def testMostFreeMemory(self):
+    self.assertEqual(hv_kvm._ComputePlacement(self._NODES, 2, 1024, {}),
+                     {"node": 1, "cpus": [4, 5]})
+
+  def testLeastLoaded(self):
+    cpu_load = {4: 1, 5: 1, 6: 1, 0: 2}
+    self.assertEqual(hv_kvm._ComputePlacement(self._NODES, 2, 1024, cpu_load),
+                     {"node": 0, "cpus": [1, 2]})
+    cpu_load = {4: 1, 5: 1, 6: 1, 0: 4}
+    self.assertEqual(hv_kvm._ComputePlacement(self._NODES, 2, 1024, cpu_load),
+                     {"node": 1, "cpus": [4, 7]})
+
+  def testMemory(self):
+    cpu_load = {4: 1, 5: 1, 6: 1, 7: 1}
+    self.assertEqual(hv_kvm._ComputePlacement(self._NODES, 2, 3072, cpu_load),
+                     {"node": 1, "cpus": [4, 5]})
+
+  def testDoesNotFit(self):
+    self.assertEqual(hv_kvm._ComputePlacement(self._NODES, 2, 8192, {}), None)
+    self.assertEqual(hv_kvm._ComputePlacement(self._NODES, 6, 1024, {}), None)
+    self.assertEqual(hv_kvm._ComputePlacement([], 1, 128, {}), None)
+
 
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -217,8 +217,10 @@ class TestParseNodeInfo(testutils.GanetiTestCase):
     data = testutils.ReadTestData("xen-xm-info-4.0.1.txt")
     result = hv_xen._ParseNodeInfo(data)
     self.assertEqual(result, {
+      "cpu_cores_per_socket": 2,
       "cpu_nodes": 1,
       "cpu_sockets": 2,
+      "cpu_threads_per_core": 1,
       "cpu_total": 4,
       "hv_version": (4, 0),
       "memory_free": 8004,
@@ -251,8 +253,10 @@ class TestMergeInstanceInfo(testutils.GanetiTestCase):
     instance_list = self._FakeXmList(True)
     result = hv_xen._GetNodeInfo(info, instance_list)
     self.assertEqual(result, {
+      "cpu_cores_per_socket": 2,
       "cpu_nodes": 1,
       "cpu_sockets": 2,
+      "cpu_threads_per_core": 1,
       "cpu_total": 4,
       "cpu_dom0": 7,
       "hv_version": (4, 0),
@@ -554,7 +558,10 @@ class _TestXenHypervisor(object):
     shutil.rmtree(self.tmpdir)
 
   def _GetHv(self, run_cmd=NotImplemented):
-    return self.TARGET(_cfgdir=self.tmpdir, _run_cmd_fn=run_cmd, _cmd=self.CMD)
+    # Every hypervisor object gets its own cache of the list of domains
+    cachedir = tempfile.mkdtemp(dir=self.tmpdir)
+    return self.TARGET(_cfgdir=self.tmpdir, _run_cmd_fn=run_cmd, _cmd=self.CMD,
+                       _cache_file=utils.PathJoin(cachedir, "list.json"))
 
   def _SuccessCommand(self, stdout, cmd):
     self.assertEqual(cmd[0], self.CMD)
@@ -662,6 +669,35 @@ class _TestXenHypervisor(object):
       "testinstance.example.com",
       ])
 
+  def testInstanceListCache(self):
+    run_cmd = testutils.CallCounter(self._XenList)
+    hv = self._GetHv(run_cmd=run_cmd)
+
+    self.assertEqual(len(hv.ListInstances()), 3)
+    self.assertEqual(hv.GetInstanceInfo(hv_xen._DOM0_NAME)[1], 0)
+    self.assertEqual(hv.GetInstanceInfo("server01.example.com")[1], 1)
+    self.assertEqual(len(hv.GetAllInstancesInfo()), 3)
+    self.assertEqual(run_cmd.Count(), 1)
+
+    hv._instance_list_cache.Invalidate()
+    self.assertEqual(len(hv.ListInstances()), 3)
+    self.assertEqual(run_cmd.Count(), 2)
+
+  def testInstanceListCacheExpiry(self):
+    hv = self._GetHv()
+    instance_list = [["Domain-0", 0, 1023, 1, hv_base.HvInstanceState.RUNNING,
+                      154706.1]]
+
+    cache = hv._instance_list_cache
+    self.assertTrue(cache.Get(key=self.CMD) is None)
+
+    cache.Put(instance_list, key=self.CMD, _now=100.0)
+    self.assertEqual(cache.Get(key=self.CMD, _now=101.0), instance_list)
+
+    # Expired, or retrieved with another command
+    self.assertTrue(cache.Get(key=self.CMD, _now=110.0) is None)
+    self.assertTrue(cache.Get(key="other", _now=101.0) is None)
+
   def _StartInstanceCommand(self, inst, paused, failcreate, cmd):
     if cmd == [self.CMD, "info"]:
       output = testutils.ReadTestData("xen-xm-info-4.0.1.txt")
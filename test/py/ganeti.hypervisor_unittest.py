@@ -21,12 +21,16 @@
 
 """Script for testing hypervisor functionality"""
 
+import os
+import shutil
+import tempfile
 import unittest
 
 from ganeti import constants
 from ganeti import compat
 from ganeti import objects
 from ganeti import errors
+from ganeti import utils
 from ganeti import hypervisor
 from ganeti.hypervisor import hv_base
 
@@ -57,10 +61,91 @@ class TestBase(unittest.TestCase):
     self.assertEqual(fn(["a"]), "a")
     self.assertEqual(fn(["a", "b"]), "a; b")
 
-  def testGetLinuxNodeInfo(self):
-    meminfo = testutils.TestDataFilename("proc_meminfo.txt")
-    cpuinfo = testutils.TestDataFilename("proc_cpuinfo.txt")
-    result = hv_base.BaseHypervisor.GetLinuxNodeInfo(meminfo, cpuinfo)
+
+
+class TestTimedFileCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.cache = hv_base.TimedFileCache(utils.PathJoin(self.tmpdir,
+                                                       "cache.json"), 3.0)
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def test(self):
+    data = [["inst1.example.com", 1234], ["inst2.example.com", -1]]
+
+    self.assertTrue(self.cache.Get(_now=100.0) is None)
+
+    self.cache.Put(data, _now=100.0)
+    self.assertEqual(self.cache.Get(_now=100.0), data)
+    self.assertEqual(self.cache.Get(_now=102.0), data)
+
+    # Expired, or written in the future
+    self.assertTrue(self.cache.Get(_now=110.0) is None)
+    self.assertTrue(self.cache.Get(_now=90.0) is None)
+
+    self.cache.Invalidate()
+    self.assertTrue(self.cache.Get(_now=100.0) is None)
+
+  def testKey(self):
+    self.cache.Put("data", key="xl", _now=100.0)
+    self.assertEqual(self.cache.Get(key="xl", _now=101.0), "data")
+    self.assertTrue(self.cache.Get(key="xm", _now=101.0) is None)
+    self.assertTrue(self.cache.Get(_now=101.0) is None)
+
+  def testCorrupt(self):
+    utils.WriteFile(self.cache.filename, data="{\"timest")
+    self.assertTrue(self.cache.Get() is None)
+
+    utils.WriteFile(self.cache.filename, data="[]")
+    self.assertTrue(self.cache.Get() is None)
+
+  def testUnwritable(self):
+    cache = hv_base.TimedFileCache(utils.PathJoin(self.tmpdir, "missing",
+                                                  "cache.json"), 3.0)
+    cache.Put("data")
+    self.assertTrue(cache.Get() is None)
+
+
+class TestGetLinuxNodeInfo(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.meminfo = testutils.TestDataFilename("proc_meminfo.txt")
+    self.cpuinfo = testutils.TestDataFilename("proc_cpuinfo.txt")
+    self.nodedir = utils.PathJoin(self.tmpdir, "node")
+    self.cpudir = utils.PathJoin(self.tmpdir, "cpu")
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _GetNodeInfo(self):
+    return hv_base.BaseHypervisor.GetLinuxNodeInfo(self.meminfo, self.cpuinfo,
+                                                   self.nodedir, self.cpudir)
+
+  def _AddCpu(self, cpu, package, core):
+    path = utils.PathJoin(self.cpudir, "cpu%s" % cpu, "topology")
+    os.makedirs(path)
+    utils.WriteFile(utils.PathJoin(path, "physical_package_id"),
+                    data="%s\n" % package)
+    utils.WriteFile(utils.PathJoin(path, "core_id"), data="%s\n" % core)
+
+  def _AddNumaNode(self, node, cpulist, total, free, hp_total, hp_free):
+    path = utils.PathJoin(self.nodedir, "node%s" % node)
+    os.makedirs(path)
+    utils.WriteFile(utils.PathJoin(path, "cpulist"), data="%s\n" % cpulist)
+    utils.WriteFile(utils.PathJoin(path, "meminfo"), data="\n".join([
+      "Node %s MemTotal:       %s kB" % (node, total),
+      "Node %s MemFree:        %s kB" % (node, free),
+      "Node %s MemUsed:        %s kB" % (node, total - free),
+      "Node %s HugePages_Total:  %s" % (node, hp_total),
+      "Node %s HugePages_Free:   %s" % (node, hp_free),
+      "Node %s HugePages_Surp:      0" % node,
+      "",
+      ]))
+
+  def testWithoutSysfs(self):
+    result = self._GetNodeInfo()
 
     self.assertEqual(result["memory_total"], 7686)
     self.assertEqual(result["memory_free"], 6272)
@@ -68,6 +153,64 @@ class TestBase(unittest.TestCase):
     self.assertEqual(result["cpu_total"], 4)
     self.assertEqual(result["cpu_nodes"], 1)
     self.assertEqual(result["cpu_sockets"], 1)
+    self.assertEqual(result["hugepages_total"], 0)
+    self.assertEqual(result["hugepages_free"], 0)
+    for key in ["cpu_cores_per_socket", "cpu_threads_per_core", "numa_nodes"]:
+      self.assertFalse(key in result)
+
+  def testTopology(self):
+    # Two sockets with two hyper-threaded cores each
+    for cpu in range(8):
+      self._AddCpu(cpu, cpu / 4, cpu % 2)
+    # Offline CPUs don't have a topology directory
+    os.makedirs(utils.PathJoin(self.cpudir, "cpu8"))
+    os.makedirs(utils.PathJoin(self.cpudir, "cpufreq"))
+
+    self._AddNumaNode(0, "0-3", 4096 * 1024, 1024 * 1024, 512, 256)
+    self._AddNumaNode(1, "4-7", 4096 * 1024, 2048 * 1024, 0, 0)
+    os.makedirs(utils.PathJoin(self.nodedir, "power"))
+
+    result = self._GetNodeInfo()
+
+    self.assertEqual(result["cpu_sockets"], 2)
+    self.assertEqual(result["cpu_cores_per_socket"], 2)
+    self.assertEqual(result["cpu_threads_per_core"], 2)
+    self.assertEqual(result["cpu_nodes"], 2)
+    self.assertEqual(result["numa_nodes"], [
+      {"id": 0, "memory_total": 4096, "memory_free": 1024,
+       "cpus": [0, 1, 2, 3], "hugepages_total": 1024, "hugepages_free": 512},
+      {"id": 1, "memory_total": 4096, "memory_free": 2048,
+       "cpus": [4, 5, 6, 7], "hugepages_total": 0, "hugepages_free": 0},
+      ])
+
+  def testMemoryOnlyNumaNode(self):
+    self._AddNumaNode(0, "0-3", 1024 * 1024, 512 * 1024, 0, 0)
+    self._AddNumaNode(1, "", 1024 * 1024, 1024 * 1024, 0, 0)
+
+    result = self._GetNodeInfo()
+
+    self.assertEqual(result["cpu_nodes"], 2)
+    self.assertEqual(result["numa_nodes"][1]["cpus"], [])
+
+  def testBrokenNumaNode(self):
+    self._AddNumaNode(0, "0-3", 1024 * 1024, 512 * 1024, 0, 0)
+    path = utils.PathJoin(self.nodedir, "node1")
+    os.makedirs(path)
+    utils.WriteFile(utils.PathJoin(path, "cpulist"), data="4-7\n")
+    utils.WriteFile(utils.PathJoin(path, "meminfo"),
+                    data="Node 1 MemTotal: 1024 kB\n")
+
+    # No NUMA topology is reported rather than an incomplete one
+    result = self._GetNodeInfo()
+    self.assertEqual(result["cpu_nodes"], 1)
+    self.assertFalse("numa_nodes" in result)
+
+  def testUnreadableNumaNode(self):
+    os.makedirs(utils.PathJoin(self.nodedir, "node0"))
+
+    result = self._GetNodeInfo()
+    self.assertEqual(result["cpu_nodes"], 1)
+    self.assertFalse("numa_nodes" in result)
 
 
 if __name__ == "__main__":
@@ -44,6 +44,7 @@ from ganeti import jqueue
 from ganeti import opcodes
 from ganeti import compat
 from ganeti import mcpu
+from ganeti import objects
 from ganeti import query
 from ganeti import workerpool
 
@@ -304,6 +305,7 @@ class TestQueuedOpCode(unittest.TestCase):
       self.assert_(op.start_timestamp is None)
       self.assert_(op.exec_timestamp is None)
       self.assert_(op.end_timestamp is None)
+      self.assert_(op.profile is None)
       self.assert_(op.result is None)
       self.assertEqual(op.status, constants.OP_STATUS_QUEUED)
 
@@ -313,6 +315,21 @@ class TestQueuedOpCode(unittest.TestCase):
     _Check(op2)
     self.assertEqual(op1.Serialize(), op2.Serialize())
 
+  def testProfile(self):
+    op1 = jqueue._QueuedOpCode(opcodes.OpTestDelay())
+    op1.profile = {
+      "lock/cluster": 0.5,
+      "exec": 2.0,
+      }
+    op2 = jqueue._QueuedOpCode.Restore(op1.Serialize())
+    self.assertEqual(op2.profile, op1.profile)
+    self.assertEqual(op1.Serialize(), op2.Serialize())
+
+    # Jobs written by older versions have no profile
+    state = op1.Serialize()
+    del state["profile"]
+    self.assert_(jqueue._QueuedOpCode.Restore(state).profile is None)
+
   def testPriority(self):
     def _Check(op):
       assert constants.OP_PRIO_DEFAULT != constants.OP_PRIO_HIGH, \
@@ -716,6 +733,7 @@ class _FakeQueueForProc:
     self._updates = []
     self._submitted = []
     self._accepting_jobs = True
+    self._opcode_times = []
 
     self._submit_count = itertools.count(1000)
 
@@ -757,6 +775,10 @@ class _FakeQueueForProc:
   def AcceptingJobsUnlocked(self):
     return self._accepting_jobs
 
+  def RecordOpcodeTimes(self, lock_wait, exec_time):
+    assert not self._acquired, "Lock acquired while recording times"
+    self._opcode_times.append((lock_wait, exec_time))
+
 
 class _FakeExecOpCodeForProc:
   def __init__(self, queue, before_start, after_start):
@@ -883,6 +905,9 @@ class TestJobProcessor(unittest.TestCase, _JobProcessorTestUtils):
                        jqueue._JobProcessor.FINISHED)
       self.assertRaises(IndexError, queue.GetNextUpdate)
 
+    # Lock wait and execution times are reported for every opcode
+    self.assertEqual(len(queue._opcode_times), 1 + 3 + 10 + 100)
+
   def testOpcodeError(self):
     queue = _FakeQueueForProc()
 
@@ -2082,6 +2107,174 @@ class TestEvaluateJobProcessorResult(unittest.TestCase):
     self.assertRaises(IndexError, depmgr.GetNextNotification)
 
 
+class TestWorkerPoolPolicy(unittest.TestCase):
+  def setUp(self):
+    self.now = 1000.0
+    self.policy = jqueue._WorkerPoolPolicy(2, 10, _time_fn=self._GetTime)
+
+  def _GetTime(self):
+    return self.now
+
+  def testGrowWithBacklog(self):
+    # Idle pool stays at the minimum
+    self.assertEqual(self.policy.ComputeSize(2, 0, 0), 2)
+    self.assertEqual(self.policy.resizes, 0)
+
+    # Runnable jobs are waiting
+    self.assertEqual(self.policy.ComputeSize(2, 2, 3),
+                     2 + 3 + jqueue._AUTOSCALE_SPARE_WORKERS)
+    self.assertEqual(self.policy.resizes, 1)
+
+    # Never more than the maximum
+    self.assertEqual(self.policy.ComputeSize(7, 7, 100), 10)
+    self.assertEqual(self.policy.ComputeSize(10, 10, 100), 10)
+    self.assertEqual(self.policy.resizes, 2)
+
+  def testNoGrowthWhileWaitingForLocks(self):
+    self.policy.RecordOpcode(30.0, 10.0)
+    self.assertAlmostEqual(self.policy.GetLockWaitRatio(), 0.75)
+    self.assertEqual(self.policy.ComputeSize(4, 4, 20), 4)
+
+    # Opcodes spend most of their time executing again
+    self.policy.RecordOpcode(0.0, 60.0)
+    self.assertTrue(self.policy.GetLockWaitRatio() <
+                    jqueue._AUTOSCALE_MAX_LOCK_WAIT_RATIO)
+    self.assertEqual(self.policy.ComputeSize(4, 4, 20), 10)
+
+  def testTimesDecay(self):
+    self.assertEqual(self.policy.GetTimes(), (0.0, 0.0))
+    self.assertEqual(self.policy.GetLockWaitRatio(), 0.0)
+
+    self.policy.RecordOpcode(8.0, 4.0)
+    self.assertEqual(self.policy.GetTimes(), (8.0, 4.0))
+
+    self.now += jqueue._AUTOSCALE_HALF_LIFE
+    self.assertEqual(self.policy.GetTimes(), (4.0, 2.0))
+    self.assertAlmostEqual(self.policy.GetLockWaitRatio(), 2.0 / 3)
+
+    # Negative durations (e.g. due to clock changes) are ignored
+    self.policy.RecordOpcode(-10.0, 2.0)
+    self.assertEqual(self.policy.GetTimes(), (4.0, 4.0))
+
+  def testShrink(self):
+    self.assertEqual(self.policy.ComputeSize(2, 2, 8), 10)
+
+    # Too early to shrink
+    self.now += jqueue._AUTOSCALE_SHRINK_DELAY / 2
+    self.assertEqual(self.policy.ComputeSize(10, 1, 0), 10)
+
+    # Shrink to busy workers and spares
+    self.now += jqueue._AUTOSCALE_SHRINK_DELAY
+    self.assertEqual(self.policy.ComputeSize(10, 5, 0),
+                     5 + jqueue._AUTOSCALE_SPARE_WORKERS)
+    self.assertEqual(self.policy.resizes, 2)
+
+    # Busy workers are never stopped, even if there are jobs waiting and
+    # opcodes mostly wait for locks
+    self.now += jqueue._AUTOSCALE_SHRINK_DELAY
+    self.policy.RecordOpcode(100.0, 1.0)
+    self.assertEqual(self.policy.ComputeSize(7, 7, 3), 7)
+
+    # Never less than the minimum
+    self.assertEqual(self.policy.ComputeSize(7, 0, 0), 2)
+    self.assertEqual(self.policy.resizes, 3)
+
+
+class TestPickTask(unittest.TestCase):
+  def setUp(self):
+    self.free = set()
+    self.checked = []
+
+  def _Check(self, name):
+    self.checked.append(name)
+    return name in self.free
+
+  def testFirstAvailable(self):
+    tasks = [[0, 1, 10, ("a", )], [0, 2, 20, ("b", )], [0, 3, 30, ("c", )]]
+    skips = {}
+
+    self.free.update(["b", "c"])
+    self.assertEqual(jqueue._PickTask(tasks, self._Check, skips), 1)
+    self.assertEqual(self.checked, ["a", "b"])
+    self.assertEqual(skips, { 10: 1, })
+
+    # Chosen tasks are forgotten
+    self.free.add("a")
+    self.assertEqual(jqueue._PickTask(tasks, self._Check, skips), 0)
+    self.assertEqual(skips, {})
+
+  def testNoneAvailable(self):
+    tasks = [[0, 1, None, None], [0, 2, 20, ("b", )], [0, 3, 30, ("c", )]]
+    skips = {}
+
+    # Abandoned entries are ignored
+    self.assertEqual(jqueue._PickTask(tasks, self._Check, skips), 1)
+    self.assertEqual(self.checked, ["b", "c"])
+    self.assertEqual(skips, {})
+
+    self.assertEqual(jqueue._PickTask(tasks[:1], self._Check, skips), 0)
+
+  def testMaxSkips(self):
+    tasks = [[0, 1, 10, ("a", )], [0, 2, 20, ("b", )]]
+    skips = {}
+
+    self.free.add("b")
+
+    for _ in range(jqueue._SCHEDULER_MAX_SKIPS):
+      self.assertEqual(jqueue._PickTask(tasks, self._Check, skips), 1)
+
+    self.assertEqual(skips, { 10: jqueue._SCHEDULER_MAX_SKIPS, })
+
+    # Passed over too often
+    self.assertEqual(jqueue._PickTask(tasks, self._Check, skips), 0)
+    self.assertEqual(skips, {})
+
+
+class _FakeConfigForNodes:
+  def __init__(self, names):
+    self.calls = 0
+    self._nodes = dict(("uuid-%s" % name,
+                        objects.Node(uuid="uuid-%s" % name, name=name))
+                       for name in names)
+
+  def GetAllNodesInfo(self):
+    self.calls += 1
+    return self._nodes
+
+
+class TestGetNodeUuidFn(unittest.TestCase):
+  def test(self):
+    cfg = _FakeConfigForNodes(["node1.example.com", "node2.example.com",
+                               "node20.example.com"])
+    fn = jqueue._GetNodeUuidFn(cfg)
+
+    # Nodes are only read once they're needed
+    self.assertEqual(cfg.calls, 0)
+
+    self.assertEqual(fn("node1.example.com"), "uuid-node1.example.com")
+    self.assertEqual(fn("NODE2"), "uuid-node2.example.com")
+    self.assertEqual(fn("node20"), "uuid-node20.example.com")
+    self.assertEqual(fn("node3"), None)
+    self.assertEqual(cfg.calls, 1)
+
+
+class TestGetNextOpcode(unittest.TestCase, _JobProcessorTestUtils):
+  def test(self):
+    queue = _FakeQueueForProc()
+    ops = [opcodes.OpTestDummy(result="Res%s" % i, fail=False)
+           for i in range(3)]
+    job = self._CreateJob(queue, 29110, ops)
+
+    self.assertEqual(jqueue._GetNextOpcode(job), job.ops[0])
+
+    job.ops[0].status = constants.OP_STATUS_SUCCESS
+    self.assertEqual(jqueue._GetNextOpcode(job), job.ops[1])
+
+    for op in job.ops:
+      op.status = constants.OP_STATUS_SUCCESS
+    self.assertTrue(jqueue._GetNextOpcode(job) is None)
+
+
 class _FakeTimeoutStrategy:
   def __init__(self, timeouts):
     self.timeouts = timeouts
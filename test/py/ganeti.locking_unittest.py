@@ -265,6 +265,60 @@ class TestPipeCondition(_ConditionTestCase):
     self.assertRaises(Queue.Empty, self.done.get_nowait)
 
 
+class TestSingleNotifyLockCondition(TestSingleNotifyPipeCondition):
+  """SingleNotifyLockCondition tests"""
+
+  def setUp(self):
+    _ConditionTestCase.setUp(self, locking.SingleNotifyLockCondition)
+
+  def testNoFileDescriptors(self):
+    def _Wait():
+      self.cond.acquire()
+      self.done.put("A")
+      self.cond.wait(None)
+      self.cond.release()
+      self.done.put("W")
+
+    self._addThread(target=_Wait)
+    self._addThread(target=_Wait)
+    self.assertEqual(self.done.get(True, 1), "A")
+    self.assertEqual(self.done.get(True, 1), "A")
+
+    self.cond.acquire()
+    self.assertEqual(len(self.cond._waiter_locks), 2)
+    self.assertTrue(self.cond._read_fd is None)
+    self.assertTrue(self.cond._write_fd is None)
+    self.cond.notifyAll()
+    self.assertEqual(self.cond._waiter_locks, [])
+    self.cond.release()
+
+    self._waitThreads()
+    self.assertEqual(self.done.get_nowait(), "W")
+    self.assertEqual(self.done.get_nowait(), "W")
+    self.assertRaises(Queue.Empty, self.done.get_nowait)
+
+
+class TestLockCondition(TestPipeCondition):
+  """LockCondition tests"""
+
+  def setUp(self):
+    _ConditionTestCase.setUp(self, locking.LockCondition)
+
+
+class TestSetConditionType(unittest.TestCase):
+  def tearDown(self):
+    locking.SetConditionType(locking.CONDITION_LOCK)
+
+  def test(self):
+    for kind in locking.CONDITION_TYPES:
+      locking.SetConditionType(kind)
+      self.assertEqual(locking.SharedLock.condition_class,
+                       locking._CONDITION_CLASSES[kind])
+
+    self.assertRaises(errors.ProgrammerError, locking.SetConditionType,
+                      "unknown")
+
+
 class TestSharedLock(_ThreadedTestCase):
   """SharedLock tests"""
 
@@ -1039,6 +1093,166 @@ class TestSharedLock(_ThreadedTestCase):
     self.assertRaises(Queue.Empty, self.done.get_nowait)
 
 
+  def _WaitForPending(self, count):
+    def _Check():
+      if self.sl._count_pending() != count:
+        raise utils.RetryAgain()
+
+    utils.Retry(_Check, 0.01, 10.0)
+
+  def testReservation(self):
+    self.sl.acquire()
+
+    reserved = threading.Event()
+    proceed = threading.Event()
+
+    def _Reserved():
+      reservation = self.sl._reserve()
+      reserved.set()
+      proceed.wait()
+      self.assertTrue(self.sl._acquire_reserved(reservation))
+      self.done.put("reserved")
+      self.sl.release()
+
+    def _Blocking():
+      self.assertTrue(self.sl.acquire())
+      self.done.put("blocking")
+      self.sl.release()
+
+    self._addThread(target=_Reserved)
+    reserved.wait()
+    self._addThread(target=_Blocking)
+    self._WaitForPending(2)
+
+    # The reservation is on top of the queue, so the blocking acquire must not
+    # get the lock even if the reserving thread isn't waiting yet
+    self.sl.release()
+    self.assertRaises(Queue.Empty, self.done.get, True, 0.2)
+    self.assertEqual(self.sl._count_pending(), 2)
+
+    proceed.set()
+    self._waitThreads()
+
+    self.assertEqual(self.done.get_nowait(), "reserved")
+    self.assertEqual(self.done.get_nowait(), "blocking")
+    self.assertRaises(Queue.Empty, self.done.get_nowait)
+    self.assertTrue(self.sl._check_empty())
+
+  def testReservationCancel(self):
+    self.sl.acquire()
+
+    reserved = threading.Event()
+    proceed = threading.Event()
+
+    def _Reserved():
+      reservation = self.sl._reserve()
+      reserved.set()
+      proceed.wait()
+      self.done.put("cancelled")
+      self.sl._cancel_reservation(reservation)
+
+    def _Blocking():
+      self.assertTrue(self.sl.acquire())
+      self.done.put("blocking")
+      self.sl.release()
+
+    self._addThread(target=_Reserved)
+    reserved.wait()
+    self._addThread(target=_Blocking)
+    self._WaitForPending(2)
+
+    self.sl.release()
+
+    # Cancelling the reservation must let the next acquire go ahead
+    proceed.set()
+    self._waitThreads()
+
+    self.assertEqual(self.done.get_nowait(), "cancelled")
+    self.assertEqual(self.done.get_nowait(), "blocking")
+    self.assertRaises(Queue.Empty, self.done.get_nowait)
+    self.assertTrue(self.sl._check_empty())
+
+  def testReservationTimeout(self):
+    self.sl.acquire()
+
+    def _Reserved():
+      reservation = self.sl._reserve(shared=1)
+      self.assertFalse(self.sl._acquire_reserved(reservation, timeout=0.05))
+      self.done.put("timeout")
+
+    self._addThread(target=_Reserved)
+    self._waitThreads()
+
+    self.assertEqual(self.done.get_nowait(), "timeout")
+    self.assertTrue(self.sl._check_empty())
+    self.sl.release()
+
+  def testReservationDeleted(self):
+    self.sl.acquire()
+
+    reserved = threading.Event()
+    proceed = threading.Event()
+
+    def _Reserved():
+      reservation = self.sl._reserve()
+      reserved.set()
+      proceed.wait()
+      self.assertRaises(errors.LockError, self.sl._acquire_reserved,
+                        reservation)
+      self.done.put("deleted")
+
+    self._addThread(target=_Reserved)
+    reserved.wait()
+    self.sl.delete()
+    proceed.set()
+    self._waitThreads()
+
+    self.assertEqual(self.done.get_nowait(), "deleted")
+    self.assertTrue(self.sl._check_empty())
+    self.assertRaises(errors.LockError, self.sl._reserve)
+
+  def testIsAvailable(self):
+    self.assertTrue(self.sl.is_available(shared=0))
+    self.assertTrue(self.sl.is_available(shared=1))
+
+    self.sl.acquire(shared=1)
+    self.assertFalse(self.sl.is_available(shared=0))
+    self.assertTrue(self.sl.is_available(shared=1))
+
+    def _Acquire():
+      self.sl.acquire()
+      self.done.put("exclusive")
+      self.sl.release()
+
+    # Shared acquires would have to wait behind the pending exclusive one
+    self._addThread(target=_Acquire)
+    self._WaitForPending(1)
+    self.assertFalse(self.sl.is_available(shared=1))
+
+    self.sl.release()
+    self._waitThreads()
+    self.assertEqual(self.done.get_nowait(), "exclusive")
+
+    self.assertTrue(self.sl.is_available(shared=0))
+
+    self.sl.acquire()
+    self.assertFalse(self.sl.is_available(shared=0))
+    self.assertFalse(self.sl.is_available(shared=1))
+    self.sl.release()
+
+
+class TestSharedLockWithPipeCondition(TestSharedLock):
+  """SharedLock tests using pipe-based conditions"""
+
+  def setUp(self):
+    locking.SetConditionType(locking.CONDITION_PIPE)
+    TestSharedLock.setUp(self)
+
+  def tearDown(self):
+    locking.SetConditionType(locking.CONDITION_LOCK)
+    TestSharedLock.tearDown(self)
+
+
 class TestSharedLockInCondition(_ThreadedTestCase):
   """SharedLock as a condition lock tests"""
 
@@ -1070,6 +1284,156 @@ class TestSharedLockInPipeCondition(TestSharedLockInCondition):
     self.cond = locking.PipeCondition(self.sl)
 
 
+class TestSharedLockInLockCondition(TestSharedLockInCondition):
+  """SharedLock as a lock condition lock tests"""
+
+  def setCondition(self):
+    self.cond = locking.LockCondition(self.sl)
+
+
+class TestIntentLock(_ThreadedTestCase):
+  """IntentLock tests"""
+
+  def setUp(self):
+    _ThreadedTestCase.setUp(self)
+    self.lock = locking.IntentLock("TestIntentLock")
+
+  def _TryAcquire(self, mode):
+    def _Acquire():
+      if self.lock.acquire(mode, timeout=0.01):
+        self.done.put(True)
+        self.lock.release()
+      else:
+        self.done.put(False)
+
+    self._addThread(target=_Acquire)
+    self._waitThreads()
+
+    return self.done.get_nowait()
+
+  def testCompatibility(self):
+    modes = [
+      locking.MODE_INTENT_SHARED,
+      locking.MODE_INTENT_EXCLUSIVE,
+      locking.MODE_SHARED,
+      locking.MODE_EXCLUSIVE,
+      ]
+
+    compatible = set([
+      (locking.MODE_INTENT_SHARED, locking.MODE_INTENT_SHARED),
+      (locking.MODE_INTENT_SHARED, locking.MODE_INTENT_EXCLUSIVE),
+      (locking.MODE_INTENT_SHARED, locking.MODE_SHARED),
+      (locking.MODE_INTENT_EXCLUSIVE, locking.MODE_INTENT_SHARED),
+      (locking.MODE_INTENT_EXCLUSIVE, locking.MODE_INTENT_EXCLUSIVE),
+      (locking.MODE_SHARED, locking.MODE_INTENT_SHARED),
+      (locking.MODE_SHARED, locking.MODE_SHARED),
+      ])
+
+    for held in modes:
+      self.assertTrue(self.lock.acquire(held))
+      self.assertTrue(self.lock.is_owned())
+      self.assertTrue(self.lock.is_owned(mode=held))
+      self.assertEqual(self.lock.get_owned_mode(), held)
+
+      for other in modes:
+        self.assertEqual(self._TryAcquire(other), (held, other) in compatible,
+                         msg="Unexpected result for %s while holding %s" %
+                         (other, held))
+
+      self.lock.release()
+      self.assertFalse(self.lock.is_owned())
+
+  def testDowngrade(self):
+    self.lock.acquire(locking.MODE_EXCLUSIVE)
+    self.assertFalse(self._TryAcquire(locking.MODE_INTENT_SHARED))
+
+    self.lock.downgrade(locking.MODE_INTENT_EXCLUSIVE)
+    self.assertTrue(self.lock.is_owned(mode=locking.MODE_INTENT_EXCLUSIVE))
+    self.assertTrue(self._TryAcquire(locking.MODE_INTENT_SHARED))
+    self.assertFalse(self._TryAcquire(locking.MODE_SHARED))
+
+    self.lock.downgrade(locking.MODE_INTENT_SHARED)
+    self.assertTrue(self._TryAcquire(locking.MODE_SHARED))
+    self.assertRaises(AssertionError, self.lock.downgrade,
+                      locking.MODE_EXCLUSIVE)
+
+    self.lock.release()
+    self.assertRaises(AssertionError, self.lock.release)
+
+  def testDowngradeWakesPending(self):
+    self.lock.acquire(locking.MODE_EXCLUSIVE)
+
+    acquired = threading.Event()
+
+    def _Acquire():
+      self.assertTrue(self.lock.acquire(locking.MODE_INTENT_SHARED))
+      acquired.set()
+      self.lock.release()
+
+    self._addThread(target=_Acquire)
+    self.assertFalse(acquired.wait(0.05))
+
+    self.lock.downgrade(locking.MODE_SHARED)
+    acquired.wait()
+    self._waitThreads()
+
+    self.lock.release()
+
+  def testQueueOrder(self):
+    self.lock.acquire(locking.MODE_SHARED)
+
+    queued = []
+
+    def _Acquire(mode, name):
+      self.assertTrue(self.lock.acquire(mode))
+      self.done.put(name)
+      self.lock.release()
+
+    # An exclusive acquire must not be overtaken by later intent acquires,
+    # even if they're compatible with the current owner
+    for (mode, name) in [(locking.MODE_EXCLUSIVE, "exclusive"),
+                         (locking.MODE_INTENT_SHARED, "intent")]:
+      queued.append(name)
+      self._addThread(target=_Acquire, args=(mode, name))
+
+      def _Check():
+        (_, _, _, pending) = \
+          self.lock.GetLockInfo(set([query.LQ_PENDING]))[0]
+        if len(pending) != len(queued):
+          raise utils.RetryAgain()
+
+      utils.Retry(_Check, 0.01, 10.0)
+
+    self.assertEqual(self.lock.GetLockInfo(set([query.LQ_MODE,
+                                                query.LQ_OWNER])),
+                     [("TestIntentLock", locking.MODE_SHARED,
+                       [threading.currentThread().getName()], None)])
+
+    self.lock.release()
+    self._waitThreads()
+
+    self.assertEqual(self.done.get_nowait(), "exclusive")
+    self.assertEqual(self.done.get_nowait(), "intent")
+    self.assertRaises(Queue.Empty, self.done.get_nowait)
+
+  def testIsAvailable(self):
+    self.assertTrue(compat.all(self.lock.is_available(mode)
+                               for mode in locking._INTENT_MODE_ORDER))
+
+    self.lock.acquire(locking.MODE_INTENT_EXCLUSIVE)
+    self.assertTrue(self.lock.is_available(locking.MODE_INTENT_SHARED))
+    self.assertTrue(self.lock.is_available(locking.MODE_INTENT_EXCLUSIVE))
+    self.assertFalse(self.lock.is_available(locking.MODE_SHARED))
+    self.assertFalse(self.lock.is_available(locking.MODE_EXCLUSIVE))
+    self.lock.release()
+
+    self.lock.acquire(locking.MODE_SHARED)
+    self.assertTrue(self.lock.is_available(locking.MODE_INTENT_SHARED))
+    self.assertFalse(self.lock.is_available(locking.MODE_INTENT_EXCLUSIVE))
+    self.assertTrue(self.lock.is_available(locking.MODE_SHARED))
+    self.lock.release()
+
+
 class TestSSynchronizedDecorator(_ThreadedTestCase):
   """Shared Lock Synchronized decorator test"""
 
@@ -1164,6 +1528,25 @@ class TestLockSet(_ThreadedTestCase):
     self.assertFalse(self.ls.check_owned([]))
     self.assertFalse(self.ls.check_owned("one"))
 
+  def testCheckAvailable(self):
+    self.assertTrue(self.ls.check_available(None))
+    self.assertTrue(self.ls.check_available(["one", "nonexist"]))
+
+    self.ls.acquire(["one", "two"], shared=1)
+    self.assertTrue(self.ls.check_available(["one"], shared=1))
+    self.assertFalse(self.ls.check_available(["one"], shared=0))
+    self.assertTrue(self.ls.check_available(["three"], shared=0))
+    self.assertTrue(self.ls.check_available(None, shared=1))
+    self.assertFalse(self.ls.check_available(None, shared=0))
+    self.ls.release()
+
+    self.ls.acquire("three")
+    self.assertFalse(self.ls.check_available(None, shared=1))
+    self.assertTrue(self.ls.check_available(["one", "two"], shared=0))
+    self.ls.release()
+
+    self.assertTrue(self.ls.check_available(None, shared=0))
+
   def testAcquireRelease(self):
     self.assertFalse(self.ls.check_owned(self.ls._names()))
     self.assert_(self.ls.acquire("one"))
@@ -1970,6 +2353,235 @@ class TestLockSet(_ThreadedTestCase):
     self.assertRaises(Queue.Empty, self.done.get_nowait)
 
 
+class TestFairLockSet(TestLockSet):
+  """LockSet tests with fair acquires"""
+
+  def _setUpLS(self):
+    """Helper to (re)initialize the lock set"""
+    self.resources = ["one", "two", "three"]
+    self.ls = locking.LockSet(self.resources, "TestFairLockSet", fair=True)
+
+  def testQueueOrder(self):
+    self.ls.acquire(["one", "two"])
+
+    first_queued = threading.Event()
+    second_queued = threading.Event()
+
+    def _Acquire(names, name, queued_name, queued):
+      def _Notify(lname):
+        if lname == queued_name:
+          queued.set()
+
+      self.ls.acquire(names, test_notify=_Notify)
+      self.done.put(name)
+      self.ls.release()
+
+    self._addThread(target=_Acquire,
+                    args=(["one", "two"], "first", "one", first_queued))
+    first_queued.wait()
+    self._addThread(target=_Acquire,
+                    args=(["two", "three"], "second", "two", second_queued))
+    second_queued.wait()
+
+    # The first thread has queued for both locks before the second thread, so
+    # the second one must not get "two" even though it's free
+    self.ls.release(names=["two"])
+    self.assertRaises(Queue.Empty, self.done.get, True, 0.2)
+
+    self.ls.release()
+    self._waitThreads()
+
+    self.assertEqual(self.done.get_nowait(), "first")
+    self.assertEqual(self.done.get_nowait(), "second")
+    self.assertRaises(Queue.Empty, self.done.get_nowait)
+
+  def testTimeoutCancelsReservations(self):
+    self.ls.acquire(["two"])
+
+    def _Acquire():
+      self.assertEqual(self.ls.acquire(["one", "two", "three"], timeout=0.05),
+                       None)
+      self.assertFalse(self.ls.list_owned())
+      self.done.put("timeout")
+
+    self._addThread(target=_Acquire)
+    self._waitThreads()
+    self.assertEqual(self.done.get_nowait(), "timeout")
+
+    for name in self.resources:
+      self.assertTrue(self.ls._get_lockdict()[name]._check_empty())
+
+    self.ls.release()
+
+
+  def testLockDeleteWithOpportunisticAcquisition(self):
+    # Not applicable, deleting a lock would have to wait for the reservation
+    # made by the thread acquiring the whole set
+    pass
+
+
+class TestIntentLockSet(_ThreadedTestCase):
+  """LockSet tests with intent locking"""
+
+  def setUp(self):
+    _ThreadedTestCase.setUp(self)
+    self.resources = ["one", "two", "three"]
+    self.ls = locking.LockSet(self.resources, "TestIntentLockSet",
+                              intent=True)
+
+  def _IsMemberOwned(self, name, shared=-1):
+    return self.ls._get_lockdict()[name].is_owned(shared=shared)
+
+  def _TryAcquire(self, names, shared):
+    def _Acquire():
+      result = self.ls.acquire(names, shared=shared, timeout=0.01)
+      if result is not None:
+        self.ls.release()
+      self.done.put(result is not None)
+
+    self._addThread(target=_Acquire)
+    self._waitThreads()
+
+    return self.done.get_nowait()
+
+  def testAcquireAll(self):
+    self.assertEqual(self.ls.acquire(None), set(self.resources))
+    self.assertTrue(self.ls.owning_all())
+    self.assertEqual(self.ls.list_owned(), set(self.resources))
+    self.assertTrue(self.ls.check_owned(self.resources, shared=0))
+    self.assertFalse(self.ls.check_owned(self.resources, shared=1))
+    self.assertRaises(errors.LockError, self.ls.check_owned, "unknown")
+
+    # Only the internal lock is acquired
+    self.assertTrue(self.ls._get_lock().is_owned(mode=locking.MODE_EXCLUSIVE))
+    self.assertFalse(compat.any(self._IsMemberOwned(name)
+                                for name in self.resources))
+
+    self.assertFalse(self._TryAcquire(["one"], 1))
+    self.assertFalse(self._TryAcquire(None, 1))
+
+    self.ls.release()
+    self.assertFalse(self.ls.is_owned())
+    self.assertFalse(self.ls._get_lock().is_owned())
+    self.assertTrue(self._TryAcquire(None, 0))
+
+  def testAcquireAllShared(self):
+    self.ls.acquire(None, shared=1)
+    self.assertTrue(self.ls.check_owned(self.resources, shared=1))
+    self.assertTrue(self._TryAcquire(["one"], 1))
+    self.assertTrue(self._TryAcquire(None, 1))
+    self.assertFalse(self._TryAcquire(["one"], 0))
+    self.ls.release()
+
+  def testAcquireNames(self):
+    self.assertEqual(self.ls.acquire(["one", "two"]), set(["one", "two"]))
+    self.assertFalse(self.ls.owning_all())
+    self.assertTrue(self.ls._get_lock().is_owned(
+      mode=locking.MODE_INTENT_EXCLUSIVE))
+    self.assertTrue(self._IsMemberOwned("one", shared=0))
+
+    # Other locks can still be acquired, the whole set can't
+    self.assertTrue(self._TryAcquire(["three"], 0))
+    self.assertFalse(self._TryAcquire(["two"], 1))
+    self.assertFalse(self._TryAcquire(None, 1))
+
+    self.ls.release(["one"])
+    self.assertEqual(self.ls.list_owned(), set(["two"]))
+    self.assertTrue(self.ls._get_lock().is_owned())
+
+    self.ls.release()
+    self.assertFalse(self.ls.is_owned())
+    self.assertFalse(self.ls._get_lock().is_owned())
+
+    self.ls.acquire("three", shared=1)
+    self.assertTrue(self.ls._get_lock().is_owned(
+      mode=locking.MODE_INTENT_SHARED))
+    self.assertTrue(self._TryAcquire(None, 1))
+    self.ls.release()
+
+  def testPartialRelease(self):
+    self.ls.acquire(None)
+    self.ls.release(["one"])
+
+    self.assertEqual(self.ls.list_owned(), set(["two", "three"]))
+    self.assertFalse(self.ls.owning_all())
+    self.assertTrue(self.ls.check_owned(["two", "three"], shared=0))
+    self.assertTrue(self._IsMemberOwned("two", shared=0))
+    self.assertFalse(self._IsMemberOwned("one"))
+    self.assertTrue(self._TryAcquire(["one"], 0))
+    self.assertFalse(self._TryAcquire(["two"], 0))
+
+    self.ls.release()
+    self.assertFalse(self.ls.is_owned())
+    self.assertTrue(self._TryAcquire(None, 0))
+
+  def testPartialDowngrade(self):
+    self.ls.acquire(None)
+    self.ls.downgrade(["one"])
+
+    self.assertTrue(self.ls.check_owned("one", shared=1))
+    self.assertTrue(self.ls.check_owned(["two", "three"], shared=0))
+    self.assertTrue(self.ls._get_lock().is_owned(
+      mode=locking.MODE_INTENT_EXCLUSIVE))
+
+    self.ls.downgrade()
+    self.assertTrue(self.ls.check_owned(self.resources, shared=1))
+    self.assertTrue(self.ls._get_lock().is_owned(
+      mode=locking.MODE_INTENT_SHARED))
+    self.assertTrue(self._TryAcquire(None, 1))
+
+    self.ls.release()
+
+  def testDowngradeAll(self):
+    self.ls.acquire(None)
+    self.ls.downgrade()
+    self.assertTrue(self.ls.owning_all())
+    self.assertTrue(self.ls.check_owned(self.resources, shared=1))
+    self.ls.release()
+
+  def testAddRemove(self):
+    # Locks added while owning the whole set are owned as well
+    self.ls.acquire(None)
+    self.ls.add("four")
+    self.assertTrue(self.ls.check_owned("four", shared=0))
+    self.assertEqual(self.ls.remove(["one", "four"]), ["one", "four"])
+    self.assertEqual(self.ls.list_owned(), set(["two", "three"]))
+    self.ls.release()
+
+    self.ls.add("five", acquired=1)
+    self.assertEqual(self.ls.list_owned(), set(["five"]))
+    self.assertTrue(self.ls._get_lock().is_owned(
+      mode=locking.MODE_INTENT_EXCLUSIVE))
+    self.assertFalse(self._TryAcquire(None, 1))
+
+    self.assertEqual(self.ls.remove("five"), ["five"])
+    self.assertFalse(self.ls.is_owned())
+    self.assertFalse(self.ls._get_lock().is_owned())
+
+    self.assertEqual(self.ls.remove("two"), ["two"])
+    self.assertEqual(self.ls._names(), set(["three"]))
+
+  def testCheckAvailable(self):
+    self.assertTrue(self.ls.check_available(None, shared=0))
+    self.assertTrue(self.ls.check_available(["one", "unknown"], shared=0))
+
+    self.ls.acquire(["one"], shared=1)
+    self.assertTrue(self.ls.check_available(["one"], shared=1))
+    self.assertFalse(self.ls.check_available(["one"], shared=0))
+    self.assertTrue(self.ls.check_available(["two", "three"], shared=0))
+    self.assertTrue(self.ls.check_available(None, shared=1))
+    self.assertFalse(self.ls.check_available(None, shared=0))
+    self.ls.release()
+
+    self.ls.acquire(None, shared=1)
+    self.assertTrue(self.ls.check_available(["two"], shared=1))
+    self.assertFalse(self.ls.check_available(["two"], shared=0))
+    self.assertTrue(self.ls.check_available(None, shared=1))
+    self.ls.release()
+
+    self.assertTrue(self.ls.check_available(None, shared=0))
+
+
 class TestGetLsAcquireModeAndTimeouts(unittest.TestCase):
   def setUp(self):
     self.fn = locking._GetLsAcquireModeAndTimeouts
@@ -2685,5 +3297,96 @@ class TestLockMonitor(_ThreadedTestCase):
           self.assertEqual(i.CountPending(), 0)
 
 
+class TestLockStatistics(_ThreadedTestCase):
+  def setUp(self):
+    _ThreadedTestCase.setUp(self)
+    self.lm = locking.LockMonitor()
+    self.clock = [1000.0]
+
+  def tearDown(self):
+    locking.SetStatisticsEnabled(False)
+    locking.SetOpcodeContext(None)
+
+  def _Time(self):
+    return self.clock[0]
+
+  def testDisabled(self):
+    lock = locking.SharedLock("lock", monitor=self.lm, _time_fn=self._Time)
+    lock.acquire()
+    lock.release()
+    self.assertEqual(lock.GetLockStatistics(), [])
+
+    result = objects.QueryResponse.FromDict(
+      self.lm.QueryLocks(["name", "acquires", "opcodes"]))
+    self.assertEqual(result.data, [[
+      (constants.RS_NORMAL, "lock"),
+      (constants.RS_UNAVAIL, None),
+      (constants.RS_UNAVAIL, None),
+      ]])
+
+  def testAcquireRelease(self):
+    locking.SetStatisticsEnabled(True)
+    locking.SetOpcodeContext("OP_TEST_DELAY")
+
+    lock = locking.SharedLock("instance/inst1", monitor=self.lm,
+                              _time_fn=self._Time)
+    lock.acquire(shared=1)
+    self.clock[0] += 2.5
+    lock.release()
+
+    # Releasing a lock acquired with statistics enabled is always recorded
+    lock.acquire()
+    locking.SetStatisticsEnabled(False)
+    lock.release()
+
+    [(name, stats)] = lock.GetLockStatistics()
+    self.assertEqual(name, "instance/inst1")
+    self.assertEqual(stats["acquires"], 2)
+    self.assertEqual(stats["timeouts"], 0)
+    self.assertEqual(stats["wait_total"], 0.0)
+    self.assertEqual(stats["hold_total"], 2.5)
+    self.assertEqual(stats["hold_max"], 2.5)
+    self.assertEqual(stats["wait_hist"][0],
+                     (locking.LOCK_WAIT_BUCKETS[0], 2))
+    self.assertEqual(stats["wait_hist"][-1], (None, 0))
+    self.assertEqual(stats["opcodes"], [["OP_TEST_DELAY", 2, 0, 0.0, 2.5]])
+    self.assertEqual(stats["blocked_by"], [])
+
+  def testBlocked(self):
+    locking.SetStatisticsEnabled(True)
+    locking.SetOpcodeContext("OP_CLUSTER_VERIFY")
+
+    lock = locking.SharedLock("node/node1", monitor=self.lm)
+    lock.acquire()
+
+    def _Acquire():
+      locking.SetOpcodeContext("OP_INSTANCE_STARTUP")
+      self.done.put(lock.acquire(timeout=0.05))
+      self.done.put(lock.acquire(timeout=0))
+
+    self._addThread(target=_Acquire)
+    self._waitThreads()
+    self.assertFalse(self.done.get_nowait())
+    self.assertFalse(self.done.get_nowait())
+
+    lock.release()
+
+    result = objects.QueryResponse.FromDict(
+      self.lm.QueryLocks(["name", "acquires", "timeouts", "opcodes",
+                          "blocked_by"]))
+    self.assertEqual(len(result.data), 1)
+    (name, acquires, timeouts, opcodes, blocked_by) = \
+      [value for (_, value) in result.data[0]]
+    self.assertEqual(name, "node/node1")
+    self.assertEqual(acquires, 1)
+    self.assertEqual(timeouts, 2)
+    self.assertEqual([op_id for (op_id, _, _, _, _) in opcodes],
+                     ["OP_CLUSTER_VERIFY", "OP_INSTANCE_STARTUP"])
+    self.assertEqual(opcodes[1][1:3], [0, 2])
+    self.assertTrue(opcodes[1][3] >= 0.05)
+    self.assertEqual(blocked_by,
+                     [["OP_INSTANCE_STARTUP", "OP_CLUSTER_VERIFY", 1]])
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
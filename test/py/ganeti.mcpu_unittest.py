@@ -31,6 +31,9 @@ from ganeti import opcodes
 from ganeti import cmdlib
 from ganeti import locking
 from ganeti import constants
+from ganeti import errors
+from ganeti import hooksmaster
+from ganeti.rpc import node as rpc
 from ganeti.constants import \
     LOCK_ATTEMPTS_TIMEOUT, \
     LOCK_ATTEMPTS_MAXWAIT, \
@@ -84,6 +87,14 @@ class TestLockAttemptTimeoutStrategy(unittest.TestCase):
       self.assert_(strat.NextAttempt() is None)
 
 
+class TestBlockingLockStrategy(unittest.TestCase):
+  def test(self):
+    strat = mcpu.BlockingLockStrategy()
+
+    for _ in range(10):
+      self.assert_(strat.NextAttempt() is None)
+
+
 class TestDispatchTable(unittest.TestCase):
   def test(self):
     for opcls in opcodes.OP_MAPPING.values():
@@ -103,6 +114,142 @@ class TestDispatchTable(unittest.TestCase):
                               opcls.OP_ID))
 
 
+class TestGetLockHints(unittest.TestCase):
+  def testBgl(self):
+    op = opcodes.OpClusterRename(name="cluster.example.com")
+    self.assertEqual(mcpu.GetLockHints(op),
+                     [(locking.LEVEL_CLUSTER, [locking.BGL], 0)])
+
+  def testInstance(self):
+    op = opcodes.OpInstanceReboot(instance_name="inst1.example.com")
+    self.assertEqual(mcpu.GetLockHints(op), [
+      (locking.LEVEL_CLUSTER, [locking.BGL], 1),
+      (locking.LEVEL_INSTANCE, ["inst1.example.com"], 0),
+      ])
+
+  def testBatch(self):
+    op = opcodes.OpInstanceBatch(ops=[
+      opcodes.OpInstanceStartup(instance_name="inst1.example.com"),
+      opcodes.OpInstanceShutdown(instance_name="inst2.example.com"),
+      ])
+    self.assertEqual(mcpu.GetLockHints(op), [
+      (locking.LEVEL_CLUSTER, [locking.BGL], 1),
+      (locking.LEVEL_INSTANCE, ["inst1.example.com", "inst2.example.com"], 0),
+      ])
+
+  def testNode(self):
+    # Node names are only resolved to lock names given a function to do so
+    op = opcodes.OpNodePowercycle(node_name="node1.example.com")
+    self.assertEqual(mcpu.GetLockHints(op),
+                     [(locking.LEVEL_CLUSTER, [locking.BGL], 1)])
+
+    node_uuids = {
+      "node1.example.com": "2e4f9f8a-node1",
+      }
+    self.assertEqual(mcpu.GetLockHints(op, node_uuid_fn=node_uuids.get), [
+      (locking.LEVEL_CLUSTER, [locking.BGL], 1),
+      (locking.LEVEL_NODE, ["2e4f9f8a-node1"], 0),
+      ])
+
+    op = opcodes.OpNodePowercycle(node_name="unknown.example.com")
+    self.assertEqual(mcpu.GetLockHints(op, node_uuid_fn=node_uuids.get),
+                     [(locking.LEVEL_CLUSTER, [locking.BGL], 1)])
+
+    op = opcodes.OpNodePowercycle(node_name="node1.example.com",
+                                  node_uuid="2e4f9f8a-node1")
+    self.assertEqual(mcpu.GetLockHints(op), [
+      (locking.LEVEL_CLUSTER, [locking.BGL], 1),
+      (locking.LEVEL_NODE, ["2e4f9f8a-node1"], 0),
+      ])
+
+
+class TestOpProfile(unittest.TestCase):
+  def setUp(self):
+    self.clock = testutils.FakeClock()
+    self.rpc_time = testutils.FakeClock(now=100.0)
+    self.write_time = testutils.FakeClock(now=20.0)
+
+  def _Make(self):
+    return mcpu.OpProfile(_time_fn=self.clock, _rpc_time_fn=self.rpc_time,
+                          _write_time_fn=self.write_time)
+
+  def testAdd(self):
+    prof = self._Make()
+    prof.Add("lock/node", 1.5)
+    prof.Add("lock/node", 0.5)
+    prof.Add("exec", 3.0)
+    self.assertEqual(prof.spans, {
+      "lock/node": 2.0,
+      "exec": 3.0,
+      })
+
+  def _Sleep(self, duration, result=None):
+    self.clock.now += duration
+    return result
+
+  def _Fail(self, duration):
+    self.clock.now += duration
+    raise errors.OpExecError("Failed")
+
+  def testRun(self):
+    prof = self._Make()
+    self.assertEqual(prof.Run("hooks_pre", self._Sleep, 2.0, result=123), 123)
+    self.assertRaises(errors.OpExecError, prof.Run, "exec", self._Fail, 4.0)
+    self.assertEqual(prof.Run("hooks_pre", self._Sleep, 1.0), None)
+    self.assertEqual(prof.spans, {
+      "hooks_pre": 3.0,
+      "exec": 4.0,
+      })
+
+  def testFinish(self):
+    prof = self._Make()
+    self.rpc_time.now += 7.0
+    self.write_time.now += 0.25
+    self.assertEqual(prof.Finish(), {
+      "rpc": 7.0,
+      "config_write": 0.25,
+      })
+
+
+class TestRunHooksWithManifest(unittest.TestCase):
+  def _GetManifests(self, node_names):
+    rr = rpc.RpcResult
+    return {
+      "node1": rr(data=(True, ["node-add-post.d"]), node="node1"),
+      "node2": rr(data=(True, []), node="node2"),
+      "node3": rr(data=(False, "Error"), node="node3"),
+      }
+
+  def _RunHooks(self, node_list, hpath, phase, env):
+    self.assertEqual(sorted(node_list), self.expected)
+    self.assertEqual(hpath, "node-add")
+    return dict((name, rpc.RpcResult(data=(True, [("script", "ok", "")]),
+                                     node=name))
+                for name in node_list)
+
+  def test(self):
+    cache = hooksmaster.HooksManifestCache(60)
+    self.expected = ["node1", "node3"]
+    results = mcpu._RunHooksWithManifest(cache, self._GetManifests,
+                                         self._RunHooks,
+                                         ["node1", "node2", "node3"],
+                                         "node-add", constants.HOOKS_PHASE_POST,
+                                         {})
+    self.assertEqual(sorted(results.keys()), ["node1", "node2", "node3"])
+    self.assertEqual(results["node1"].payload, [("script", "ok", "")])
+    self.assertEqual(results["node2"].payload, [])
+    self.assertFalse(results["node2"].fail_msg)
+
+  def testNoScripts(self):
+    cache = hooksmaster.HooksManifestCache(60)
+    results = mcpu._RunHooksWithManifest(cache, self._GetManifests,
+                                         NotImplemented, ["node1", "node2"],
+                                         "node-add", constants.HOOKS_PHASE_PRE,
+                                         {})
+    self.assertEqual(results["node1"].payload, [])
+    self.assertEqual(results["node2"].payload, [])
+
+
 class TestProcessResult(unittest.TestCase):
   def setUp(self):
     self._submitted = []
@@ -299,6 +299,21 @@ class TestOpcodes(unittest.TestCase):
     self.assertNotEquals(loaded_inst, inst_op)
     self.assertEquals(loaded_inst.__getstate__(), inst_state)
 
+  def testOpInstanceBatch(self):
+    ops = [opcodes.OpInstanceStartup(instance_name="inst1.example.com"),
+           opcodes.OpInstanceShutdown(instance_name="inst2.example.com")]
+    ops_state = [op.__getstate__() for op in ops]
+
+    batch = opcodes.OpInstanceBatch(ops=ops)
+    state = batch.__getstate__()
+    self.assertEqual(state["ops"], ops_state)
+    loaded_batch = opcodes.OpCode.LoadOpCode(state)
+    self.assertEqual([op.__getstate__() for op in loaded_batch.ops],
+                     ops_state)
+    self.assertTrue(isinstance(loaded_batch.ops[0], opcodes.OpInstanceStartup))
+    self.assertTrue(isinstance(loaded_batch.ops[1],
+                               opcodes.OpInstanceShutdown))
+
 
 class TestOpcodeDepends(unittest.TestCase):
   def test(self):
@@ -432,10 +432,14 @@ class TestNodeQuery(unittest.TestCase):
 
     fake_live_data = {
       "bootid": "a2504766-498e-4b25-b21e-d23098dc3af4",
+      "ccores": 1,
       "cnodes": 4,
       "cnos": 3,
       "csockets": 4,
+      "cthreads": 2,
       "ctotal": 8,
+      "hpfree": 512,
+      "hptotal": 1024,
       "mnode": 128,
       "mfree": 100,
       "mtotal": 4096,
@@ -443,6 +447,8 @@ class TestNodeQuery(unittest.TestCase):
       "dtotal": 100 * 1024 * 1024,
       "spfree": 0,
       "sptotal": 0,
+      "numa": [{"id": 0, "memory_total": 2048, "memory_free": 50,
+                "cpus": [0, 1]}],
       }
 
     assert (sorted(query._NODE_LIVE_FIELDS.keys()) ==
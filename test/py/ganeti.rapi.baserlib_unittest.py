@@ -23,12 +23,14 @@
 
 import unittest
 import itertools
+import errno
 
 from ganeti import errors
 from ganeti import opcodes
 from ganeti import ht
 from ganeti import http
 from ganeti import compat
+from ganeti import pathutils
 from ganeti.rapi import baserlib
 
 import testutils
@@ -157,5 +159,76 @@ class TestOpcodeResource(unittest.TestCase):
       self.assertFalse(hasattr(obj, attr))
 
 
+class _FakeStat:
+  def __init__(self, ino, size, mtime):
+    self.st_dev = 1
+    self.st_ino = ino
+    self.st_size = size
+    self.st_mtime = mtime
+
+
+class TestCacheValidators(unittest.TestCase):
+  @staticmethod
+  def _StatMissing(_):
+    raise EnvironmentError(errno.ENOENT, "Not found")
+
+  def testConfig(self):
+    stats = {
+      pathutils.CLUSTER_CONF_FILE: _FakeStat(10, 1234, 1390000000.5),
+      }
+    validator = baserlib.GetConfigValidator(_stat_fn=stats.__getitem__)
+    self.assertTrue(validator)
+
+    # Same file gives same validator
+    self.assertEqual(baserlib.GetConfigValidator(_stat_fn=stats.__getitem__),
+                     validator)
+
+    # Configuration was replaced
+    stats[pathutils.CLUSTER_CONF_FILE] = _FakeStat(11, 1234, 1390000000.5)
+    self.assertNotEqual(baserlib.GetConfigValidator(_stat_fn=stats.__getitem__),
+                        validator)
+
+  def testConfigMissing(self):
+    self.assertTrue(baserlib.GetConfigValidator(_stat_fn=self._StatMissing)
+                    is None)
+
+  def testJobQueue(self):
+    stat = _FakeStat(4, 4096, 1390000000.0)
+    validator = \
+      baserlib.GetJobQueueValidator(_stat_fn=lambda _: stat,
+                                    _read_fn=lambda *_, **__: "1234")
+    self.assertTrue(validator)
+
+    other = \
+      baserlib.GetJobQueueValidator(_stat_fn=lambda _: stat,
+                                    _read_fn=lambda *_, **__: "1235")
+    self.assertNotEqual(validator, other)
+
+  def testSingleJob(self):
+    paths = []
+
+    def _Stat(path):
+      paths.append(path)
+      return _FakeStat(1, 100, 1390000000.0)
+
+    self.assertTrue(baserlib.GetJobQueueValidator(job_id="182",
+                                                  _stat_fn=_Stat))
+    self.assertEqual(paths, [pathutils.QUEUE_DIR + "/job-182"])
+
+    self.assertTrue(baserlib.GetJobQueueValidator(job_id="../x",
+                                                  _stat_fn=_Stat) is None)
+    self.assertTrue(baserlib.GetJobQueueValidator(job_id="17",
+                                                  _stat_fn=self._StatMissing)
+                    is None)
+    self.assertEqual(len(paths), 1)
+
+  def testETag(self):
+    etag = baserlib.FormatETag("/2/instances", "config:1")
+    self.assertTrue(etag.startswith("\"") and etag.endswith("\""))
+    self.assertEqual(etag, baserlib.FormatETag("/2/instances", "config:1"))
+    self.assertNotEqual(etag, baserlib.FormatETag("/2/nodes", "config:1"))
+    self.assertNotEqual(etag, baserlib.FormatETag("/2/instances", "config:2"))
+
+
 if __name__ == "__main__":
   testutils.GanetiTestProgram()
@@ -333,6 +333,146 @@ class TestRpcProcessor(unittest.TestCase):
     self.assertEqual(http_proc.reqcount, 1)
 
 
+class TestRpcStatistics(unittest.TestCase):
+  def _GetResponse(self, clock, req):
+    if req.host == "192.0.2.10":
+      clock[0] = 100.3
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, None))
+    else:
+      clock[0] = 120.0
+      req.success = False
+      req.error = "Timeout"
+    req.completion_cb(req)
+
+  def testRecording(self):
+    clock = [100.0]
+    stats = rpc.RpcStatistics(buckets=[0.1, 1.0, 10.0])
+    resolver = rpc._StaticResolver(["192.0.2.10", "192.0.2.11",
+                                    rpc._OFFLINE])
+    http_proc = _FakeRequestProcessor(compat.partial(self._GetResponse,
+                                                     clock))
+    proc = rpc._RpcProcessor(resolver, 1234, _stats=stats,
+                             _time_fn=lambda: clock[0])
+    nodes = ["node1", "node2", "node3"]
+    body = {
+      "node1": "x" * 10,
+      "node2": "y" * 20,
+      "node3": "",
+      }
+    result = proc(nodes, "version", body, 15, NotImplemented,
+                  _req_process_fn=http_proc)
+    self.assertFalse(result["node1"].fail_msg)
+    self.assertTrue(result["node2"].fail_msg)
+    self.assertTrue(result["node3"].offline)
+
+    entries = dict(((procedure, node), (values, histogram))
+                   for (procedure, node, values, histogram) in
+                     stats.GetEntries())
+    self.assertEqual(sorted(entries.keys()),
+                     [("version", "node1"), ("version", "node2")])
+
+    (values, histogram) = entries[("version", "node1")]
+    self.assertEqual(values["calls"], 1)
+    self.assertEqual(values["failures"], 0)
+    self.assertEqual(values["timeouts"], 0)
+    self.assertEqual(values["bytes_sent"], 10)
+    self.assertEqual(values["bytes_received"],
+                     len(serializer.DumpJson((True, None))))
+    self.assertAlmostEqual(values["latency_max"], 0.3)
+    self.assertEqual(histogram, [(0.1, 0), (1.0, 1), (10.0, 0), (None, 0)])
+
+    (values, histogram) = entries[("version", "node2")]
+    self.assertEqual(values["calls"], 1)
+    self.assertEqual(values["failures"], 1)
+    self.assertEqual(values["timeouts"], 1)
+    self.assertEqual(values["bytes_sent"], 20)
+    self.assertEqual(values["bytes_received"], 0)
+    self.assertEqual(values["latency_total"], 0.0)
+    self.assertEqual(histogram, [(0.1, 0), (1.0, 0), (10.0, 0), (None, 0)])
+
+    stats.Reset()
+    self.assertEqual(stats.GetEntries(), [])
+
+  def testQuery(self):
+    stats = rpc.RpcStatistics(buckets=[0.1, 1.0])
+    for latency in [0.05, 0.05, 0.5, 3.0]:
+      stats.Record("node_info", "node1.example.com", latency, 100, 200,
+                   False, False)
+
+    response = objects.QueryResponse.FromDict(
+      stats.QueryStatistics(["name", "calls", "bytes_sent", "latency_avg",
+                             "latency_p50", "latency_p90", "latency_max"]))
+    self.assertEqual(len(response.data), 1)
+    row = [value for (_, value) in response.data[0]]
+    self.assertEqual(row[:3], ["node_info/node1.example.com", 4, 400])
+    self.assertAlmostEqual(row[3], 0.9)
+    self.assertAlmostEqual(row[4], 0.1)
+    self.assertAlmostEqual(row[5], 3.0)
+    self.assertAlmostEqual(row[6], 3.0)
+
+  def testAdaptiveTimeout(self):
+    stats = rpc.RpcStatistics()
+    nodes = ["node1", "node2"]
+
+    # No data yet
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", nodes, 60), 60)
+
+    for node in nodes:
+      for _ in range(rpc._ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+        stats.Record("node_info", node, 0.02, 10, 10, False, False)
+
+    # Fast nodes are limited by the lower bound
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", nodes, 60),
+                     rpc._ADAPTIVE_TIMEOUT_MIN)
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", nodes, 5), 5)
+
+    # The slowest node determines the timeout
+    stats.Record("node_info", "node2", 4.0, 10, 10, False, False)
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", nodes, 60),
+                     4 * rpc._ADAPTIVE_TIMEOUT_FACTOR)
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", ["node1"], 60),
+                     rpc._ADAPTIVE_TIMEOUT_MIN)
+
+    # After a timeout the default is used once
+    stats.Record("node_info", "node1", 10.0, 10, 0, True, True)
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", nodes, 60), 60)
+    stats.Record("node_info", "node1", 0.02, 10, 10, False, False)
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", ["node1"], 60),
+                     rpc._ADAPTIVE_TIMEOUT_MIN)
+
+    # Unknown nodes
+    self.assertEqual(stats.GetAdaptiveTimeout("node_info", ["node3"], 60), 60)
+    self.assertEqual(stats.GetAdaptiveTimeout("version", nodes, 60), 60)
+
+  def _GetAdaptiveResponse(self, timeouts, req):
+    timeouts.append(req.read_timeout)
+    req.success = True
+    req.resp_status_code = http.HTTP_OK
+    req.resp_body = serializer.DumpJson((True, None))
+
+  def testAdaptiveProcessor(self):
+    stats = rpc.RpcStatistics()
+    for _ in range(rpc._ADAPTIVE_TIMEOUT_MIN_SAMPLES):
+      stats.Record("node_info", "node1", 0.02, 10, 10, False, False)
+
+    resolver = rpc._StaticResolver(["192.0.2.20"])
+    timeouts = []
+    http_proc = _FakeRequestProcessor(compat.partial(self._GetAdaptiveResponse,
+                                                     timeouts))
+    proc = rpc._RpcProcessor(resolver, 1234, _stats=stats)
+
+    # Adaptive timeouts must be asked for explicitly
+    for adaptive_timeout in [True, False]:
+      result = proc(["node1"], "node_info", {"node1": ""}, 60, NotImplemented,
+                    adaptive_timeout=adaptive_timeout,
+                    _req_process_fn=http_proc)
+      self.assertFalse(result["node1"].fail_msg)
+
+    self.assertEqual(timeouts, [rpc._ADAPTIVE_TIMEOUT_MIN, 60])
+
+
 class TestSsconfResolver(unittest.TestCase):
   def testSsconfLookup(self):
     addr_list = ["192.0.2.%d" % n for n in range(0, 255, 13)]
@@ -497,6 +637,14 @@ class TestCompress(unittest.TestCase):
     self.assertRaises(Exception, backend._Decompress,
                       (constants.RPC_ENCODING_ZLIB_BASE64, "invalid zlib data"))
 
+  def testFramed(self):
+    data = 5242 * "Hello World!\n"
+    compressed = rpc._Compress(NotImplemented, data)
+    result = serializer.LoadFramed(rpc._DumpFramedBody(["x", compressed]))
+    self.assertEqual(result[0], "x")
+    self.assertEqual(result[1][0], constants.RPC_ENCODING_ZLIB_RAW)
+    self.assertEqual(backend._Decompress(result[1]), data)
+
 
 class TestRpcClientBase(unittest.TestCase):
   def testNoHosts(self):
@@ -593,6 +741,136 @@ class TestRpcClientBase(unittest.TestCase):
         self.assertEqual(serializer.LoadJson(res.payload),
                          ["foo", hex(num), hash("Hello%s" % num)])
 
+  def testSharedBody(self):
+    resolver = rpc._StaticResolver([
+      "192.0.2.7",
+      "192.0.2.8",
+      "192.0.2.9",
+      ])
+
+    nodes = [
+      "node7.example.com",
+      "node8.example.com",
+      "node9.example.com",
+      ]
+
+    encoded = []
+
+    def _Encode(node, value):
+      encoded.append(node)
+      return "%s/%s" % (node, value)
+
+    encoders = {
+      rpc_defs.ED_COMPRESS: _Encode,
+      rpc_defs.ED_INST_DICT: _Encode,
+      }
+
+    bodies = []
+
+    def _VerifyRequest(req):
+      bodies.append(req.post_data)
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      req.resp_body = serializer.DumpJson((True, req.post_data))
+
+    http_proc = _FakeRequestProcessor(_VerifyRequest)
+    client = rpc._RpcClientBase(resolver, encoders.get,
+                                _req_process_fn=http_proc)
+
+    # Node-independent arguments are encoded only once
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", None, NotImplemented),
+      ("arg1", rpc_defs.ED_COMPRESS, NotImplemented),
+      ], None, None, NotImplemented)
+    result = client._Call(cdef, nodes, ["foo", "data"])
+    self.assertEqual(len(result), len(nodes))
+    self.assertEqual(encoded, [None])
+    self.assertEqual(len(bodies), len(nodes))
+    self.assertTrue(compat.all(body is bodies[0] for body in bodies))
+    self.assertEqual(serializer.LoadJson(bodies[0]), ["foo", "None/data"])
+
+    # Node-dependent arguments are encoded for every node
+    del encoded[:]
+    del bodies[:]
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", rpc_defs.ED_COMPRESS, NotImplemented),
+      ("arg1", rpc_defs.ED_INST_DICT, NotImplemented),
+      ], None, None, NotImplemented)
+    result = client._Call(cdef, nodes, ["data", "inst"])
+    self.assertEqual(len(result), len(nodes))
+    self.assertEqual(sorted(encoded), sorted(nodes + nodes))
+    for (node, res) in result.items():
+      self.assertFalse(res.fail_msg)
+      self.assertEqual(serializer.LoadJson(res.payload),
+                       ["%s/data" % node, "%s/inst" % node])
+
+  def testFramedNegotiation(self):
+    resolver = rpc._StaticResolver([
+      "192.0.2.20",
+      "192.0.2.21",
+      ])
+
+    nodes = [
+      "node20.example.com",
+      "node21.example.com",
+      ]
+
+    data = 1000 * "Hello World\n"
+    framed_nodes = set()
+    requests = []
+
+    def _VerifyRequest(req):
+      requests.append(req)
+      node = nodes[resolver._addresses.index(req.host)]
+      if serializer.IsFramed(req.post_data):
+        self.assertTrue(("Content-type: %s" % http.HTTP_APP_GANETI_RPC)
+                        in req.headers)
+        (args, ) = serializer.LoadFramed(req.post_data)
+      else:
+        self.assertTrue(("Content-type: %s" % http.HTTP_APP_JSON)
+                        in req.headers)
+        (args, ) = serializer.LoadJson(req.post_data)
+      self.assertEqual(backend._Decompress(args), data)
+
+      req.success = True
+      req.resp_status_code = http.HTTP_OK
+      if node in framed_nodes:
+        req.resp_body = serializer.DumpFramed((True, node))
+      else:
+        req.resp_body = serializer.DumpJson((True, node))
+
+    http_proc = _FakeRequestProcessor(_VerifyRequest)
+    client = rpc._RpcClientBase(resolver, rpc._ENCODERS.get,
+                                _req_process_fn=http_proc)
+
+    cdef = ("test_call", NotImplemented, None, constants.RPC_TMO_NORMAL, [
+      ("arg0", rpc_defs.ED_COMPRESS, NotImplemented),
+      ], None, None, NotImplemented)
+
+    # Only the first node supports framed bodies
+    framed_nodes.add(nodes[0])
+
+    for _ in range(3):
+      del requests[:]
+      result = client._Call(cdef, nodes, [data])
+      self.assertEqual(len(result), len(nodes))
+      for (node, res) in result.items():
+        self.assertFalse(res.fail_msg)
+        self.assertEqual(res.payload, node)
+
+    # After the first call, requests to the first node are framed
+    self.assertEqual(sorted((req.host, serializer.IsFramed(req.post_data))
+                            for req in requests),
+                     [("192.0.2.20", True), ("192.0.2.21", False)])
+
+    # The node stops responding with framed bodies
+    framed_nodes.clear()
+    client._Call(cdef, nodes, [data])
+    del requests[:]
+    client._Call(cdef, nodes, [data])
+    self.assertFalse(compat.any(serializer.IsFramed(req.post_data)
+                                for req in requests))
+
   def testPostProc(self):
     def _VerifyRequest(nums, req):
       req.success = True
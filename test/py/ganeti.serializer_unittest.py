@@ -107,6 +107,65 @@ class TestSerializer(testutils.GanetiTestCase):
                       serializer.DumpJson(tdata), "mykey")
 
 
+class TestFramed(testutils.GanetiTestCase):
+  def testRoundTrip(self):
+    for data in TestSerializer._TESTDATA:
+      for compress_min in [0, 10, 1024 * 1024]:
+        txt = serializer.DumpFramed(data, compress_min=compress_min)
+        self.assertTrue(serializer.IsFramed(txt))
+        self.assertEqualValues(serializer.LoadFramed(txt), data)
+
+  def testNotFramed(self):
+    self.assertFalse(serializer.IsFramed(serializer.DumpJson([1, 2])))
+    self.assertFalse(serializer.IsFramed(""))
+
+  def testCompression(self):
+    data = ["Hello World"] * 1000
+    compressed = serializer.DumpFramed(data)
+    uncompressed = serializer.DumpFramed(data, compress_min=1024 * 1024)
+    self.assertTrue(len(compressed) < len(uncompressed))
+    self.assertEqual(serializer.LoadFramed(compressed), data)
+    self.assertEqual(serializer.LoadFramed(uncompressed), data)
+
+  def testBlobs(self):
+    blobs = ["\0\1\2\xff", "", "raw data" * 100]
+    data = {
+      "first": serializer.FramedBlobRef(0),
+      "list": [1, serializer.FramedBlobRef(2), serializer.FramedBlobRef(1)],
+      "other": {"key": "value"},
+      }
+    result = serializer.LoadFramed(serializer.DumpFramed(data, blobs))
+    self.assertEqual(result, {
+      "first": blobs[0],
+      "list": [1, blobs[2], blobs[1]],
+      "other": {"key": "value"},
+      })
+
+  def testInvalid(self):
+    txt = serializer.DumpFramed(["data"], ["blob"])
+    for invalid in ["", "\0GNT", txt[:-1], txt + "x",
+                    serializer.DumpJson(["data"])]:
+      self.assertRaises(errors.ParseError, serializer.LoadFramed, invalid)
+
+  def testTruncatedBlobs(self):
+    txt = serializer.DumpFramed(["data"], ["blob1", "blob2"])
+    for length in range(len(txt)):
+      self.assertRaises(errors.ParseError, serializer.LoadFramed,
+                        txt[:length])
+
+  def testInvalidBlobReference(self):
+    for ref in [serializer.FramedBlobRef(1), serializer.FramedBlobRef(-1),
+                serializer.FramedBlobRef("0"), serializer.FramedBlobRef(True)]:
+      txt = serializer.DumpFramed([ref], ["blob"], compress_min=1024 * 1024)
+      self.assertRaises(errors.ParseError, serializer.LoadFramed, txt)
+
+  def testInvalidJson(self):
+    txt = serializer.DumpFramed(["data"], compress_min=1024 * 1024)
+    # Replace the closing bracket of the JSON document
+    self.assertRaises(errors.ParseError, serializer.LoadFramed,
+                      txt[:-1] + "}")
+
+
 class TestLoadAndVerifyJson(unittest.TestCase):
   def testNoJson(self):
     self.assertRaises(errors.ParseError, serializer.LoadAndVerifyJson,
@@ -26,6 +26,9 @@ import unittest
 import random
 import mimetools
 import base64
+import os
+import shutil
+import tempfile
 from cStringIO import StringIO
 
 from ganeti import constants
@@ -41,6 +44,7 @@ import ganeti.rapi.baserlib
 import ganeti.rapi.testutils
 import ganeti.rapi.rlib2
 import ganeti.http.auth
+import ganeti.server.rapi
 
 import testutils
 
@@ -250,6 +254,96 @@ class TestRemoteApiHandler(unittest.TestCase):
           self.assertEqual(code, http.HttpNotImplemented.code)
 
 
+class TestMatchETag(unittest.TestCase):
+  def test(self):
+    fn = ganeti.server.rapi._MatchETag
+    self.assertFalse(fn(None, "\"a\""))
+    self.assertFalse(fn("", "\"a\""))
+    self.assertFalse(fn("\"b\"", "\"a\""))
+    self.assertTrue(fn("\"a\"", "\"a\""))
+    self.assertTrue(fn("\"b\", \"a\"", "\"a\""))
+    self.assertTrue(fn("*", "\"a\""))
+
+
+class TestResponseCache(unittest.TestCase):
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+    self.now = 1000.0
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def _GetCache(self):
+    return ganeti.server.rapi.ResponseCache(self.tmpdir, ttl=2.0,
+                                            _time_fn=lambda: self.now)
+
+  def test(self):
+    cache = self._GetCache()
+    self.assertTrue(cache.Get("/2/nodes", "v1") is None)
+
+    cache.Put("/2/nodes", "v1", "[1, 2]")
+    self.assertEqual(cache.Get("/2/nodes", "v1"), "[1, 2]")
+
+    # Entries are shared between instances
+    self.assertEqual(self._GetCache().Get("/2/nodes", "v1"), "[1, 2]")
+
+    # Changed validator or different path
+    self.assertTrue(cache.Get("/2/nodes", "v2") is None)
+    self.assertTrue(cache.Get("/2/nodes?bulk=1", "v1") is None)
+
+    # Expired
+    self.now += 5.0
+    self.assertTrue(cache.Get("/2/nodes", "v1") is None)
+
+  def testWithoutValidator(self):
+    cache = self._GetCache()
+    cache.Put("/2/instances?bulk=1", None, "[]")
+    self.assertEqual(cache.Get("/2/instances?bulk=1", None), "[]")
+    self.assertTrue(cache.Get("/2/instances?bulk=1", "v1") is None)
+
+  def _GetEntries(self):
+    return [name for name in os.listdir(self.tmpdir)
+            if not name.startswith(".")]
+
+  def testInvalidEntry(self):
+    cache = self._GetCache()
+    cache.Put("/2/groups", "v1", "[]")
+
+    (filename, ) = self._GetEntries()
+    utils.WriteFile(utils.PathJoin(self.tmpdir, filename), data="garbage")
+
+    self.assertTrue(cache.Get("/2/groups", "v1") is None)
+    self.assertEqual(self._GetEntries(), [])
+
+  def testExpiry(self):
+    cache = self._GetCache()
+    for i in range(5):
+      cache.Put("/2/jobs/%s" % i, "v1", "{}")
+    self.assertEqual(len(self._GetEntries()), 5)
+
+    # Expired entries are removed when reading them
+    self.now += 3.0
+    self.assertTrue(cache.Get("/2/jobs/0", "v1") is None)
+    self.assertEqual(len(self._GetEntries()), 4)
+
+    # and the others when storing a new entry
+    cache.Put("/2/nodes", "v1", "[]")
+    self.assertEqual(self._GetEntries(), [os.path.basename(
+      cache._GetFilename("/2/nodes"))])
+
+    # The directory is scanned at most once per lifetime
+    stale = utils.PathJoin(self.tmpdir, "stale")
+    utils.WriteFile(stale, data="")
+    os.utime(stale, (0, 0))
+    cache.Put("/2/groups", "v1", "[]")
+    self.assertTrue(os.path.exists(stale))
+
+    self.now += 3.0
+    cache.Put("/2/networks", "v1", "[]")
+    self.assertEqual(self._GetEntries(), [os.path.basename(
+      cache._GetFilename("/2/networks"))])
+
+
 class _FakeLuxiClientForQuery:
   def __init__(self, *args, **kwargs):
     pass
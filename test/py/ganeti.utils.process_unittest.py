@@ -436,6 +436,16 @@ class TestRunCmd(testutils.GanetiTestCase):
                       [], output=self.fname, input_fd=open(self.fname))
 
 
+class TestRunInParallel(unittest.TestCase):
+  def testOrder(self):
+    items = range(20)
+    result = utils.RunInParallel(lambda i: i * 2, items, 4)
+    self.assertEqual(result, [i * 2 for i in items])
+
+  def testEmpty(self):
+    self.assertEqual(utils.RunInParallel(NotImplemented, [], 4), [])
+
+
 class TestRunParts(testutils.GanetiTestCase):
   """Testing case for the RunParts function"""
 
@@ -567,6 +577,63 @@ class TestRunParts(testutils.GanetiTestCase):
     nosuchdir = utils.PathJoin(self.rundir, "no/such/directory")
     self.assertEqual(utils.RunParts(nosuchdir), [])
 
+  def testParallel(self):
+    files = [os.path.join(self.rundir, "%02dtest" % i) for i in range(10)]
+
+    # The scripts only finish once all of them have started
+    for fname in files:
+      utils.WriteFile(fname, data=("#!/bin/sh\n\ntouch %s.started\n"
+                                   "while [ $(ls %s | grep -c started) -lt"
+                                   " %d ]; do sleep 0.1; done\n"
+                                   "echo -n $(basename $0)" %
+                                   (fname, self.rundir, len(files))))
+      os.chmod(fname, stat.S_IREAD | stat.S_IEXEC)
+
+    results = utils.RunParts(self.rundir, reset_env=True,
+                             max_parallel=len(files), timeout=60)
+
+    self.assertEqual(len(results), len(files))
+    for (fname, (relname, status, runresult)) in zip(files, results):
+      self.assertEqual(relname, os.path.basename(fname))
+      self.assertEqual(status, constants.RUNPARTS_RUN)
+      self.assertFalse(runresult.failed)
+      self.assertEqual(runresult.output, relname)
+
+  def testParallelMix(self):
+    for (name, data, mode) in [
+      ("00test", "#!/bin/sh\n\nexit 1", stat.S_IREAD | stat.S_IEXEC),
+      ("10test", "", 0600),
+      ("20test", "", stat.S_IREAD | stat.S_IEXEC),
+      ("30test", "#!/bin/sh\n\necho -n ciao", stat.S_IREAD | stat.S_IEXEC),
+      ]:
+      fname = os.path.join(self.rundir, name)
+      utils.WriteFile(fname, data=data)
+      os.chmod(fname, mode)
+
+    results = utils.RunParts(self.rundir, reset_env=True, max_parallel=3)
+
+    self.assertEqual([(relname, status) for (relname, status, _) in results],
+                     [("00test", constants.RUNPARTS_RUN),
+                      ("10test", constants.RUNPARTS_SKIP),
+                      ("20test", constants.RUNPARTS_ERR),
+                      ("30test", constants.RUNPARTS_RUN)])
+    self.assertTrue(results[0][2].failed)
+    self.assertEqual(results[1][2], None)
+    self.assertTrue(results[2][2])
+    self.assertEqual(results[3][2].output, "ciao")
+
+  def testTimeout(self):
+    fname = os.path.join(self.rundir, "00test")
+    utils.WriteFile(fname, data="#!/bin/sh\n\nexec sleep 60")
+    os.chmod(fname, stat.S_IREAD | stat.S_IEXEC)
+
+    (relname, status, runresult) = \
+      utils.RunParts(self.rundir, reset_env=True, timeout=0.5)[0]
+    self.assertEqual(relname, os.path.basename(fname))
+    self.assertEqual(status, constants.RUNPARTS_RUN)
+    self.assertTrue(runresult.failed)
+    self.assertTrue("timeout" in runresult.fail_reason)
+
 
 class TestStartDaemon(testutils.GanetiTestCase):
   def setUp(self):
@@ -152,6 +152,18 @@ class PriorityWorker(workerpool.BaseWorker):
       ctx.lock.release()
 
 
+class BlockingContext:
+  def __init__(self):
+    self.started = threading.Semaphore(0)
+    self.release = threading.Event()
+
+
+class BlockingWorker(workerpool.BaseWorker):
+  def RunTask(self, ctx):
+    ctx.started.release()
+    ctx.release.wait()
+
+
 class NotImplementedWorker(workerpool.BaseWorker):
   def RunTask(self):
     raise NotImplementedError
@@ -313,6 +325,57 @@ class TestWorkerpool(unittest.TestCase):
 
     self.assertEquals(ctx.GetDoneTasks(), 11)
 
+  def testResize(self):
+    ctx = BlockingContext()
+    wp = workerpool.WorkerPool("Test", 4, BlockingWorker)
+    try:
+      self._CheckWorkerCount(wp, 4)
+      self.assertEqual(wp.GetWorkerCounts(), (4, 0, 0))
+
+      wp.SetActive(False)
+      wp.AddManyTasks([(ctx, ) for _ in range(3)])
+      self.assertEqual(wp.GetWorkerCounts(), (4, 0, 3))
+
+      # Let two tasks start
+      wp.Resize(2)
+      self.assertEqual(wp.GetWorkerCounts(), (2, 0, 3))
+      wp.SetActive(True)
+      ctx.started.acquire()
+      ctx.started.acquire()
+      self.assertEqual(wp.GetWorkerCounts(), (2, 2, 1))
+
+      # Grow, the new worker picks up the remaining task
+      wp.Resize(5)
+      ctx.started.acquire()
+      self.assertEqual(wp.GetWorkerCounts(), (5, 3, 0))
+
+      # Idle workers are stopped first
+      wp.Resize(3, wait=False)
+      self.assertEqual(wp.GetWorkerCounts(), (3, 3, 0))
+
+      # Reduce the number of workers without waiting for busy ones
+      wp.Resize(1, wait=False)
+      self.assertEqual(wp.GetWorkerCounts(), (1, 1, 0))
+
+      wp._lock.acquire()
+      try:
+        self.assertTrue(len(wp._termworkers) >= 2)
+      finally:
+        wp._lock.release()
+
+      ctx.release.set()
+      wp.Quiesce()
+
+      # Waits for all terminating workers
+      wp.Resize(1)
+      self.assertEqual(wp.GetWorkerCounts(), (1, 0, 0))
+      self.assertFalse(wp._termworkers)
+    finally:
+      ctx.release.set()
+      wp.TerminateWorkers()
+      self._CheckWorkerCount(wp, 0)
+      self.assertFalse(wp._termworkers)
+
   def _CheckNoTasks(self, wp):
     wp._lock.acquire()
     try:
@@ -45,6 +45,14 @@ def ParseOptions():
                     help="Number of threads", metavar="NUM")
   parser.add_option("-d", dest="duration", default=5, type="float",
                     help="Duration", metavar="SECS")
+  parser.add_option("-c", dest="condition", default=locking.CONDITION_LOCK,
+                    choices=sorted(locking.CONDITION_TYPES),
+                    help=("Condition implementation used for waiting (one of"
+                          " %s)" % ", ".join(sorted(locking.CONDITION_TYPES))))
+  parser.add_option("--timeout", dest="timeout", default=None, type="float",
+                    help=("Acquire locks with this timeout, retrying until"
+                          " successful (default: blocking acquires)"),
+                    metavar="SECS")
 
   (opts, args) = parser.parse_args()
 
@@ -61,10 +69,31 @@ class State:
     """
     self.verify = [0 for _ in range(thread_count)]
     self.counts = [0 for _ in range(thread_count)]
+    self.wait_time = [0.0 for _ in range(thread_count)]
+    self.max_wait_time = [0.0 for _ in range(thread_count)]
     self.total_count = 0
+    self.pipe_count = 0
+    self.max_fds = 0
 
 
-def _Counter(lock, state, me):
+def _CountOpenFds():
+  """Returns the number of file descriptors open in this process.
+
+  """
+  return len(os.listdir("/proc/self/fd"))
+
+
+def _WrapPipe(state, fn):
+  """Returns a wrapper for C{os.pipe} counting created pipes.
+
+  """
+  def wrapper():
+    state.pipe_count += 1
+    return fn()
+  return wrapper
+
+
+def _Counter(lock, state, me, timeout):
   """Thread function for acquiring locks.
 
   """
@@ -72,8 +101,14 @@ def _Counter(lock, state, me):
   verify = state.verify
 
   while True:
-    lock.acquire()
+    start = time.time()
+    while not lock.acquire(timeout=timeout):
+      pass
+    waited = time.time() - start
     try:
+      state.wait_time[me] += waited
+      state.max_wait_time[me] = max(state.max_wait_time[me], waited)
+
       verify[me] = 1
 
       counts[me] += 1
@@ -96,14 +131,20 @@ def _Counter(lock, state, me):
 def main():
   (opts, _) = ParseOptions()
 
+  state = State(opts.thread_count)
+
+  locking.SetConditionType(opts.condition)
+  locking.os.pipe = _WrapPipe(state, os.pipe)
+
   lock = locking.SharedLock("TestLock")
 
-  state = State(opts.thread_count)
+  fds_before = _CountOpenFds()
 
   lock.acquire(shared=0)
   try:
     for i in range(opts.thread_count):
-      t = threading.Thread(target=_Counter, args=(lock, state, i))
+      t = threading.Thread(target=_Counter,
+                           args=(lock, state, i, opts.timeout))
       t.setDaemon(True)
       t.start()
 
@@ -114,7 +155,8 @@ def main():
   while True:
     if (time.clock() - start) > opts.duration:
       break
-    time.sleep(0.1)
+    state.max_fds = max(state.max_fds, _CountOpenFds() - fds_before)
+    time.sleep(0.01)
 
   # Make sure we get a consistent view
   lock.acquire(shared=0)
@@ -132,6 +174,14 @@ def main():
   print "Benchmark CPU time: %0.3fs" % lock_cputime
   print ("Average time per lock acquisition: %0.5fms" %
          (1000.0 * lock_cputime / state.total_count))
+  print "Condition implementation: %s" % opts.condition
+  print ("Average wall time spent waiting per acquisition: %0.5fms" %
+         (1000.0 * sum(state.wait_time) / state.total_count))
+  print ("Longest wait for an acquisition: %0.5fms" %
+         (1000.0 * max(state.max_wait_time)))
+  print "Pipes created: %d" % state.pipe_count
+  print "Highest number of additional open file descriptors: %d" % \
+    state.max_fds
   print "Process:"
   print "  User time: %0.3fs" % res.ru_utime
   print "  System time: %0.3fs" % res.ru_stime
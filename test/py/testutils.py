@@ -256,3 +256,25 @@ class CallCounter(object):
 
     """
     return self._count
+
+
+class FakeClock(object):
+  """Callable returning a time which is only changed explicitly.
+
+  Can be passed to code accepting a time function, e.g. C{time.time}.
+
+  """
+  def __init__(self, now=0.0):
+    """Initializes this class.
+
+    @type now: number
+    @param now: Initial time
+
+    """
+    self.now = now
+
+  def __call__(self):
+    """Returns the current time.
+
+    """
+    return self.now